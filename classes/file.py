@@ -24,6 +24,7 @@ class File:
         category_id: Optional[int] = None,
         subcategory_id: Optional[int] = None,
         file_exists: bool = True,
+        preview_version: Optional[int] = None,
     ) -> None:
         """Create a file entity.
 
@@ -35,12 +36,13 @@ class File:
 			description: Optional description (defaults to placeholder).
 			created_at: Creation date string, defaults to now if empty.
 			ready: 1 if converted and ready, 0 if in processing.
-			viewed: Comma or pipe-delimited string of viewers (backend format).
+			viewed: Comma-separated viewer names, filled per page by file_apply_view_flags (display only).
 			note: Optional note.
 			order_id: Optional ID of associated order (foreign key).
 			category_id: Category ID for file organization.
 			subcategory_id: Subcategory ID for file organization.
 			file_exists: Whether the file exists on disk.
+			preview_version: Version of the poster/sprite previews, None if absent.
 		"""
         self.display_name: str = display_name
         self.file_name: str = file_name
@@ -61,44 +63,58 @@ class File:
         self.category_id: Optional[int] = category_id
         self.subcategory_id: Optional[int] = subcategory_id
         self.exists: bool = bool(file_exists)
+        self.preview_version: Optional[int] = int(
+            preview_version) if preview_version else None
+        # Per-user view state from file_view (see SQLUtils.file_apply_view_flags)
+        self.viewed_by_me: bool = False
+        self.viewer_count: int = 0
 
         # Legacy compatibility - will be computed dynamically
         self.real_name: str = file_name
-        self.path: str = ""  # Will be computed when needed
+        self._path: Optional[str] = None  # Resolved lazily, see `path`
+
+    @property
+    def name(self) -> str:
+        """Legacy alias for display_name."""
+        return self.display_name
+
+    @property
+    def path(self) -> str:
+        """Storage directory of this file (resolved once, without DB queries)."""
+        if self._path is None:
+            self._path = self._get_storage_path()
+        return self._path
+
+    @path.setter
+    def path(self, value: str) -> None:
+        self._path = value
 
     def _get_storage_path(self) -> str:
         """Get the storage path for this file based on category/subcategory."""
+        # Process-wide resolver works with or without Flask app context
+        try:
+            from modules.storage_paths import get_default_resolver
+            resolver = get_default_resolver()
+            if resolver is not None:
+                return resolver.storage_dir(self.category_id,
+                                            self.subcategory_id)
+        except Exception:
+            pass
+
         try:
-            # Try to get SQLUtils from Flask app context first
             from flask import current_app
             if hasattr(current_app, '_sql'):
                 return current_app._sql.get_file_storage_path(
                     self.category_id, self.subcategory_id)
         except Exception:
             pass
-
-        try:
-            from modules.SQLUtils import SQLUtils
-            # We need to get the SQLUtils instance to compute the path
-            # This is a bit of a hack, but necessary for the File class to work independently
-            import os
-            config_path = os.path.join(
-                os.path.dirname(os.path.dirname(__file__)), 'config.ini')
-            if os.path.exists(config_path):
-                sql_utils = SQLUtils(config_path)
-                return sql_utils.get_file_storage_path(self.category_id,
-                                                       self.subcategory_id)
-            else:
-                # Fallback to default path
-                return "/mnt/files/znf/files"
-        except Exception:
-            return "/mnt/files/znf/files"
+        return "/mnt/files/znf/files"
 
     def _check_file_exists(self) -> bool:
         """Check if the file exists on disk (prefer converted mp4, fallback to webm)."""
         try:
             # Get the storage path for this file
-            storage_path = self._get_storage_path()
+            storage_path = self.path
 
             # Determine target media path: prefer converted mp4, fallback to original webm
             base = os.path.join(storage_path,
@@ -128,7 +144,7 @@ class File:
         """Get the appropriate file path for the current state (webm for processing, mp4 for ready)."""
         try:
             # Get the storage path for this file
-            storage_path = self._get_storage_path()
+            storage_path = self.path
 
             base = os.path.join(storage_path,
                                 os.path.splitext(self.file_name)[0])
@@ -1,5 +1,79 @@
 from flask_login import UserMixin
 
+_SCOPE_MAPPING = None
+
+
+def _scope_mapping():
+	"""Legacy page/letter -> scope mapping (built once; lazy to avoid import cycles)."""
+	global _SCOPE_MAPPING
+	if _SCOPE_MAPPING is not None:
+		return _SCOPE_MAPPING
+	try:
+		from modules.permissions import (
+			FILES_VIEW_PAGE, FILES_UPLOAD, FILES_EDIT_ANY, FILES_DELETE_ANY,
+			FILES_MARK_VIEWED, FILES_NOTES, REQUESTS_APPROVE, REQUESTS_ALLOW,
+			REQUESTS_VIEW_PAGE, ORDERS_VIEW_PAGE, USERS_VIEW_PAGE, USERS_MANAGE,
+			GROUPS_VIEW_PAGE, GROUPS_MANAGE, CATEGORIES_VIEW, CATEGORIES_MANAGE,
+			SUBCATEGORIES_VIEW, SUBCATEGORIES_MANAGE, ADMIN_VIEW_PAGE, ADMIN_MANAGE, ADMIN_ANY, FILES_DISPLAY_ALL,
+		)
+	except Exception:
+		return None, None
+	mapping = {
+		3: {
+			'a': FILES_VIEW_PAGE,
+			'b': FILES_UPLOAD,
+			'c': FILES_EDIT_ANY,
+			'd': FILES_DELETE_ANY,
+			'l': FILES_NOTES,
+			'm': FILES_MARK_VIEWED,
+			'f': FILES_DISPLAY_ALL,
+			'z': ADMIN_ANY,
+		},
+		1: {
+			'a': REQUESTS_VIEW_PAGE,
+			'e': REQUESTS_APPROVE,
+			'f': REQUESTS_ALLOW,
+			'z': ADMIN_ANY,
+		},
+		2: {
+			'a': ORDERS_VIEW_PAGE,
+			'z': ADMIN_ANY,
+		},
+		4: {  # users page
+			'a': USERS_VIEW_PAGE,
+			'b': USERS_MANAGE,  # manage includes add/edit/toggle/delete/reset
+			'z': ADMIN_ANY,
+		},
+		5: {  # groups page
+			'a': GROUPS_VIEW_PAGE,
+			'b': GROUPS_MANAGE,
+			'z': ADMIN_ANY,
+		},
+		6: {  # admin page (new slot in legacy permission string)
+			'a': ADMIN_VIEW_PAGE,
+			'b': ADMIN_MANAGE,
+			'z': ADMIN_ANY,
+		},
+		7: {  # categories page
+			'a': CATEGORIES_VIEW,
+			'b': CATEGORIES_MANAGE,
+			'c': SUBCATEGORIES_VIEW,
+			'd': SUBCATEGORIES_MANAGE,
+			'z': ADMIN_ANY,
+		},
+	}
+	# Implicit view if user has any non-view action on a page
+	view_scope_by_page = {
+		1: REQUESTS_VIEW_PAGE,
+		2: ORDERS_VIEW_PAGE,
+		3: FILES_VIEW_PAGE,
+		4: USERS_VIEW_PAGE,
+		5: GROUPS_VIEW_PAGE,
+		6: ADMIN_VIEW_PAGE,
+	}
+	_SCOPE_MAPPING = (mapping, view_scope_by_page)
+	return _SCOPE_MAPPING
+
 class User(UserMixin):
 	def __init__(self, id, login, name, password, gid, enabled, permission):
 		 self.id = id
@@ -40,8 +114,7 @@ class User(UserMixin):
 		return ','.join(self.permission)
 
 	# --- New permissions adapter API ---
-	@property
-	def permissions(self):
+	def _compute_scopes(self):
 		"""Map legacy page-letter permissions to named scopes.
 
 		Page indexes (1-based) legacy mapping:
@@ -59,62 +132,10 @@ class User(UserMixin):
 		  f: requests.allow
 		  z: admin.any
 		"""
-		try:
-			from modules.permissions import (
-				FILES_VIEW_PAGE, FILES_UPLOAD, FILES_EDIT_ANY, FILES_DELETE_ANY,
-				FILES_MARK_VIEWED, FILES_NOTES, REQUESTS_APPROVE, REQUESTS_ALLOW,
-				REQUESTS_VIEW_PAGE, ORDERS_VIEW_PAGE, USERS_VIEW_PAGE, USERS_MANAGE,
-				GROUPS_VIEW_PAGE, GROUPS_MANAGE, CATEGORIES_VIEW, CATEGORIES_MANAGE,
-				SUBCATEGORIES_VIEW, SUBCATEGORIES_MANAGE, ADMIN_VIEW_PAGE, ADMIN_MANAGE, ADMIN_ANY, FILES_DISPLAY_ALL,
-			)
-		except Exception:
+		mapping, view_scope_by_page = _scope_mapping()
+		if mapping is None:
 			# Fallback if import cycle during app startup
-			return set()
-
-		mapping = {
-			3: {
-				'a': FILES_VIEW_PAGE,
-				'b': FILES_UPLOAD,
-				'c': FILES_EDIT_ANY,
-				'd': FILES_DELETE_ANY,
-				'l': FILES_NOTES,
-				'm': FILES_MARK_VIEWED,
-				'f': FILES_DISPLAY_ALL,
-				'z': ADMIN_ANY,
-			},
-			1: {
-				'a': REQUESTS_VIEW_PAGE,
-				'e': REQUESTS_APPROVE,
-				'f': REQUESTS_ALLOW,
-				'z': ADMIN_ANY,
-			},
-			2: {
-				'a': ORDERS_VIEW_PAGE,
-				'z': ADMIN_ANY,
-			},
-			4: {  # users page
-				'a': USERS_VIEW_PAGE,
-				'b': USERS_MANAGE,  # manage includes add/edit/toggle/delete/reset
-				'z': ADMIN_ANY,
-			},
-			5: {  # groups page
-				'a': GROUPS_VIEW_PAGE,
-				'b': GROUPS_MANAGE,
-				'z': ADMIN_ANY,
-			},
-			6: {  # admin page (new slot in legacy permission string)
-				'a': ADMIN_VIEW_PAGE,
-				'b': ADMIN_MANAGE,
-				'z': ADMIN_ANY,
-			},
-			7: {  # categories page
-				'a': CATEGORIES_VIEW,
-				'b': CATEGORIES_MANAGE,
-				'c': SUBCATEGORIES_VIEW,
-				'd': SUBCATEGORIES_MANAGE,
-				'z': ADMIN_ANY,
-			},
-		}
+			return None
 
 		result = set()
 		# First, map explicit letters to scopes
@@ -127,14 +148,6 @@ class User(UserMixin):
 				if scope:
 					result.add(scope)
 		# Then, grant implicit view if user has any non-view action on a page
-		view_scope_by_page = {
-			1: REQUESTS_VIEW_PAGE,
-			2: ORDERS_VIEW_PAGE,
-			3: FILES_VIEW_PAGE,
-			4: USERS_VIEW_PAGE,
-			5: GROUPS_VIEW_PAGE,
-			6: ADMIN_VIEW_PAGE,
-		}
 		for index, letters in enumerate(self.permission, start=1):
 			view_scope = view_scope_by_page.get(index)
 			if not view_scope:
@@ -148,18 +161,49 @@ class User(UserMixin):
 		if getattr(self, 'is_config_admin', False):
 			result.add('admin.any')
 		# If user has full admin, reflect admin page rights explicitly for UI and guards
-		try:
-			if 'admin.any' in result:
-				result.add(ADMIN_VIEW_PAGE)
-				result.add(ADMIN_MANAGE)
-		except Exception:
-			pass
+		if 'admin.any' in result:
+			result.add('admin.view')
+			result.add('admin.manage')
 		return result
 
+	def _compile(self):
+		"""Compile scopes and bitmask once per distinct permission string."""
+		key = (tuple(self.permission), bool(getattr(self, 'is_config_admin', False)))
+		if self.__dict__.get('_compiled_key') == key:
+			return
+		scopes = self._compute_scopes()
+		if scopes is None:
+			self._scopes, self._mask = frozenset(), 0
+			return
+		from modules.permissions import scopes_to_mask
+		self._scopes = frozenset(scopes)
+		self._mask = scopes_to_mask(scopes)
+		self._compiled_key = key
+
+	def apply_permission_mask(self, mask):
+		"""Adopt a precompiled bitmask (e.g. from the principal cache) without recomputing."""
+		from modules.permissions import mask_to_scopes
+		self._mask = int(mask)
+		self._scopes = frozenset(mask_to_scopes(self._mask))
+		self._compiled_key = (tuple(self.permission), bool(getattr(self, 'is_config_admin', False)))
+
+	@property
+	def permissions(self):
+		"""Named scopes of this user (compiled once, see _compute_scopes)."""
+		self._compile()
+		return self._scopes
+
+	@property
+	def permission_mask(self):
+		"""Integer bitmask of scopes (bit positions from modules.permissions.SCOPE_BITS)."""
+		self._compile()
+		return self._mask
+
 	def has(self, scope: str) -> bool:
 		"""Check if user has named permission scope or admin.any."""
-		perms = self.permissions
-		return 'admin.any' in perms or scope in perms
+		self._compile()
+		from modules.permissions import SCOPE_BITS
+		return bool(self._mask & (SCOPE_BITS['admin.any'] | SCOPE_BITS.get(scope, 0)))
 
 	def permission_labels(self):
 		"""Return human-readable labels for user's permissions (for UI)."""
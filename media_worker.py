@@ -0,0 +1,114 @@
+"""Standalone media worker: consumes the Redis conversion queue.
+
+Run next to gunicorn (one or more processes):
+
+    python media_worker.py [--concurrency N]
+
+Concurrency defaults to ``[videos] worker_concurrency`` (0 = CPU count - 1).
+SIGTERM/SIGINT stop taking new jobs and let running conversions finish.
+"""
+
+import argparse
+import signal
+import sys
+
+from modules.category_tree import CategoryTree
+from modules.conversion_progress import ConversionProgress
+from modules.logging import init_logging, get_logger
+from modules.job_queue import media_queue_from_config
+from modules.redis_client import init_redis_client, redis_url
+from modules.SQLUtils import SQLUtils
+from modules.storage_paths import StoragePathResolver, set_default_resolver
+from services.media import MediaService
+from services.hls import hls_packager_from_config
+from services.media_probe import MediaProbe
+from services.previews import preview_generator_from_config
+from services.media_worker import MediaWorker, default_concurrency
+
+init_logging()
+_log = get_logger('media_worker')
+
+
+class _SocketEmitter:
+    """Write-only Socket.IO emitter for 'processing-complete' and progress events."""
+
+    def __init__(self, url: str) -> None:
+        from socketio import RedisManager
+        self._manager = RedisManager(url, write_only=True)
+
+    def emit(self, event, data, namespace='/', room=None, **kwargs):
+        self._manager.emit(event, data, namespace=namespace, room=room)
+
+    def sleep(self, seconds=0):
+        pass
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='ZNF media conversion worker')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='parallel conversions (default: [videos] worker_concurrency)')
+    args = parser.parse_args(argv)
+
+    sql = SQLUtils()
+    config = sql.config
+    redis_cfg = dict(config['redis']) if config.has_section('redis') else {}
+    redis_client = init_redis_client(redis_cfg)
+    # Same in-memory storage folder map as the web app (File.path, get_file_storage_path)
+    storage_paths = StoragePathResolver(
+        config.get('files', 'root', fallback='/var/lib/znf-files'),
+        CategoryTree(sql, redis_client))
+    sql.storage_paths = storage_paths
+    set_default_resolver(storage_paths)
+    queue = media_queue_from_config(config, redis_client)
+    if queue is None:
+        _log.error('Media queue unavailable: check [redis] and [videos] queue = redis')
+        return 1
+    try:
+        socketio = _SocketEmitter(redis_url(redis_cfg))
+    except Exception as e:
+        _log.warning(f"Socket.IO emitter unavailable, clients will not be notified: {e}")
+        socketio = None
+
+    progress = ConversionProgress(
+        redis_client,
+        socketio,
+        min_interval=config.getfloat('videos', 'progress_interval', fallback=1.0))
+    concurrency = args.concurrency
+    if concurrency is None:
+        concurrency = config.getint('videos', 'worker_concurrency', fallback=0)
+    concurrency = concurrency or default_concurrency()
+    media = MediaService(
+        None,
+        config['files']['root'],
+        sql,
+        socketio,
+        progress=progress,
+        convert_timeout=config.getint('videos', 'convert_timeout', fallback=300),
+        stall_timeout=config.getint('videos', 'stall_timeout', fallback=120),
+        probe=MediaProbe(redis_client),
+        remux=config.getboolean('videos', 'remux', fallback=True),
+        remux_max_height=config.getint('videos', 'remux_max_height', fallback=1080),
+        remux_max_kbps=config.getint('videos', 'remux_max_kbps', fallback=4000),
+        hls=hls_packager_from_config(config),
+        previews=preview_generator_from_config(config),
+        timeout_factor=config.getfloat('videos', 'convert_timeout_factor', fallback=3.0),
+        chunked_min_seconds=config.getint('videos', 'chunked_min_seconds', fallback=900),
+        chunk_seconds=config.getint('videos', 'chunk_seconds', fallback=120),
+        chunk_parallelism=config.getint('videos', 'chunk_parallelism', fallback=2),
+        concurrent_jobs=concurrency)
+    worker = MediaWorker(queue, {'convert': media.run_job}, concurrency=concurrency)
+
+    def _shutdown(signum, frame):
+        _log.info('Media worker stopping, waiting for running conversions...')
+        worker.stop()
+
+    signal.signal(signal.SIGINT, _shutdown)
+    signal.signal(signal.SIGTERM, _shutdown)
+    worker.start()
+    worker.wait()
+    _log.info(f"Media worker stopped (processed={worker.processed}, failed={worker.failed})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,6 @@
 """Database access layer with connection pooling and simple helpers."""
 
 import mysql.connector as mysql
-from mysql.connector import errors as mysql_errors
 from typing import Optional
 
 from classes.user import User
@@ -12,13 +11,16 @@ from classes.group import Group
 from classes.category import Category
 from classes.subcategory import Subcategory
 import os
+import re
 from modules.core import Config
 import base64
 import secrets
 from .logging import get_logger
+from .migrations import run_migrations
+from .db_pool import ConnectionPool
+from .redis_client import redis_config_from, shared_redis
 import time
 import threading
-import redis
 
 _log = get_logger(__name__)
 
@@ -28,7 +30,9 @@ class SQL(Config):
 	
 	def __init__(self):
 		super().__init__()
-		self._pool: Optional[mysql.pooling.MySQLConnectionPool] = None
+		self._pool: Optional[ConnectionPool] = None
+		self._pool_lock = threading.Lock()
+		self._ctx_local = threading.local()
 		# Initialize database schema on startup (only once across all workers)
 		self._ensure_database_schema()
 
@@ -140,156 +144,104 @@ class SQL(Config):
 		self.execute_non_query(f"INSERT IGNORE INTO {self.config['db']['prefix']}_user (id, login, name, password, gid, enabled, permission) VALUES (%s, %s, %s, %s, %s, %s, %s);", 
 							  [1, "admin", self.config['admin']['name'], self.config['admin']['password'], 1, 1, admin_permissions])
 
+	def _connect(self):
+		"""Open a new MySQL connection (pool factory)."""
+		return mysql.connect(
+			host=self.config['db']['host'],
+			user=self.config['db']['user'],
+			password=self.config['db']['password'],
+			database=self.config['db']['name'],
+			charset="utf8mb4",
+			collation="utf8mb4_general_ci",
+			connection_timeout=int(self.config['db'].get('connect_timeout', 10)),
+			autocommit=True,  # Enable autocommit to prevent long transactions
+			sql_mode='STRICT_TRANS_TABLES,NO_ZERO_DATE,NO_ZERO_IN_DATE,ERROR_FOR_DIVISION_BY_ZERO',
+		)
+
+	def _get_pool(self) -> ConnectionPool:
+		"""Create the connection pool on first use (once per process)."""
+		if self._pool is None:
+			with self._pool_lock:
+				if self._pool is None:
+					# Only log pool creation once across all workers using Redis
+					self._log_pool_creation_once_static()
+					self._pool = ConnectionPool(
+						self._connect,
+						size=int(self.config['db'].get('pool_size', 20)),
+						acquire_timeout=float(self.config['db'].get('pool_acquire_timeout', 30)),
+						idle_check_seconds=float(self.config['db'].get('pool_idle_check_seconds', 30)),
+					)
+		return self._pool
+
 	@staticmethod
 	def with_conn(func):
+		"""Run ``func(self, conn, cur, command, args)`` on a pooled connection.
+
+		The connection is bound to the current greenlet, so nested calls (or calls
+		inside ``with sql:``) reuse it; nothing is stored on the shared instance.
+		"""
 		def _with_conn(self, command, args=[]):
-			if not self._pool:
-				# Only log pool creation once across all workers using Redis
-				self._log_pool_creation_once_static()
-				self._pool = mysql.pooling.MySQLConnectionPool(
-					pool_name="znv_pool",
-					pool_size=int(self.config['db'].get('pool_size', 20)),  # Increased from 5 to 20
-					pool_reset_session=True,
-					host=self.config['db']['host'],
-					user=self.config['db']['user'],
-					password=self.config['db']['password'],
-					database=self.config['db']['name'],
-					charset="utf8mb4",
-					collation="utf8mb4_general_ci",
-					connection_timeout=int(self.config['db'].get('connect_timeout', 10)),
-					autocommit=True,  # Enable autocommit to prevent long transactions
-					sql_mode='STRICT_TRANS_TABLES,NO_ZERO_DATE,NO_ZERO_IN_DATE,ERROR_FOR_DIVISION_BY_ZERO',
-				)
-			# Retry acquire to avoid immediate PoolError: pool exhausted under burst load
-			retries = int(self.config['db'].get('pool_acquire_retries', 100))  # Increased from 50 to 100
-			delay_ms = int(self.config['db'].get('pool_acquire_delay_ms', 100))  # Decreased from 200 to 100
-			last_err = None
-			for _ in range(max(1, retries)):
+			with self._get_pool().connection() as conn:
+				# Use buffered cursor to allow fetch after execute reliably
+				cur = conn.cursor(buffered=True)
 				try:
-					assert self._pool is not None
-					self.conn = self._pool.get_connection()
-					break
-				except mysql_errors.PoolError as e:
-					last_err = e
-					_log.warning(f"Pool exhausted, retrying in {delay_ms}ms (attempt {_+1}/{retries})")
-					time.sleep(max(0, delay_ms) / 1000.0)
-			else:
-				# Exhausted retries
-				_log.error(f"Failed to get connection after {retries} retries, pool size: {self._pool.pool_size}")
-				raise last_err or mysql_errors.PoolError("Failed getting connection; pool exhausted")
-			# Ensure connection is alive; reconnect if needed
-			try:
-				self.conn.ping(reconnect=True, attempts=1, delay=0)
-			except Exception:
-				pass
-			# Use buffered cursor to allow fetch after execute reliably
-			self.cur = self.conn.cursor(buffered=True)
-			try:
-				data = func(self, command, args)
-				return data
-			finally:
-				# Always clean up cursor and return connection to pool
-				try:
-					self.cur.close()
-				except Exception:
-					pass
-				try:
-					self.conn.close()  # This returns connection to pool
-				except Exception:
-					pass
+					return func(self, conn, cur, command, args)
+				finally:
+					try:
+						cur.close()
+					except Exception:
+						pass
 		return _with_conn
 
 	def get_pool_status(self):
-		"""Get connection pool status for monitoring."""
+		"""Get connection pool status and wait/checkout metrics for monitoring."""
 		if not self._pool:
 			return {"pool_size": 0, "available_connections": 0, "in_use": 0}
-		try:
-			q = getattr(self._pool, '_cnx_queue', None)
-			available = int(q.qsize()) if (q is not None and hasattr(q, 'qsize')) else 0
-		except Exception:
-			available = 0
-		in_use = max(0, int(self._pool.pool_size) - available)
-		return {
-			"pool_size": int(self._pool.pool_size),
-			"available_connections": available,
-			"in_use": in_use,
-		}
+		return self._pool.status()
+
+	@property
+	def conn(self):
+		"""Connection held by the current greenlet inside ``with sql:`` (or None)."""
+		return self._pool.current() if self._pool else None
 
 	def __enter__(self):
-		"""Context manager entry - get connection from pool."""
-		if not self._pool:
-			# Ensure schema and initialize pool if missing (mirrors with_conn)
-			self._ensure_database_schema()
-			# Only log pool creation once across all workers using Redis
-			redis_client = SQL._create_redis_client_for_logging_static()
-			if redis_client and redis_client.set('pool_created_logged', '1', nx=True, ex=20):
-				_log.info(f"Creating MySQL connection pool with size {int(self.config['db'].get('pool_size', 20))}")
-			
-			self._pool = mysql.pooling.MySQLConnectionPool(
-					pool_name="znv_pool",
-					pool_size=int(self.config['db'].get('pool_size', 20)),
-					pool_reset_session=True,
-					host=self.config['db']['host'],
-					user=self.config['db']['user'],
-					password=self.config['db']['password'],
-					database=self.config['db']['name'],
-					charset="utf8mb4",
-					collation="utf8mb4_general_ci",
-					connection_timeout=int(self.config['db'].get('connect_timeout', 10)),
-					autocommit=True,
-					sql_mode='STRICT_TRANS_TABLES,NO_ZERO_DATE,NO_ZERO_IN_DATE,ERROR_FOR_DIVISION_BY_ZERO',
-				)
-		retries = int(self.config['db'].get('pool_acquire_retries', 100))
-		delay_ms = int(self.config['db'].get('pool_acquire_delay_ms', 100))
-		last_err = None
-		for _ in range(max(1, retries)):
-			try:
-				assert self._pool is not None
-				self.conn = self._pool.get_connection()
-				self.cur = self.conn.cursor(buffered=True)
-				return self
-			except mysql_errors.PoolError as e:
-				last_err = e
-				_log.warning(f"Pool exhausted in context manager, retrying in {delay_ms}ms (attempt {_+1}/{retries})")
-				time.sleep(max(0, delay_ms) / 1000.0)
-		else:
-			_log.error(f"Failed to get connection in context manager after {retries} retries")
-			raise last_err or mysql_errors.PoolError("Failed getting connection; pool exhausted")
+		"""Context manager entry - bind a pooled connection to the current greenlet."""
+		ctx = self._get_pool().connection()
+		ctx.__enter__()
+		stack = getattr(self._ctx_local, 'stack', None)
+		if stack is None:
+			stack = self._ctx_local.stack = []
+		stack.append(ctx)
+		return self
 
 	def __exit__(self, exc_type, exc_val, exc_tb):
 		"""Context manager exit - return connection to pool."""
-		try:
-			if hasattr(self, 'cur') and self.cur:
-				self.cur.close()
-		except Exception:
-			pass
-		try:
-			if hasattr(self, 'conn') and self.conn:
-				self.conn.close()  # Returns connection to pool
-		except Exception:
-			pass
+		stack = getattr(self._ctx_local, 'stack', None)
+		if stack:
+			return stack.pop().__exit__(exc_type, exc_val, exc_tb)
+		return False
 
 	@with_conn
-	def execute_non_query(self, command, args=[]):
-		self.cur.execute(command, args)
-		self.conn.commit()
+	def execute_non_query(self, conn, cur, command, args=[]):
+		cur.execute(command, args)
+		conn.commit()
 
 	@with_conn
-	def execute_scalar(self, command, args=[]):
-		self.cur.execute(command, args)
-		return self.cur.fetchone()
+	def execute_scalar(self, conn, cur, command, args=[]):
+		cur.execute(command, args)
+		return cur.fetchone()
 
 	@with_conn
-	def execute_query(self, command, args=[]):
-		self.cur.execute(command, args)
-		return self.cur.fetchall()
+	def execute_query(self, conn, cur, command, args=[]):
+		cur.execute(command, args)
+		return cur.fetchall()
 
 	@with_conn
-	def execute_insert(self, command, args=[]):
+	def execute_insert(self, conn, cur, command, args=[]):
 		"""Execute INSERT and return last inserted id."""
-		self.cur.execute(command, args)
-		self.conn.commit()
-		return self.cur.lastrowid
+		cur.execute(command, args)
+		conn.commit()
+		return cur.lastrowid
 
 
 class SQLUtils(SQL):
@@ -300,107 +252,19 @@ class SQLUtils(SQL):
 		
 		# Common SQL query fragments for optimization
 		# Note: path is deprecated in DB; use category_id/subcategory_id/file_name. Keep legacy path for fallback.
-		self._FILE_SELECT_FIELDS_CORE = "id, display_name, file_name as real_name, owner, description, created_at as date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists"
+		# Viewer names come from the normalized file_view table and are loaded for the
+		# rendered page only (file_apply_view_flags); legacy file.viewed is no longer written
+		self._FILE_SELECT_FIELDS_CORE = "id, display_name, file_name as real_name, owner, description, created_at as date, ready, NULL AS viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists, preview_version"
 		self._USER_SELECT_FIELDS = "id, login, name, password, gid, enabled, permission"
 		self._GROUP_SELECT_FIELDS = "id, name, description"
 		self._CATEGORY_SELECT_FIELDS = "id, display_name, folder_name, display_order, enabled"
 		self._SUBCATEGORY_SELECT_FIELDS = "id, category_id, display_name, folder_name, display_order, enabled, user_view_own, user_view_group, user_view_all, user_edit_own, user_edit_group, user_edit_all, user_delete_own, user_delete_group, user_delete_all, group_view_own, group_view_group, group_view_all, group_edit_own, group_edit_group, group_edit_all, group_delete_own, group_delete_group, group_delete_all, user_upload, group_upload"
 
-		# Ensure push subscriptions table exists with required columns and indexes
-		try:
-			prefix = self.config['db']['prefix']
-			dbname = self.config['db']['name']
-			self.execute_non_query(f"""
-				CREATE TABLE IF NOT EXISTS {prefix}_push_sub (
-	id INTEGER UNIQUE AUTO_INCREMENT,
-					user_id INT NOT NULL,
-					endpoint TEXT NOT NULL,
-					p256dh TEXT NOT NULL,
-					auth TEXT NOT NULL,
-					user_agent TEXT DEFAULT '',
-					last_success_at DATETIME NULL,
-					last_error_at DATETIME NULL,
-					last_checked_at DATETIME NULL,
-					error_code VARCHAR(32) DEFAULT NULL,
-					invalidated_at DATETIME NULL,
-					created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-					updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-	PRIMARY KEY(id)
-				);
-			""")
-			# Lower lock wait timeouts to avoid startup hangs when DDL locks are present
-			try:
-				self.execute_non_query("SET SESSION lock_wait_timeout = 3;")
-			except Exception:
-				pass
-			try:
-				self.execute_non_query("SET SESSION innodb_lock_wait_timeout = 3;")
-			except Exception:
-				pass
-			# Add indexes and columns if missing (best-effort)
-			try:
-				self.execute_non_query(f"CREATE UNIQUE INDEX ux_{prefix}_push_sub_endpoint ON {prefix}_push_sub (endpoint(255));")
-			except Exception:
-				pass
-			try:
-				self.execute_non_query(f"CREATE INDEX ix_{prefix}_push_sub_user ON {prefix}_push_sub (user_id);")
-			except Exception:
-				pass
-			# Columns that might be missing in older installs (check via INFORMATION_SCHEMA)
-			for col, ddl in [
-				('user_agent', f"ALTER TABLE {prefix}_push_sub ADD COLUMN IF NOT EXISTS user_agent TEXT DEFAULT ''"),
-				('last_success_at', f"ALTER TABLE {prefix}_push_sub ADD COLUMN IF NOT EXISTS last_success_at DATETIME NULL"),
-				('last_error_at', f"ALTER TABLE {prefix}_push_sub ADD COLUMN IF NOT EXISTS last_error_at DATETIME NULL"),
-				('last_checked_at', f"ALTER TABLE {prefix}_push_sub ADD COLUMN IF NOT EXISTS last_checked_at DATETIME NULL"),
-				('error_code', f"ALTER TABLE {prefix}_push_sub ADD COLUMN IF NOT EXISTS error_code VARCHAR(32) NULL"),
-				('invalidated_at', f"ALTER TABLE {prefix}_push_sub ADD COLUMN IF NOT EXISTS invalidated_at DATETIME NULL"),
-			]:
-				try:
-					exists = self.execute_scalar(
-						"""
-						SELECT COUNT(1) FROM INFORMATION_SCHEMA.COLUMNS
-						WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s
-						LIMIT 1;
-						""",
-						[dbname, f"{prefix}_push_sub", col]
-					)
-					if not exists or int(exists[0]) == 0:
-						try:
-							self.execute_non_query(ddl)
-						except Exception:
-							# Fallback for servers without IF NOT EXISTS support
-							try:
-								self.execute_non_query(ddl.replace(" IF NOT EXISTS", ""))
-							except Exception:
-								pass
-				except Exception:
-					pass
-			# Ensure new subcategory upload flags exist
-			try:
-				for col, ddl in [
-					('user_upload', f"ALTER TABLE {prefix}_file_subcategory ADD COLUMN IF NOT EXISTS user_upload TINYINT(1) NOT NULL DEFAULT 0"),
-					('group_upload', f"ALTER TABLE {prefix}_file_subcategory ADD COLUMN IF NOT EXISTS group_upload TINYINT(1) NOT NULL DEFAULT 0"),
-				]:
-					try:
-						exists = self.execute_scalar(
-							"""
-							SELECT COUNT(1) FROM INFORMATION_SCHEMA.COLUMNS
-							WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s
-							LIMIT 1;
-							""",
-							[dbname, f"{prefix}_file_subcategory", col]
-						)
-						if not exists or int(exists[0]) == 0:
-							try:
-								self.execute_non_query(ddl)
-							except Exception:
-								self.execute_non_query(ddl.replace(" IF NOT EXISTS", ""))
-					except Exception:
-						pass
-			except Exception:
-				pass
-		except Exception:
-			pass
+		# Optional StoragePathResolver attached by the app (see modules/storage_paths.py)
+		self.storage_paths = None
+
+		# Apply pending schema migrations (once per process, serialized across workers)
+		run_migrations(self.config)
 
 	def permission_length(self):
 		"""Get the length of permission string from first user.
@@ -452,66 +316,6 @@ class SQLUtils(SQL):
 		return self.execute_scalar(f"SELECT name FROM {self.config['db']['prefix']}_group WHERE id = %s;", args)[0]
 
 	# --- Internal helpers for files ---
-	def _ensure_files_new_columns(self):
-		try:
-			prefix = self.config['db']['prefix']
-			dbname = self.config['db']['name']
-			# Add new columns if missing
-			for col, ddl in [
-				('category_id', f"ALTER TABLE {prefix}_file ADD COLUMN IF NOT EXISTS category_id INT NULL"),
-				('subcategory_id', f"ALTER TABLE {prefix}_file ADD COLUMN IF NOT EXISTS subcategory_id INT NULL"),
-				('file_name', f"ALTER TABLE {prefix}_file ADD COLUMN IF NOT EXISTS file_name VARCHAR(255) NULL")
-			]:
-				try:
-					exists = self.execute_scalar(
-						"""
-						SELECT COUNT(1) FROM INFORMATION_SCHEMA.COLUMNS
-						WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s
-						LIMIT 1;
-						""",
-						[dbname, f"{prefix}_file", col]
-					)
-					if not exists or int(exists[0]) == 0:
-						try:
-							self.execute_non_query(ddl)
-						except Exception:
-							self.execute_non_query(ddl.replace(" IF NOT EXISTS", ""))
-				except Exception:
-					pass
-			# Indexes for fast lookups
-			try:
-				self.execute_non_query(f"CREATE INDEX ix_{prefix}_file_cat_sub ON {prefix}_file (category_id, subcategory_id);")
-			except Exception:
-				pass
-			try:
-				self.execute_non_query(f"CREATE INDEX ix_{prefix}_file_fname ON {prefix}_file (file_name);")
-			except Exception:
-				pass
-			# Backfill legacy rows into new columns (best-effort)
-			try:
-				rows = self.execute_query(
-					f"SELECT id, category_id, subcategory_id, file_name FROM {prefix}_file WHERE (category_id IS NULL OR subcategory_id IS NULL OR file_name IS NULL);"
-				)
-				for r in rows or []:
-					fid, cat_id, sub_id, fname = r
-					# compute file_name
-					fname_new = fname or 'unknown'
-					# Set default values for missing fields
-					new_cat_id = cat_id or 1  # Default to first category
-					new_sub_id = sub_id or 1  # Default to first subcategory
-					# Apply update when we have something to set
-					try:
-						self.execute_non_query(
-							f"UPDATE {prefix}_file SET category_id = COALESCE(%s, category_id), subcategory_id = COALESCE(%s, subcategory_id), file_name = COALESCE(%s, file_name) WHERE id = %s;",
-							[new_cat_id, new_sub_id, fname_new, fid]
-						)
-					except Exception:
-						pass
-			except Exception:
-				pass
-		except Exception:
-			pass
-
 	def _get_category_folder_by_id(self, category_id: int) -> str:
 		row = self.execute_scalar(
 			f"SELECT folder_name FROM {self.config['db']['prefix']}_file_category WHERE id = %s LIMIT 1;",
@@ -527,6 +331,13 @@ class SQLUtils(SQL):
 		return row[0] if row else ''
 
 	def _build_storage_dir(self, category_id: int, subcategory_id: int) -> str:
+		# In-memory id->folder maps when the app has attached a resolver (no queries)
+		resolver = getattr(self, 'storage_paths', None)
+		if resolver is not None:
+			try:
+				return resolver.storage_dir(category_id, subcategory_id)
+			except Exception:
+				pass
 		try:
 			base = self.config['files']['root']
 			cat_folder = self._get_category_folder_by_id(category_id)
@@ -578,7 +389,6 @@ class SQLUtils(SQL):
 		Returns:
 			File object or None if not found
 		"""
-		self._ensure_files_new_columns()
 		from classes.file import File
 		row = self.execute_scalar(
 			f"SELECT {self._FILE_SELECT_FIELDS_CORE} FROM {self.config['db']['prefix']}_file WHERE id = %s;",
@@ -587,15 +397,14 @@ class SQLUtils(SQL):
 		if not row:
 			return None
 		(
-			fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists
+			fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists, preview_version
 		) = row
-		return File(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists)
+		return File(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists, preview_version)
 
 	def file_by_path(self, args):
 		"""Backward-compatible: resolve by absolute directory path, then fetch by category/subcategory.
 		Args: [abs_dir_path]
 		"""
-		self._ensure_files_new_columns()
 		try:
 			abs_dir = args[0]
 			parts = os.path.normpath(abs_dir).split(os.sep)
@@ -613,8 +422,8 @@ class SQLUtils(SQL):
 			from classes.file import File
 			files = []
 			for r in rows or []:
-				(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists) = r
-				files.append(File(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists))
+				(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists, preview_version) = r
+				files.append(File(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists, preview_version))
 			return files
 		except Exception:
 			return []
@@ -624,7 +433,6 @@ class SQLUtils(SQL):
 		Args: [category_id, subcategory_id]
 		Returns: list[File]
 		"""
-		self._ensure_files_new_columns()
 		try:
 			cat_id, sub_id = int(args[0]), int(args[1])
 		except Exception:
@@ -636,8 +444,173 @@ class SQLUtils(SQL):
 		from classes.file import File
 		files = []
 		for r in rows or []:
-			(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists) = r
-			files.append(File(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists))
+			(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists, preview_version) = r
+			files.append(File(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists, preview_version))
+		return files
+
+	def _file_unseen_sql(self) -> str:
+		"""Condition: file not viewed by user ``%s`` (primary key lookup in file_view)."""
+		prefix = self.config['db']['prefix']
+		return f"NOT EXISTS (SELECT 1 FROM {prefix}_file_view fv WHERE fv.file_id = {prefix}_file.id AND fv.user_id = %s)"
+
+	def file_page_by_category_and_subcategory(self, category_id, subcategory_id, limit: int = 15, offset: int = 0, before=None, unseen_for=None):
+		"""Fetch one page of files (newest first) using SQL ORDER BY/LIMIT.
+
+		Args:
+			category_id: Category ID
+			subcategory_id: Subcategory ID
+			limit: Page size
+			offset: Rows to skip (ignored when ``before`` is given)
+			before: Optional keyset cursor ``(created_at, id)`` of the last row of the previous page
+			unseen_for: Optional user ID; only files not yet viewed by this user are returned
+
+		Returns:
+			list[File]
+		"""
+		try:
+			cat_id, sub_id = int(category_id), int(subcategory_id)
+			limit = max(1, int(limit))
+			offset = max(0, int(offset))
+		except Exception:
+			return []
+		prefix = self.config['db']['prefix']
+		where = "category_id = %s AND subcategory_id = %s"
+		args = [cat_id, sub_id]
+		if unseen_for:
+			where += f" AND {self._file_unseen_sql()}"
+			args.append(int(unseen_for))
+		if before:
+			rows = self.execute_query(
+				f"SELECT {self._FILE_SELECT_FIELDS_CORE} FROM {prefix}_file WHERE {where} AND (created_at < %s OR (created_at = %s AND id < %s)) ORDER BY created_at DESC, id DESC LIMIT %s;",
+				args + [before[0], before[0], int(before[1]), limit]
+			)
+		else:
+			rows = self.execute_query(
+				f"SELECT {self._FILE_SELECT_FIELDS_CORE} FROM {prefix}_file WHERE {where} ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s;",
+				args + [limit, offset]
+			)
+		return self._files_from_rows(rows)
+
+	def file_count_by_category_and_subcategory(self, category_id, subcategory_id, unseen_for=None) -> int:
+		"""Count files in a subcategory (served by the category/subcategory index).
+
+		With ``unseen_for`` only files not yet viewed by that user are counted.
+		"""
+		try:
+			where = "category_id = %s AND subcategory_id = %s"
+			args = [int(category_id), int(subcategory_id)]
+			if unseen_for:
+				where += f" AND {self._file_unseen_sql()}"
+				args.append(int(unseen_for))
+			row = self.execute_scalar(
+				f"SELECT COUNT(*) FROM {self.config['db']['prefix']}_file WHERE {where};",
+				args
+			)
+			return int(row[0]) if row else 0
+		except Exception:
+			return 0
+
+	def _file_search_against(self, query: str) -> str:
+		"""Build a BOOLEAN MODE expression: every whitespace token must match as a phrase."""
+		terms = []
+		for tok in (query or '').split():
+			tok = tok.replace('"', ' ').strip()
+			if tok:
+				terms.append(f'+"{tok}"')
+		return ' '.join(terms)
+
+	def file_search_page(self, category_id, subcategory_id, query: str, limit: int = 30, offset: int = 0, order: str = 'relevance'):
+		"""Search files of one subcategory in MySQL and return a single page.
+
+		Uses the ngram FULLTEXT index over display_name, file_name, description,
+		note and owner. Tokens that look like a date or time (digits with
+		``-``, ``:``, ``.``) may match created_at instead, as in the LIKE path.
+		Queries too short for the ngram tokenizer (or servers without the
+		index) fall back to a LIKE scan bounded by the category/subcategory
+		index.
+
+		Args:
+			category_id: Category ID
+			subcategory_id: Subcategory ID
+			query: User search string
+			limit: Page size
+			offset: Rows to skip
+			order: 'relevance' (default) or 'date' (newest first)
+
+		Returns:
+			tuple[list[File], int]: files of the page and total match count
+		"""
+		try:
+			cat_id, sub_id = int(category_id), int(subcategory_id)
+			limit = max(1, int(limit))
+			offset = max(0, int(offset))
+		except Exception:
+			return [], 0
+		query = (query or '').strip()
+		if not query:
+			return (self.file_page_by_category_and_subcategory(cat_id, sub_id, limit=limit, offset=offset),
+					self.file_count_by_category_and_subcategory(cat_id, sub_id))
+		if getattr(self, '_file_fulltext_ok', True) and all(len(t) >= 2 for t in query.split()):
+			prefix = self.config['db']['prefix']
+			against = self._file_search_against(query)
+			match = "MATCH(display_name, file_name, description, note, owner) AGAINST (%s IN BOOLEAN MODE)"
+			order_sql = "created_at DESC, id DESC" if order == 'date' else "score DESC, created_at DESC, id DESC"
+			# Plain words share one MATCH (index-driven); date-like tokens may hit created_at instead
+			tokens = query.split()
+			dates = [t for t in tokens if re.match(r'^\d[\d\-:.]*$', t)]
+			words = [t for t in tokens if t not in dates]
+			cond_sql, cond_args = [], []
+			if words:
+				cond_sql.append(match)
+				cond_args.append(self._file_search_against(' '.join(words)))
+			for tok in dates:
+				cond_sql.append(f"({match} OR DATE_FORMAT(created_at, %s) LIKE %s)")
+				cond_args.extend([self._file_search_against(tok), '%Y-%m-%d %H:%i', '%' + tok + '%'])
+			where = "category_id = %s AND subcategory_id = %s AND " + " AND ".join(cond_sql)
+			try:
+				total_row = self.execute_scalar(
+					f"SELECT COUNT(*) FROM {prefix}_file WHERE {where};",
+					[cat_id, sub_id] + cond_args
+				)
+				rows = self.execute_query(
+					f"SELECT {self._FILE_SELECT_FIELDS_CORE}, {match} AS score FROM {prefix}_file WHERE {where} ORDER BY {order_sql} LIMIT %s OFFSET %s;",
+					[against, cat_id, sub_id] + cond_args + [limit, offset]
+				)
+				return self._files_from_rows([r[:-1] for r in rows or []]), (int(total_row[0]) if total_row else 0)
+			except Exception as e:
+				# No FULLTEXT index on this server: remember it; either way answer via the LIKE path
+				if getattr(e, 'errno', None) == 1191 or 'FULLTEXT' in str(e).upper():
+					self._file_fulltext_ok = False
+				_log.warning(f"Fulltext file search failed, using LIKE fallback: {e}")
+		return self._file_search_like(cat_id, sub_id, query, limit, offset)
+
+	def _file_search_like(self, cat_id: int, sub_id: int, query: str, limit: int, offset: int):
+		"""LIKE-based search limited to one subcategory (newest first)."""
+		like_sql = []
+		like_args = []
+		for tok in query.split():
+			pattern = '%' + tok.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+			like_sql.append("(display_name LIKE %s OR file_name LIKE %s OR description LIKE %s OR note LIKE %s OR owner LIKE %s OR DATE_FORMAT(created_at, %s) LIKE %s)")
+			like_args.extend([pattern] * 5 + ['%Y-%m-%d %H:%i', pattern])
+		where = "category_id = %s AND subcategory_id = %s AND " + " AND ".join(like_sql)
+		prefix = self.config['db']['prefix']
+		total_row = self.execute_scalar(
+			f"SELECT COUNT(*) FROM {prefix}_file WHERE {where};",
+			[cat_id, sub_id] + like_args
+		)
+		rows = self.execute_query(
+			f"SELECT {self._FILE_SELECT_FIELDS_CORE} FROM {prefix}_file WHERE {where} ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s;",
+			[cat_id, sub_id] + like_args + [limit, offset]
+		)
+		return self._files_from_rows(rows), (int(total_row[0]) if total_row else 0)
+
+	def _files_from_rows(self, rows):
+		"""Map rows selected with _FILE_SELECT_FIELDS_CORE to File objects."""
+		from classes.file import File
+		files = []
+		for r in rows or []:
+			(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists, preview_version) = r
+			files.append(File(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists, preview_version))
 		return files
 
 	def file_all(self):
@@ -646,13 +619,12 @@ class SQLUtils(SQL):
 		Returns:
 			List of File objects or None if no files found
 		"""
-		self._ensure_files_new_columns()
 		rows = self.execute_query(f"SELECT {self._FILE_SELECT_FIELDS_CORE} FROM {self.config['db']['prefix']}_file;")
 		from classes.file import File
 		result = []
 		for r in rows or []:
-			(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists) = r
-			result.append(File(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists))
+			(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists, preview_version) = r
+			result.append(File(fid, display_name, file_name, owner, description, date, ready, viewed, note, length_seconds, size_mb, order_id, category_id, subcategory_id, file_exists, preview_version))
 		return result
 
 	def file_add(self, args):
@@ -688,7 +660,6 @@ class SQLUtils(SQL):
 		New schema columns: display_name, file_name, category_id, subcategory_id, owner, description,
 							created_at, ready, length_seconds, size_mb, order_id, file_exists
 		"""
-		self._ensure_files_new_columns()
 		display_name = args[0]
 		file_name = args[1]
 		category_id = int(args[2] or 0)
@@ -700,8 +671,6 @@ class SQLUtils(SQL):
 		length_seconds = args[8]
 		size_mb = args[9]
 		order_id = args[10] if len(args) > 10 else None
-		# Build absolute storage directory
-		path_dir = self._build_storage_dir(category_id, subcategory_id)
 		values = [
 			display_name,
 			file_name,   # file_name
@@ -737,6 +706,14 @@ class SQLUtils(SQL):
 		"""Update file metadata. Args: [length_seconds, size_mb, id]"""
 		self.execute_non_query(f"UPDATE {self.config['db']['prefix']}_file SET length_seconds = %s, size_mb = %s WHERE id = %s;", args)
 	
+	def file_set_conversion_mode(self, file_id, mode):
+		"""Record the media pipeline used for a file (remux | audio | encode)."""
+		self.execute_non_query(f"UPDATE {self.config['db']['prefix']}_file SET conversion_mode = %s WHERE id = %s;", [mode, int(file_id)])
+
+	def file_set_preview_version(self, file_id, version):
+		"""Store the version of a file's poster/sprite (None when it has no previews)."""
+		self.execute_non_query(f"UPDATE {self.config['db']['prefix']}_file SET preview_version = %s WHERE id = %s;", [version, int(file_id)])
+
 	def file_ready(self, args):
 		"""Mark files as ready. Args: [id1, id2, ...]"""
 		if not args:
@@ -752,9 +729,61 @@ class SQLUtils(SQL):
 		"""Update file_exists status. Args: file_id, exists"""
 		self.execute_non_query(f"UPDATE {self.config['db']['prefix']}_file SET file_exists = %s WHERE id = %s;", [exists, file_id])
 
-	def file_view(self, args):
-		"""Mark file as viewed. Args: [viewed, id]"""
-		self.execute_non_query(f"UPDATE {self.config['db']['prefix']}_file SET viewed = %s WHERE id = %s;", args)
+	def file_set_exists_bulk(self, file_ids, exists) -> None:
+		"""Set file_exists for many rows at once. Args: file_ids (list[int]), exists (bool)"""
+		ids = [int(i) for i in (file_ids or [])]
+		if not ids:
+			return
+		placeholders = ', '.join(['%s'] * len(ids))
+		self.execute_non_query(
+			f"UPDATE {self.config['db']['prefix']}_file SET file_exists = %s WHERE id IN ({placeholders});",
+			[1 if exists else 0] + ids
+		)
+
+	def file_locations_all(self):
+		"""Fetch (id, category folder, subcategory folder, file_name, file_exists) for every file in one query."""
+		prefix = self.config['db']['prefix']
+		return self.execute_query(
+			f"""SELECT f.id, c.folder_name, s.folder_name, f.file_name, f.file_exists
+			FROM {prefix}_file f
+			LEFT JOIN {prefix}_file_category c ON c.id = f.category_id
+			LEFT JOIN {prefix}_file_subcategory s ON s.id = f.subcategory_id;"""
+		) or []
+
+	def file_mark_viewed(self, file_id, user_id):
+		"""Record that a user viewed a file (idempotent, no read-modify-write)."""
+		self.execute_non_query(
+			f"INSERT IGNORE INTO {self.config['db']['prefix']}_file_view (file_id, user_id) VALUES (%s, %s);",
+			[int(file_id), int(user_id)]
+		)
+
+	def file_apply_view_flags(self, files, user_id):
+		"""Set ``viewed_by_me``, ``viewer_count`` and ``viewed`` (viewer names) with a single indexed query.
+
+		Args:
+			files: list[File] (typically one listing page)
+			user_id: Current user ID
+		"""
+		ids = [int(f.id) for f in files or []]
+		if not ids:
+			return files
+		counts = {}
+		try:
+			prefix = self.config['db']['prefix']
+			marks = ', '.join(['%s'] * len(ids))
+			rows = self.execute_query(
+				f"""SELECT fv.file_id, COUNT(*), SUM(fv.user_id = %s),
+					GROUP_CONCAT(u.name ORDER BY fv.viewed_at, fv.user_id SEPARATOR ', ')
+				FROM {prefix}_file_view fv JOIN {prefix}_user u ON u.id = fv.user_id
+				WHERE fv.file_id IN ({marks}) GROUP BY fv.file_id;""",
+				[int(user_id or 0)] + ids
+			)
+			counts = {int(r[0]): (int(r[1] or 0), bool(int(r[2] or 0)), r[3]) for r in rows or []}
+		except Exception as e:
+			_log.warning(f"Failed to load view flags: {e}")
+		for f in files:
+			f.viewer_count, f.viewed_by_me, f.viewed = counts.get(int(f.id), (0, False, None))
+		return files
 
 	def file_note(self, args):
 		"""Update file note. Args: [note, id]"""
@@ -1070,48 +1099,9 @@ class SQLUtils(SQL):
 			raise
 
 	def _create_redis_client_for_logging(self):
-		"""Create a temporary Redis client for logging synchronization using config settings."""
+		"""Shared Redis client for logging synchronization using config settings."""
 		try:
-			redis_config = {}
-			# Try dict-style access first
-			try:
-				redis_config = self.config['redis']
-			except Exception:
-				# Fallback to ConfigParser-style access
-				try:
-					redis_config = {
-						'server': self.config.get('redis', 'server', fallback=None),
-						'port': self.config.get('redis', 'port', fallback=6379),
-						'password': self.config.get('redis', 'password', fallback=None),
-						'socket': self.config.get('redis', 'socket', fallback=None),
-						'db': self.config.get('redis', 'db', fallback=0)
-					}
-					# Convert port to int
-					try:
-						redis_config['port'] = int(redis_config['port'])
-					except (ValueError, TypeError):
-						redis_config['port'] = 6379
-				except Exception:
-					redis_config = {}
-			
-			# Create Redis client using the same logic as RedisClient
-			if redis_config.get('socket'):
-				if redis_config.get('password'):
-					url = f"unix://:{redis_config['password']}@{redis_config['socket']}?db={redis_config.get('db', 0)}"
-				else:
-					url = f"unix://{redis_config['socket']}?db={redis_config.get('db', 0)}"
-			else:
-				host = redis_config.get('server', 'localhost')
-				port = redis_config.get('port', 6379)
-				password = redis_config.get('password')
-				db = redis_config.get('db', 0)
-				
-				if password:
-					url = f"redis://:{password}@{host}:{port}/{db}"
-				else:
-					url = f"redis://{host}:{port}/{db}"
-			
-			return redis.from_url(url, decode_responses=True, socket_connect_timeout=5, socket_timeout=5)
+			return shared_redis(redis_config_from(self.config))
 		except Exception:
 			return None
 
@@ -1124,52 +1114,9 @@ class SQLUtils(SQL):
 
 	@staticmethod
 	def _create_redis_client_for_logging_static():
-		"""Create a temporary Redis client for logging synchronization using config settings (static method)."""
+		"""Shared Redis client for logging synchronization using config settings (static method)."""
 		try:
-			# Import here to avoid circular imports
-			from modules.core import Config
-			temp_config = Config()
-			redis_config = {}
-			
-			# Try dict-style access first
-			try:
-				redis_config = temp_config.config['redis']
-			except Exception:
-				# Fallback to ConfigParser-style access
-				try:
-					redis_config = {
-						'server': temp_config.config.get('redis', 'server', fallback=None),
-						'port': temp_config.config.get('redis', 'port', fallback=6379),
-						'password': temp_config.config.get('redis', 'password', fallback=None),
-						'socket': temp_config.config.get('redis', 'socket', fallback=None),
-						'db': temp_config.config.get('redis', 'db', fallback=0)
-					}
-					# Convert port to int
-					try:
-						redis_config['port'] = int(redis_config['port'])
-					except (ValueError, TypeError):
-						redis_config['port'] = 6379
-				except Exception:
-					redis_config = {}
-			
-			# Create Redis client using the same logic as RedisClient
-			if redis_config.get('socket'):
-				if redis_config.get('password'):
-					url = f"unix://:{redis_config['password']}@{redis_config['socket']}?db={redis_config.get('db', 0)}"
-				else:
-					url = f"unix://{redis_config['socket']}?db={redis_config.get('db', 0)}"
-			else:
-				host = redis_config.get('server', 'localhost')
-				port = redis_config.get('port', 6379)
-				password = redis_config.get('password')
-				db = redis_config.get('db', 0)
-				
-				if password:
-					url = f"redis://:{password}@{host}:{port}/{db}"
-				else:
-					url = f"redis://{host}:{port}/{db}"
-			
-			return redis.from_url(url, decode_responses=True, socket_connect_timeout=5, socket_timeout=5)
+			return shared_redis(redis_config_from(Config().config))
 		except Exception:
 			return None
 
@@ -1473,6 +1420,33 @@ class SQLUtils(SQL):
 		data = self.execute_query(f"SELECT {self._CATEGORY_SELECT_FIELDS} FROM {self.config['db']['prefix']}_file_category ORDER BY display_order, id;")
 		return [Category(*d) for d in data] if data else []
 
+	def category_tree_rows(self):
+		"""Load all categories with their subcategories in one joined query.
+
+		Returns:
+			tuple[list[Category], list[Subcategory]]: ordered by display_order, id
+		"""
+		prefix = self.config['db']['prefix']
+		cat_fields = ', '.join(f"c.{f.strip()}" for f in self._CATEGORY_SELECT_FIELDS.split(','))
+		sub_fields = ', '.join(f"s.{f.strip()}" for f in self._SUBCATEGORY_SELECT_FIELDS.split(','))
+		ncat = len(self._CATEGORY_SELECT_FIELDS.split(','))
+		rows = self.execute_query(
+			f"""SELECT {cat_fields}, {sub_fields}
+			FROM {prefix}_file_category c
+			LEFT JOIN {prefix}_file_subcategory s ON s.category_id = c.id
+			ORDER BY c.display_order, c.id, s.display_order, s.id;"""
+		) or []
+		categories = []
+		subcategories = []
+		seen = set()
+		for r in rows:
+			if r[0] not in seen:
+				seen.add(r[0])
+				categories.append(Category(*r[:ncat]))
+			if r[ncat] is not None:
+				subcategories.append(Subcategory(*r[ncat:]))
+		return categories, subcategories
+
 	def category_by_id(self, args):
 		"""Get category by ID."""
 		data = self.execute_scalar(f"SELECT {self._CATEGORY_SELECT_FIELDS} FROM {self.config['db']['prefix']}_file_category WHERE id = %s;", args)
@@ -0,0 +1,185 @@
+"""
+Shared in-process cache of the category/subcategory tree.
+
+The tree is loaded with a single joined query and kept per process. A version
+stamp in Redis is bumped on every category/subcategory mutation, so all
+workers reload on their next access after a change.
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from modules.logging import get_logger
+
+_log = get_logger(__name__)
+
+
+class CategoryTree:
+    """Cached category tree with Redis version-stamp invalidation."""
+
+    VERSION_KEY = 'znf:category_tree:version'
+
+    def __init__(self, sql_utils, redis_client=None, check_interval: float = 1.0):
+        """
+        Args:
+            sql_utils: SQLUtils (category_tree_rows)
+            redis_client: Optional RedisClient for cross-worker invalidation
+            check_interval: Minimal seconds between Redis version checks
+        """
+        self._sql = sql_utils
+        self.redis = redis_client
+        self.check_interval = float(check_interval)
+        self._lock = threading.Lock()
+        self._loaded_version: Optional[str] = None
+        self._checked_at = 0.0
+        self._categories: List[Any] = []
+        self._subs_by_category: Dict[int, List[Any]] = {}
+        self._dirs: List[Dict[str, str]] = []
+        self._loaded = False
+        # Incremented on every reload so dependants (e.g. StoragePathResolver) can rebuild
+        self.generation = 0
+
+    def _remote_version(self) -> str:
+        if not self.redis:
+            return '0'
+        try:
+            return str(self.redis.client.get(self.VERSION_KEY) or '0')
+        except Exception:
+            return self._loaded_version or '0'
+
+    def _load(self, version: str) -> None:
+        categories, subcategories = self._sql.category_tree_rows()
+        subs_by_category: Dict[int, List[Any]] = {}
+        for sub in subcategories:
+            subs_by_category.setdefault(int(sub.category_id), []).append(sub)
+        self._categories = categories
+        self._subs_by_category = subs_by_category
+        self._dirs = self._build_dirs(categories, subs_by_category)
+        self._loaded_version = version
+        self._loaded = True
+        self.generation += 1
+
+    @staticmethod
+    def _build_dirs(categories, subs_by_category) -> List[Dict[str, str]]:
+        """Files-view tree: enabled categories (except 'registrators') with enabled subcategories."""
+        dirs: List[Dict[str, str]] = []
+        for cat in categories:
+            try:
+                if int(getattr(cat, 'enabled', 1)) != 1:
+                    continue
+                if (getattr(cat, 'folder_name', '') or '').strip().lower() == 'registrators':
+                    continue
+                enabled_subs = [
+                    s for s in subs_by_category.get(int(cat.id), [])
+                    if int(getattr(s, 'enabled', 1)) == 1
+                ]
+                if not enabled_subs:
+                    continue
+                entry = {cat.folder_name: cat.display_name}
+                for sub in enabled_subs:
+                    key = sub.folder_name
+                    # Avoid key collision when sub folder equals category folder
+                    if str(key) == str(cat.folder_name):
+                        key = f"{sub.folder_name}__dup_{sub.id}"
+                    entry[key] = sub.display_name
+                dirs.append(entry)
+            except Exception:
+                continue
+        return dirs
+
+    def _ensure_fresh(self) -> None:
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded and now - self._checked_at < self.check_interval:
+                return
+            version = self._remote_version()
+            if not self._loaded or version != self._loaded_version:
+                try:
+                    self._load(version)
+                except Exception as e:
+                    _log.warning(f"Failed to load category tree: {e}")
+                    if not self._loaded:
+                        raise
+            self._checked_at = now
+
+    def invalidate(self) -> None:
+        """Drop local copy and bump the shared version so every worker reloads."""
+        with self._lock:
+            self._loaded = False
+            self._checked_at = 0.0
+        if self.redis:
+            try:
+                self.redis.client.incr(self.VERSION_KEY)
+            except Exception as e:
+                _log.warning(f"Failed to bump category tree version: {e}")
+
+    def reload(self) -> None:
+        """Force a local reload on next access (without bumping the shared version)."""
+        with self._lock:
+            self._loaded = False
+            self._checked_at = 0.0
+
+    def current_generation(self) -> int:
+        """Refresh if needed and return the generation of the loaded tree."""
+        self._ensure_fresh()
+        return self.generation
+
+    def all_subcategories(self) -> List[Any]:
+        """All subcategories of all categories."""
+        self._ensure_fresh()
+        return [s for subs in self._subs_by_category.values() for s in subs]
+
+    def categories(self) -> List[Any]:
+        """All categories (including disabled), ordered by display_order, id."""
+        self._ensure_fresh()
+        return list(self._categories)
+
+    def subcategories(self, category_id: int) -> List[Any]:
+        """All subcategories of a category, ordered by display_order, id."""
+        self._ensure_fresh()
+        return list(self._subs_by_category.get(int(category_id), []))
+
+    def category_id_by_folder(self, folder_name: str) -> Optional[int]:
+        """In-memory equivalent of SQLUtils.category_id_by_folder."""
+        self._ensure_fresh()
+        for cat in self._categories:
+            if cat.folder_name == folder_name:
+                return int(cat.id)
+        return None
+
+    def subcategory_id_by_folder(self, category_id: int, folder_name: str) -> Optional[int]:
+        """In-memory equivalent of SQLUtils.subcategory_id_by_folder."""
+        self._ensure_fresh()
+        for sub in self._subs_by_category.get(int(category_id or 0), []):
+            if sub.folder_name == folder_name:
+                return int(sub.id)
+        return None
+
+    def folder_enabled(self, category_id: int, subcategory_id: int) -> bool:
+        """True when both the category and the subcategory exist and are enabled."""
+        self._ensure_fresh()
+        cat = next((c for c in self._categories if int(c.id) == int(category_id or 0)), None)
+        if cat is None or int(getattr(cat, 'enabled', 1)) != 1:
+            return False
+        for subs in self._subs_by_category.values():
+            for sub in subs:
+                if int(sub.id) == int(subcategory_id or 0):
+                    return int(getattr(sub, 'enabled', 1)) == 1
+        return False
+
+    def display_names(self, category_id: int, subcategory_id: int) -> Tuple[str, str]:
+        """(category, subcategory) display names; empty strings when unknown."""
+        self._ensure_fresh()
+        cat = next((c for c in self._categories if int(c.id) == int(category_id or 0)), None)
+        sub = next((s for s in self._subs_by_category.get(int(category_id or 0), [])
+                    if int(s.id) == int(subcategory_id or 0)), None)
+        return (cat.display_name if cat else '', sub.display_name if sub else '')
+
+    def dirs(self) -> List[Dict[str, str]]:
+        """Files-view tree as list of {root_key: name, sub_key: name, ...} (copies)."""
+        self._ensure_fresh()
+        return [dict(entry) for entry in self._dirs]
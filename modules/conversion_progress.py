@@ -0,0 +1,171 @@
+"""
+Conversion progress tracking for ffmpeg jobs.
+
+``MediaService`` runs ffmpeg with ``-progress pipe:1`` and feeds the parsed
+``out_time_ms``/``speed`` values here. Updates are throttled and stored in
+Redis (``znf:convert:<file_id>``, shared by web and media workers) and
+emitted as ``files:progress`` to the per-file Socket.IO room ``file:<id>``.
+``/files/progress/<id>`` reads the stored status.
+"""
+
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from modules.logging import get_logger
+
+_log = get_logger(__name__)
+
+PROGRESS_EVENT = 'files:progress'
+
+
+def file_room(file_id: int) -> str:
+    """Socket.IO room of a single file's conversion progress."""
+    return f'file:{int(file_id)}'
+
+
+def parse_progress_block(lines) -> Dict[str, str]:
+    """Parse ``key=value`` lines of one ffmpeg ``-progress`` block."""
+    data: Dict[str, str] = {}
+    for line in lines:
+        key, sep, value = (line or '').strip().partition('=')
+        if sep:
+            data[key] = value.strip()
+    return data
+
+
+def parse_speed(value: Optional[str]) -> Optional[float]:
+    """``'1.52x'`` -> 1.52; None for ``N/A`` or garbage."""
+    try:
+        speed = float((value or '').strip().rstrip('x'))
+        return speed if speed > 0 else None
+    except ValueError:
+        return None
+
+
+def parse_out_time(data: Dict[str, str]) -> Optional[float]:
+    """Encoded position in seconds (``out_time_ms`` is in microseconds)."""
+    for key in ('out_time_us', 'out_time_ms'):
+        try:
+            value = int(data.get(key) or '')
+        except ValueError:
+            continue
+        if value >= 0:
+            return value / 1_000_000.0
+    return None
+
+
+class ConversionProgress:
+    """Throttled progress/ETA publisher backed by Redis and Socket.IO."""
+
+    KEY_PREFIX = 'znf:convert:'
+    LOCAL_LIMIT = 1000
+
+    def __init__(self,
+                 redis_client: Optional[Any] = None,
+                 socketio: Optional[Any] = None,
+                 min_interval: float = 1.0,
+                 ttl: int = 86400) -> None:
+        """
+        Args:
+            redis_client: RedisClient (or redis-py client) for the shared status
+            socketio: Socket.IO server or emitter with ``emit(event, data, namespace, room)``
+            min_interval: Minimal seconds between two published updates per file
+            ttl: Lifetime of a stored status in seconds
+        """
+        self.redis = getattr(redis_client, 'client', redis_client)
+        self.socketio = socketio
+        self.min_interval = max(0.0, float(min_interval))
+        self.ttl = max(60, int(ttl))
+        self._last: Dict[int, float] = {}
+        self._local: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, file_id: int) -> str:
+        return f"{self.KEY_PREFIX}{int(file_id)}"
+
+    def _publish(self, file_id: int, status: Dict[str, Any]) -> None:
+        file_id = int(file_id)
+        status = dict(status, id=file_id, updated_at=time.time())
+        with self._lock:
+            self._local[file_id] = status
+            if len(self._local) > self.LOCAL_LIMIT:
+                # Keep the most recently updated entries only
+                by_age = sorted(self._local,
+                                key=lambda k: self._local[k]['updated_at'])
+                for old_id in by_age[:len(by_age) - self.LOCAL_LIMIT]:
+                    self._local.pop(old_id, None)
+        if self.redis is not None:
+            try:
+                self.redis.set(self._key(file_id), json.dumps(status), ex=self.ttl)
+            except Exception as e:
+                _log.warning(f"Failed to store conversion progress for {file_id}: {e}")
+        if self.socketio is not None:
+            try:
+                self.socketio.emit(PROGRESS_EVENT,
+                                   status,
+                                   namespace='/',
+                                   room=file_room(file_id))
+            except Exception as e:
+                _log.warning(f"Failed to emit conversion progress for {file_id}: {e}")
+
+    def queued(self, file_id: int) -> None:
+        """Record that a conversion was scheduled."""
+        self._publish(file_id, {'state': 'queued'})
+
+    def update(self,
+               file_id: int,
+               out_time: Optional[float],
+               duration: Optional[float],
+               speed: Optional[float],
+               force: bool = False) -> bool:
+        """Publish a running update unless one was sent less than ``min_interval`` ago.
+
+        Returns:
+            bool: True if the update was published
+        """
+        now = time.monotonic()
+        file_id = int(file_id)
+        with self._lock:
+            if not force and now - self._last.get(file_id, 0.0) < self.min_interval:
+                return False
+            self._last[file_id] = now
+        percent = None
+        eta = None
+        if duration and duration > 0 and out_time is not None:
+            percent = round(min(100.0, 100.0 * out_time / duration), 1)
+            if speed:
+                eta = max(0, int(round((duration - out_time) / speed)))
+        self._publish(file_id, {
+            'state': 'running',
+            'out_time': round(out_time, 2) if out_time is not None else None,
+            'duration': duration,
+            'percent': percent,
+            'speed': speed,
+            'eta': eta,
+        })
+        return True
+
+    def finish(self, file_id: int, ok: bool, error: Optional[str] = None) -> None:
+        """Publish the final state of a conversion attempt."""
+        with self._lock:
+            self._last.pop(int(file_id), None)
+        self._publish(file_id, {
+            'state': 'done' if ok else 'failed',
+            'percent': 100.0 if ok else None,
+            'error': error,
+        })
+
+    def get(self, file_id: int) -> Optional[Dict[str, Any]]:
+        """Last known status of a file's conversion (Redis first, then process-local)."""
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(self._key(file_id))
+                if raw:
+                    return json.loads(raw)
+            except Exception as e:
+                _log.warning(f"Failed to read conversion progress for {file_id}: {e}")
+        with self._lock:
+            status = self._local.get(int(file_id))
+        return dict(status) if status else None
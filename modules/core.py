@@ -5,8 +5,8 @@ Loads INI configuration with environment variable overrides.
 
 from configparser import ConfigParser
 from os import getenv
-import redis
 from .logging import get_logger
+from .redis_client import redis_config_from, shared_redis
 
 _log = get_logger(__name__)
 
@@ -38,13 +38,12 @@ class Config:
 
 	def _log_config_once(self, cfg_path: str) -> None:
 		"""Log config loading only once across all workers using Redis."""
-		redis_client = redis.Redis(
-			unix_socket_path='/var/run/redis/redis.sock',
-			password='znf25!',
-			db=0
-		)
-		# Use Redis SET with NX (only if not exists) and EX (expire in 20 seconds)
-		if redis_client.set('config_loaded_logged', '1', nx=True, ex=20):
+		try:
+			redis_client = shared_redis(redis_config_from(self.config))
+			# Use Redis SET with NX (only if not exists) and EX (expire in 20 seconds)
+			if redis_client.set('config_loaded_logged', '1', nx=True, ex=20):
+				_log.info(f"Configuration loaded from {cfg_path}")
+		except Exception:
 			_log.info(f"Configuration loaded from {cfg_path}")
 
 	def _apply_env_overrides(self) -> None:
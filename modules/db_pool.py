@@ -0,0 +1,252 @@
+"""
+Fair, instrumented MySQL connection pool.
+
+Replaces ``MySQLConnectionPool`` + sleep/retry polling in ``SQL.with_conn``:
+
+- waiters block on their own event with a deadline instead of polling;
+- released connections are handed directly to the oldest waiter (FIFO);
+- the connection is bound to the calling greenlet/thread, so nested calls in
+  the same greenlet reuse it instead of taking a second one (and nothing is
+  stored on the shared SQL instance);
+- connections are pinged only after being idle for a while;
+- wait/checkout timings are kept for ``/api/pool-status``.
+
+``threading`` primitives are used on purpose: under gunicorn gevent workers
+they are monkey-patched to their greenlet-aware equivalents.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+from mysql.connector import errors as mysql_errors
+
+from modules.logging import get_logger
+
+_log = get_logger(__name__)
+
+# Errors after which a connection must not go back to the pool
+_BROKEN_ERRORS = (mysql_errors.OperationalError, mysql_errors.InterfaceError)
+
+
+class _Waiter:
+    __slots__ = ('event', 'conn')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.conn = None
+
+
+class ConnectionPool:
+    """Bounded connection pool with FIFO hand-off and per-greenlet checkout."""
+
+    def __init__(self,
+                 factory: Callable[[], Any],
+                 size: int = 10,
+                 acquire_timeout: float = 30.0,
+                 idle_check_seconds: float = 30.0,
+                 stats_window: int = 1024):
+        """
+        Args:
+            factory: Callable returning a new DB-API connection
+            size: Maximal number of open connections
+            acquire_timeout: Seconds a caller may wait for a connection
+            idle_check_seconds: Ping connections idle for longer than this
+            stats_window: Number of recent wait samples kept for percentiles
+        """
+        self._factory = factory
+        self.size = max(1, int(size))
+        self.acquire_timeout = float(acquire_timeout)
+        self.idle_check_seconds = float(idle_check_seconds)
+        self._lock = threading.Lock()
+        self._idle: List[Tuple[Any, float]] = []  # LIFO: warm connections first
+        self._waiters: Deque[_Waiter] = deque()
+        self._open = 0
+        self._local = threading.local()
+        # Metrics
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._pings = 0
+        self._max_waiters = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._held_total = 0.0
+        self._held_max = 0.0
+        self._recent_waits: Deque[float] = deque(maxlen=max(16, int(stats_window)))
+
+    # --- acquire / release ---
+
+    def _acquire(self) -> Any:
+        started = time.monotonic()
+        waiter = None
+        conn, idle_since, create = None, 0.0, False
+        with self._lock:
+            if self._idle and not self._waiters:
+                conn, idle_since = self._idle.pop()
+            elif self._open < self.size:
+                self._open += 1
+                create = True
+            else:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+                self._max_waiters = max(self._max_waiters, len(self._waiters))
+        if create:
+            try:
+                conn = self._factory()
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                self._grant_free_slot()
+                raise
+        elif waiter is not None:
+            if not waiter.event.wait(self.acquire_timeout):
+                with self._lock:
+                    try:
+                        self._waiters.remove(waiter)
+                        timed_out = True
+                    except ValueError:
+                        timed_out = False  # granted just as the deadline hit
+                    if timed_out:
+                        self._timeouts += 1
+                if timed_out:
+                    raise mysql_errors.PoolError(
+                        f"Failed getting connection; pool exhausted "
+                        f"(size={self.size}, waited {self.acquire_timeout:.1f}s)")
+            conn = waiter.conn
+            if conn is None:
+                # Woken because a slot was freed: open a new connection
+                try:
+                    conn = self._factory()
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                    self._grant_free_slot()
+                    raise
+            else:
+                idle_since = time.monotonic()
+        if idle_since and time.monotonic() - idle_since > self.idle_check_seconds:
+            conn = self._revalidate(conn)
+        waited = time.monotonic() - started
+        with self._lock:
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            self._recent_waits.append(waited)
+        return conn
+
+    def _revalidate(self, conn: Any) -> Any:
+        """Ping a connection that has been idle; reconnect if the server dropped it."""
+        self._pings += 1
+        try:
+            conn.ping(reconnect=True, attempts=1, delay=0)
+            return conn
+        except Exception as e:
+            _log.warning(f"Idle MySQL connection is dead, reopening: {e}")
+            try:
+                conn.close()
+            except Exception:
+                pass
+            try:
+                return self._factory()
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                self._grant_free_slot()
+                raise
+
+    def _release(self, conn: Any, broken: bool = False) -> None:
+        if broken:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            with self._lock:
+                self._open -= 1
+                self._discarded += 1
+            self._grant_free_slot()
+            return
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.conn = conn
+                waiter.event.set()
+                return
+            self._idle.append((conn, time.monotonic()))
+
+    def _grant_free_slot(self) -> None:
+        """A slot was freed without a connection: let the oldest waiter open one."""
+        with self._lock:
+            if self._waiters and self._open < self.size:
+                self._open += 1
+                waiter = self._waiters.popleft()
+                waiter.event.set()
+
+    @contextmanager
+    def connection(self):
+        """Yield a connection bound to the current greenlet (re-entrant)."""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+        conn = self._acquire()
+        self._local.conn = conn
+        taken_at = time.monotonic()
+        broken = False
+        try:
+            yield conn
+        except _BROKEN_ERRORS:
+            broken = True
+            raise
+        finally:
+            self._local.conn = None
+            held_for = time.monotonic() - taken_at
+            with self._lock:
+                self._held_total += held_for
+                self._held_max = max(self._held_max, held_for)
+            self._release(conn, broken=broken)
+
+    def current(self) -> Optional[Any]:
+        """Connection held by the current greenlet, if any."""
+        return getattr(self._local, 'conn', None)
+
+    # --- metrics ---
+
+    def status(self) -> dict:
+        """Snapshot of pool state and timings (seconds are reported in ms)."""
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            checkouts = self._checkouts
+            idle = len(self._idle)
+            p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+            return {
+                'pool_size': self.size,
+                'open_connections': self._open,
+                'available_connections': idle + (self.size - self._open),
+                'idle_connections': idle,
+                'in_use': self._open - idle,
+                'waiters': len(self._waiters),
+                'max_waiters': self._max_waiters,
+                'checkouts': checkouts,
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+                'idle_pings': self._pings,
+                'wait_ms_avg': round(self._wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+                'wait_ms_p95': round(p95 * 1000, 3),
+                'wait_ms_max': round(self._wait_max * 1000, 3),
+                'checkout_ms_avg': round(self._held_total / checkouts * 1000, 3) if checkouts else 0.0,
+                'checkout_ms_max': round(self._held_max * 1000, 3),
+            }
+
+    def close(self) -> None:
+        """Close idle connections (in-use ones are closed on release by their owner)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
@@ -1,6 +1,18 @@
-"""Redis-based force logout management."""
+"""Redis-based force logout management.
 
-from typing import Set
+Flagged users and sessions live in two Redis sets. Every change also bumps
+``znf:force_logout:epoch`` and publishes the new epoch on the
+``znf:force_logout`` channel. Each worker keeps a snapshot of both sets
+together with the epoch it was read at. A listener thread reloads the
+snapshot when a newer epoch is announced, so the per-request checks in
+``before_request`` run against memory only. Without a running listener the
+snapshot is trusted for ``max_staleness`` seconds; after that the epoch is
+re-read from Redis.
+"""
+
+import threading
+import time
+from typing import Iterable, Set
 from modules.logging import get_logger
 
 _log = get_logger(__name__)
@@ -9,15 +21,126 @@ _log = get_logger(__name__)
 class RedisForceLogoutManager:
     """Redis-based force logout management."""
     
-    def __init__(self, redis_client):
+    def __init__(self, redis_client, max_staleness: float = 1.0):
         """Initialize force logout manager.
         
         Args:
             redis_client: Redis client instance
+            max_staleness: Seconds the local snapshot is trusted while no listener runs
         """
         self.redis = redis_client
         self.users_key = "znf:force_logout:users"
         self.sessions_key = "znf:force_logout:sessions"
+        self.epoch_key = "znf:force_logout:epoch"
+        self.channel = "znf:force_logout"
+        self.max_staleness = float(max_staleness)
+        self._lock = threading.Lock()
+        self._epoch = -1
+        self._users: Set[str] = set()
+        self._sessions: Set[str] = set()
+        self._loaded_at = float('-inf')
+        self._listener = None
+        self._stop = threading.Event()
+
+    # --- local snapshot ---
+
+    def _reload(self) -> bool:
+        """Read epoch and both sets atomically into the local snapshot."""
+        pipe = self.redis.client.pipeline(transaction=True)
+        pipe.get(self.epoch_key)
+        pipe.smembers(self.users_key)
+        pipe.smembers(self.sessions_key)
+        epoch, users, sessions = pipe.execute()
+        with self._lock:
+            if int(epoch or 0) < self._epoch:
+                # A concurrent reload already stored a newer snapshot
+                return False
+            self._epoch = int(epoch or 0)
+            self._users = set(users or ())
+            self._sessions = set(sessions or ())
+            self._loaded_at = time.monotonic()
+        return True
+
+    def _snapshot(self):
+        """Current (users, sessions), refreshed only when the epoch moved."""
+        listening = self._listener is not None and self._listener.is_alive()
+        if self._epoch < 0 or (not listening and time.monotonic() - self._loaded_at > self.max_staleness):
+            try:
+                if self._epoch < 0 or int(self.redis.client.get(self.epoch_key) or 0) != self._epoch:
+                    self._reload()
+                else:
+                    self._loaded_at = time.monotonic()
+            except Exception as e:
+                _log.warning(f"Failed to refresh force logout snapshot: {e}")
+        return self._users, self._sessions
+
+    def _announce(self, pipe) -> list:
+        """Bump the epoch in ``pipe``, run it and publish the new epoch.
+
+        Returns:
+            Results of the commands queued before the epoch bump
+        """
+        pipe.incr(self.epoch_key)
+        results = pipe.execute()
+        epoch = int(results[-1])
+        try:
+            self.redis.client.publish(self.channel, str(epoch))
+        except Exception as e:
+            _log.warning(f"Failed to publish force logout epoch {epoch}: {e}")
+        # This worker sees its own change immediately
+        try:
+            self._reload()
+        except Exception:
+            with self._lock:
+                self._epoch = -1
+        return results[:-1]
+
+    def _listen(self) -> None:
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = self.redis.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Changes published while not subscribed would be missed
+                self._reload()
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if not message:
+                        continue
+                    try:
+                        epoch = int(message.get('data'))
+                    except (TypeError, ValueError):
+                        epoch = None
+                    if epoch is None or epoch > self._epoch:
+                        self._reload()
+            except Exception as e:
+                if not self._stop.is_set():
+                    _log.warning(f"Force logout listener error: {e}")
+                    with self._lock:
+                        self._epoch = -1
+                    self._stop.wait(1.0)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def start_listener(self) -> None:
+        """Start the pub/sub listener thread (once per process)."""
+        if not self.redis or (self._listener is not None and self._listener.is_alive()):
+            return
+        self._stop.clear()
+        self._listener = threading.Thread(target=self._listen, name='force-logout-listener', daemon=True)
+        self._listener.start()
+
+    def shutdown(self) -> None:
+        """Stop the listener thread."""
+        self._stop.set()
+        listener = self._listener
+        if listener is not None:
+            listener.join(timeout=2.0)
+        self._listener = None
     
     def add_user_logout(self, user_id: int) -> bool:
         """Add user to force logout list.
@@ -32,11 +155,35 @@ class RedisForceLogoutManager:
             return False
         
         try:
-            return self.redis.client.sadd(self.users_key, str(user_id))
+            pipe = self.redis.client.pipeline()
+            pipe.sadd(self.users_key, str(user_id))
+            return bool(self._announce(pipe)[0])
         except Exception as e:
             _log.warning(f"Failed to add user {user_id} to force logout: {e}")
             return False
     
+    def add_users_logout(self, user_ids: Iterable[int]) -> bool:
+        """Add several users to the force logout list in one change.
+        
+        Args:
+            user_ids: User IDs to force logout
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        members = sorted({str(uid) for uid in user_ids})
+        if not self.redis or not members:
+            return False
+        
+        try:
+            pipe = self.redis.client.pipeline()
+            pipe.sadd(self.users_key, *members)
+            self._announce(pipe)
+            return True
+        except Exception as e:
+            _log.warning(f"Failed to add users {members} to force logout: {e}")
+            return False
+    
     def add_session_logout(self, session_id: str) -> bool:
         """Add session to force logout list.
         
@@ -50,7 +197,9 @@ class RedisForceLogoutManager:
             return False
         
         try:
-            return self.redis.client.sadd(self.sessions_key, session_id)
+            pipe = self.redis.client.pipeline()
+            pipe.sadd(self.sessions_key, session_id)
+            return bool(self._announce(pipe)[0])
         except Exception as e:
             _log.warning(f"Failed to add session {session_id} to force logout: {e}")
             return False
@@ -68,7 +217,9 @@ class RedisForceLogoutManager:
             return False
         
         try:
-            return self.redis.client.srem(self.users_key, str(user_id))
+            pipe = self.redis.client.pipeline()
+            pipe.srem(self.users_key, str(user_id))
+            return bool(self._announce(pipe)[0])
         except Exception as e:
             _log.warning(f"Failed to remove user {user_id} from force logout: {e}")
             return False
@@ -86,7 +237,9 @@ class RedisForceLogoutManager:
             return False
         
         try:
-            return self.redis.client.srem(self.sessions_key, session_id)
+            pipe = self.redis.client.pipeline()
+            pipe.srem(self.sessions_key, session_id)
+            return bool(self._announce(pipe)[0])
         except Exception as e:
             _log.warning(f"Failed to remove session {session_id} from force logout: {e}")
             return False
@@ -104,7 +257,7 @@ class RedisForceLogoutManager:
             return False
         
         try:
-            return self.redis.client.sismember(self.users_key, str(user_id))
+            return str(user_id) in self._snapshot()[0]
         except Exception as e:
             _log.warning(f"Failed to check force logout for user {user_id}: {e}")
             return False
@@ -122,7 +275,7 @@ class RedisForceLogoutManager:
             return False
         
         try:
-            return self.redis.client.sismember(self.sessions_key, session_id)
+            return session_id in self._snapshot()[1]
         except Exception as e:
             _log.warning(f"Failed to check force logout for session {session_id}: {e}")
             return False
@@ -137,7 +290,7 @@ class RedisForceLogoutManager:
             return set()
         
         try:
-            return self.redis.client.smembers(self.users_key)
+            return set(self._snapshot()[0])
         except Exception as e:
             _log.warning(f"Failed to get forced logout users: {e}")
             return set()
@@ -152,7 +305,7 @@ class RedisForceLogoutManager:
             return set()
         
         try:
-            return self.redis.client.smembers(self.sessions_key)
+            return set(self._snapshot()[1])
         except Exception as e:
             _log.warning(f"Failed to get forced logout sessions: {e}")
             return set()
@@ -167,8 +320,11 @@ class RedisForceLogoutManager:
             return False
         
         try:
-            users_deleted = self.redis.client.delete(self.users_key)
-            sessions_deleted = self.redis.client.delete(self.sessions_key)
+            pipe = self.redis.client.pipeline()
+            pipe.scard(self.users_key)
+            pipe.scard(self.sessions_key)
+            pipe.delete(self.users_key, self.sessions_key)
+            users_deleted, sessions_deleted, _ = self._announce(pipe)
             _log.info(f"Cleared force logout entries: {users_deleted} users, {sessions_deleted} sessions")
             return True
         except Exception as e:
@@ -0,0 +1,252 @@
+"""
+Durable job queue in Redis for background media work.
+
+Conversions used to live only in the in-process ``ThreadPool`` of each web
+worker and were lost on restart or ``max_requests`` recycling. Jobs are now
+stored in Redis and consumed by the standalone ``media_worker.py`` process:
+
+- ``ready``    sorted set, higher priority first, FIFO within a priority;
+- ``delayed``  sorted set of retries scored by the time they become due;
+- ``inflight`` sorted set of reserved jobs scored by their visibility deadline
+  (a job whose worker died is delivered again after the deadline);
+- ``dead``     list of jobs that exhausted ``max_attempts``.
+
+Job bodies are JSON documents in one hash. Reservation is a Lua script, so a
+job is never handed to two consumers.
+"""
+
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from modules.logging import get_logger
+
+_log = get_logger(__name__)
+
+# Priorities are clamped so that ``-priority * _PRIORITY_SPAN + ms`` stays
+# exact in a double-precision sorted set score
+PRIORITY_MIN = -9
+PRIORITY_MAX = 9
+_PRIORITY_SPAN = 10**13
+
+# KEYS: ready, delayed, inflight, data, dead
+# ARGV: now (s), visibility timeout (s), priority span
+_RESERVE_LUA = """
+local now = tonumber(ARGV[1])
+local span = tonumber(ARGV[3])
+local function requeue(id)
+  local raw = redis.call('HGET', KEYS[4], id)
+  if raw then
+    local job = cjson.decode(raw)
+    redis.call('ZADD', KEYS[1], -tonumber(job['priority']) * span + math.floor(now * 1000), id)
+  end
+end
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now, 'LIMIT', 0, 100)) do
+  redis.call('ZREM', KEYS[2], id)
+  requeue(id)
+end
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now, 'LIMIT', 0, 100)) do
+  redis.call('ZREM', KEYS[3], id)
+  requeue(id)
+end
+while true do
+  local popped = redis.call('ZPOPMIN', KEYS[1])
+  if #popped == 0 then
+    return false
+  end
+  local id = popped[1]
+  local raw = redis.call('HGET', KEYS[4], id)
+  if raw then
+    local job = cjson.decode(raw)
+    if tonumber(job['attempts']) >= tonumber(job['max_attempts']) then
+      if job['last_error'] == nil or job['last_error'] == cjson.null then
+        job['last_error'] = 'visibility timeout expired'
+      end
+      redis.call('LPUSH', KEYS[5], cjson.encode(job))
+      redis.call('HDEL', KEYS[4], id)
+    else
+      job['attempts'] = tonumber(job['attempts']) + 1
+      raw = cjson.encode(job)
+      redis.call('HSET', KEYS[4], id, raw)
+      redis.call('ZADD', KEYS[3], now + tonumber(ARGV[2]), id)
+      return raw
+    end
+  end
+end
+"""
+
+
+class RedisJobQueue:
+    """Priority job queue with retries, visibility timeouts and a dead-letter list."""
+
+    KEY_PREFIX = 'znf:jobs:'
+
+    def __init__(self,
+                 redis,
+                 name: str = 'media',
+                 visibility_timeout: int = 900,
+                 max_attempts: int = 3,
+                 retry_backoff: int = 30,
+                 retry_backoff_max: int = 1800) -> None:
+        """
+        Args:
+            redis: redis-py client (``RedisClient.client``) with decode_responses=True
+            name: Queue name, part of the Redis keys
+            visibility_timeout: Seconds a reserved job may run before it is delivered again
+            max_attempts: Default number of deliveries before a job is dead-lettered
+            retry_backoff: Base delay in seconds before the first retry (doubled per attempt)
+            retry_backoff_max: Upper bound for the retry delay
+        """
+        self.redis = redis
+        self.name = name
+        self.visibility_timeout = max(1, int(visibility_timeout))
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_backoff = max(0, int(retry_backoff))
+        self.retry_backoff_max = max(self.retry_backoff, int(retry_backoff_max))
+        prefix = f"{self.KEY_PREFIX}{name}:"
+        self.ready_key = prefix + 'ready'
+        self.delayed_key = prefix + 'delayed'
+        self.inflight_key = prefix + 'inflight'
+        self.data_key = prefix + 'data'
+        self.dead_key = prefix + 'dead'
+        self._reserve = redis.register_script(_RESERVE_LUA)
+
+    @staticmethod
+    def _ready_score(priority: int, now: float) -> float:
+        return -priority * _PRIORITY_SPAN + int(now * 1000)
+
+    def backoff(self, attempts: int) -> int:
+        """Delay in seconds before retrying a job that failed ``attempts`` times."""
+        if attempts <= 0:
+            return 0
+        return min(self.retry_backoff_max,
+                   self.retry_backoff * (2**(attempts - 1)))
+
+    def enqueue(self,
+                kind: str,
+                payload: Dict[str, Any],
+                priority: int = 0,
+                max_attempts: Optional[int] = None) -> str:
+        """Store a job and make it available to consumers.
+
+        Args:
+            kind: Handler name (e.g. ``'convert'``)
+            payload: JSON-serializable job arguments
+            priority: -9..9, higher runs first
+            max_attempts: Override of the queue default
+
+        Returns:
+            str: job id
+        """
+        now = time.time()
+        priority = max(PRIORITY_MIN, min(PRIORITY_MAX, int(priority)))
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'payload': payload,
+            'priority': priority,
+            'attempts': 0,
+            'max_attempts': int(max_attempts or self.max_attempts),
+            'enqueued_at': now,
+            'last_error': None,
+        }
+        pipe = self.redis.pipeline()
+        pipe.hset(self.data_key, job['id'], json.dumps(job))
+        pipe.zadd(self.ready_key, {job['id']: self._ready_score(priority, now)})
+        pipe.execute()
+        return job['id']
+
+    def reserve(self) -> Optional[Dict[str, Any]]:
+        """Take the next due job; it stays invisible until ack/fail or the timeout.
+
+        Returns:
+            dict | None: job document with ``attempts`` already incremented
+        """
+        raw = self._reserve(
+            keys=[
+                self.ready_key, self.delayed_key, self.inflight_key,
+                self.data_key, self.dead_key
+            ],
+            args=[time.time(), self.visibility_timeout, _PRIORITY_SPAN])
+        return json.loads(raw) if raw else None
+
+    def touch(self, job: Dict[str, Any]) -> None:
+        """Push the visibility deadline of a running job forward."""
+        self.redis.zadd(self.inflight_key,
+                        {job['id']: time.time() + self.visibility_timeout},
+                        xx=True)
+
+    def ack(self, job: Dict[str, Any]) -> None:
+        """Remove a successfully processed job."""
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.inflight_key, job['id'])
+        pipe.hdel(self.data_key, job['id'])
+        pipe.execute()
+
+    def fail(self, job: Dict[str, Any], error: str = '') -> bool:
+        """Schedule a retry with backoff, or dead-letter the job.
+
+        Returns:
+            bool: True when the job will be retried
+        """
+        job = dict(job, last_error=(error or '')[:2000])
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.inflight_key, job['id'])
+        if int(job['attempts']) >= int(job['max_attempts']):
+            pipe.hdel(self.data_key, job['id'])
+            pipe.lpush(self.dead_key, json.dumps(dict(job, failed_at=time.time())))
+            pipe.execute()
+            _log.error(
+                f"Job {job['kind']} {job['id']} dead-lettered after {job['attempts']} attempts: {error}"
+            )
+            return False
+        due = time.time() + self.backoff(int(job['attempts']))
+        pipe.hset(self.data_key, job['id'], json.dumps(job))
+        pipe.zadd(self.delayed_key, {job['id']: due})
+        pipe.execute()
+        _log.warning(
+            f"Job {job['kind']} {job['id']} failed (attempt {job['attempts']}/{job['max_attempts']}), retry in {int(due - time.time())}s: {error}"
+        )
+        return True
+
+    def dead_letters(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent dead-lettered jobs (newest first)."""
+        return [
+            json.loads(r)
+            for r in self.redis.lrange(self.dead_key, 0, max(0, limit - 1))
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        """Queue depth per state."""
+        pipe = self.redis.pipeline()
+        pipe.zcard(self.ready_key)
+        pipe.zcard(self.delayed_key)
+        pipe.zcard(self.inflight_key)
+        pipe.llen(self.dead_key)
+        ready, delayed, inflight, dead = pipe.execute()
+        return {
+            'ready': int(ready),
+            'delayed': int(delayed),
+            'inflight': int(inflight),
+            'dead': int(dead),
+        }
+
+
+def media_queue_from_config(config, redis_client) -> Optional[RedisJobQueue]:
+    """Build the media conversion queue from ``[videos]``.
+
+    Returns None (in-process conversions, the default) unless ``queue = redis``
+    is set and Redis is available; the Redis queue needs a running
+    ``media_worker.py``.
+    """
+    mode = (config.get('videos', 'queue', fallback='inprocess') or '').strip().lower()
+    client = getattr(redis_client, 'client', redis_client)
+    if mode != 'redis' or client is None:
+        return None
+    return RedisJobQueue(
+        client,
+        name='media',
+        visibility_timeout=config.getint('videos', 'job_visibility_timeout', fallback=900),
+        max_attempts=config.getint('videos', 'job_max_attempts', fallback=3),
+        retry_backoff=config.getint('videos', 'job_retry_backoff', fallback=30))
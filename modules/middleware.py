@@ -5,10 +5,19 @@ from flask_login import logout_user, current_user
 from time import time
 from datetime import timedelta
 from modules.logging import log_access, get_logger
+from modules.request_tracker import RequestTracker, SessionTTLMap
 
 _log = get_logger(__name__)
 
 
+def _config_float(app, section, key, default):
+	"""Read a number from ``app._sql.config`` (config.ini), falling back to ``default``."""
+	try:
+		return app._sql.config.getfloat(section, key, fallback=default)
+	except Exception:
+		return default
+
+
 def is_real_page(path):
     """Check if path is a real page (not API, static, or background request)."""
     if not path:
@@ -40,108 +49,76 @@ def is_real_page(path):
 def init_middleware(app):
 	"""Initialize middleware for the Flask app."""
 	
+	tracker = RequestTracker(write_interval=_config_float(app, 'web', 'activity_write_interval', 10.0))
+	setattr(app, 'request_tracker', tracker)
+	# In-process sessions live in the tracker's TTL map (admin views read it)
+	app._sessions = tracker.sessions
+
 	@app.before_request
 	def before_request():
 		"""Log request start time."""
 		g.start_time = time()
 		# Initialize in-memory stores and track active sessions
+		entry = None
+		sid = None
+		is_authenticated = False
 		try:
 			if not hasattr(app, '_force_logout_users'):
 				app._force_logout_users = set()
 			if not hasattr(app, '_force_logout_sessions'):
 				app._force_logout_sessions = set()
-			if not hasattr(app, '_sessions'):
-				app._sessions = {}
+			if not isinstance(getattr(app, '_sessions', None), SessionTTLMap):
+				tracker.sessions.update(getattr(app, '_sessions', None) or {})
+				app._sessions = tracker.sessions
 			# Track current session as active (best-effort)
 			is_auth_attr = getattr(current_user, 'is_authenticated', False)
 			is_authenticated = bool(is_auth_attr() if callable(is_auth_attr) else is_auth_attr)
-			if is_authenticated:
-				cookie_name = getattr(app, 'session_cookie_name', 'session')
-				sid = request.cookies.get(cookie_name) or request.cookies.get('session')
-				if sid:
-					uid = getattr(current_user, 'id', None)
-					uname = getattr(current_user, 'name', None)
-					ip = request.headers.get('X-Forwarded-For', '').split(',')[0].strip() or request.remote_addr
-					ua = request.headers.get('User-Agent', '')
-					now_ts = time()
-					entry = app._sessions.get(sid) or {}
-					if not entry:
-						entry = {'created_at': now_ts}
-					entry.update({'user_id': uid, 'user': uname, 'ip': ip, 'ua': ua, 'last_seen': now_ts})
-					app._sessions[sid] = entry
-					
-					# Also update Redis if available
-					if hasattr(app, 'redis_client') and app.redis_client:
-						try:
-							import json
-							session_data = {
-								'sid': sid,
-								'user_id': uid,
-								'user': uname,
-								'ip': ip,
-								'ua': ua,
-								'created_at': entry.get('created_at', now_ts),
-								'last_activity': now_ts
-							}
-							app.redis_client.hset('sessions:active', sid, json.dumps(session_data))
-							app.redis_client.expire('sessions:active', 1800)  # TTL 30 minutes
-							
-							# Also update presence for active users (only for real pages)
-							# Filter out API endpoints, static files, and background requests
-							path = request.path
-							if is_real_page(path):
-								
-								user_key = f"{uname}|{ip}"
-								presence_data = {
-									'user': uname,
-									'ip': ip,
-									'ua': ua,
-									'page': path,
-									'lastSeen': int(now_ts * 1000)  # Convert to milliseconds
-								}
-								app.redis_client.hset('presence:users', user_key, json.dumps(presence_data))
-								app.redis_client.expire('presence:users', 60)  # TTL 1 minute
-						except Exception:
-							pass
-					# prune expired sessions by lifetime
-					try:
-						lifetime = app.config.get('PERMANENT_SESSION_LIFETIME')
-						if isinstance(lifetime, timedelta):
-							max_age = int(lifetime.total_seconds())
-						else:
-							max_age = int(lifetime or 31*24*3600)
-					except Exception:
-						max_age = 31*24*3600
-					cutoff = time() - max_age
-					for k, v in list(getattr(app, '_sessions', {}).items()):
-						try:
-							if float(v.get('last_seen') or 0) < cutoff:
-								app._sessions.pop(k, None)
-						except Exception:
-							pass
+			cookie_name = getattr(app, 'session_cookie_name', 'session')
+			sid = request.cookies.get(cookie_name) or request.cookies.get('session')
+			if is_authenticated and sid:
+				ip = request.headers.get('X-Forwarded-For', '').split(',')[0].strip() or request.remote_addr
+				# prune expired sessions by lifetime
+				try:
+					lifetime = app.config.get('PERMANENT_SESSION_LIFETIME')
+					if isinstance(lifetime, timedelta):
+						max_age = int(lifetime.total_seconds())
+					else:
+						max_age = int(lifetime or 31*24*3600)
+				except Exception:
+					max_age = 31*24*3600
+				entry = tracker.touch_session(sid, getattr(current_user, 'id', None),
+					getattr(current_user, 'name', None), ip, request.headers.get('User-Agent', ''),
+					g.start_time, max_age)
 		except Exception:
 			pass
 		# Enforce server-side force-logout if flagged by admin (by user or session)
 		try:
+			uid = getattr(current_user, 'id', None)
 			# Temporarily disable Redis force-logout checks if flag set
-			if getattr(app.config, 'get', lambda *_: False)('FORCE_LOGOUT_DISABLED') or app.config.get('FORCE_LOGOUT_DISABLED'):
+			check_logout = not (getattr(app.config, 'get', lambda *_: False)('FORCE_LOGOUT_DISABLED') or app.config.get('FORCE_LOGOUT_DISABLED'))
+			manager = getattr(app, 'force_logout_manager', None)
+			redis_client = getattr(app, 'redis_client', None)
+			client = getattr(redis_client, 'client', None)
+
+			# Coalesced session/presence writes in one pipeline
+			if client is not None:
+				try:
+					tracker.track(client, sid, entry,
+						request.path if is_real_page(request.path) else None)
+				except Exception as e:
+					_log.debug(f"Request bookkeeping failed: {e}")
+			if not check_logout:
 				return
-			is_auth_attr = getattr(current_user, 'is_authenticated', False)
-			is_authenticated = bool(is_auth_attr() if callable(is_auth_attr) else is_auth_attr)
-			uid = getattr(current_user, 'id', None)
-			cookie_name = getattr(app, 'session_cookie_name', 'session')
-			sid = request.cookies.get(cookie_name) or request.cookies.get('session')
-			
-			# Check Redis-based force logout first
+
+			# Check Redis-based force logout first (local snapshot, refreshed on epoch change)
 			force_logout = False
-			if hasattr(app, 'force_logout_manager') and app.force_logout_manager:
-				if is_authenticated and uid:
-					if app.force_logout_manager.is_user_forced_logout(uid):
-						force_logout = True
-						app.force_logout_manager.remove_user_logout(uid)
-				if sid and app.force_logout_manager.is_session_forced_logout(sid):
+			if manager:
+				if is_authenticated and uid and manager.is_user_forced_logout(uid):
+					force_logout = True
+					manager.remove_user_logout(uid)
+				if sid and manager.is_session_forced_logout(sid):
 					force_logout = True
-					app.force_logout_manager.remove_session_logout(sid)
+					manager.remove_session_logout(sid)
 			else:
 				# Fallback to in-memory force logout
 				if is_authenticated and (uid in getattr(app, '_force_logout_users', set()) or (sid and sid in getattr(app, '_force_logout_sessions', set()))):
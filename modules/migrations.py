@@ -0,0 +1,304 @@
+"""Versioned schema migrations.
+
+Migrations are ordered steps identified by an integer version. Applied
+versions are recorded in ``<prefix>_schema_version``; the runner takes a
+MySQL named lock on a dedicated connection so that only one worker applies
+pending steps while the others wait and then see an up-to-date schema.
+
+Hot query paths must not perform any DDL/INFORMATION_SCHEMA checks: every
+structural change belongs here as a new step appended to ``MIGRATIONS``.
+"""
+
+import threading
+from typing import Callable, List, NamedTuple
+
+import mysql.connector as mysql
+
+from .logging import get_logger
+
+_log = get_logger(__name__)
+
+
+class Migration(NamedTuple):
+	"""Single migration step: ``apply(cur, prefix, dbname)``."""
+	version: int
+	description: str
+	apply: Callable
+
+
+# --- Helpers (operate on a raw cursor of the migration connection) ---
+
+def _column_exists(cur, dbname: str, table: str, column: str) -> bool:
+	cur.execute(
+		"""
+		SELECT COUNT(1) FROM INFORMATION_SCHEMA.COLUMNS
+		WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s;
+		""",
+		[dbname, table, column]
+	)
+	row = cur.fetchone()
+	return bool(row and int(row[0]) > 0)
+
+
+def _index_exists(cur, dbname: str, table: str, index: str) -> bool:
+	cur.execute(
+		"""
+		SELECT COUNT(1) FROM INFORMATION_SCHEMA.STATISTICS
+		WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND INDEX_NAME = %s;
+		""",
+		[dbname, table, index]
+	)
+	row = cur.fetchone()
+	return bool(row and int(row[0]) > 0)
+
+
+def _add_column(cur, dbname: str, table: str, column: str, definition: str) -> None:
+	if not _column_exists(cur, dbname, table, column):
+		cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+
+
+def _add_index(cur, dbname: str, table: str, index: str, columns: str, kind: str = 'INDEX') -> None:
+	if not _index_exists(cur, dbname, table, index):
+		cur.execute(f"CREATE {kind} {index} ON {table} ({columns});")
+
+
+# --- Steps ---
+
+def _m1_file_location_columns(cur, prefix: str, dbname: str) -> None:
+	table = f"{prefix}_file"
+	_add_column(cur, dbname, table, 'category_id', 'INT NULL')
+	_add_column(cur, dbname, table, 'subcategory_id', 'INT NULL')
+	_add_column(cur, dbname, table, 'file_name', 'VARCHAR(255) NULL')
+	_add_index(cur, dbname, table, f"ix_{prefix}_file_cat_sub", 'category_id, subcategory_id')
+	_add_index(cur, dbname, table, f"ix_{prefix}_file_fname", 'file_name')
+
+
+def _m2_file_legacy_backfill(cur, prefix: str, dbname: str) -> None:
+	# Single set-based UPDATE instead of one statement per legacy row
+	cur.execute(
+		f"""
+		UPDATE {prefix}_file
+		SET category_id = COALESCE(category_id, 1),
+			subcategory_id = COALESCE(subcategory_id, 1),
+			file_name = COALESCE(file_name, 'unknown')
+		WHERE category_id IS NULL OR subcategory_id IS NULL OR file_name IS NULL;
+		"""
+	)
+
+
+def _m3_push_sub_columns(cur, prefix: str, dbname: str) -> None:
+	table = f"{prefix}_push_sub"
+	_add_column(cur, dbname, table, 'user_agent', "TEXT NULL")
+	_add_column(cur, dbname, table, 'last_success_at', 'DATETIME NULL')
+	_add_column(cur, dbname, table, 'last_error_at', 'DATETIME NULL')
+	_add_column(cur, dbname, table, 'last_checked_at', 'DATETIME NULL')
+	_add_column(cur, dbname, table, 'error_code', 'VARCHAR(32) NULL')
+	_add_column(cur, dbname, table, 'invalidated_at', 'DATETIME NULL')
+
+
+def _m4_subcategory_upload_flags(cur, prefix: str, dbname: str) -> None:
+	table = f"{prefix}_file_subcategory"
+	_add_column(cur, dbname, table, 'user_upload', 'TINYINT(1) NOT NULL DEFAULT 0')
+	_add_column(cur, dbname, table, 'group_upload', 'TINYINT(1) NOT NULL DEFAULT 0')
+
+
+def _m5_file_listing_index(cur, prefix: str, dbname: str) -> None:
+	# Serves WHERE category_id/subcategory_id + ORDER BY created_at DESC (id via the clustered PK)
+	_add_index(cur, dbname, f"{prefix}_file", f"ix_{prefix}_file_cat_sub_created", 'category_id, subcategory_id, created_at')
+
+
+def _m6_file_search_fulltext(cur, prefix: str, dbname: str) -> None:
+	# ngram parser tokenizes without word boundaries, so substrings of names match;
+	# servers without the plugin get a plain FULLTEXT index instead
+	table = f"{prefix}_file"
+	index = f"ftx_{prefix}_file_search"
+	if _index_exists(cur, dbname, table, index):
+		return
+	columns = 'display_name, file_name, description, note, owner'
+	try:
+		cur.execute(f"ALTER TABLE {table} ADD FULLTEXT INDEX {index} ({columns}) WITH PARSER ngram;")
+	except Exception as e:
+		_log.warning(f"ngram parser unavailable, creating plain FULLTEXT index: {e}")
+		cur.execute(f"ALTER TABLE {table} ADD FULLTEXT INDEX {index} ({columns});")
+
+
+def _m7_file_view_table(cur, prefix: str, dbname: str) -> None:
+	# One row per (file, viewer) instead of the ever-growing comma string in file.viewed
+	table = f"{prefix}_file_view"
+	cur.execute(f"""
+		CREATE TABLE IF NOT EXISTS {table} (
+			file_id INT NOT NULL,
+			user_id INT NOT NULL,
+			viewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+			PRIMARY KEY (file_id, user_id),
+			KEY ix_{prefix}_file_view_user (user_id, file_id),
+			FOREIGN KEY (file_id) REFERENCES {prefix}_file(id) ON DELETE CASCADE,
+			FOREIGN KEY (user_id) REFERENCES {prefix}_user(id) ON DELETE CASCADE
+		) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+	""")
+	# Backfill from the legacy viewer-name list (", " or "|" separated)
+	cur.execute(f"""
+		INSERT IGNORE INTO {table} (file_id, user_id)
+		SELECT f.id, u.id FROM {prefix}_file f
+		JOIN {prefix}_user u
+			ON FIND_IN_SET(u.name, REPLACE(REPLACE(REPLACE(f.viewed, '|', ','), ', ', ','), ' ,', ',')) > 0
+		WHERE f.viewed IS NOT NULL AND f.viewed <> '';
+	""")
+
+
+def _m8_file_conversion_mode(cur, prefix: str, dbname: str) -> None:
+	# Which media pipeline produced the stored file: remux | audio | encode
+	_add_column(cur, dbname, f"{prefix}_file", 'conversion_mode', "VARCHAR(16) NULL")
+
+
+def _m9_file_preview_version(cur, prefix: str, dbname: str) -> None:
+	# Version of <base>.preview/ (poster, sprite); part of the preview URLs
+	_add_column(cur, dbname, f"{prefix}_file", 'preview_version', "INT NULL")
+
+
+def _m10_push_sub_drop_duplicate_index(cur, prefix: str, dbname: str) -> None:
+	# ix_<prefix>_push_sub_user duplicated idx_user (user_id) from CREATE TABLE
+	table = f"{prefix}_push_sub"
+	index = f"ix_{prefix}_push_sub_user"
+	if _index_exists(cur, dbname, table, index) and _index_exists(cur, dbname, table, 'idx_user'):
+		cur.execute(f"DROP INDEX {index} ON {table};")
+
+
+MIGRATIONS: List[Migration] = [
+	Migration(1, 'file: category_id/subcategory_id/file_name columns and indexes', _m1_file_location_columns),
+	Migration(2, 'file: backfill legacy rows', _m2_file_legacy_backfill),
+	Migration(3, 'push_sub: delivery status columns', _m3_push_sub_columns),
+	Migration(4, 'file_subcategory: upload flags', _m4_subcategory_upload_flags),
+	Migration(5, 'file: (category_id, subcategory_id, created_at) listing index', _m5_file_listing_index),
+	Migration(6, 'file: FULLTEXT search index', _m6_file_search_fulltext),
+	Migration(7, 'file_view: per-user view tracking', _m7_file_view_table),
+	Migration(8, 'file: conversion_mode column', _m8_file_conversion_mode),
+	Migration(9, 'file: preview_version column', _m9_file_preview_version),
+	Migration(10, 'push_sub: drop index duplicating idx_user', _m10_push_sub_drop_duplicate_index),
+]
+
+
+class MigrationRunner:
+	"""Apply pending migrations once, serialized across workers by GET_LOCK.
+
+	Args:
+		config: ConfigParser with a ``[db]`` section
+		migrations: ordered list of steps (defaults to ``MIGRATIONS``)
+		connect: connection factory (defaults to ``mysql.connector.connect``)
+	"""
+
+	def __init__(self, config, migrations: List[Migration] = None, connect: Callable = None):
+		self.config = config
+		self.migrations = sorted(migrations if migrations is not None else MIGRATIONS, key=lambda m: m.version)
+		self._connect = connect or mysql.connect
+		self.prefix = config['db']['prefix']
+		self.dbname = config['db']['name']
+		self.table = f"{self.prefix}_schema_version"
+		self.lock_name = f"{self.dbname}.{self.prefix}_schema_migrate"
+		try:
+			self.lock_timeout = int(config['db'].get('migrate_lock_timeout', 60))
+		except Exception:
+			self.lock_timeout = 60
+
+	@property
+	def latest_version(self) -> int:
+		return self.migrations[-1].version if self.migrations else 0
+
+	def _open(self):
+		db = self.config['db']
+		return self._connect(
+			host=db['host'],
+			user=db['user'],
+			password=db['password'],
+			database=db['name'],
+			charset="utf8mb4",
+			collation="utf8mb4_general_ci",
+			connection_timeout=int(db.get('connect_timeout', 10)),
+			autocommit=True,
+		)
+
+	def _ensure_version_table(self, cur) -> None:
+		cur.execute(f"""
+			CREATE TABLE IF NOT EXISTS {self.table} (
+				version INT NOT NULL PRIMARY KEY,
+				description VARCHAR(255) NOT NULL DEFAULT '',
+				applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+			) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+		""")
+
+	def _applied_versions(self, cur) -> set:
+		cur.execute(f"SELECT version FROM {self.table};")
+		return {int(r[0]) for r in (cur.fetchall() or [])}
+
+	def run(self) -> List[int]:
+		"""Apply all pending steps in version order.
+
+		Returns:
+			list[int]: versions applied by this call (empty when up to date)
+		"""
+		applied_now: List[int] = []
+		conn = self._open()
+		cur = conn.cursor(buffered=True)
+		locked = False
+		try:
+			self._ensure_version_table(cur)
+			cur.execute("SELECT GET_LOCK(%s, %s);", [self.lock_name, self.lock_timeout])
+			row = cur.fetchone()
+			locked = bool(row and row[0] == 1)
+			if not locked:
+				raise RuntimeError(f"Could not acquire migration lock '{self.lock_name}' within {self.lock_timeout}s")
+			# Re-read under the lock: another worker may have finished meanwhile
+			done = self._applied_versions(cur)
+			for m in self.migrations:
+				if m.version in done:
+					continue
+				_log.info(f"Applying schema migration {m.version}: {m.description}")
+				m.apply(cur, self.prefix, self.dbname)
+				cur.execute(
+					f"INSERT INTO {self.table} (version, description) VALUES (%s, %s);",
+					[m.version, m.description[:255]]
+				)
+				applied_now.append(m.version)
+			return applied_now
+		finally:
+			if locked:
+				try:
+					cur.execute("SELECT RELEASE_LOCK(%s);", [self.lock_name])
+					cur.fetchone()
+				except Exception:
+					pass
+			try:
+				cur.close()
+			except Exception:
+				pass
+			try:
+				conn.close()
+			except Exception:
+				pass
+
+
+_migrated = False
+_migrate_lock = threading.Lock()
+
+
+def run_migrations(config) -> None:
+	"""Run pending migrations at most once per process.
+
+	Raises:
+		Exception: The failing step's error; queries rely on the migrated
+			schema, so the process must not start serving without it
+	"""
+	global _migrated
+	if _migrated:
+		return
+	with _migrate_lock:
+		if _migrated:
+			return
+		try:
+			applied = MigrationRunner(config).run()
+			if applied:
+				_log.info(f"Schema migrated to version {applied[-1]}")
+			_migrated = True
+		except Exception as e:
+			_log.error(f"Schema migration failed, refusing to start: {e}")
+			raise
@@ -37,6 +37,31 @@ ADMIN_VIEW_PAGE = 'admin.view'
 ADMIN_MANAGE = 'admin.manage'
 ADMIN_ANY = 'admin.any'
 
+# Stable bit positions for compiled permission masks (append new scopes at the end;
+# masks are cached in Redis, reordering would invalidate them)
+ALL_SCOPES = (
+	FILES_VIEW_PAGE, REQUESTS_VIEW_PAGE, ORDERS_VIEW_PAGE, USERS_VIEW_PAGE,
+	USERS_MANAGE, GROUPS_VIEW_PAGE, GROUPS_MANAGE, CATEGORIES_VIEW,
+	CATEGORIES_MANAGE, SUBCATEGORIES_VIEW, SUBCATEGORIES_MANAGE, FILES_UPLOAD,
+	FILES_EDIT_ANY, FILES_DELETE_ANY, FILES_MARK_VIEWED, FILES_SEE_VIEWERS,
+	FILES_NOTES, FILES_DISPLAY_ALL, REQUESTS_APPROVE, REQUESTS_ALLOW,
+	ADMIN_VIEW_PAGE, ADMIN_MANAGE, ADMIN_ANY,
+)
+SCOPE_BITS = {scope: 1 << i for i, scope in enumerate(ALL_SCOPES)}
+
+
+def scopes_to_mask(scopes: Iterable[str]) -> int:
+	"""Compile a set of scopes into an integer bitmask (unknown scopes are ignored)."""
+	mask = 0
+	for scope in scopes:
+		mask |= SCOPE_BITS.get(scope, 0)
+	return mask
+
+
+def mask_to_scopes(mask: int) -> Set[str]:
+	"""Expand a bitmask back into the set of scopes."""
+	return {scope for scope, bit in SCOPE_BITS.items() if mask & bit}
+
 
 def _get_user_permissions(user) -> Set[str]:
 	perms: Set[str] = getattr(user, 'permissions', set())
@@ -52,6 +77,10 @@ def has_permission(user, perm: str) -> bool:
 		is_authenticated = False
 	if not is_authenticated:
 		return False
+	# Fast path: compiled bitmask check (classes.user.User)
+	has = getattr(user, 'has', None)
+	if getattr(user, 'permission_mask', None) is not None and callable(has):
+		return bool(has(perm))
 	perms = _get_user_permissions(user)
 	if ADMIN_ANY in perms:
 		return True
@@ -1,4 +1,17 @@
-"""Redis-based presence tracking."""
+"""Redis-based presence tracking.
+
+Entries (Socket.IO sessions and heartbeats) are indexed without keyspace
+scans:
+
+- ``znf:presence:index``      sorted set, entry id -> last-seen timestamp;
+- ``znf:presence:data``       hash, entry id -> JSON details;
+- ``znf:presence:user:<id>``  set of entry ids of one user (for removal);
+  removed and trimmed entries are dropped from it via the ``user_id``
+  stored in their details.
+
+Updates are O(log n); reads take the live range of the index and trim the
+expired one in a single pipelined call, then fetch only the k live entries.
+"""
 
 import time
 import json
@@ -10,22 +23,97 @@ _log = get_logger(__name__)
 
 class RedisPresenceManager:
     """Redis-based presence tracking manager."""
-    
+
     def __init__(self, redis_client):
         """Initialize presence manager.
-        
+
         Args:
             redis_client: Redis client instance
         """
         self.redis = redis_client
         self.presence_prefix = "znf:presence:"
-        self.heartbeat_prefix = "znf:presence_hb:"
+        self.index_key = f"{self.presence_prefix}index"
+        self.data_key = f"{self.presence_prefix}data"
+        self.user_prefix = f"{self.presence_prefix}user:"
         self.stale_threshold = 8  # seconds
-    
-    def update_presence(self, sid: str, user_id: int, user_name: str, 
+        # Entries stay listed for stale_threshold, stored a bit longer
+        self.retention = self.stale_threshold + 10
+        self.user_index_ttl = 86400
+
+    def _client(self):
+        return self.redis.client if self.redis else None
+
+    @staticmethod
+    def _session_id(sid: str) -> str:
+        return f"s:{sid}"
+
+    @staticmethod
+    def _heartbeat_id(user_id: int, ip: str) -> str:
+        return f"h:{user_id}:{ip}"
+
+    def _store(self, entry_id: str, user_id: Optional[int], data: Dict[str, Any]) -> bool:
+        client = self._client()
+        if client is None:
+            return False
+        pipe = client.pipeline()
+        pipe.zadd(self.index_key, {entry_id: data['updated_at']})
+        pipe.hset(self.data_key, entry_id, json.dumps(data))
+        if user_id is not None:
+            user_key = f"{self.user_prefix}{user_id}"
+            pipe.sadd(user_key, entry_id)
+            pipe.expire(user_key, self.user_index_ttl)
+        pipe.execute()
+        return True
+
+    def _unlink_users(self, client, entry_ids: List[str], values: List[Optional[str]]) -> None:
+        """SREM deleted entries from their users' sets (``values``: their former details)."""
+        by_user: Dict[str, List[str]] = {}
+        for entry_id, raw in zip(entry_ids, values):
+            try:
+                user_id = json.loads(raw).get('user_id') if raw else None
+            except Exception:
+                user_id = None
+            if user_id is not None:
+                by_user.setdefault(f"{self.user_prefix}{user_id}", []).append(entry_id)
+        if not by_user:
+            return
+        pipe = client.pipeline()
+        for user_key, ids in by_user.items():
+            pipe.srem(user_key, *ids)
+        pipe.execute()
+
+    def _remove(self, entry_ids: List[str]) -> int:
+        client = self._client()
+        if client is None or not entry_ids:
+            return 0
+        pipe = client.pipeline()
+        pipe.hmget(self.data_key, entry_ids)
+        pipe.zrem(self.index_key, *entry_ids)
+        pipe.hdel(self.data_key, *entry_ids)
+        values, removed, _ = pipe.execute()
+        self._unlink_users(client, entry_ids, values or [])
+        return int(removed or 0)
+
+    def _range_and_trim(self, with_live: bool = True):
+        """Live entry ids and the ids trimmed from the index, in one round trip."""
+        client = self._client()
+        if client is None:
+            return [], []
+        now = int(time.time())
+        cutoff = f"({now - self.retention}"
+        pipe = client.pipeline()
+        if with_live:
+            pipe.zrangebyscore(self.index_key, now - self.stale_threshold, '+inf')
+        pipe.zrangebyscore(self.index_key, '-inf', cutoff)
+        pipe.zremrangebyscore(self.index_key, '-inf', cutoff)
+        results = pipe.execute()
+        live = results[0] if with_live else []
+        return list(live or []), list(results[-2] or [])
+
+    def update_presence(self, sid: str, user_id: int, user_name: str,
                        ip: str, page: str, user_agent: str) -> bool:
         """Update user presence.
-        
+
         Args:
             sid: Socket.IO session ID
             user_id: User ID
@@ -33,13 +121,13 @@ class RedisPresenceManager:
             ip: Client IP address
             page: Current page
             user_agent: User agent string
-            
+
         Returns:
             True if successful, False otherwise
         """
         if not self.redis:
             return False
-        
+
         try:
             now = int(time.time())
             presence_data = {
@@ -50,30 +138,27 @@ class RedisPresenceManager:
                 'ua': user_agent,
                 'updated_at': now
             }
-            
-            key = f"{self.presence_prefix}{sid}"
-            self.redis.set(key, json.dumps(presence_data), ex=self.stale_threshold + 10)
-            return True
-            
+            return self._store(self._session_id(sid), user_id, presence_data)
+
         except Exception as e:
             _log.warning(f"Failed to update presence for {sid}: {e}")
             return False
-    
+
     def update_heartbeat(self, user_id: int, ip: str, page: str, user_agent: str) -> bool:
         """Update heartbeat-based presence.
-        
+
         Args:
             user_id: User ID
             ip: Client IP address
             page: Current page
             user_agent: User agent string
-            
+
         Returns:
             True if successful, False otherwise
         """
         if not self.redis:
             return False
-        
+
         try:
             now = int(time.time())
             heartbeat_data = {
@@ -83,125 +168,91 @@ class RedisPresenceManager:
                 'ua': user_agent,
                 'updated_at': now
             }
-            
-            key = f"{self.heartbeat_prefix}{user_id}:{ip}"
-            self.redis.set(key, json.dumps(heartbeat_data), ex=self.stale_threshold + 10)
-            return True
-            
+            return self._store(self._heartbeat_id(user_id, ip), user_id, heartbeat_data)
+
         except Exception as e:
             _log.warning(f"Failed to update heartbeat for user {user_id}: {e}")
             return False
-    
+
     def remove_presence(self, sid: str) -> bool:
         """Remove presence entry.
-        
+
         Args:
             sid: Socket.IO session ID
-            
+
         Returns:
             True if successful, False otherwise
         """
         if not self.redis:
             return False
-        
+
         try:
-            key = f"{self.presence_prefix}{sid}"
-            return self.redis.delete(key)
+            return self._remove([self._session_id(sid)]) > 0
         except Exception as e:
             _log.warning(f"Failed to remove presence for {sid}: {e}")
             return False
-    
+
     def remove_user_presence(self, user_id: int) -> bool:
         """Remove all presence entries for a user.
-        
+
         Args:
             user_id: User ID
-            
+
         Returns:
             True if successful, False otherwise
         """
-        if not self.redis:
+        client = self._client()
+        if client is None:
             return False
-        
+
         try:
-            # Remove socket-based presence
-            pattern = f"{self.presence_prefix}*"
-            keys = self.redis.client.keys(pattern) if self.redis.client else []
-            removed_count = 0
-            
-            for key in keys:
-                try:
-                    data = self.redis.get(key)
-                    if data:
-                        presence_data = json.loads(data)
-                        if presence_data.get('user_id') == user_id:
-                            if self.redis.delete(key):
-                                removed_count += 1
-                except Exception:
-                    continue
-            
-            # Remove heartbeat-based presence
-            hb_pattern = f"{self.heartbeat_prefix}{user_id}:*"
-            hb_keys = self.redis.client.keys(hb_pattern) if self.redis.client else []
-            for key in hb_keys:
-                if self.redis.delete(key):
-                    removed_count += 1
-            
+            user_key = f"{self.user_prefix}{user_id}"
+            pipe = client.pipeline()
+            pipe.smembers(user_key)
+            pipe.delete(user_key)
+            entry_ids = sorted(pipe.execute()[0] or [])
+            removed_count = self._remove(entry_ids)
             _log.debug(f"Removed {removed_count} presence entries for user {user_id}")
             return True
-            
+
         except Exception as e:
             _log.warning(f"Failed to remove presence for user {user_id}: {e}")
             return False
-    
+
     def get_active_presence(self) -> List[Dict[str, Any]]:
         """Get all active presence entries.
-        
+
         Returns:
             List of active presence entries
         """
-        if not self.redis:
+        client = self._client()
+        if client is None:
             return []
-        
+
         try:
-            now = int(time.time())
-            stale_cutoff = now - self.stale_threshold
+            live, expired = self._range_and_trim()
+            pipe = client.pipeline()
+            if live:
+                pipe.hmget(self.data_key, live)
+            if expired:
+                pipe.hmget(self.data_key, expired)
+                pipe.hdel(self.data_key, *expired)
+            results = pipe.execute() if (live or expired) else []
+            values = results[0] if live else []
+            if expired:
+                self._unlink_users(client, expired, results[-2] or [])
+
             active_entries = []
-            
-            # Get socket-based presence
-            pattern = f"{self.presence_prefix}*"
-            keys = self.redis.client.keys(pattern) if self.redis.client else []
-            
-            for key in keys:
-                try:
-                    data = self.redis.get(key)
-                    if data:
-                        presence_data = json.loads(data)
-                        updated_at = presence_data.get('updated_at', 0)
-                        
-                        if updated_at >= stale_cutoff:
-                            presence_data['sid'] = key.replace(self.presence_prefix, '')
-                            active_entries.append(presence_data)
-                except Exception:
+            for entry_id, data in zip(live, values):
+                if not data:
                     continue
-            
-            # Get heartbeat-based presence
-            hb_pattern = f"{self.heartbeat_prefix}*"
-            hb_keys = self.redis.client.keys(hb_pattern) if self.redis.client else []
-            
-            for key in hb_keys:
                 try:
-                    data = self.redis.get(key)
-                    if data:
-                        heartbeat_data = json.loads(data)
-                        updated_at = heartbeat_data.get('updated_at', 0)
-                        
-                        if updated_at >= stale_cutoff:
-                            heartbeat_data['sid'] = key.replace(self.heartbeat_prefix, '')
-                            active_entries.append(heartbeat_data)
+                    entry = json.loads(data)
                 except Exception:
                     continue
-            
+                entry['sid'] = entry_id[2:]
+                active_entries.append(entry)
+
             # Deduplicate by user_id+ip+ua, keeping freshest entry
             unique_entries = {}
             for entry in active_entries:
@@ -209,72 +260,39 @@ class RedisPresenceManager:
                 ip = (entry.get('ip') or '').strip()
                 ua = (entry.get('ua') or '').strip()[:64]  # Limit UA length
                 key = f"{uid or 'unknown'}:{ip}:{ua}"
-                
+
                 prev = unique_entries.get(key)
                 if not prev or entry.get('updated_at', 0) >= prev.get('updated_at', 0):
                     unique_entries[key] = entry
-            
+
             result = list(unique_entries.values())
             result.sort(key=lambda x: x.get('updated_at', 0), reverse=True)
             return result
-            
+
         except Exception as e:
             _log.warning(f"Failed to get active presence: {e}")
             return []
-    
+
     def cleanup_stale_presence(self) -> int:
         """Clean up stale presence entries.
-        
+
         Returns:
             Number of entries cleaned up
         """
-        if not self.redis:
+        client = self._client()
+        if client is None:
             return 0
-        
+
         try:
-            now = int(time.time())
-            stale_cutoff = now - self.stale_threshold
-            cleaned_count = 0
-            
-            # Clean socket-based presence
-            pattern = f"{self.presence_prefix}*"
-            keys = self.redis.client.keys(pattern) if self.redis.client else []
-            
-            for key in keys:
-                try:
-                    data = self.redis.get(key)
-                    if data:
-                        presence_data = json.loads(data)
-                        updated_at = presence_data.get('updated_at', 0)
-                        
-                        if updated_at < stale_cutoff:
-                            if self.redis.delete(key):
-                                cleaned_count += 1
-                except Exception:
-                    continue
-            
-            # Clean heartbeat-based presence
-            hb_pattern = f"{self.heartbeat_prefix}*"
-            hb_keys = self.redis.client.keys(hb_pattern) if self.redis.client else []
-            
-            for key in hb_keys:
-                try:
-                    data = self.redis.get(key)
-                    if data:
-                        heartbeat_data = json.loads(data)
-                        updated_at = heartbeat_data.get('updated_at', 0)
-                        
-                        if updated_at < stale_cutoff:
-                            if self.redis.delete(key):
-                                cleaned_count += 1
-                except Exception:
-                    continue
-            
-            if cleaned_count > 0:
-                _log.debug(f"Cleaned up {cleaned_count} stale presence entries")
-            
-            return cleaned_count
-            
+            _, expired = self._range_and_trim(with_live=False)
+            if expired:
+                pipe = client.pipeline()
+                pipe.hmget(self.data_key, expired)
+                pipe.hdel(self.data_key, *expired)
+                self._unlink_users(client, expired, pipe.execute()[0] or [])
+                _log.debug(f"Cleaned up {len(expired)} stale presence entries")
+            return len(expired)
+
         except Exception as e:
             _log.warning(f"Failed to cleanup stale presence: {e}")
             return 0
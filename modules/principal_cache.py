@@ -0,0 +1,213 @@
+"""
+Cached principal loading for Flask-Login's ``user_loader``.
+
+Every request used to re-read the user row from MySQL and rebuild the
+permission set. The user row and its compiled permission bitmask are now kept
+in Redis (shared by all workers, TTL-bounded) and in a small per-process map
+with a short TTL. User/group edits and force-logout invalidate both layers:
+the Redis entries are deleted and the change is published on
+``znf:principal``, so the listener thread of every worker drops its local
+copy as well. Without a running listener a local copy lives for at most
+``local_ttl`` seconds.
+
+The password hash is never cached: principals are only used to identify the
+session owner, login/reauth still read the row directly.
+"""
+
+import json
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from classes.user import User
+from modules.logging import get_logger
+
+_log = get_logger(__name__)
+
+
+class PrincipalCache:
+    """Two-level (process + Redis) cache of users and their permission bitmasks."""
+
+    KEY_PREFIX = 'znf:principal:'
+    CHANNEL = 'znf:principal'
+    # Published instead of a user id by invalidate_all
+    ALL = '*'
+
+    def __init__(self, sql_utils, redis_client=None, ttl: int = 30, local_ttl: float = 5.0):
+        """
+        Args:
+            sql_utils: SQLUtils (user_by_id)
+            redis_client: Optional RedisClient shared between workers
+            ttl: Seconds a principal lives in Redis
+            local_ttl: Seconds a principal lives in this process
+        """
+        self._sql = sql_utils
+        self.redis = redis_client
+        self.ttl = max(1, int(ttl))
+        self.local_ttl = float(local_ttl)
+        self._lock = threading.Lock()
+        self._local: Dict[int, Tuple[float, dict]] = {}
+        self._listener = None
+        self._stop = threading.Event()
+
+    def _key(self, uid: int) -> str:
+        return f"{self.KEY_PREFIX}{int(uid)}"
+
+    @staticmethod
+    def _to_record(user: User) -> dict:
+        return {
+            'id': user.id,
+            'login': user.login,
+            'name': user.name,
+            'gid': user.gid,
+            'enabled': user.enabled,
+            'permission': ','.join(user.permission),
+            'mask': user.permission_mask,
+        }
+
+    @staticmethod
+    def _from_record(record: dict) -> User:
+        user = User(record['id'], record['login'], record['name'], '', record['gid'],
+                    record['enabled'], record['permission'])
+        user.apply_permission_mask(record['mask'])
+        return user
+
+    def _local_get(self, uid: int) -> Optional[dict]:
+        entry = self._local.get(uid)
+        if not entry:
+            return None
+        expires, record = entry
+        if expires < time.monotonic():
+            self._local.pop(uid, None)
+            return None
+        return record
+
+    def _local_put(self, uid: int, record: dict) -> None:
+        with self._lock:
+            self._local[uid] = (time.monotonic() + self.local_ttl, record)
+
+    def _redis_get(self, uid: int) -> Optional[dict]:
+        if not self.redis:
+            return None
+        try:
+            raw = self.redis.client.get(self._key(uid))
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            _log.warning(f"Principal cache read failed for {uid}: {e}")
+            return None
+
+    def _redis_put(self, uid: int, record: dict) -> None:
+        if not self.redis:
+            return
+        try:
+            self.redis.client.set(self._key(uid), json.dumps(record), ex=self.ttl)
+        except Exception as e:
+            _log.warning(f"Principal cache write failed for {uid}: {e}")
+
+    def _drop_local(self, target: str) -> None:
+        with self._lock:
+            if target == self.ALL:
+                self._local.clear()
+            else:
+                try:
+                    self._local.pop(int(target), None)
+                except (TypeError, ValueError):
+                    pass
+
+    def _publish(self, target: str) -> None:
+        try:
+            self.redis.client.publish(self.CHANNEL, target)
+        except Exception as e:
+            _log.warning(f"Failed to publish principal invalidation {target}: {e}")
+
+    def _listen(self) -> None:
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = self.redis.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                # Invalidations published while not subscribed would be missed
+                self._drop_local(self.ALL)
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        self._drop_local(str(message.get('data')))
+            except Exception as e:
+                if not self._stop.is_set():
+                    _log.warning(f"Principal cache listener error: {e}")
+                    self._stop.wait(1.0)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def start_listener(self) -> None:
+        """Start the pub/sub invalidation listener thread (once per process)."""
+        if not self.redis or (self._listener is not None and self._listener.is_alive()):
+            return
+        self._stop.clear()
+        self._listener = threading.Thread(target=self._listen, name='principal-cache-listener', daemon=True)
+        self._listener.start()
+
+    def shutdown(self) -> None:
+        """Stop the listener thread."""
+        self._stop.set()
+        listener = self._listener
+        if listener is not None:
+            listener.join(timeout=2.0)
+        self._listener = None
+
+    def get_user(self, uid) -> Optional[User]:
+        """Return a fresh User for ``uid`` (None if it does not exist)."""
+        try:
+            uid = int(uid)
+        except (TypeError, ValueError):
+            return None
+        record = self._local_get(uid)
+        if record is None:
+            record = self._redis_get(uid)
+            if record is None:
+                user = self._sql.user_by_id([uid])
+                if not user:
+                    return None
+                record = self._to_record(user)
+                self._redis_put(uid, record)
+            self._local_put(uid, record)
+        return self._from_record(record)
+
+    def invalidate(self, uid) -> None:
+        """Forget one principal in Redis and in every worker."""
+        try:
+            uid = int(uid)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self._local.pop(uid, None)
+        if self.redis:
+            try:
+                self.redis.client.delete(self._key(uid))
+            except Exception as e:
+                _log.warning(f"Principal cache invalidation failed for {uid}: {e}")
+            self._publish(str(uid))
+
+    def invalidate_all(self) -> None:
+        """Forget every principal (group edits, force-logout of everyone)."""
+        with self._lock:
+            self._local.clear()
+        if not self.redis:
+            return
+        try:
+            client = self.redis.client
+            batch = []
+            for key in client.scan_iter(match=f"{self.KEY_PREFIX}*", count=500):
+                batch.append(key)
+                if len(batch) >= 500:
+                    client.delete(*batch)
+                    batch = []
+            if batch:
+                client.delete(*batch)
+        except Exception as e:
+            _log.warning(f"Principal cache flush failed: {e}")
+        self._publish(self.ALL)
@@ -1,120 +1,245 @@
-"""Redis-based rate limiting decorator."""
+"""Redis-based rate limiting (GCRA).
 
+Each limited key stores a single number, its theoretical arrival time (TAT),
+and is checked and updated by one Lua script call: O(1) memory per key and
+one round trip per request, the same across all workers. The sorted-set
+sliding window it replaces needed four commands and kept every request of
+the window in memory.
+
+Keys are per user for authenticated requests and per IP otherwise. With
+``local_share`` > 0 a worker may admit up to that share of a key's remaining
+budget without asking Redis; those admissions are charged to the key on the
+next Redis call. Without Redis the same algorithm runs in process memory.
+"""
+
+import math
+import threading
 import time
 from functools import wraps
+from typing import Any, Callable, Dict, Optional, Tuple
 from flask import request, jsonify, flash, redirect, url_for
 from modules.logging import get_logger
 
 _log = get_logger(__name__)
 
+# KEYS: limit key
+# ARGV: emission interval (ms), burst tolerance (ms), already admitted locally
+# Returns {allowed (0|1), retry after (ms), requests still admissible now}
+_GCRA_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or '0')
+if tat < now then
+  tat = now
+end
+tat = tat + interval * tonumber(ARGV[3])
+local allowed = 0
+local retry_after = 0
+if tat - tolerance <= now then
+  allowed = 1
+  tat = tat + interval
+else
+  retry_after = tat - tolerance - now
+end
+redis.call('SET', KEYS[1], tat, 'PX', math.max(1, math.ceil(tat - now)))
+local remaining = math.max(0, math.floor((now + tolerance - tat) / interval) + 1)
+return {allowed, retry_after, remaining}
+"""
+
+
+def _gcra(tat: float, now: float, interval: float, tolerance: float,
+          pending: int = 0) -> Tuple[bool, float, float, int]:
+    """In-process GCRA step mirroring ``_GCRA_LUA``.
+
+    Returns:
+        (allowed, new TAT, retry after (ms), requests still admissible now)
+    """
+    tat = max(tat, now) + interval * pending
+    if tat - tolerance <= now:
+        tat += interval
+        remaining = max(0, math.floor((now + tolerance - tat) / interval) + 1)
+        return True, tat, 0.0, remaining
+    return False, tat, tat - tolerance - now, 0
+
+
+class RateLimiter:
+    """GCRA limiter shared by the route presets, registrators and the proxy."""
+
+    KEY_PREFIX = 'znf:rl:'
+
+    def __init__(self, redis_client=None, local_share: float = 0.0) -> None:
+        """
+        Args:
+            redis_client: RedisClient (or redis-py client); None keeps state in process
+            local_share: Share (0..1) of a key's remaining budget this worker may
+                admit without a Redis round trip; 0 checks every request in Redis
+        """
+        self.redis = getattr(redis_client, 'client', redis_client)
+        self.local_share = min(1.0, max(0.0, float(local_share)))
+        self._script = self.redis.register_script(_GCRA_LUA) if self.redis is not None else None
+        self._lock = threading.Lock()
+        # key -> TAT (ms) when running without Redis
+        self._tat: Dict[str, float] = {}
+        # key -> [admissions left without Redis, admitted but not yet charged, valid until (ms)]
+        self._local: Dict[str, list] = {}
+
+    @staticmethod
+    def _params(limit: int, window: float) -> Tuple[int, int]:
+        interval = max(1, int(window * 1000 / max(1, limit)))
+        return interval, interval * (max(1, limit) - 1)
+
+    def hit(self, name: str, identity: str, limit: int, window: float) -> Tuple[bool, float]:
+        """Count one request of ``identity`` against ``limit`` per ``window`` seconds.
+
+        Returns:
+            (allowed, seconds until the next request would be allowed)
+        """
+        key = f"{self.KEY_PREFIX}{name}:{identity}"
+        interval, tolerance = self._params(limit, window)
+        now = time.time() * 1000
+        if self._script is None:
+            with self._lock:
+                allowed, tat, retry_after, _ = _gcra(self._tat.get(key, 0.0), now, interval, tolerance)
+                self._tat[key] = tat
+                if len(self._tat) > 10000:
+                    self._tat = {k: v for k, v in self._tat.items() if v > now}
+            return allowed, retry_after / 1000.0
+
+        pending = 0
+        if self.local_share > 0:
+            with self._lock:
+                state = self._local.get(key)
+                if state and state[0] > 0 and state[2] > now:
+                    state[0] -= 1
+                    state[1] += 1
+                    return True, 0.0
+                if state:
+                    pending = state[1]
+                    self._local.pop(key, None)
+        allowed, retry_after, remaining = self._script(keys=[key], args=[interval, tolerance, pending])
+        if allowed and self.local_share > 0:
+            quota = int(int(remaining) * self.local_share)
+            if quota > 0:
+                with self._lock:
+                    # Stop admitting locally before the budget could have refilled elsewhere
+                    self._local[key] = [quota, 0, now + window * 1000]
+                    if len(self._local) > 10000:
+                        self._local = {k: v for k, v in self._local.items() if v[2] > now}
+        return bool(allowed), int(retry_after) / 1000.0
+
+    def limit(self, name: str, max_calls: int, window_sec: float,
+              on_limit: Optional[Callable[[str, float], Any]] = None):
+        """Decorator limiting a view per user (authenticated) or per IP."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                try:
+                    identity = request_identity()
+                    allowed, retry_after = self.hit(name, identity, max_calls, window_sec)
+                    if not allowed:
+                        _log.warning(f"Rate limit exceeded for {identity}:{fn.__name__} ({max_calls}/{window_sec}s)")
+                        handler = on_limit or _limited_response
+                        return handler(fn.__name__, retry_after)
+                except Exception as e:
+                    _log.warning(f"Rate limiting error: {e}, allowing request")
+                return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+def request_identity() -> str:
+    """Rate limit identity of the current request: ``u:<id>`` or ``ip:<addr>``."""
+    try:
+        from flask_login import current_user
+        if getattr(current_user, 'is_authenticated', False) and getattr(current_user, 'id', None) is not None:
+            return f"u:{current_user.id}"
+    except Exception:
+        pass
+    return f"ip:{request.remote_addr or 'unknown'}"
+
+
+def json_limited_response(endpoint: str, retry_after: float):
+    """429 JSON response with Retry-After."""
+    response = jsonify({'error': 'Слишком много запросов, попробуйте позже'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, int(math.ceil(retry_after))))
+    return response
+
+
+def _limited_response(endpoint: str, retry_after: float):
+    """Default response of a limited view (JSON, plain text for login, or flash + redirect)."""
+    # For login endpoint, avoid redirects to break potential loops
+    if endpoint == 'login':
+        # Prefer JSON if requested
+        accept = request.headers.get('Accept', '')
+        if 'application/json' in accept:
+            return jsonify({'error': 'Слишком много попыток входа, попробуйте позже'}), 429
+        # Minimal HTML/text response to stop redirect chains
+        return (
+            'Слишком много попыток входа, попробуйте позже',
+            429,
+            {'Content-Type': 'text/plain; charset=utf-8'}
+        )
+
+    # Check if client expects JSON response
+    if request.headers.get('Accept', '').find('application/json') != -1:
+        return json_limited_response(endpoint, retry_after)
+    flash('Слишком много запросов, попробуйте позже', 'error')
+    # Try to redirect to appropriate page
+    try:
+        if 'admin' in endpoint:
+            return redirect(url_for('admin'))
+        elif 'users' in endpoint:
+            return redirect(url_for('users'))
+        elif 'files' in endpoint:
+            return redirect(url_for('files'))
+        elif 'categories' in endpoint:
+            return redirect(url_for('categories_admin'))
+        else:
+            return redirect('/')
+    except Exception:
+        return redirect('/')
+
 
 def redis_rate_limit(max_calls: int = 60, window_sec: int = 60, redis_client=None):
     """Redis-based rate limiting decorator.
-    
+
     Args:
         max_calls: Maximum number of calls allowed in window
         window_sec: Time window in seconds
-        redis_client: Redis client instance
-        
+        redis_client: Redis client instance or RateLimiter
+
     Returns:
         Decorator function
     """
+    limiter = redis_client if isinstance(redis_client, RateLimiter) else RateLimiter(redis_client)
+
     def decorator(fn):
-        @wraps(fn)
-        def wrapper(*args, **kwargs):
-            if not redis_client:
-                # Fallback to no rate limiting if Redis unavailable
-                return fn(*args, **kwargs)
-            
-            try:
-                # Create rate limit key: IP + endpoint
-                client_ip = request.remote_addr or 'unknown'
-                endpoint = fn.__name__
-                key = f"znf:rate_limit:{client_ip}:{endpoint}"
-                
-                now = time.time()
-                window_start = now - window_sec
-                
-                # Use Redis pipeline for atomic operations
-                pipe = redis_client.pipeline()
-                if pipe:
-                    # Remove old entries
-                    pipe.zremrangebyscore(key, 0, window_start)
-                    # Add current request
-                    pipe.zadd(key, {str(now): now})
-                    # Count current requests
-                    pipe.zcard(key)
-                    # Set expiration
-                    pipe.expire(key, window_sec + 10)
-                    
-                    results = pipe.execute()
-                    if results and len(results) >= 3:
-                        current_count = results[2] or 0
-                        
-                        if current_count > max_calls:
-                            _log.warning(f"Rate limit exceeded for {client_ip}:{endpoint} ({current_count}/{max_calls})")
-
-                            # For login endpoint, avoid redirects to break potential loops
-                            if endpoint == 'login':
-                                # Prefer JSON if requested
-                                accept = request.headers.get('Accept', '')
-                                if 'application/json' in accept:
-                                    return jsonify({'error': 'Слишком много попыток входа, попробуйте позже'}), 429
-                                # Minimal HTML/text response to stop redirect chains
-                                return (
-                                    'Слишком много попыток входа, попробуйте позже',
-                                    429,
-                                    {'Content-Type': 'text/plain; charset=utf-8'}
-                                )
-
-                            # Check if client expects JSON response
-                            if request.headers.get('Accept', '').find('application/json') != -1:
-                                return jsonify({
-                                    'error': 'Слишком много запросов, попробуйте позже'
-                                }), 429
-                            else:
-                                flash('Слишком много запросов, попробуйте позже', 'error')
-                                # Try to redirect to appropriate page
-                                try:
-                                    if 'admin' in endpoint:
-                                        return redirect(url_for('admin'))
-                                    elif 'users' in endpoint:
-                                        return redirect(url_for('users'))
-                                    elif 'files' in endpoint:
-                                        return redirect(url_for('files'))
-                                    elif 'categories' in endpoint:
-                                        return redirect(url_for('categories_admin'))
-                                    else:
-                                        return redirect('/')
-                                except Exception:
-                                    return redirect('/')
-                else:
-                    # Pipeline failed, allow request but log warning
-                    _log.warning(f"Redis pipeline failed for rate limiting, allowing request")
-                
-            except Exception as e:
-                _log.warning(f"Rate limiting error: {e}, allowing request")
-            
-            return fn(*args, **kwargs)
-        
-        return wrapper
-    
+        return limiter.limit(fn.__name__, max_calls, window_sec)(fn)
+
     return decorator
 
 
-def create_rate_limiter(redis_client):
+def create_rate_limiter(redis_client, local_share: float = 0.0):
     """Create rate limiter instances for different endpoints.
-    
+
     Args:
-        redis_client: Redis client instance
-        
+        redis_client: Redis client instance or RateLimiter
+        local_share: See ``RateLimiter``
+
     Returns:
         Dict of rate limiter decorators
     """
-    def make_limiter(max_calls, window_sec):
+    limiter = redis_client if isinstance(redis_client, RateLimiter) else RateLimiter(redis_client, local_share)
+
+    def make_limiter(max_calls, window_sec, on_limit=None):
         """Create a rate limiter with specific parameters."""
-        return redis_rate_limit(max_calls, window_sec, redis_client)
-    
+        def decorator(fn):
+            return limiter.limit(fn.__name__, max_calls, window_sec, on_limit)(fn)
+        return decorator
+
     return {
         'login': make_limiter(20, 60),     # 20 attempts per minute (increased for force logout scenarios)
         'admin': make_limiter(30, 60),      # 30 requests per minute
@@ -123,5 +248,6 @@ def create_rate_limiter(redis_client):
         'categories': make_limiter(20, 60), # 20 requests per minute
         'groups': make_limiter(60, 60),     # 60 requests per minute
         'proxy': make_limiter(10, 60),      # 10 requests per minute
+        'registrators': make_limiter(60, 60, json_limited_response),  # 60 requests per minute (JSON API)
         'default': make_limiter(60, 60)    # Default rate limit
     }
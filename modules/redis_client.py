@@ -1,6 +1,17 @@
-"""Redis client wrapper with connection management and fallback handling."""
+"""Redis client wrapper with connection management and fallback handling.
 
+Every Redis user in a process shares one connection pool per URL
+(``shared_redis``). Idle connections are health-checked by redis-py before
+reuse (``health_check_interval``) and failed commands are retried on a fresh
+connection, so callers no longer PING before each command or open their own
+``redis.Redis`` clients.
+"""
+
+import os
+import threading
 import redis
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
 import time
 import json
 from typing import Any, Optional, Dict, List, Union, Set, TypeVar, Callable, cast
@@ -8,6 +19,90 @@ from modules.logging import get_logger
 
 _log = get_logger(__name__)
 
+# (pid, url) -> client on the process-wide pool
+_shared_clients: Dict[Any, redis.Redis] = {}
+_shared_lock = threading.Lock()
+
+
+def redis_config_from(config) -> Dict[str, Any]:
+    """Plain [redis] config dict from a ConfigParser ({} if the section is missing)."""
+    if config is None or not config.has_section('redis'):
+        return {}
+    section = config['redis']
+    try:
+        port = int(section.get('port', fallback='6379') or 6379)
+    except (ValueError, TypeError):
+        port = 6379
+    return {
+        'server': section.get('server', fallback=None) or section.get('host', fallback=None),
+        'port': port,
+        'password': section.get('password', fallback=None),
+        'socket': section.get('socket', fallback=None),
+        'db': section.get('db', fallback='0'),
+        'health_check_interval': section.getint('health_check_interval', fallback=30),
+        'max_connections': section.getint('max_connections', fallback=64),
+    }
+
+
+def redis_url(config: Dict[str, Any]) -> str:
+    """Build a redis-py URL from a [redis] config dict (unix socket preferred)."""
+    if config.get('socket'):
+        if config.get('password'):
+            return f"unix://:{config['password']}@{config['socket']}?db={config.get('db', 0)}"
+        return f"unix://{config['socket']}?db={config.get('db', 0)}"
+    host = config.get('server', 'localhost')
+    port = config.get('port', 6379)
+    password = config.get('password')
+    db = config.get('db', 0)
+    if password:
+        return f"redis://:{password}@{host}:{port}/{db}"
+    return f"redis://{host}:{port}/{db}"
+
+
+def shared_redis(config: Dict[str, Any]) -> redis.Redis:
+    """Process-wide client for ``config`` on a health-checked connection pool.
+
+    Args:
+        config: [redis] config dict (see ``redis_config_from``); optional keys
+            ``health_check_interval`` (seconds a connection may idle before it is
+            PINGed on checkout) and ``max_connections``
+
+    Returns:
+        redis.Redis: Client with decode_responses=True; reconnects by itself
+    """
+    url = redis_url(config)
+    key = (os.getpid(), url)
+    client = _shared_clients.get(key)
+    if client is not None:
+        return client
+    with _shared_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            pool = redis.ConnectionPool.from_url(
+                url,
+                decode_responses=True,
+                socket_connect_timeout=5,
+                socket_timeout=5,
+                health_check_interval=int(config.get('health_check_interval') or 30),
+                max_connections=int(config.get('max_connections') or 64),
+                retry=Retry(ExponentialBackoff(cap=1.0, base=0.05), 3),
+                retry_on_error=[redis.ConnectionError, redis.TimeoutError])
+            client = redis.Redis(connection_pool=pool)
+            _shared_clients[key] = client
+    return client
+
+
+def close_shared_redis() -> None:
+    """Disconnect all shared pools of this process (on shutdown)."""
+    with _shared_lock:
+        clients = list(_shared_clients.values())
+        _shared_clients.clear()
+    for client in clients:
+        try:
+            client.connection_pool.disconnect()
+        except Exception:
+            pass
+
 
 class RedisClient:
     """Redis client with automatic reconnection and fallback handling."""
@@ -31,24 +126,9 @@ class RedisClient:
     def _connect(self) -> bool:
         """Establish Redis connection."""
         try:
-            # Prefer unix socket if available
-            if self.config.get('socket'):
-                if self.config.get('password'):
-                    url = f"unix://:{self.config['password']}@{self.config['socket']}?db={self.config.get('db', 0)}"
-                else:
-                    url = f"unix://{self.config['socket']}?db={self.config.get('db', 0)}"
-            else:
-                host = self.config.get('server', 'localhost')
-                port = self.config.get('port', 6379)
-                password = self.config.get('password')
-                db = self.config.get('db', 0)
-                
-                if password:
-                    url = f"redis://:{password}@{host}:{port}/{db}"
-                else:
-                    url = f"redis://{host}:{port}/{db}"
+            url = redis_url(self.config)
             
-            self.client = redis.from_url(url, decode_responses=True, socket_connect_timeout=5, socket_timeout=5)
+            self.client = shared_redis(self.config)
             
             # Test connection
             self.client.ping()
@@ -74,21 +154,13 @@ class RedisClient:
             return False
     
     def _ensure_connection(self) -> bool:
-        """Ensure Redis connection is active, reconnect if needed."""
+        """Ensure a client exists; the pool health-checks and reconnects connections."""
         if self._shutdown:
             return False
             
         if not self.connected or not self.client:
             return self._connect()
-        
-        try:
-            self.client.ping()
-            return True
-        except Exception:
-            if not self._shutdown:
-                _log.warning("Redis connection lost, attempting to reconnect...")
-                return self._connect()
-            return False
+        return True
     
     # --- Internal helper to deduplicate guards/try/except ---
     T = TypeVar('T')
@@ -100,6 +172,12 @@ class RedisClient:
             if client is None:
                 return default
             return func(client)
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            # Retries on fresh connections failed: reconnect on the next call
+            self.connected = False
+            self.last_error = str(e)
+            _log.warning(f"Redis connection lost: {e}")
+            return default
         except Exception as e:
             _log.warning(f"Redis call failed: {e}")
             return default
@@ -117,6 +195,12 @@ class RedisClient:
         """Get value by key with fallback."""
         return self._call(lambda c: c.get(key), None)
     
+    def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Get several values in one round trip (None for missing keys)."""
+        if not keys:
+            return []
+        return self._call(lambda c: c.mget(keys), [None] * len(keys)) or [None] * len(keys)
+    
     def set(self, key: str, value: str, ex: Optional[int] = None) -> bool:
         """Set value with optional expiration."""
         return self._call(lambda c: bool(c.set(key, value, ex=ex)), False)
@@ -1,10 +1,21 @@
-"""Registrators support: URL templating and HTTP directory browsing."""
+"""Registrators support: URL templating and HTTP directory browsing (cached)."""
 
-from typing import List, Tuple, Dict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import hashlib
+import json
 import re
+import threading
+import time
+import urllib.error
 import urllib.request
 import urllib.parse
 
+from modules.logging import get_logger
+
+_log = get_logger(__name__)
+
 
 TEMPLATE_MARKERS = ["<date>", "<user>", "<time>", "<type>", "<file>"]
 
@@ -77,16 +88,8 @@ class Registrator:
 		return url
 
 
-def parse_directory_listing(url: str) -> List[str]:
-	"""Fetch an HTTP directory listing and return entry names.
-
-	The target servers expose index of folders; we parse anchors (href) and return names.
-	"""
-	try:
-		with urllib.request.urlopen(url, timeout=8) as resp:
-			html = resp.read().decode("utf-8", "ignore")
-	except Exception:
-		return []
+def parse_listing_html(html: str) -> List[str]:
+	"""Return the sorted, de-duplicated entry names of a directory index page."""
 	# Match href values in <a href="name/"> or files; exclude parent dirs
 	names: List[str] = []
 	for m in re.finditer(r"<a\s+href=\"([^\"]+)\"", html, flags=re.IGNORECASE):
@@ -111,4 +114,228 @@ def parse_directory_listing(url: str) -> List[str]:
 	return uniq
 
 
+def fetch_directory_listing(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+		timeout: float = 8) -> Tuple[int, List[str], Optional[str], Optional[str]]:
+	"""Conditionally fetch a directory listing.
+
+	Returns:
+		(status, names, etag, last_modified); status 304 means the cached
+		listing is still valid and ``names`` is empty.
+
+	Raises:
+		Exception: On network errors and HTTP errors other than 304.
+	"""
+	req = urllib.request.Request(url)
+	if etag:
+		req.add_header("If-None-Match", etag)
+	if last_modified:
+		req.add_header("If-Modified-Since", last_modified)
+	try:
+		with urllib.request.urlopen(req, timeout=timeout) as resp:
+			html = resp.read().decode("utf-8", "ignore")
+			return (resp.status, parse_listing_html(html), resp.headers.get("ETag"),
+				resp.headers.get("Last-Modified"))
+	except urllib.error.HTTPError as e:
+		if e.code == 304:
+			return 304, [], etag, last_modified
+		raise
+
+
+def parse_directory_listing(url: str) -> List[str]:
+	"""Fetch an HTTP directory listing and return entry names.
+
+	The target servers expose index of folders; we parse anchors (href) and return names.
+	"""
+	try:
+		return fetch_directory_listing(url)[1]
+	except Exception:
+		return []
+
+
+class RegistratorIndex:
+	"""Redis-cached directory listings of registrators with background prefetch.
+
+	Registrators run slow embedded web servers, so every listing is cached per
+	URL. A listing younger than ``ttl`` is served as is; an older one is
+	revalidated with If-None-Match/If-Modified-Since and kept (up to
+	``stale_ttl``) when the registrator is unreachable. Opening a level
+	prefetches the next one on a small bounded pool, and each fetch feeds
+	per-registrator latency counters.
+	"""
+
+	KEY_PREFIX = 'znf:reg:index:'
+	STATS_PREFIX = 'znf:reg:stats:'
+
+	def __init__(self, redis_client=None, ttl: int = 60, stale_ttl: int = 86400, timeout: float = 8,
+			prefetch_workers: int = 4, prefetch_limit: int = 10):
+		"""
+		Args:
+			redis_client: Optional RedisClient shared between workers (process map otherwise)
+			ttl: Seconds a listing is served without revalidation
+			stale_ttl: Seconds a listing is kept as a fallback for unreachable registrators
+			timeout: HTTP timeout of one listing request
+			prefetch_workers: Concurrent background prefetch requests (0 disables prefetch)
+			prefetch_limit: Child listings prefetched per opened level
+		"""
+		self.redis = redis_client
+		self.ttl = max(0, int(ttl))
+		self.stale_ttl = max(self.ttl, int(stale_ttl))
+		self.timeout = timeout
+		self.prefetch_limit = max(0, int(prefetch_limit))
+		self._pool = ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix='reg-prefetch') \
+			if prefetch_workers > 0 else None
+		self._lock = threading.Lock()
+		self._inflight: Set[str] = set()
+		self._local: Dict[str, dict] = {}
+		self._local_stats: Dict[str, Dict[str, float]] = {}
+
+	def _key(self, url: str) -> str:
+		return self.KEY_PREFIX + hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+	def _get(self, url: str) -> Optional[dict]:
+		if not self.redis:
+			return self._local.get(url)
+		try:
+			raw = self.redis.get(self._key(url))
+			return json.loads(raw) if raw else None
+		except Exception:
+			return None
+
+	def _get_many(self, urls: List[str]) -> List[Optional[dict]]:
+		"""Cached records of ``urls`` (one MGET with Redis)."""
+		if not self.redis:
+			return [self._local.get(url) for url in urls]
+		try:
+			raws = self.redis.mget([self._key(url) for url in urls])
+			return [json.loads(raw) if raw else None for raw in raws]
+		except Exception:
+			return [None] * len(urls)
+
+	def _put(self, url: str, record: dict) -> None:
+		if not self.redis:
+			with self._lock:
+				self._local[url] = record
+			return
+		try:
+			self.redis.set(self._key(url), json.dumps(record), ex=self.stale_ttl)
+		except Exception as e:
+			_log.warning(f"Registrator index write failed for {url}: {e}")
+
+	def _record_stat(self, rid, outcome: str, seconds: float) -> None:
+		if rid is None:
+			return
+		ms = seconds * 1000.0
+		key = f"{self.STATS_PREFIX}{rid}"
+		if not self.redis:
+			with self._lock:
+				st = self._local_stats.setdefault(key, {})
+				st[outcome] = st.get(outcome, 0) + 1
+				if outcome != 'hit':
+					st['requests'] = st.get('requests', 0) + 1
+					st['total_ms'] = st.get('total_ms', 0.0) + ms
+					st['max_ms'] = max(st.get('max_ms', 0.0), ms)
+					st['last_ms'] = ms
+			return
+		try:
+			pipe = self.redis.pipeline()
+			if pipe is None:
+				return
+			pipe.hincrby(key, outcome, 1)
+			if outcome != 'hit':
+				pipe.hincrby(key, 'requests', 1)
+				pipe.hincrbyfloat(key, 'total_ms', ms)
+				pipe.hset(key, 'last_ms', f"{ms:.1f}")
+			pipe.execute()
+			if outcome != 'hit':
+				# Read-modify-write is fine for a monitoring maximum
+				current = float(self.redis.hget(key, 'max_ms') or 0)
+				if ms > current:
+					self.redis.hset(key, 'max_ms', f"{ms:.1f}")
+		except Exception as e:
+			_log.warning(f"Registrator stats update failed for {rid}: {e}")
+
+	def stats(self, rid) -> Dict[str, float]:
+		"""Latency counters of one registrator (hits, revalidated, fetched, errors, avg/max/last ms)."""
+		key = f"{self.STATS_PREFIX}{rid}"
+		if self.redis:
+			raw = self.redis.hgetall(key) or {}
+		else:
+			raw = dict(self._local_stats.get(key, {}))
+		out: Dict[str, float] = {}
+		for name in ('hit', 'revalidated', 'fetched', 'error', 'requests'):
+			out[name] = int(float(raw.get(name) or 0))
+		for name in ('total_ms', 'max_ms', 'last_ms'):
+			out[name] = round(float(raw.get(name) or 0), 1)
+		out['avg_ms'] = round(out['total_ms'] / out['requests'], 1) if out['requests'] else 0.0
+		return out
+
+	def listing(self, url: str, rid=None, max_age: Optional[float] = None) -> List[str]:
+		"""Entry names at ``url``, from cache when fresh, revalidated otherwise."""
+		max_age = self.ttl if max_age is None else max_age
+		record = self._get(url)
+		now = time.time()
+		if record and now - float(record.get('fetched_at') or 0) < max_age:
+			self._record_stat(rid, 'hit', 0.0)
+			return list(record.get('names') or [])
+		started = time.monotonic()
+		try:
+			status, names, etag, last_modified = fetch_directory_listing(
+				url,
+				etag=(record or {}).get('etag'),
+				last_modified=(record or {}).get('last_modified'),
+				timeout=self.timeout)
+		except Exception as e:
+			self._record_stat(rid, 'error', time.monotonic() - started)
+			_log.warning(f"Registrator listing failed for {url}: {e}")
+			# A stale listing beats an empty one while the device is offline
+			return list((record or {}).get('names') or [])
+		if status == 304 and record:
+			self._record_stat(rid, 'revalidated', time.monotonic() - started)
+			names = list(record.get('names') or [])
+		else:
+			self._record_stat(rid, 'fetched', time.monotonic() - started)
+		self._put(url, {
+			'names': names,
+			'etag': etag,
+			'last_modified': last_modified,
+			'fetched_at': now,
+		})
+		return names
+
+	def prefetch(self, urls: Iterable[str], rid=None) -> int:
+		"""Warm the cache for the first ``prefetch_limit`` URLs in the background.
+
+		Returns:
+			int: Number of URLs scheduled (already fresh or in-flight ones are skipped).
+		"""
+		if self._pool is None:
+			return 0
+		candidates = list(islice(urls, self.prefetch_limit))
+		if not candidates:
+			return 0
+		now = time.time()
+		scheduled = 0
+		for url, record in zip(candidates, self._get_many(candidates)):
+			if record and now - float(record.get('fetched_at') or 0) < self.ttl:
+				continue
+			with self._lock:
+				if url in self._inflight:
+					continue
+				self._inflight.add(url)
+			self._pool.submit(self._prefetch_one, url, rid)
+			scheduled += 1
+		return scheduled
+
+	def _prefetch_one(self, url: str, rid) -> None:
+		try:
+			self.listing(url, rid)
+		except Exception as e:
+			_log.warning(f"Registrator prefetch failed for {url}: {e}")
+		finally:
+			with self._lock:
+				self._inflight.discard(url)
 
+	def shutdown(self) -> None:
+		"""Stop the prefetch pool without waiting for pending requests."""
+		if self._pool is not None:
+			self._pool.shutdown(wait=False)
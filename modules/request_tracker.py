@@ -0,0 +1,165 @@
+"""
+Per-request session bookkeeping for ``before_request``.
+
+Every authenticated request used to issue several Redis round trips
+(HSET/EXPIRE on ``sessions:active`` and ``presence:users``, each preceded
+by a PING) and walk all of ``app._sessions`` to prune expired entries. The
+tracker instead:
+
+- sends the due writes in one pipeline;
+- coalesces last-seen writes: an entry is rewritten only when its details
+  changed or ``write_interval`` seconds have passed since the last write;
+- keeps in-process sessions in an insertion-ordered map by last-seen, so
+  pruning only pops expired entries from the front.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from time import time
+from typing import Any, Dict, Optional, Tuple
+
+from modules.logging import get_logger
+
+_log = get_logger(__name__)
+
+SESSIONS_KEY = 'sessions:active'
+PRESENCE_KEY = 'presence:users'
+
+
+class SessionTTLMap(OrderedDict):
+    """``sid -> entry`` dict ordered by ``last_seen`` (oldest first)."""
+
+    def touch(self, sid: str, entry: Dict[str, Any]) -> None:
+        """Store ``entry`` as the most recently seen session."""
+        self[sid] = entry
+        self.move_to_end(sid)
+
+    def prune(self, cutoff: float) -> int:
+        """Drop sessions last seen before ``cutoff``; O(expired)."""
+        removed = 0
+        while self:
+            sid, entry = next(iter(self.items()))
+            try:
+                if float(entry.get('last_seen') or 0) >= cutoff:
+                    break
+            except (TypeError, ValueError, AttributeError):
+                pass
+            self.pop(sid, None)
+            removed += 1
+        return removed
+
+
+class RequestTracker:
+    """Coalesced, pipelined session/presence bookkeeping."""
+
+    def __init__(self,
+                 write_interval: float = 10.0,
+                 session_ttl: int = 1800,
+                 presence_ttl: int = 60) -> None:
+        """
+        Args:
+            write_interval: Seconds an unchanged last-seen entry is not rewritten
+                (must stay below the 30 s window of the presence views)
+            session_ttl: TTL of the ``sessions:active`` hash
+            presence_ttl: TTL of the ``presence:users`` hash
+        """
+        self.write_interval = max(0.0, float(write_interval))
+        self.session_ttl = int(session_ttl)
+        self.presence_ttl = int(presence_ttl)
+        self.sessions = SessionTTLMap()
+        self._lock = threading.Lock()
+        # (hash, field) -> (time of last write, details fingerprint)
+        self._written: 'OrderedDict[Tuple[str, str], Tuple[float, str]]' = OrderedDict()
+
+    def _due(self, key: Tuple[str, str], fingerprint: str, now: float) -> bool:
+        with self._lock:
+            # Entries older than the interval would be rewritten anyway
+            while self._written:
+                oldest_key, (written_at, _) = next(iter(self._written.items()))
+                if now - written_at < self.write_interval:
+                    break
+                self._written.pop(oldest_key, None)
+            last = self._written.get(key)
+            if last and last[1] == fingerprint:
+                return False
+            self._written[key] = (now, fingerprint)
+            self._written.move_to_end(key)
+            return True
+
+    def forget(self, sid: Optional[str] = None) -> None:
+        """Drop coalescing state so the next request writes through."""
+        with self._lock:
+            if sid is None:
+                self._written.clear()
+            else:
+                self._written.pop((SESSIONS_KEY, sid), None)
+
+    def touch_session(self, sid: str, uid: Any, uname: Any, ip: str, ua: str,
+                      now: float, max_age: float) -> Dict[str, Any]:
+        """Update the in-process session entry and prune expired ones."""
+        entry = self.sessions.get(sid) or {'created_at': now}
+        entry.update({'user_id': uid, 'user': uname, 'ip': ip, 'ua': ua, 'last_seen': now})
+        self.sessions.touch(sid, entry)
+        self.sessions.prune(now - max_age)
+        return entry
+
+    def track(self,
+              client: Any,
+              sid: Optional[str],
+              entry: Optional[Dict[str, Any]],
+              page: Optional[str]) -> bool:
+        """Write due bookkeeping in one round trip.
+
+        Args:
+            client: redis-py client (``RedisClient.client``)
+            sid: Session cookie value
+            entry: In-process session entry of an authenticated user (None otherwise)
+            page: Request path when it is a real page (updates ``presence:users``)
+
+        Returns:
+            bool: True when Redis was written
+        """
+        now = time()
+        pipe = client.pipeline(transaction=False)
+        queued = False
+        marked = []
+        if entry is not None and sid:
+            fingerprint = f"{entry.get('user_id')}|{entry.get('ip')}|{entry.get('ua')}"
+            if self._due((SESSIONS_KEY, sid), fingerprint, now):
+                marked.append((SESSIONS_KEY, sid))
+                pipe.hset(SESSIONS_KEY, sid, json.dumps({
+                    'sid': sid,
+                    'user_id': entry.get('user_id'),
+                    'user': entry.get('user'),
+                    'ip': entry.get('ip'),
+                    'ua': entry.get('ua'),
+                    'created_at': entry.get('created_at', now),
+                    'last_activity': now
+                }))
+                pipe.expire(SESSIONS_KEY, self.session_ttl)
+                queued = True
+            if page:
+                user_key = f"{entry.get('user')}|{entry.get('ip')}"
+                if self._due((PRESENCE_KEY, user_key), f"{page}|{entry.get('ua')}", now):
+                    marked.append((PRESENCE_KEY, user_key))
+                    pipe.hset(PRESENCE_KEY, user_key, json.dumps({
+                        'user': entry.get('user'),
+                        'ip': entry.get('ip'),
+                        'ua': entry.get('ua'),
+                        'page': page,
+                        'lastSeen': int(now * 1000)  # Convert to milliseconds
+                    }))
+                    pipe.expire(PRESENCE_KEY, self.presence_ttl)
+                    queued = True
+        if not queued:
+            return False
+        try:
+            pipe.execute()
+        except Exception:
+            # Writes did not happen: let the next request retry them
+            with self._lock:
+                for key in marked:
+                    self._written.pop(key, None)
+            raise
+        return True
@@ -11,6 +11,9 @@ from flask_login import LoginManager, current_user
 from flask_session import Session
 
 from modules.SQLUtils import SQLUtils
+from modules.category_tree import CategoryTree
+from modules.principal_cache import PrincipalCache
+from modules.storage_paths import StoragePathResolver, set_default_resolver
 
 
 class Server(Flask):
@@ -53,6 +56,22 @@ class Server(Flask):
 		self.login_manager.login_message = 'Please log in to access this page.'
 		self.login_manager.refresh_view = 'reauth'  # type: ignore[assignment]
 		self._sql = SQLUtils()
+		# Shared category/subcategory tree (one joined query, invalidated via Redis version stamp)
+		self.category_tree = CategoryTree(self._sql, getattr(self, 'redis_client', None))
+		# Storage paths resolved from the cached tree (zero queries per file, usable outside app context)
+		try:
+			files_root = self._sql.config['files']['root']
+		except Exception:
+			files_root = '/var/lib/znf-files'
+		self.storage_paths = StoragePathResolver(files_root, self.category_tree)
+		self._sql.storage_paths = self.storage_paths
+		set_default_resolver(self.storage_paths)
+		# Principals for user_loader (user row + permission bitmask; process + Redis cache)
+		self.principal_cache = PrincipalCache(
+			self._sql,
+			getattr(self, 'redis_client', None),
+			ttl=self._sql.config.getint('web', 'principal_ttl', fallback=30),
+			local_ttl=self._sql.config.getfloat('web', 'principal_local_ttl', fallback=5.0))
 		# Load Flask secret key from DB (create if missing) unless provided via env
 		try:
 			if getenv('SECRET_KEY') is None:
@@ -77,42 +96,8 @@ class Server(Flask):
 		- Include only enabled categories and enabled subcategories
 		- Do not include categories that have no enabled subcategories
 		"""
-		self.dirs = []
 		try:
-			categories = self._sql.category_all() or []
-			for cat in categories:
-				try:
-					# Skip disabled and system 'registrators'
-					if hasattr(cat, 'enabled') and int(cat.enabled) != 1:
-						continue
-					if (getattr(cat, 'folder_name', '') or '').strip().lower() == 'registrators':
-						continue
-					# Collect enabled subcategories
-					enabled_subs = []
-					subcategories = self._sql.subcategory_by_category([cat.id]) or []
-					for sub in subcategories:
-						if hasattr(sub, 'enabled') and int(sub.enabled) == 1:
-							enabled_subs.append(sub)
-					# Skip category without enabled subcategories
-					if not enabled_subs:
-						continue
-					# Add category root
-					self.dirs.append({cat.folder_name: cat.display_name})
-					# Add enabled subcategories
-					for sub in enabled_subs:
-						try:
-							# Avoid key collision when sub folder equals category folder
-							key = sub.folder_name
-							cat_key = list(self.dirs[len(self.dirs) - 1].keys())[0]
-							if str(key) == str(cat_key):
-								# Suffix with stable marker and id
-								key = f"{sub.folder_name}__dup_{sub.id}"
-							self.dirs[len(self.dirs) - 1].update({key: sub.display_name})
-						except Exception:
-							# Fallback without normalization
-							self.dirs[len(self.dirs) - 1].update({sub.folder_name: sub.display_name})
-				except Exception:
-					continue
+			self.dirs = self.category_tree.dirs()
 		except Exception as e:
 			try:
 				self.logger.warning("Could not load categories from database: %s", e)
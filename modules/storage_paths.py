@@ -0,0 +1,89 @@
+"""
+Storage path resolution for files without per-file DB queries.
+
+Files live under ``<files.root>/files/<category folder>/<subcategory folder>``.
+The resolver keeps id→folder maps built from the shared CategoryTree and
+rebuilds them whenever the tree reloads. A process-wide default instance is
+registered at startup so code outside a Flask app context (background
+threads, ``File`` objects) can resolve paths as well.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from modules.logging import get_logger
+
+_log = get_logger(__name__)
+
+
+class StoragePathResolver:
+    """Resolve storage directories from category/subcategory ids in memory."""
+
+    def __init__(self, files_root: str, category_tree):
+        """
+        Args:
+            files_root: Root path for files storage (config files.root)
+            category_tree: CategoryTree providing categories/subcategories
+        """
+        root = str(files_root or '/var/lib/znf-files')
+        self.files_root = root if os.path.isabs(root) else os.path.abspath(root)
+        self.tree = category_tree
+        self._lock = threading.Lock()
+        self._generation = -1
+        self._cat_folders: Dict[int, str] = {}
+        self._sub_folders: Dict[int, str] = {}
+        self._forced_at = 0.0
+
+    def _refresh(self) -> None:
+        generation = self.tree.current_generation()
+        if generation == self._generation:
+            return
+        with self._lock:
+            if generation == self._generation:
+                return
+            self._cat_folders = {
+                int(c.id): c.folder_name
+                for c in self.tree.categories()
+            }
+            self._sub_folders = {
+                int(s.id): s.folder_name
+                for s in self.tree.all_subcategories()
+            }
+            self._generation = generation
+
+    def folders(self, category_id, subcategory_id) -> Tuple[str, str]:
+        """Return (category folder, subcategory folder); empty strings when unknown."""
+        cat_id, sub_id = int(category_id or 0), int(subcategory_id or 0)
+        try:
+            self._refresh()
+            unknown = (cat_id and cat_id not in self._cat_folders) or (
+                sub_id and sub_id not in self._sub_folders)
+            if unknown and time.monotonic() - self._forced_at > 5:
+                # Possibly created moments ago in another worker: reload (rate-limited)
+                self._forced_at = time.monotonic()
+                self.tree.reload()
+                self._refresh()
+        except Exception as e:
+            _log.warning(f"Failed to refresh storage folders: {e}")
+        return self._cat_folders.get(cat_id, ''), self._sub_folders.get(sub_id, '')
+
+    def storage_dir(self, category_id, subcategory_id) -> str:
+        """Absolute directory for the given category/subcategory ids."""
+        cat_folder, sub_folder = self.folders(category_id, subcategory_id)
+        return os.path.join(self.files_root, 'files', cat_folder, sub_folder)
+
+
+_default_resolver: Optional[StoragePathResolver] = None
+
+
+def set_default_resolver(resolver: Optional[StoragePathResolver]) -> None:
+    """Register process-wide resolver (done once at app startup)."""
+    global _default_resolver
+    _default_resolver = resolver
+
+
+def get_default_resolver() -> Optional[StoragePathResolver]:
+    """Return process-wide resolver or None if not initialized."""
+    return _default_resolver
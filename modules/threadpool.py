@@ -1,7 +1,6 @@
 """Simple thread pool for background tasks with a concurrency cap."""
 
 import logging
-import redis
 from threading import Thread, Lock
 from queue import Queue, Empty
 from time import sleep
@@ -57,52 +56,12 @@ class ThreadPool:
 				self._queue.task_done()
 
 	def _create_redis_client_for_logging(self):
-		"""Create a temporary Redis client for logging synchronization using config settings."""
+		"""Shared Redis client for logging synchronization using config settings."""
 		try:
 			# Import here to avoid circular imports
 			from modules.core import Config
-			temp_config = Config()
-			redis_config = {}
-			
-			# Try dict-style access first
-			try:
-				redis_config = temp_config.config['redis']
-			except Exception:
-				# Fallback to ConfigParser-style access
-				try:
-					redis_config = {
-						'server': temp_config.config.get('redis', 'server', fallback=None),
-						'port': temp_config.config.get('redis', 'port', fallback=6379),
-						'password': temp_config.config.get('redis', 'password', fallback=None),
-						'socket': temp_config.config.get('redis', 'socket', fallback=None),
-						'db': temp_config.config.get('redis', 'db', fallback=0)
-					}
-					# Convert port to int
-					try:
-						redis_config['port'] = int(redis_config['port'])
-					except (ValueError, TypeError):
-						redis_config['port'] = 6379
-				except Exception:
-					redis_config = {}
-			
-			# Create Redis client using the same logic as RedisClient
-			if redis_config.get('socket'):
-				if redis_config.get('password'):
-					url = f"unix://:{redis_config['password']}@{redis_config['socket']}?db={redis_config.get('db', 0)}"
-				else:
-					url = f"unix://{redis_config['socket']}?db={redis_config.get('db', 0)}"
-			else:
-				host = redis_config.get('server', 'localhost')
-				port = redis_config.get('port', 6379)
-				password = redis_config.get('password')
-				db = redis_config.get('db', 0)
-				
-				if password:
-					url = f"redis://:{password}@{host}:{port}/{db}"
-				else:
-					url = f"redis://{host}:{port}/{db}"
-			
-			return redis.from_url(url, decode_responses=True, socket_connect_timeout=5, socket_timeout=5)
+			from modules.redis_client import redis_config_from, shared_redis
+			return shared_redis(redis_config_from(Config().config))
 		except Exception:
 			return None
 
@@ -0,0 +1,331 @@
+"""
+Registry of background registrator uploads in Redis.
+
+The upload helpers used to open a new ``redis.Redis`` connection per call,
+hardcoded the parallel limit and checked the active set before adding to it
+(so concurrent requests could all pass the check), and rewrote the whole JSON
+job on every progress tick. Jobs now live on the shared connection pool:
+
+- ``job:<id>``  hash per job; counters change with HINCRBY, lists/dicts are
+  stored as JSON fields;
+- ``slots``     sorted set used as a semaphore: member = upload id, score =
+  lease deadline. Acquisition is a Lua script (expired leases are dropped,
+  then the id is added only below the limit), so the limit holds under
+  concurrency and the slot of a dead worker frees itself when its lease runs
+  out. Holding a slot also means owning the job;
+- ``running``   set of jobs with status 'running' (listing and resume).
+
+Cancelling a job with a live worker only sets ``cancel_requested``; the
+worker notices it at its next checkpoint, removes the files it registered
+and finishes the job, so the slot stays taken until the transfer stopped.
+"""
+
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from modules.logging import get_logger
+
+_log = get_logger(__name__)
+
+# KEYS: slots
+# ARGV: now (s), lease deadline (s), limit, upload id
+# Returns {granted (0|1), slots in use}
+_ACQUIRE_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZSCORE', KEYS[1], ARGV[4]) then
+  return {0, redis.call('ZCARD', KEYS[1])}
+end
+local used = redis.call('ZCARD', KEYS[1])
+if used >= tonumber(ARGV[3]) then
+  return {0, used}
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+return {1, used + 1}
+"""
+
+_JSON_FIELDS = ('file_urls', 'file_names', 'resume', 'uploaded_files')
+_INT_FIELDS = ('user_id', 'total_files', 'completed_files', 'error_count',
+               'current_file_progress', 'bytes_done', 'progress')
+_FLOAT_FIELDS = ('start_time', 'created_at', 'updated_at', 'end_time',
+                 'cancelled_at')
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+class UploadCancelled(Exception):
+    """The job was cancelled; raised by its worker to stop the transfer."""
+
+
+class UploadJobRegistry:
+    """Upload jobs, their progress counters and a leased slot semaphore."""
+
+    KEY_PREFIX = 'znf:uploads:'
+
+    def __init__(self,
+                 redis,
+                 max_parallel: int = 3,
+                 lease_seconds: int = 180,
+                 job_ttl: int = 3600,
+                 progress_interval: float = 1.0) -> None:
+        """
+        Args:
+            redis: redis-py client (``RedisClient.client``) with decode_responses=True
+            max_parallel: Uploads that may run at the same time
+            lease_seconds: Slot lifetime without ``renew`` (worker presumed dead after it)
+            job_ttl: Seconds a job hash lives after its last update
+            progress_interval: Minimum seconds between two progress writes of one job
+        """
+        self.redis = redis
+        self.max_parallel = max(1, int(max_parallel))
+        self.lease_seconds = max(1, int(lease_seconds))
+        self.job_ttl = max(60, int(job_ttl))
+        self.progress_interval = max(0.0, float(progress_interval))
+        self.slots_key = self.KEY_PREFIX + 'slots'
+        self.running_key = self.KEY_PREFIX + 'running'
+        self._acquire = redis.register_script(_ACQUIRE_LUA)
+        self._lock = threading.Lock()
+        # upload id -> (monotonic time of last write, bytes reported so far)
+        self._reported: Dict[str, Tuple[float, int]] = {}
+
+    def _job_key(self, upload_id: str) -> str:
+        return f"{self.KEY_PREFIX}job:{upload_id}"
+
+    @staticmethod
+    def _encode(fields: Dict[str, Any]) -> Dict[str, str]:
+        out = {}
+        for name, value in fields.items():
+            if name in _JSON_FIELDS:
+                out[name] = json.dumps(value)
+            elif value is None:
+                out[name] = ''
+            else:
+                out[name] = str(value)
+        return out
+
+    @staticmethod
+    def _decode(raw: Dict[str, str]) -> Dict[str, Any]:
+        job: Dict[str, Any] = {}
+        for name, value in raw.items():
+            try:
+                if name in _JSON_FIELDS:
+                    job[name] = json.loads(value) if value else None
+                elif name in _INT_FIELDS:
+                    job[name] = int(float(value)) if value else 0
+                elif name in _FLOAT_FIELDS:
+                    job[name] = float(value) if value else None
+                else:
+                    job[name] = value
+            except (TypeError, ValueError):
+                job[name] = value
+        return job
+
+    # --- slots ---
+
+    def acquire(self, upload_id: str) -> Tuple[bool, int]:
+        """Take a slot for ``upload_id``.
+
+        Returns:
+            (granted, slots in use); not granted when the limit is reached or
+            the job is already held by a live worker
+        """
+        now = time.time()
+        granted, used = self._acquire(
+            keys=[self.slots_key],
+            args=[now, now + self.lease_seconds, self.max_parallel, upload_id])
+        return bool(granted), int(used)
+
+    def renew(self, upload_id: str) -> bool:
+        """Extend the lease; False when the slot was lost (expired or cancelled)."""
+        return bool(
+            self.redis.zadd(self.slots_key,
+                            {upload_id: time.time() + self.lease_seconds},
+                            xx=True,
+                            ch=True))
+
+    def release(self, upload_id: str) -> None:
+        """Give the slot back."""
+        self.redis.zrem(self.slots_key, upload_id)
+
+    def usage(self) -> int:
+        """Slots held by live leases."""
+        pipe = self.redis.pipeline()
+        pipe.zremrangebyscore(self.slots_key, '-inf', time.time())
+        pipe.zcard(self.slots_key)
+        return int(pipe.execute()[1])
+
+    # --- jobs ---
+
+    def create(self, job: Dict[str, Any]) -> None:
+        """Store a new job (its slot must already be acquired)."""
+        key = self._job_key(job['id'])
+        now = time.time()
+        record = dict(job, created_at=job.get('created_at') or now,
+                      updated_at=now)
+        pipe = self.redis.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping=self._encode(record))
+        pipe.expire(key, self.job_ttl)
+        if record.get('status') == 'running':
+            pipe.sadd(self.running_key, job['id'])
+        pipe.execute()
+
+    def get(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """Job document, or None if unknown or expired."""
+        raw = self.redis.hgetall(self._job_key(upload_id))
+        return self._decode(raw) if raw else None
+
+    def update(self, upload_id: str, **fields: Any) -> bool:
+        """Set job fields; the running set follows ``status``."""
+        key = self._job_key(upload_id)
+        if not self.redis.exists(key):
+            return False
+        fields['updated_at'] = time.time()
+        pipe = self.redis.pipeline()
+        pipe.hset(key, mapping=self._encode(fields))
+        pipe.expire(key, self.job_ttl)
+        status = fields.get('status')
+        if status == 'running':
+            pipe.sadd(self.running_key, upload_id)
+        elif status in FINISHED_STATUSES:
+            pipe.srem(self.running_key, upload_id)
+        pipe.execute()
+        return True
+
+    def incr(self, upload_id: str, field: str, amount: int = 1) -> None:
+        """Atomically add to a counter field."""
+        key = self._job_key(upload_id)
+        pipe = self.redis.pipeline()
+        pipe.hincrby(key, field, amount)
+        pipe.hset(key, 'updated_at', str(time.time()))
+        pipe.expire(key, self.job_ttl)
+        pipe.execute()
+
+    def start_file(self, upload_id: str, index: int, name: str) -> None:
+        """Mark file ``index`` as the one being transferred."""
+        with self._lock:
+            self._reported[upload_id] = (float('-inf'), 0)
+        self.update(upload_id,
+                    completed_files=index,
+                    current_file=name,
+                    current_file_progress=0)
+
+    def report_progress(self,
+                        upload_id: str,
+                        done: int,
+                        total: int,
+                        force: bool = False) -> bool:
+        """Record transfer progress of the current file, at most every ``progress_interval``.
+
+        ``done`` below the last reported offset means the transfer started
+        over; the bytes counted from then on are added again.
+
+        Returns:
+            bool: True when Redis was written
+        """
+        now = time.monotonic()
+        with self._lock:
+            last, reported = self._reported.get(upload_id,
+                                                (float('-inf'), 0))
+            if done < reported:
+                # The transfer restarted from byte 0 (source changed or ignored Range)
+                reported = 0
+            if not force and now - last < self.progress_interval:
+                return False
+            self._reported[upload_id] = (now, done)
+        key = self._job_key(upload_id)
+        pipe = self.redis.pipeline()
+        pipe.hincrby(key, 'bytes_done', max(0, done - reported))
+        if total:
+            pipe.hset(key, 'current_file_progress',
+                      str(int(done * 100 / total)))
+        pipe.hset(key, 'updated_at', str(time.time()))
+        pipe.expire(key, self.job_ttl)
+        pipe.execute()
+        return True
+
+    def request_cancel(self, upload_id: str) -> bool:
+        """Flag a job as cancelled for its worker.
+
+        Returns:
+            bool: True when a live worker holds the slot and will acknowledge
+            the cancel by finishing the job; False when nobody does, in which
+            case the caller finishes it
+        """
+        pipe = self.redis.pipeline()
+        pipe.hset(self._job_key(upload_id), mapping={
+            'cancel_requested': '1',
+            'cancelled_at': str(time.time()),
+        })
+        pipe.zscore(self.slots_key, upload_id)
+        deadline = pipe.execute()[1]
+        return deadline is not None and float(deadline) > time.time()
+
+    def cancel_requested(self, upload_id: str) -> bool:
+        """True once ``request_cancel`` was called for the job."""
+        return self.redis.hget(self._job_key(upload_id), 'cancel_requested') == '1'
+
+    def finish(self, upload_id: str, status: str, **fields: Any) -> None:
+        """Move a job to a final status and free its slot."""
+        with self._lock:
+            self._reported.pop(upload_id, None)
+        self.update(upload_id, status=status, **fields)
+        pipe = self.redis.pipeline()
+        pipe.srem(self.running_key, upload_id)
+        pipe.zrem(self.slots_key, upload_id)
+        pipe.execute()
+
+    def running_ids(self) -> List[str]:
+        """Ids of jobs with status 'running'."""
+        return sorted(self.redis.smembers(self.running_key) or [])
+
+    def list_running(self) -> List[Dict[str, Any]]:
+        """Summaries of running jobs."""
+        out = []
+        for upload_id in self.running_ids():
+            job = self.get(upload_id)
+            if not job or job.get('status') != 'running':
+                continue
+            out.append({
+                'id': upload_id,
+                'user_id': job.get('user_id'),
+                'registrator_name': job.get('registrator_name'),
+                'total_files': job.get('total_files', 0),
+                'completed_files': job.get('completed_files', 0),
+                'created_at': job.get('created_at'),
+                'progress': job.get('current_file_progress', 0),
+            })
+        return out
+
+    def cleanup(self, max_idle: int = 3600) -> int:
+        """Drop finished, expired and idle jobs from the running set.
+
+        Returns:
+            int: Number of jobs removed
+        """
+        removed = 0
+        now = time.time()
+        for upload_id in self.running_ids():
+            job = self.get(upload_id)
+            idle = now - float((job or {}).get('updated_at') or 0)
+            if job and job.get('status') == 'running' and idle <= max_idle:
+                continue
+            pipe = self.redis.pipeline()
+            pipe.srem(self.running_key, upload_id)
+            pipe.zrem(self.slots_key, upload_id)
+            if job and job.get('status') == 'running':
+                pipe.delete(self._job_key(upload_id))
+            pipe.execute()
+            removed += 1
+        return removed
+
+
+def upload_registry_from_config(config,
+                                redis_client) -> Optional[UploadJobRegistry]:
+    """Build the registry from ``[files]``; None when Redis is unavailable."""
+    client = getattr(redis_client, 'client', redis_client)
+    if client is None:
+        return None
+    return UploadJobRegistry(
+        client,
+        max_parallel=config.getint('files', 'max_parallel_uploads', fallback=3))
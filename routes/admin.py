@@ -83,6 +83,25 @@ def register(app, socketio=None):
         except Exception as e:
             return jsonify({'status': 'error', 'message': str(e)}), 500
 
+    @app.route('/api/media-queue-status', methods=['GET'])
+    @login_required
+    @require_permissions(ADMIN_VIEW_PAGE)
+    def media_queue_status():
+        """API endpoint with media conversion queue depth and recent dead letters."""
+        try:
+            queue = getattr(getattr(app, 'media_service', None), 'job_queue',
+                            None)
+            if queue is None:
+                return jsonify({'status': 'success', 'mode': 'inprocess'})
+            return jsonify({
+                'status': 'success',
+                'mode': 'redis',
+                'queue': queue.stats(),
+                'dead_letters': queue.dead_letters(20)
+            })
+        except Exception as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 500
+
     # --- Обслуживание таблицы подписок на уведомления (ручной запуск, с блокировкой на 23ч) ---
     @app.route('/admin/push_maintain', methods=['POST'])
     @require_permissions(ADMIN_MANAGE)
@@ -1337,9 +1356,17 @@ def register(app, socketio=None):
             try:
                 # Track users forced to logout to invalidate cookies in middleware
                 if uid:
-                    if not hasattr(app, '_force_logout_users'):
-                        app._force_logout_users = set()
-                    app._force_logout_users.add(int(uid))
+                    manager = getattr(app, 'force_logout_manager', None)
+                    if manager:
+                        manager.add_user_logout(int(uid))
+                    else:
+                        if not hasattr(app, '_force_logout_users'):
+                            app._force_logout_users = set()
+                        app._force_logout_users.add(int(uid))
+                    # Next request must reload the principal from the DB
+                    cache = getattr(app, 'principal_cache', None)
+                    if cache is not None:
+                        cache.invalidate(uid)
             except Exception:
                 pass
             # Cleanup presence/heartbeat and sessions store (best-effort)
@@ -1447,13 +1474,26 @@ def register(app, socketio=None):
                 if not hasattr(app, '_force_logout_users'):
                     app._force_logout_users = set()
                 presence = getattr(app, '_presence', {}) or {}
+                flagged = set()
                 for info in list(presence.values()):
                     uid = info.get('user_id')
                     if uid is not None:
                         try:
-                            app._force_logout_users.add(int(uid))
+                            flagged.add(int(uid))
                         except Exception:
                             pass
+                manager = getattr(app, 'force_logout_manager', None)
+                if manager:
+                    manager.add_users_logout(flagged)
+                else:
+                    app._force_logout_users.update(flagged)
+                # Drop every cached principal so the next request reloads from the DB
+                try:
+                    cache = getattr(app, 'principal_cache', None)
+                    if cache is not None:
+                        cache.invalidate_all()
+                except Exception:
+                    pass
                 # Clear tracked HTTP sessions immediately so UI updates at once
                 try:
                     if hasattr(app, '_sessions'):
@@ -1473,6 +1513,8 @@ def register(app, socketio=None):
                     if hasattr(app, 'redis_client') and app.redis_client:
                         app.redis_client.delete('presence:users')
                         app.redis_client.delete('sessions:active')
+                    if getattr(app, 'request_tracker', None):
+                        app.request_tracker.forget()
                 except Exception:
                     pass
                 # Notify admin room about force logout
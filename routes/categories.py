@@ -60,6 +60,15 @@ def register(app, socketio=None):
             except Exception:
                 pass
 
+    def _invalidate_category_tree() -> None:
+        """Drop cached category tree in all workers after a mutation."""
+        try:
+            tree = getattr(app, 'category_tree', None)
+            if tree is not None:
+                tree.invalidate()
+        except Exception as e:
+            _log.warning(f"[categories] tree invalidation failed: {e}")
+
     def _wants_json_response() -> bool:
         """Определение, ожидает ли клиент JSON‑ответ (AJAX/fetch).
 
@@ -223,6 +232,7 @@ def register(app, socketio=None):
 
             new_id = app._sql.category_add(
                 [display_name, folder_name, display_order, enabled])
+            _invalidate_category_tree()
             # Notify clients (files page, categories admin) to refresh
             try:
                 _emit_categories_changed({
@@ -290,6 +300,7 @@ def register(app, socketio=None):
                     display_name, existing.folder_name, display_order, enabled,
                     category_id
                 ])
+                _invalidate_category_tree()
                 try:
                     _emit_categories_changed({
                         'reason': 'toggled',
@@ -359,6 +370,7 @@ def register(app, socketio=None):
                 display_name, existing.folder_name, display_order, enabled,
                 category_id
             ])
+            _invalidate_category_tree()
             try:
                 _emit_categories_changed({
                     'reason': 'edit',
@@ -441,6 +453,7 @@ def register(app, socketio=None):
                 return redirect(url_for('categories_admin'))
 
             app._sql.category_delete([category_id])
+            _invalidate_category_tree()
             try:
                 _emit_categories_changed({
                     'reason': 'delete',
@@ -533,6 +546,7 @@ def register(app, socketio=None):
                 category_id, display_name, folder_name, display_order, enabled
             ]
             new_id = app._sql.subcategory_add(args)
+            _invalidate_category_tree()
             try:
                 _emit_categories_changed({
                     'reason': 'sub-add',
@@ -646,6 +660,7 @@ def register(app, socketio=None):
                 ] + perms + [user_upload, group_upload, subcategory_id]
                 before_enabled = int(getattr(existing, 'enabled', 1))
                 app._sql.subcategory_edit(args)
+                _invalidate_category_tree()
                 try:
                     _emit_categories_changed({
                         'reason': 'sub-toggled',
@@ -704,6 +719,7 @@ def register(app, socketio=None):
                 category_id, display_name, folder_name, display_order, enabled
             ] + permissions + [subcategory_id]
             app._sql.subcategory_edit(args)
+            _invalidate_category_tree()
             try:
                 _emit_categories_changed({
                     'reason': 'sub-edit',
@@ -763,6 +779,7 @@ def register(app, socketio=None):
                 return redirect(url_for('categories_admin'))
 
             app._sql.subcategory_delete([subcategory_id])
+            _invalidate_category_tree()
             try:
                 _emit_categories_changed({
                     'reason': 'sub-delete',
@@ -1091,6 +1108,7 @@ def register(app, socketio=None):
             ] + perms + [subcategory_id]
 
             app._sql.subcategory_edit(args)
+            _invalidate_category_tree()
 
             # Log the permission change
             log_action(
@@ -7,25 +7,23 @@ from utils.common import make_dir, hash_str
 from utils.dir_utils import validate_directory_params
 from services.permissions import dirs_by_permission
 from modules.SQLUtils import SQLUtils
-from modules.permissions import require_permissions, FILES_VIEW_PAGE, FILES_UPLOAD, FILES_EDIT_ANY, FILES_DELETE_ANY, FILES_MARK_VIEWED, FILES_NOTES
+from modules.permissions import require_permissions, has_any, FILES_VIEW_PAGE, FILES_UPLOAD, FILES_EDIT_ANY, FILES_DELETE_ANY, FILES_MARK_VIEWED, FILES_NOTES
 from modules.logging import get_logger, log_access, log_action
 from flask import request, jsonify
 import time
 import threading
-import requests
 
 
 def get_file_location_info(file, app):
-    """Get category and subcategory names for file logging."""
+    """Get category and subcategory names for file logging (no DB queries)."""
     try:
         if hasattr(file, 'category_id') and hasattr(file, 'subcategory_id'):
             cat_id = getattr(file, 'category_id', None)
             sub_id = getattr(file, 'subcategory_id', None)
             if cat_id and sub_id:
-                cat = app._sql.category_by_id([cat_id])
-                sub = app._sql.subcategory_by_id([sub_id])
-                cat_name = cat.name if cat else f"cat_id={cat_id}"
-                sub_name = sub.name if sub else f"sub_id={sub_id}"
+                cat, sub = app.category_tree.display_names(cat_id, sub_id)
+                cat_name = cat or f"cat_id={cat_id}"
+                sub_name = sub or f"sub_id={sub_id}"
                 return f" in {cat_name}/{sub_name}"
         return ""
     except Exception:
@@ -33,47 +31,60 @@ def get_file_location_info(file, app):
 
 
 from modules.sync_manager import emit_files_changed
-from flask_socketio import join_room
+from modules.conversion_progress import file_room
+from modules.upload_jobs import FINISHED_STATUSES, UploadCancelled
+from services.hls import (HLS_MIMETYPES, HLS_NAME_RE, MASTER_PLAYLIST, hls_dir,
+                          move_hls, remove_hls)
+from services.previews import (PREVIEW_MIMETYPES, PREVIEW_NAMES, move_previews,
+                               preview_dir, remove_previews)
+from flask_socketio import join_room, leave_room
 import time
 from functools import wraps
 import os
 from typing import Any, Dict, Tuple, Optional, List
 from random import randint
-import subprocess
 import json
 
 _log = get_logger(__name__)
 
 
-def clear_all_uploads_on_startup():
-    """Clear all upload jobs from Redis on server startup."""
-    try:
-        import redis
-        redis_client = redis.Redis(
-            unix_socket_path='/var/run/redis/redis.sock',
-            password='znf25!',
-            db=0)
-
-        # Clear all upload jobs and active uploads set
-        keys = redis_client.keys('upload_job:*')
-        cleaned_count = 0
-
-        if keys and isinstance(keys, list):
-            for key in keys:
-                redis_client.delete(key)
-                cleaned_count += 1
-
-        # Clear active uploads set
-        redis_client.delete('active_uploads')
-
-        # Only log upload cleanup once across all workers
-        if redis_client.set('upload_cleanup_logged', '1', nx=True, ex=20):
-            _log.info(
-                f"Server startup: Cleared {cleaned_count} upload jobs from Redis"
-            )
+def resume_interrupted_uploads(importer, jobs, attempts=12, interval=20):
+    """Restart 'running' upload jobs whose worker died, in a background thread.
+
+	A job is orphaned once its slot lease expires (``lease_seconds`` after the
+	last checkpoint), so the scan repeats ``attempts`` times every
+	``interval`` seconds. Re-acquiring the slot is atomic, so only one worker
+	resumes a job; it continues with the first unfinished file and its saved
+	Range state.
+	"""
+
+    def _scan():
+        for _ in range(attempts):
+            try:
+                pending = 0
+                for upload_id in jobs.running_ids():
+                    job = jobs.get(upload_id)
+                    if not job or job.get('status') != 'running':
+                        continue
+                    granted, _used = jobs.acquire(upload_id)
+                    if not granted:
+                        pending += 1
+                        continue
+                    _log.info(
+                        f"Resuming upload {upload_id} at file "
+                        f"{int(job.get('completed_files') or 0) + 1}/{job.get('total_files')}"
+                    )
+                    start_background_upload(job, importer, jobs)
+                if not pending:
+                    return
+            except Exception as e:
+                _log.error(f"Error resuming uploads: {e}")
+                return
+            time.sleep(interval)
 
-    except Exception as e:
-        _log.error(f"Error clearing uploads on startup: {e}")
+    thread = threading.Thread(target=_scan)
+    thread.daemon = True
+    thread.start()
 
 
 def register(app, media_service, socketio=None) -> None:
@@ -91,8 +102,17 @@ def register(app, media_service, socketio=None) -> None:
 	- serving converted and original files
 	- recorder modal endpoints
 	"""
-    # Clear all uploads on server startup
-    clear_all_uploads_on_startup()
+    # Drop stale uploads on server startup and pick up interrupted ones
+    upload_jobs = getattr(app, 'upload_jobs', None)
+    if upload_jobs is not None:
+        try:
+            cleaned = upload_jobs.cleanup()
+            if cleaned:
+                _log.info(f"Server startup: Cleared {cleaned} upload jobs")
+        except Exception as e:
+            _log.error(f"Error clearing uploads on startup: {e}")
+        if getattr(app, 'registrator_importer', None) is not None:
+            resume_interrupted_uploads(app.registrator_importer, upload_jobs)
 
     # validate_directory_params импортирован из utils.dir_utils
 
@@ -106,6 +126,29 @@ def register(app, media_service, socketio=None) -> None:
                     join_room('files')
                 except Exception:
                     pass
+
+            # Per-file rooms for conversion progress ('files:progress')
+            @app.socketio.on('files:watch')
+            def _files_watch(data=None):
+                try:
+                    if not current_user.is_authenticated or not has_any(
+                            current_user, (FILES_VIEW_PAGE, )):
+                        return
+                    for fid in (data or {}).get('ids') or []:
+                        file = app._sql.file_by_id([int(fid)])
+                        # Same per-file check as the media routes
+                        if file and _stream_access_allowed(file):
+                            join_room(file_room(int(fid)))
+                except Exception:
+                    pass
+
+            @app.socketio.on('files:unwatch')
+            def _files_unwatch(data=None):
+                try:
+                    for fid in (data or {}).get('ids') or []:
+                        leave_room(file_room(int(fid)))
+                except Exception:
+                    pass
     except Exception:
         pass
 
@@ -434,13 +477,11 @@ def register(app, media_service, socketio=None) -> None:
                     path.join(app._sql.config['files']['root'], 'files',
                               dirs[0], dirs[sdid])
                 ])
-            # Update exists status for all files and sort by date descending (newest first)
+            # Sort by date descending (newest first); file_exists is kept
+            # in sync by the background FileReconciler
             if files:
-                for file in files:
-                    file.update_exists_status()
-                    # Update the database with the new exists status
-                    app._sql.file_update_exists_status(file.id, file.exists)
                 files.sort(key=lambda f: f.created_at, reverse=True)
+                app._sql.file_apply_view_flags(files, current_user.id)
         # Determine whether to show "Загрузить с регистратора" controls
         can_reg_import = False
         try:
@@ -451,7 +492,9 @@ def register(app, media_service, socketio=None) -> None:
         except Exception:
             can_reg_import = False
         # Pre-compute category/subcategory ID mappings for move modal
+        # (resolved against the cached category tree, not one query per folder)
         move_categories = []
+        lookup = getattr(app, 'category_tree', None) or app._sql
         try:
             for i, dir_entry in enumerate(_dirs):
                 try:
@@ -461,7 +504,7 @@ def register(app, media_service, socketio=None) -> None:
                         continue
                     root_key = keys[0]
                     root_name = vals[0]
-                    cat_id = app._sql.category_id_by_folder(root_key)
+                    cat_id = lookup.category_id_by_folder(root_key)
 
                     # Build subcategory mapping
                     subs = {}
@@ -469,7 +512,7 @@ def register(app, media_service, socketio=None) -> None:
                         try:
                             sub_key = keys[j]
                             sub_name = vals[j]
-                            sub_id = app._sql.subcategory_id_by_folder(
+                            sub_id = lookup.subcategory_id_by_folder(
                                 cat_id, sub_key) if cat_id else None
                             # Only include valid subcategory IDs (not None)
                             if sub_id is not None:
@@ -588,18 +631,11 @@ def register(app, media_service, socketio=None) -> None:
                 desc,
                 dt.now().strftime('%Y-%m-%d %H:%M'), 0, 0, size_mb, None
             ])
-            # try to detect duration from original .webm and notify clients
+            # Container duration only: the packet scan of recorder .webm runs in the conversion job
             try:
-                p = subprocess.Popen([
-                    "ffprobe", "-v", "error", "-show_entries",
-                    "format=duration", "-of",
-                    "default=noprint_wrappers=1:nokey=1", fpath + '.webm'
-                ],
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE,
-                                     universal_newlines=True)
-                sout, _ = p.communicate(timeout=10)
-                length_seconds = int(float((sout or '0').strip()) or 0)
+                length_seconds = int(
+                    media_service.probe.probe(fpath + '.webm',
+                                              scan_packets=False)['duration'])
                 app._sql.file_update_metadata([length_seconds, size_mb, id])
                 if socketio:
                     try:
@@ -768,17 +804,10 @@ def register(app, media_service, socketio=None) -> None:
                 size_bytes = 0
             size_mb = round(size_bytes / (1024 * 1024), 1) if size_bytes else 0
             try:
-                # probe duration from original (works for audio/video)
-                p = subprocess.Popen([
-                    "ffprobe", "-v", "error", "-show_entries",
-                    "format=duration", "-of",
-                    "default=noprint_wrappers=1:nokey=1", base + '.webm'
-                ],
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE,
-                                     universal_newlines=True)
-                sout, _ = p.communicate(timeout=10)
-                length_seconds = int(float((sout or '0').strip()) or 0)
+                # Container duration only (no packet scan on the request path)
+                length_seconds = int(
+                    media_service.probe.probe(base + '.webm',
+                                              scan_packets=False)['duration'])
                 app._sql.file_update_metadata([length_seconds, size_mb, id])
                 if socketio:
                     try:
@@ -932,6 +961,9 @@ def register(app, media_service, socketio=None) -> None:
                 os.remove(path.join(file.path, file.real_name))
             except Exception:
                 pass
+            # Drop HLS segments of the file, if it was packaged
+            remove_hls(path.join(file.path, file.real_name))
+            remove_previews(path.join(file.path, file.real_name))
             # Also remove original uploaded file if exists (e.g., pending .webm)
             try:
                 base, _ = os.path.splitext(file.real_name)
@@ -1104,6 +1136,104 @@ def register(app, media_service, socketio=None) -> None:
             app.flash_error(e)
             return redirect(url_for('files'))
 
+    def _stream_access_allowed(file) -> bool:
+        """Owner/editor, or the file's category and subcategory are enabled."""
+        if current_user.has('files.edit_any') or current_user.name + ' (' in file.owner:
+            return True
+        try:
+            return app.category_tree.folder_enabled(file.category_id,
+                                                    file.subcategory_id)
+        except Exception:
+            return False
+
+    # (user id, file id) -> (expires at, HLS root) of recently authorized players:
+    # segment requests skip the file lookup and access check for a short while
+    _hls_roots: Dict[Tuple[int, int], Tuple[float, str]] = {}
+    _hls_roots_lock = threading.Lock()
+    HLS_ACCESS_TTL = 30.0
+
+    def _hls_root(file_id: int, name: str) -> Optional[str]:
+        """HLS directory of a file the current user may stream, None otherwise."""
+        key = (int(current_user.id), int(file_id))
+        now = time.monotonic()
+        if name.endswith('.ts'):
+            cached = _hls_roots.get(key)
+            if cached and cached[0] > now:
+                return cached[1]
+        file = app._sql.file_by_id([file_id])
+        if not file or not file.ready or not _stream_access_allowed(file):
+            _hls_roots.pop(key, None)
+            return None
+        file_dir = app.storage_paths.storage_dir(file.category_id,
+                                                 file.subcategory_id)
+        root = hls_dir(path.join(file_dir, file.file_name))
+        with _hls_roots_lock:
+            if len(_hls_roots) > 10000:
+                for k in [k for k, v in _hls_roots.items() if v[0] <= now]:
+                    _hls_roots.pop(k, None)
+            _hls_roots[key] = (now + HLS_ACCESS_TTL, root)
+        if name == MASTER_PLAYLIST:
+            log_action(
+                'FILE_OPEN', current_user.name,
+                f'open file {file.file_name} (hls) in category {file.category_id}/{file.subcategory_id}',
+                (request.remote_addr or ''))
+        return root
+
+    @app.route('/files/hls/<int:file_id>/<path:name>', methods=['GET'])
+    @require_permissions(FILES_VIEW_PAGE)
+    def files_hls(file_id: int, name: str):
+        """Serve HLS playlists and segments of a file with long-lived caching.
+
+		Segments never change once written and are cached as immutable;
+		playlists are cached for a day and revalidated via Last-Modified, so a
+		re-packaged file is picked up without a year-long stale ladder.
+		Playlists re-check access; segments reuse the user's check for
+		HLS_ACCESS_TTL seconds.
+		"""
+        if not HLS_NAME_RE.match(name or ''):
+            return abort(404)
+        root = _hls_root(file_id, name)
+        if root is None:
+            return abort(404)
+        resp = send_from_directory(root,
+                                   name,
+                                   mimetype=HLS_MIMETYPES.get(
+                                       os.path.splitext(name)[1]))
+        if name.endswith('.ts'):
+            resp.headers[
+                'Cache-Control'] = 'private, max-age=31536000, immutable'
+        else:
+            resp.headers['Cache-Control'] = 'private, max-age=86400'
+        return resp
+
+    @app.route('/files/preview/<int:file_id>/<int:version>/<name>',
+               methods=['GET'])
+    @require_permissions(FILES_VIEW_PAGE)
+    def files_preview(file_id: int, version: int, name: str):
+        """Serve poster, scrub sprite and WebVTT thumbnails of a file.
+
+		URLs carry the preview version, so the current one is cached as
+		immutable; a stale version is still answered but must revalidate.
+		"""
+        if name not in PREVIEW_NAMES:
+            return abort(404)
+        file = app._sql.file_by_id([file_id])
+        if not file or not file.preview_version or not _stream_access_allowed(
+                file):
+            return abort(404)
+        file_dir = app.storage_paths.storage_dir(file.category_id,
+                                                 file.subcategory_id)
+        resp = send_from_directory(preview_dir(
+            path.join(file_dir, file.file_name)),
+                                   name,
+                                   mimetype=PREVIEW_MIMETYPES[name])
+        if version == file.preview_version:
+            resp.headers[
+                'Cache-Control'] = 'private, max-age=31536000, immutable'
+        else:
+            resp.headers['Cache-Control'] = 'private, no-cache'
+        return resp
+
     # Serve original uploaded file (.webm) when processing
     @app.route('/files/orig/<int:did>/<int:sdid>/<name>', methods=['GET'])
     @require_permissions(FILES_VIEW_PAGE)
@@ -1250,22 +1380,8 @@ def register(app, media_service, socketio=None) -> None:
             return redirect(url_for('files'))
 
         try:
-            # Build updated viewers string: append current user if not already present
-            current_name = (current_user.name or '').strip()
-            existing = (file.viewed or '').strip()
-            if existing:
-                # Split by comma and normalize whitespace
-                parts = [
-                    p.strip() for p in existing.split(',') if p is not None
-                ]
-                if current_name and (current_name not in parts):
-                    parts.append(current_name)
-                new_value = ', '.join([p for p in parts if p])
-            else:
-                new_value = current_name
-            # Persist if we have something to write
-            if new_value:
-                app._sql.file_view([new_value, id])
+            # Idempotent insert into file_view; no read-modify-write of the row
+            app._sql.file_mark_viewed(id, current_user.id)
             log_action(
                 'FILE_MARK_VIEWED', current_user.name,
                 f'marked viewed id={id} (viewers updated){get_file_location_info(file, app)}',
@@ -1303,6 +1419,27 @@ def register(app, media_service, socketio=None) -> None:
             pass
         return redirect(url_for('files'))
 
+    @app.route('/files/progress/<int:id>', methods=['GET'])
+    @require_permissions(FILES_VIEW_PAGE)
+    def files_progress(id: int):
+        """Return conversion state, percent, x-realtime speed and ETA of a file."""
+        # Unknown and inaccessible files look the same to the caller
+        file = app._sql.file_by_id([id])
+        if not file or not _stream_access_allowed(file):
+            return jsonify({'status': 'error', 'message': 'File not found'}), 404
+        tracker = getattr(app, 'conversion_progress', None)
+        status = tracker.get(id) if tracker is not None else None
+        if not status:
+            # Nothing tracked (old file or expired status): derive from the DB
+            status = {
+                'id': id,
+                'state': 'done' if file.ready else 'unknown',
+                'percent': 100.0 if file.ready else None
+            }
+        resp = make_response(jsonify({'status': 'success', 'progress': status}))
+        resp.headers['Cache-Control'] = 'no-store'
+        return resp
+
     @app.route('/files/move/<int:id>', methods=['POST'])
     @require_permissions(FILES_UPLOAD)
     @rate_limit
@@ -1387,6 +1524,8 @@ def register(app, media_service, socketio=None) -> None:
                 new_path = new_base + ext
                 if os.path.exists(old_path):
                     os.replace(old_path, new_path)
+            move_hls(old_base + '.mp4', new_base + '.mp4')
+            move_previews(old_base + '.mp4', new_base + '.mp4')
             # Update DB category/subcategory
             if target_cat_id and target_sub_id:
                 app._sql.file_move_to_subcategory(
@@ -1396,6 +1535,7 @@ def register(app, media_service, socketio=None) -> None:
             # Update file object with new path and check if files exist
             file.category_id = target_cat_id
             file.subcategory_id = target_sub_id
+            file.path = new_dir
             file.update_exists_status()
 
             # Update the database with the new exists status
@@ -1509,7 +1649,7 @@ def register(app, media_service, socketio=None) -> None:
     @require_permissions(FILES_VIEW_PAGE)
     @rate_limit
     def files_refresh(id: int):
-        """Recompute file duration and size using robust ffprobe strategies and update DB; emits soft refresh."""
+        """Recompute file duration and size via MediaProbe and update DB; emits soft refresh."""
         try:
             file_rec = app._sql.file_by_id([id])
             if not file_rec:
@@ -1550,80 +1690,9 @@ def register(app, media_service, socketio=None) -> None:
             # Get the appropriate file path for the current state
             target = file_rec.get_file_path()
 
-            length_seconds = 0
-            size_mb = 0.0
-            # size
-            try:
-                size_bytes = os.path.getsize(target)
-                size_mb = round(size_bytes /
-                                (1024 * 1024), 1) if size_bytes else 0.0
-            except Exception:
-                pass
-            # 1) format.duration
-            try:
-                p = subprocess.Popen([
-                    "ffprobe", "-v", "error", "-show_entries",
-                    "format=duration", "-of",
-                    "default=noprint_wrappers=1:nokey=1", target
-                ],
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE,
-                                     universal_newlines=True)
-                sout, _ = p.communicate(timeout=10)
-                length_seconds = int(float((sout or '0').strip()) or 0)
-            except Exception:
-                pass
-            # 2) stream.duration
-            if not length_seconds:
-                try:
-                    p = subprocess.Popen([
-                        "ffprobe", "-v", "error", "-select_streams", "v:0",
-                        "-show_entries", "stream=duration", "-of",
-                        "default=noprint_wrappers=1:nokey=1", target
-                    ],
-                                         stdout=subprocess.PIPE,
-                                         stderr=subprocess.PIPE,
-                                         universal_newlines=True)
-                    sout, _ = p.communicate(timeout=10)
-                    length_seconds = int(float((sout or '0').strip()) or 0)
-                except Exception:
-                    pass
-            # 3) nb_frames / r_frame_rate
-            if not length_seconds:
-                try:
-                    p = subprocess.Popen([
-                        "ffprobe", "-v", "error", "-select_streams", "v:0",
-                        "-count_frames", "-show_entries",
-                        "stream=nb_read_frames,nb_frames,r_frame_rate", "-of",
-                        "json", target
-                    ],
-                                         stdout=subprocess.PIPE,
-                                         stderr=subprocess.PIPE,
-                                         universal_newlines=True)
-                    sout, _ = p.communicate(timeout=10)
-                    data = json.loads(sout or '{}')
-                    streams = data.get('streams') or []
-                    frames = 0
-                    fps = 0.0
-                    if streams:
-                        st = streams[0]
-                        frames_str = st.get('nb_read_frames') or st.get(
-                            'nb_frames') or '0'
-                        try:
-                            frames = int(frames_str)
-                        except Exception:
-                            frames = int(float(frames_str) or 0)
-                        rate_str = st.get('r_frame_rate') or '0/1'
-                        try:
-                            num, den = rate_str.split('/')
-                            den_v = float(den) if float(den) != 0 else 1.0
-                            fps = float(num) / den_v
-                        except Exception:
-                            fps = 0.0
-                    if frames > 0 and fps > 0:
-                        length_seconds = int(frames / fps)
-                except Exception:
-                    pass
+            # Single ffprobe, cached by (path, size, mtime)
+            length_seconds, size_mb = media_service.probe.length_and_size(
+                target)
             try:
                 app._sql.file_update_metadata([length_seconds, size_mb, id])
             except Exception:
@@ -1868,37 +1937,52 @@ def register(app, media_service, socketio=None) -> None:
                     'page': page,
                     'page_size': page_size
                 }), 200
-            fs = []
+            # Optional keyset cursor "<created_at>|<id>" from the previous response
+            before = None
+            cursor = (request.args.get('cursor') or '').strip()
+            if cursor and '|' in cursor:
+                try:
+                    ts, last_id = cursor.rsplit('|', 1)
+                    before = (ts, int(last_id))
+                except Exception:
+                    before = None
+            # "Unwatched only" filter is a file_view primary key lookup
+            unseen_for = current_user.id if request.args.get(
+                'unseen') == '1' else None
+            # Ordering, LIMIT/OFFSET and COUNT are done in MySQL
             try:
-                # SQL API expects a single arg list in this deployment
-                fs = app._sql.file_by_category_and_subcategory(
-                    [cat_id, sub_id])
+                files_slice = app._sql.file_page_by_category_and_subcategory(
+                    cat_id,
+                    sub_id,
+                    limit=page_size,
+                    offset=(page - 1) * page_size,
+                    before=before,
+                    unseen_for=unseen_for) or []
             except Exception:
-                fs = []
+                files_slice = []
+            total = app._sql.file_count_by_category_and_subcategory(
+                cat_id, sub_id, unseen_for=unseen_for)
+            app._sql.file_apply_view_flags(files_slice, current_user.id)
             dirs = dirs_by_permission(app, 3, 'f')
-            # Update exists status for all files and sort by date descending (newest first)
-            if fs:
-                for file in fs:
-                    file.update_exists_status()
-                    # Update the database with the new exists status
-                    app._sql.file_update_exists_status(file.id, file.exists)
-                fs.sort(key=lambda f: f.created_at, reverse=True)
-            total = len(fs or [])
-            start = (page - 1) * page_size
-            end = start + page_size
-            files_slice = fs[start:end] if fs else []
             html = render_template('components/files_rows.j2.html',
                                    files=files_slice,
                                    did=0,
                                    sdid=1,
                                    dirs=dirs)
-            resp = make_response(
-                jsonify({
-                    'html': html,
-                    'total': total,
-                    'page': page,
-                    'page_size': page_size
-                }))
+            payload = {
+                'html': html,
+                'total': total,
+                'page': page,
+                'page_size': page_size
+            }
+            # Unwatched counter costs a second COUNT: only on request
+            if request.args.get('unseen_count') == '1':
+                if unseen_for:
+                    payload['unseen_total'] = total
+                else:
+                    payload['unseen_total'] = app._sql.file_count_by_category_and_subcategory(
+                        cat_id, sub_id, unseen_for=current_user.id)
+            resp = make_response(jsonify(payload))
             resp.headers[
                 'Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
             resp.headers['Pragma'] = 'no-cache'
@@ -1934,47 +2018,22 @@ def register(app, media_service, socketio=None) -> None:
                     'page': page,
                     'page_size': page_size
                 }), 200
-            fs = []
+            # Relevance ordering by default; ?sort=date for newest first
+            sort = (request.args.get('sort') or '').strip()
+            order = 'date' if sort == 'date' else 'relevance'
             try:
-                fs = app._sql.file_search_by_category_and_subcategory(
-                    [q, cat_id, sub_id])
-            except TypeError:
-                fs = app._sql.file_search_by_category_and_subcategory(
-                    q, cat_id, sub_id)
-            except Exception:
-                fs = []
+                files_slice, total = app._sql.file_search_page(
+                    cat_id,
+                    sub_id,
+                    q,
+                    limit=page_size,
+                    offset=(page - 1) * page_size,
+                    order=order)
+            except Exception as e:
+                _log.error(f"Files search query error: {e}")
+                files_slice, total = [], 0
+            app._sql.file_apply_view_flags(files_slice, current_user.id)
             dirs = dirs_by_permission(app, 3, 'f')
-            fs = fs or []
-            if q:
-                q_cf = q.casefold()
-
-                def matches(file):
-                    # name
-                    name = (getattr(file, 'display_name', '')
-                            or getattr(file, 'name', '')
-                            or getattr(file, 'real_name', '') or '')
-                    # description
-                    desc = getattr(file, 'description', '') or ''
-                    # creator/owner
-                    owner = getattr(file, 'owner', '') or ''
-                    # creation date (string as shown in table)
-                    date = getattr(file, 'date', '') or ''
-                    try:
-                        return (q_cf in str(name).casefold()
-                                or q_cf in str(desc).casefold()
-                                or q_cf in str(owner).casefold()
-                                or q_cf in str(date).casefold())
-                    except Exception:
-                        return False
-
-                fs = [f for f in fs if matches(f)]
-            # Sort files by date descending (newest first)
-            if fs:
-                fs.sort(key=lambda f: f.created_at, reverse=True)
-            total = len(fs)
-            start = (page - 1) * page_size
-            end = start + page_size
-            files_slice = fs[start:end]
             html = render_template('components/files_rows.j2.html',
                                    files=files_slice,
                                    did=0,
@@ -2046,42 +2105,22 @@ def register(app, media_service, socketio=None) -> None:
             ]):
                 return jsonify({'error': 'Missing required parameters'}), 400
 
-            # Check parallel upload limit using atomic Redis operation
-            can_start, active_uploads, max_parallel = can_start_new_upload()
+            jobs = getattr(app, 'upload_jobs', None)
+            if jobs is None:
+                return jsonify({'error': 'Upload registry unavailable'}), 503
+            max_parallel = jobs.max_parallel
 
-            if not can_start:
+            upload_job, active_uploads = create_registrator_upload(
+                app, jobs, file_urls, file_names, registrator_name,
+                registrator_id, cat_id, sub_id)
+            if upload_job is None:
                 return jsonify({
                     'error':
                     f'Maximum parallel uploads limit reached ({active_uploads}/{max_parallel})',
                     'active_uploads': active_uploads,
                     'max_parallel': max_parallel
                 }), 429
-
-            # Create upload job
-            upload_id = f"upload_{int(time.time() * 1000)}_{current_user.id}"
-            upload_job = {
-                'id': upload_id,
-                'user_id': current_user.id,
-                'user_name': current_user.name,
-                'file_urls': file_urls,
-                'file_names': file_names,
-                'registrator_name': registrator_name,
-                'registrator_id': registrator_id,
-                'cat_id': cat_id,
-                'sub_id': sub_id,
-                'total_files': len(file_urls),
-                'completed_files': 0,
-                'error_count': 0,
-                'status': 'running',
-                'start_time': time.time(),
-                # ensure persistence/cleanup logic can rely on a stable timestamp
-                'created_at': time.time(),
-                'progress': 0,
-                'ip': request.remote_addr or ''
-            }
-
-            # Save upload job to Redis
-            save_upload_job(upload_job)
+            upload_id = upload_job['id']
 
             # Log detailed start information
             _log.info(f"📊 Performance Debug - Starting registrator import")
@@ -2094,7 +2133,7 @@ def register(app, media_service, socketio=None) -> None:
             )
 
             # Start background upload
-            start_background_upload(upload_job)
+            start_background_upload(upload_job, app.registrator_importer, jobs)
 
             # Log start
             log_action(
@@ -2108,7 +2147,7 @@ def register(app, media_service, socketio=None) -> None:
                 'upload_id':
                 upload_id,
                 'message':
-                f'Upload started in background. {active_uploads + 1}/{max_parallel} slots used.'  # type: ignore
+                f'Upload started in background. {active_uploads}/{max_parallel} slots used.'  # type: ignore
             }), 200
 
         except Exception as e:
@@ -2120,7 +2159,8 @@ def register(app, media_service, socketio=None) -> None:
     def api_upload_status(upload_id):
         """Get upload status by ID."""
         try:
-            upload_job = get_upload_job(upload_id)
+            jobs = getattr(app, 'upload_jobs', None)
+            upload_job = jobs.get(upload_id) if jobs else None
             if not upload_job:
                 return jsonify({'error': 'Upload not found'}), 404
 
@@ -2141,7 +2181,10 @@ def register(app, media_service, socketio=None) -> None:
     def api_active_uploads():
         """Get active uploads count and limit using improved Redis tracking."""
         try:
-            can_start, active_uploads, max_parallel = can_start_new_upload()
+            jobs = getattr(app, 'upload_jobs', None)
+            active_uploads = jobs.usage() if jobs else 0
+            max_parallel = jobs.max_parallel if jobs else 0
+            can_start = bool(jobs) and active_uploads < max_parallel
 
             return jsonify({
                 'status': 'success',
@@ -2159,7 +2202,8 @@ def register(app, media_service, socketio=None) -> None:
     def api_active_uploads_list():
         """Get detailed list of active uploads."""
         try:
-            active_uploads = get_active_upload_list()
+            jobs = getattr(app, 'upload_jobs', None)
+            active_uploads = jobs.list_running() if jobs else []
 
             return jsonify({
                 'status': 'success',
@@ -2174,62 +2218,51 @@ def register(app, media_service, socketio=None) -> None:
     @app.route('/api/cancel-upload/<upload_id>', methods=['POST'])
     @require_permissions(FILES_UPLOAD)
     def api_cancel_upload(upload_id):
-        """Cancel an active upload and delete uploaded files."""
-        try:
-            import redis
-            redis_client = redis.Redis(
-                unix_socket_path='/var/run/redis/redis.sock',
-                password='znf25!',
-                db=0)
+        """Cancel an active upload and delete uploaded files.
 
-            # Get upload job data
-            job_key = f"upload_job:{upload_id}"
-            job_data = redis_client.get(job_key)
+		A job with a live worker is only flagged: the worker stops at its next
+		checkpoint, deletes the imported files and frees the slot (the job
+		status turns 'cancelled'). Otherwise the job is finished here.
+		"""
+        try:
+            jobs = getattr(app, 'upload_jobs', None)
+            job_info = jobs.get(upload_id) if jobs else None
 
-            if not job_data:
+            if not job_info:
                 return jsonify({
                     'success': False,
                     'error': 'Upload job not found'
                 }), 404
+            if job_info.get('status') in FINISHED_STATUSES:
+                return jsonify({
+                    'success': False,
+                    'error': f"Upload already {job_info.get('status')}"
+                }), 409
 
-            job_info = json.loads(
-                job_data.decode('utf-8') if isinstance(job_data, bytes
-                                                       ) else str(job_data))
-
-            # Mark job as cancelled
-            job_info['status'] = 'cancelled'
-            job_info['cancelled_at'] = time.time()
-            redis_client.set(job_key, json.dumps(job_info),
-                             ex=3600)  # Keep for 1 hour
-
-            # Remove from active uploads set
-            redis_client.srem('active_uploads', upload_id)
-
-            # Delete uploaded files from database and filesystem
-            deleted_files = []
-            if 'uploaded_files' in job_info:
-                for file_info in job_info['uploaded_files']:
-                    try:
-                        # Delete from database
-                        file_id = file_info.get('file_id')
-                        if file_id:
-                            app._sql.delete_file(file_id)
-                            deleted_files.append(
-                                file_info.get('filename', 'unknown'))
-
-                        # Delete from filesystem
-                        file_path = file_info.get('file_path')
-                        if file_path and os.path.exists(file_path):
-                            os.remove(file_path)
-
-                    except Exception as e:
-                        _log.error(f"Error deleting file {file_info}: {e}")
+            if jobs.request_cancel(upload_id):
+                log_action('UPLOAD_CANCEL', current_user.name,
+                           f'requested cancel of upload {upload_id}',
+                           (request.remote_addr or ''))
+                return jsonify({
+                    'success': True,
+                    'pending': True,
+                    'message': 'Upload is being cancelled.'
+                }), 202
+
+            # No worker holds the job: clean up here
+            deleted_files = discard_uploaded_files(
+                app.registrator_importer, job_info.get('uploaded_files'))
+            jobs.finish(upload_id,
+                        'cancelled',
+                        uploaded_files=[],
+                        resume=None,
+                        end_time=time.time())
 
             # Log the cancellation
             log_action(
-                f"Cancelled upload {upload_id}",
-                f"Deleted {len(deleted_files)} files: {', '.join(deleted_files[:5])}{'...' if len(deleted_files) > 5 else ''}",
-                current_user.id)
+                'UPLOAD_CANCEL', current_user.name,
+                f"cancelled upload {upload_id}, deleted {len(deleted_files)} files: {', '.join(deleted_files[:5])}{'...' if len(deleted_files) > 5 else ''}",
+                (request.remote_addr or ''))
 
             return jsonify({
                 'success': True,
@@ -2265,35 +2298,16 @@ def register(app, media_service, socketio=None) -> None:
     def api_cleanup_uploads():
         """Clean up inactive upload jobs from Redis."""
         try:
-            import redis
-            redis_client = redis.Redis(
-                unix_socket_path='/var/run/redis/redis.sock',
-                password='znf25!',
-                db=0)
-
-            keys = redis_client.keys('upload_job:*')
-            cleaned_count = 0
-            current_time = time.time()
-
-            if keys and isinstance(keys, list):
-                for key in keys:
-                    job_data = redis_client.get(key)
-                    if job_data and isinstance(job_data, bytes):
-                        import json
-                        job = json.loads(
-                            job_data.decode('utf-8'))  # type: ignore
-                        job_status = job.get('status', 'unknown')
-                        job_created = job.get('created_at', 0)
-
-                        # Очищаем старые или завершенные загрузки
-                        if (job_status in ['completed', 'failed', 'cancelled']
-                                or (current_time - job_created)
-                                > 3600):  # Старше 1 часа
-                            redis_client.delete(key)
-                            cleaned_count += 1
-
-            # Получаем обновленный счетчик активных загрузок
-            active_uploads = get_active_upload_count()
+            jobs = getattr(app, 'upload_jobs', None)
+            if jobs is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Upload registry unavailable'
+                }), 503
+
+            # Finished jobs expire on their own; drop idle "running" ones
+            cleaned_count = jobs.cleanup(max_idle=3600)
+            active_uploads = jobs.usage()
 
             log_action(f"Cleaned up {cleaned_count} inactive upload jobs",
                        f"Remaining active uploads: {active_uploads}",
@@ -2315,494 +2329,182 @@ def register(app, media_service, socketio=None) -> None:
             return jsonify({'success': False, 'error': str(e)}), 500
 
 
-# Helper functions for background upload management
-def get_active_upload_count():
-    """Get count of active uploads from Redis with improved tracking."""
-    try:
-        import redis
-        redis_client = redis.Redis(
-            unix_socket_path='/var/run/redis/redis.sock',
-            password='znf25!',
-            db=0)
-
-        # Use Redis set for active uploads tracking
-        active_uploads_set = redis_client.smembers(
-            'active_uploads')  # type: ignore  # type: ignore
-        if active_uploads_set:
-            active_count = len(active_uploads_set)  # type: ignore
-        else:
-            active_count = 0
-
-        # Clean up inactive uploads
-        cleaned_count = 0
-        if active_uploads_set:
-            current_time = time.time()
-            for upload_id in active_uploads_set:  # type: ignore
-                upload_id = upload_id.decode('utf-8') if isinstance(
-                    upload_id, bytes) else upload_id  # type: ignore
-                job_data = redis_client.get(f"upload_job:{upload_id}")
-
-                if not job_data:
-                    # Job not found, remove from active set
-                    redis_client.srem('active_uploads', upload_id)
-                    cleaned_count += 1
-                    continue
+def create_registrator_upload(app, jobs, file_urls, file_names,
+                              registrator_name, registrator_id, cat_id,
+                              sub_id):
+    """Take an upload slot for the current user and register the job.
 
-                try:
-                    import json
-                    job = json.loads(job_data.decode('utf-8'))  # type: ignore
-                    job_status = job.get('status', 'unknown')
-                    # use created_at if present, else fall back to start_time
-                    job_created = job.get('created_at') or job.get(
-                        'start_time') or 0
-
-                    # Remove completed, failed, cancelled or old jobs
-                    # Only purge completed/failed/cancelled, or very old running jobs (> 2h)
-                    if (job_status in ['completed', 'failed', 'cancelled']
-                            or ((current_time - float(job_created)) > 7200)):
-                        redis_client.srem('active_uploads', upload_id)
-                        redis_client.delete(f"upload_job:{upload_id}")
-                        cleaned_count += 1
-                except Exception as e:
-                    _log.warning(f"Error processing upload {upload_id}: {e}")
-                    redis_client.srem('active_uploads', upload_id)
-                    cleaned_count += 1
-
-        if cleaned_count > 0:
-            _log.info(
-                f"Cleaned {cleaned_count} inactive upload jobs from Redis")
-
-        return active_count
-    except Exception as e:
-        _log.error(f"Error getting active upload count: {e}")
-        return 0
-
-
-def save_upload_job(upload_job):
-    """Save upload job to Redis and add to active uploads set."""
-    try:
-        import redis
-        import json
-        redis_client = redis.Redis(
-            unix_socket_path='/var/run/redis/redis.sock',
-            password='znf25!',
-            db=0)
-
-        # Save job data
-        redis_client.setex(f"upload_job:{upload_job['id']}", 3600,
-                           json.dumps(upload_job))  # 1 hour TTL
-
-        # Add to active uploads set if status is running
-        if upload_job.get('status') == 'running':
-            redis_client.sadd('active_uploads', upload_job['id'])
-
-    except Exception as e:
-        _log.error(f"Error saving upload job: {e}")
-
-
-def get_upload_job(upload_id):
-    """Get upload job from Redis."""
-    try:
-        import redis
-        import json
-        redis_client = redis.Redis(
-            unix_socket_path='/var/run/redis/redis.sock',
-            password='znf25!',
-            db=0)
-        job_data = redis_client.get(f"upload_job:{upload_id}")
-        if job_data:
-            try:
-                payload = job_data.decode('utf-8') if isinstance(
-                    job_data, bytes) else str(job_data)
-                job = json.loads(payload)
-                # Defensive: inject created_at if missing (older jobs)
-                if 'created_at' not in job:
-                    job['created_at'] = job.get('start_time', time.time())
-                return job
-            except Exception as _e:
-                _log.error(f"Error decoding upload job {upload_id}: {_e}")
-                return None
-        return None
-    except Exception as e:
-        _log.error(f"Error getting upload job: {e}")
-        return None
-
-
-def update_upload_job(upload_id, updates):
-    """Update upload job in Redis and manage active uploads set."""
-    try:
-        import redis
-        import json
-        redis_client = redis.Redis(
-            unix_socket_path='/var/run/redis/redis.sock',
-            password='znf25!',
-            db=0)
-        job_data = redis_client.get(f"upload_job:{upload_id}")
-        if not job_data:
-            return
-        payload = job_data.decode('utf-8') if isinstance(
-            job_data, bytes) else str(job_data)
-        job = json.loads(payload)
-
-        old_status = job.get('status')
-        job.update(updates)
-        new_status = job.get('status')
-
-        # Update job data
-        redis_client.setex(f"upload_job:{upload_id}", 3600, json.dumps(job))
-
-        # Manage active uploads set based on status change
-        if old_status != new_status:
-            if new_status == 'running':
-                redis_client.sadd('active_uploads', upload_id)
-            elif new_status in ['completed', 'failed', 'cancelled']:
-                redis_client.srem('active_uploads', upload_id)
-
-    except Exception as e:
-        _log.error(f"Error updating upload job: {e}")
-
-
-def can_start_new_upload():
-    """Atomically check if we can start a new upload (respects max_parallel_uploads)."""
+	Returns:
+		Tuple of (upload job dict, active uploads); the job is None when all
+		``jobs.max_parallel`` slots are taken.
+	"""
+    # Take a slot atomically (Lua semaphore with an expiring lease)
+    upload_id = f"upload_{int(time.time() * 1000)}_{current_user.id}"
+    granted, active_uploads = jobs.acquire(upload_id)
+    if not granted:
+        return None, active_uploads
+
+    upload_job = {
+        'id': upload_id,
+        'user_id': current_user.id,
+        'user_name': current_user.name,
+        'file_urls': file_urls,
+        'file_names': file_names,
+        'registrator_name': registrator_name,
+        'registrator_id': registrator_id,
+        'cat_id': cat_id,
+        'sub_id': sub_id,
+        'total_files': len(file_urls),
+        'completed_files': 0,
+        'error_count': 0,
+        'status': 'running',
+        'start_time': time.time(),
+        # ensure persistence/cleanup logic can rely on a stable timestamp
+        'created_at': time.time(),
+        'progress': 0,
+        'ip': request.remote_addr or '',
+        'owner':
+        f'{current_user.name} ({app._sql.group_name_by_id([current_user.gid])})'
+    }
+
+    # Save upload job to Redis
     try:
-        import redis
-        redis_client = redis.Redis(
-            unix_socket_path='/var/run/redis/redis.sock',
-            password='znf25!',
-            db=0)
-
-        # Get max parallel uploads from config (default to 3)
-        max_parallel = 3
-
-        # Use Redis pipeline for atomic operation
-        pipe = redis_client.pipeline()
-        pipe.scard('active_uploads')
-        pipe.smembers('active_uploads')
-        results = pipe.execute()  # type: ignore
-
-        active_count = results[0]
-        active_uploads = results[1]
-
-        # Clean up inactive uploads and recount
-        if active_uploads:
-            current_time = time.time()
-            cleaned_count = 0
-            for upload_id in active_uploads:
-                upload_id = upload_id.decode('utf-8') if isinstance(
-                    upload_id, bytes) else upload_id  # type: ignore
-                job_data = redis_client.get(f"upload_job:{upload_id}")
-
-                if not job_data:
-                    redis_client.srem('active_uploads', upload_id)
-                    cleaned_count += 1
-                    continue
-
-                try:
-                    import json
-                    job = json.loads(job_data.decode('utf-8'))  # type: ignore
-                    job_status = job.get('status', 'unknown')
-                    job_created = job.get('created_at', 0)
-
-                    if (job_status in ['completed', 'failed', 'cancelled']
-                            or (current_time - job_created) > 3600):
-                        redis_client.srem('active_uploads', upload_id)
-                        redis_client.delete(f"upload_job:{upload_id}")
-                        cleaned_count += 1
-                except Exception:
-                    redis_client.srem('active_uploads', upload_id)
-                    cleaned_count += 1
-
-            if cleaned_count > 0:
-                # Recount after cleanup
-                active_count = redis_client.scard(
-                    'active_uploads')  # type: ignore
+        jobs.create(upload_job)
+    except Exception:
+        jobs.release(upload_id)
+        raise
+    return upload_job, active_uploads
 
-        return active_count < max_parallel, active_count, max_parallel  # type: ignore
 
-    except Exception as e:
-        _log.error(f"Error checking upload limit: {e}")
-        return False, 0, 3  # Default to not allowing if error
+def discard_uploaded_files(importer, uploaded):
+    """Unregister and delete the files an upload job imported.
 
+	Returns:
+		List of names of the deleted files.
+	"""
+    deleted = []
+    for file_info in uploaded or []:
+        try:
+            importer.discard(file_info['file_id'], file_info['file_path'])
+            deleted.append(file_info.get('filename', 'unknown'))
+        except Exception as e:
+            _log.error(f"Error deleting file {file_info}: {e}")
+    return deleted
+
+
+def start_background_upload(upload_job, importer, jobs):
+    """Start background upload in separate thread.
+
+	The caller must hold the job's slot in ``jobs`` (UploadJobRegistry); the
+	worker renews its lease and frees it when done. Each file is streamed by
+	``importer`` (RegistratorImporter) straight into the target storage
+	directory and registered in-process. The Range resume record of the
+	current file is checkpointed into the job as ``'resume'``, so a
+	restarted worker (see ``resume_interrupted_uploads``) continues the
+	transfer instead of starting it over. A cancel request is checked at
+	every checkpoint and between files; the worker then removes the files
+	of the job it registered and finishes the job, freeing the slot.
+	"""
 
-def get_active_upload_list():
-    """Get list of active uploads with details."""
-    try:
-        import redis
-        redis_client = redis.Redis(
-            unix_socket_path='/var/run/redis/redis.sock',
-            password='znf25!',
-            db=0)
-
-        active_uploads_set = redis_client.smembers(
-            'active_uploads')  # type: ignore
-        active_uploads = []
-
-        if active_uploads_set:
-            for upload_id in active_uploads_set:  # type: ignore
-                upload_id = upload_id.decode('utf-8') if isinstance(
-                    upload_id, bytes) else upload_id  # type: ignore
-                job_data = redis_client.get(f"upload_job:{upload_id}")
-
-                if job_data:
-                    try:
-                        import json
-                        job = json.loads(
-                            job_data.decode('utf-8'))  # type: ignore
-                        if job.get('status') == 'running':
-                            active_uploads.append({
-                                'id':
-                                upload_id,
-                                'user_id':
-                                job.get('user_id'),
-                                'registrator_name':
-                                job.get('registrator_name'),
-                                'total_files':
-                                job.get('total_files', 0),
-                                'completed_files':
-                                job.get('completed_files', 0),
-                                'created_at':
-                                job.get('created_at'),
-                                'progress':
-                                job.get('progress', 0)
-                            })
-                    except Exception as e:
-                        _log.warning(
-                            f"Error processing upload {upload_id}: {e}")
-                        # Remove invalid upload from active set
-                        redis_client.srem('active_uploads', upload_id)
-
-        return active_uploads
-
-    except Exception as e:
-        _log.error(f"Error getting active upload list: {e}")
-        return []
-
-
-def increment_upload_error(upload_id):
-    """Atomically increment error_count for an upload job."""
-    try:
-        import redis
-        import json
-        redis_client = redis.Redis(
-            unix_socket_path='/var/run/redis/redis.sock',
-            password='znf25!',
-            db=0)
-        job_key = f"upload_job:{upload_id}"
-        job_data = redis_client.get(job_key)
-        if job_data and isinstance(job_data, bytes):
-            job = json.loads(job_data.decode('utf-8'))
-            current_errors = int(job.get('error_count') or 0)
-            job['error_count'] = current_errors + 1  # type: ignore
-            redis_client.setex(job_key, 3600, json.dumps(job))
-    except Exception as e:
-        _log.error(f"Error incrementing upload job error_count: {e}")
-
-
-def start_background_upload(upload_job):
-    """Start background upload in separate thread."""
+    def _acknowledge_cancel(upload_id, uploaded):
+        deleted = discard_uploaded_files(importer, uploaded)
+        jobs.finish(upload_id,
+                    'cancelled',
+                    uploaded_files=[],
+                    resume=None,
+                    end_time=time.time())
+        _log.info(f"Upload {upload_id} cancelled, deleted {len(deleted)} files")
 
     def background_upload_worker():
+        start_time = time.time()
+        upload_id = upload_job['id']
         try:
-            upload_id = upload_job['id']
             _log.info(f"Starting background upload {upload_id}")
+            first = int(upload_job.get('completed_files') or 0)
+            saved = upload_job.get('resume') or {}
+            uploaded = list(upload_job.get('uploaded_files') or [])
 
             for i, (file_url, file_name) in enumerate(
                     zip(upload_job['file_urls'], upload_job['file_names'])):
+                if i < first:
+                    continue
+                # A lost lease means the job was taken over by another worker
+                if not jobs.renew(upload_id):
+                    _log.warning(f"Upload {upload_id} lost its slot, stopping")
+                    return
+                if jobs.cancel_requested(upload_id):
+                    _acknowledge_cancel(upload_id, uploaded)
+                    return
                 try:
-                    # Update progress - mark file as started
-                    update_upload_job(
-                        upload_id, {
-                            'completed_files': i,
-                            'current_file': file_name,
-                            'current_file_progress': 0,
-                            'status': 'running'
-                        })
-
-                    # Download file directly from registrator
+                    state = dict(saved) if (saved.get('index') == i
+                                            and saved.get('url')
+                                            == file_url) else {}
+                    state.pop('index', None)
+                    state.pop('url', None)
+                    jobs.start_file(upload_id, i, file_name)
+
+                    def _on_progress(done, total):
+                        jobs.report_progress(upload_id, done, total)
+
+                    def _on_state(snapshot, i=i, file_url=file_url):
+                        if jobs.cancel_requested(upload_id):
+                            raise UploadCancelled(upload_id)
+                        jobs.renew(upload_id)
+                        jobs.update(upload_id,
+                                    resume=dict(snapshot, index=i,
+                                                url=file_url))
+
+                    result = importer.import_file(
+                        file_url,
+                        file_name,
+                        int(upload_job['cat_id']),
+                        int(upload_job['sub_id']),
+                        upload_job.get('owner') or upload_job['user_name'],
+                        f"[Регистратор - {upload_job['registrator_name']}]",
+                        verify=False,
+                        on_progress=_on_progress,
+                        state=state,
+                        on_state=_on_state)
+                    uploaded.append({
+                        'file_id': result['id'],
+                        'filename': file_name,
+                        'file_path': result['path'],
+                    })
+                    jobs.update(upload_id, uploaded_files=uploaded)
                     _log.info(
-                        f"Downloading directly from registrator: {file_url}")
-
-                    # Try different approaches for downloading
-                    headers = {
-                        'User-Agent':
-                        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                        'Accept': '*/*',
-                        'Accept-Language': 'en-US,en;q=0.9',
-                        'Accept-Encoding':
-                        'identity',  # Disable compression for large files
-                        'Connection': 'keep-alive'
-                    }
-
-                    _log.info(
-                        f"Starting download of {file_name} from {file_url}")
-
-                    import time
-                    start_time = time.time()
-
-                    # Log additional debug info for performance analysis
-                    _log.info(
-                        f"📊 Performance Debug - File: {file_name}, URL: {file_url}"
+                        f"Imported {file_name}: {result['size_bytes']} bytes in {result['seconds']:.2f}s"
                     )
-                    _log.info(f"📊 Performance Debug - Headers: {headers}")
-                    response = requests.get(file_url,
-                                            timeout=300,
-                                            verify=False,
-                                            stream=True,
-                                            headers=headers)
-
-                    _log.info(
-                        f"Download response status: {response.status_code}")
-
-                    # Log response headers for debugging
-                    _log.info(
-                        f"📊 Performance Debug - Response headers: {dict(response.headers)}"
-                    )
-
-                    if response.status_code == 200:
-                        # Download file with progress tracking
-                        content_length = int(
-                            response.headers.get('content-length', 0))
-                        downloaded_size = 0
-                        file_content = b''
-
-                        _log.info(
-                            f"Starting to download {file_name}, content-length: {content_length}"
-                        )
-
-                        # Log additional performance metrics
-                        _log.info(
-                            f"📊 Performance Debug - File size: {content_length / 1024 / 1024:.2f} MB"
-                        )
-                        _log.info(
-                            f"📊 Performance Debug - Chunk size: 65536 bytes (64KB)"
-                        )
-
-                        download_start = time.time()
-                        chunk_count = 0
-                        last_logged_progress = -1  # Track last logged progress to avoid duplicates
-                        for chunk in response.iter_content(
-                                chunk_size=65536):  # 64KB chunks
-                            if chunk:
-                                file_content += chunk
-                                downloaded_size += len(chunk)
-                                chunk_count += 1
-                                # Log progress every 100 chunks to avoid spam (64KB * 100 = 6.4MB)
-                                if chunk_count % 100 == 0:
-                                    _log.info(
-                                        f"Downloaded {downloaded_size}/{content_length} bytes for {file_name}"
-                                    )
-
-                                # Update progress every 1MB or when complete
-                                if content_length > 0:
-                                    progress = int(
-                                        (downloaded_size / content_length) *
-                                        100)
-                                    # Update progress more frequently for better UX
-                                    if progress % 2 == 0 or downloaded_size == content_length:  # Update every 2%
-                                        update_upload_job(
-                                            upload_id,
-                                            {
-                                                'current_file_progress':
-                                                progress,
-                                                'status': 'running',
-                                                'completed_files':
-                                                i  # Update completed files count during download
-                                            })
-                                        # Reduced logging - only log significant progress updates
-                                        if progress % 10 == 0 and progress != last_logged_progress:  # Log every 10% but only once per percentage
-                                            _log.info(
-                                                f"Upload progress: {i} files completed, {progress}% current file"
-                                            )
-                                            last_logged_progress = progress
-
-                        # Log download performance
-                        download_time = time.time() - download_start
-                        download_speed = (
-                            downloaded_size / 1024 /
-                            1024) / download_time if download_time > 0 else 0
-
-                        # Enhanced performance logging
-                        _log.info(
-                            f"📊 Performance Debug - Download completed: {downloaded_size} bytes in {download_time:.2f}s"
-                        )
-                        _log.info(
-                            f"📊 Performance Debug - Download speed: {download_speed:.2f} MB/s"
-                        )
-                        _log.info(
-                            f"📊 Performance Debug - Total chunks processed: {chunk_count}"
-                        )
-                        _log.info(
-                            f"📊 Performance Debug - Average chunk time: {download_time/chunk_count*1000:.2f}ms per chunk"
-                            if chunk_count >
-                            0 else "📊 Performance Debug - No chunks processed")
-
-                        # Upload file
-                        files = {
-                            'file': (file_name, file_content,
-                                     'application/octet-stream')
-                        }
-                        data = {
-                            'name': file_name,
-                            'description':
-                            f"[Регистратор - {upload_job['registrator_name']}]",
-                            'cat_id': upload_job['cat_id'],
-                            'sub_id': upload_job['sub_id']
-                        }
-
-                        # Log upload start
-                        upload_start_time = time.time()
-                        _log.info(
-                            f"📊 Performance Debug - Starting upload to localhost:8080"
-                        )
-
-                        upload_response = requests.post(
-                            f"http://localhost:8080/files/add?cat_id={upload_job['cat_id']}&sub_id={upload_job['sub_id']}",
-                            files=files,
-                            data=data,
-                            timeout=300)
-
-                        upload_time = time.time() - upload_start_time
-                        _log.info(
-                            f"📊 Performance Debug - Upload completed in {upload_time:.2f}s"
-                        )
-
-                        if upload_response.status_code == 200:
-                            _log.info(f"Successfully uploaded {file_name}")
-                            _log.info(
-                                f"📊 Performance Debug - Upload successful: {upload_response.status_code}"
-                            )
-                            # Update completed files count after successful upload
-                            update_upload_job(
-                                upload_id, {
-                                    'completed_files': i + 1,
-                                    'current_file_progress': 100
-                                })
-                        else:
-                            _log.error(
-                                f"Failed to upload {file_name}: {upload_response.status_code}"
-                            )
-                            _log.error(
-                                f"📊 Performance Debug - Upload failed: {upload_response.status_code}, Response: {upload_response.text[:200]}"
-                            )
-                            increment_upload_error(upload_id)
-                    else:
-                        _log.error(
-                            f"Failed to download {file_url}: {response.status_code}"
-                        )
-                        increment_upload_error(upload_id)
-
+                    # Cancelled while the last chunks were written: nothing may stay
+                    if jobs.cancel_requested(upload_id):
+                        _acknowledge_cancel(upload_id, uploaded)
+                        return
+                    jobs.report_progress(upload_id,
+                                         result['size_bytes'],
+                                         result['size_bytes'],
+                                         force=True)
+                    # Update completed files count after successful import
+                    jobs.update(upload_id,
+                                completed_files=i + 1,
+                                current_file_progress=100,
+                                resume=None)
+                except UploadCancelled:
+                    _acknowledge_cancel(upload_id, uploaded)
+                    return
                 except Exception as e:
                     _log.error(f"Error processing file {file_name}: {e}")
-                    increment_upload_error(upload_id)
+                    jobs.incr(upload_id, 'error_count')
+                    jobs.update(upload_id, resume=None)
+
+            if not jobs.renew(upload_id):
+                _log.warning(f"Upload {upload_id} lost its slot, stopping")
+                return
 
             # Mark as completed
             total_time = time.time() - start_time
-            update_upload_job(
-                upload_id, {
-                    'status': 'completed',
-                    'completed_files': upload_job['total_files'],
-                    'end_time': time.time()
-                })
+            jobs.finish(upload_id,
+                        'completed',
+                        completed_files=upload_job['total_files'],
+                        end_time=time.time())
 
             # Log completion with performance summary
             log_action(
@@ -2823,11 +2525,13 @@ def start_background_upload(upload_job):
 
         except Exception as e:
             _log.error(f"Background upload error: {e}")
-            update_upload_job(upload_job['id'], {
-                'status': 'failed',
-                'error': str(e),
-                'end_time': time.time()
-            })
+            try:
+                jobs.finish(upload_id,
+                            'failed',
+                            error=str(e),
+                            end_time=time.time())
+            except Exception:
+                jobs.release(upload_id)
 
     # Start background thread
     thread = threading.Thread(target=background_upload_worker)
@@ -34,6 +34,15 @@ def register(app):
 	Args:
 		app: The application object providing `route`, `permission_required`, `_sql`, and helpers.
 	"""
+    def _invalidate_principals() -> None:
+        """Drop all cached principals after a group mutation."""
+        try:
+            cache = getattr(app, 'principal_cache', None)
+            if cache is not None:
+                cache.invalidate_all()
+        except Exception as e:
+            _log.warning(f"[groups] principal invalidation failed: {e}")
+
     # Get rate limiter from app
     rate_limit = app.rate_limiters.get(
         'groups',
@@ -399,6 +408,7 @@ def register(app):
                 raise ValueError('Группа с таким названием уже существует')
             # Update group
             app._sql.group_edit([name, description, id])
+            _invalidate_principals()
             log_action('GROUP_EDIT', current_user.name,
                        f'edited group {name} (id={id})',
                        (request.remote_addr or ''))
@@ -457,6 +467,7 @@ def register(app):
                     'Нельзя удалить группу, в которой есть пользователи')
             # Delete group
             app._sql.group_delete([id])
+            _invalidate_principals()
             log_action('GROUP_DELETE', current_user.name,
                        f'deleted group {group_name} (id={id})',
                        (request.remote_addr or ''))
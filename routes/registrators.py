@@ -4,19 +4,34 @@ from modules.permissions import require_permissions, CATEGORIES_VIEW, CATEGORIES
 from modules.logging import get_logger, log_action
 from modules.registrators import Registrator, parse_directory_listing
 from modules.sync_manager import emit_registrators_changed
-from datetime import datetime
+from routes.files import create_registrator_upload, start_background_upload
 from json import loads, dumps
-from os import makedirs, path as ospath
-from hashlib import md5
-from urllib.request import urlopen
-from subprocess import Popen, PIPE
-import time
-from functools import wraps
 from flask_socketio import join_room
 import re
 
 _log = get_logger(__name__)
 
+# Browse levels in URL template order; the last one lists files
+_BROWSE_LEVELS = ['date', 'user', 'time', 'type', 'file']
+
+
+def _level_url(r, level, parts):
+    """Directory URL listing the entries of ``level`` below ``parts``."""
+    if level == 'date':
+        return r.base_url()
+    if level == 'user':
+        return r.build_partial_url(date=parts['date'])
+    if level == 'time':
+        return r.build_partial_url(date=parts['date'], user=parts['user'])
+    if level == 'type':
+        return r.build_partial_url(date=parts['date'],
+                                   user=parts['user'],
+                                   time=parts['time'])
+    return r.build_partial_url(date=parts['date'],
+                               user=parts['user'],
+                               time=parts['time'],
+                               type=parts['type'])
+
 
 def register(app, socketio=None):
     # Socket.IO room join for registrators page
@@ -95,34 +110,9 @@ def register(app, socketio=None):
 			""", [])
     except Exception:
         pass
-    # Simple in-memory rate limiter (IP+endpoint, sliding window)
-    _RATE_BUCKET = {}
-
-    def rate_limit(max_calls: int = 60, window_sec: int = 60):
-
-        def decorator(fn):
-
-            @wraps(fn)
-            def wrapper(*args, **kwargs):
-                try:
-                    key = (request.remote_addr or 'unknown', fn.__name__)
-                    now = time.time()
-                    bucket = _RATE_BUCKET.get(key, [])
-                    bucket = [t for t in bucket if now - t < window_sec]
-                    if len(bucket) >= max_calls:
-                        return jsonify({
-                            'error':
-                            'Слишком много запросов, попробуйте позже'
-                        }), 429
-                    bucket.append(now)
-                    _RATE_BUCKET[key] = bucket
-                except Exception:
-                    pass
-                return fn(*args, **kwargs)
-
-            return wrapper
-
-        return decorator
+    # Shared GCRA limiter (per user/IP, consistent across workers)
+    rate_limit = getattr(app, 'rate_limiters', {}).get('registrators',
+                                                       lambda f: f)
 
     # --- Registrators API ---
     @app.route('/api/registrators', methods=['GET'])
@@ -564,28 +554,22 @@ def register(app, socketio=None):
                         parts[keys[i]] = pp[i]
             except Exception:
                 pass
-            if level == 'date':
-                url = r.base_url()
-            elif level == 'user':
-                url = r.build_partial_url(date=parts['date'])
-            elif level == 'time':
-                url = r.build_partial_url(date=parts['date'],
-                                          user=parts['user'])
-            elif level == 'type':
-                url = r.build_partial_url(date=parts['date'],
-                                          user=parts['user'],
-                                          time=parts['time'])
-            else:
-                url = r.build_partial_url(date=parts['date'],
-                                          user=parts['user'],
-                                          time=parts['time'],
-                                          type=parts['type'])
-            entries = parse_directory_listing(url)
+            url = _level_url(r, level, parts)
+            index = getattr(app, 'registrator_index', None)
+            entries = index.listing(url, rid) if index else \
+                parse_directory_listing(url)
 
             # Sort entries in reverse order for date and time levels
             if level in ['date', 'time']:
                 entries.sort(reverse=True)
 
+            # Warm the next level (newest first) while the user looks at this one
+            if index and level in _BROWSE_LEVELS[:-1]:
+                child_level = _BROWSE_LEVELS[_BROWSE_LEVELS.index(level) + 1]
+                index.prefetch(
+                    (_level_url(r, child_level, dict(parts, **{level: e}))
+                     for e in entries), rid)
+
             return jsonify({
                 'status': 'success',
                 'entries': entries,
@@ -595,12 +579,22 @@ def register(app, socketio=None):
             app.flash_error(e)
             return jsonify({'status': 'error', 'message': str(e)}), 500
 
+    @app.route('/registrators/<int:rid>/index-stats', methods=['GET'])
+    @require_permissions(CATEGORIES_MANAGE)
+    def registrators_index_stats(rid):
+        """Directory listing cache and latency counters of one registrator."""
+        index = getattr(app, 'registrator_index', None)
+        return jsonify({
+            'status': 'success',
+            'stats': index.stats(rid) if index else {}
+        })
+
     # --- Registrators import selected files ---
     @app.route('/registrators/<int:rid>/import', methods=['POST'])
     @require_permissions(CATEGORIES_MANAGE)
-    @rate_limit()
+    @rate_limit
     def registrators_import(rid):
-        """Download selected remote files, convert, and store locally under registrators/<sub>.
+        """Queue selected remote files for a background import into the given subcategory.
 
 		Payload JSON:
 		{
@@ -610,6 +604,8 @@ def register(app, socketio=None):
 		  "files": ["filename1.MOV", ...]
 		}
 		Limits number of files by config files.max_files_upload (default 10).
+		The transfer runs as an upload job (see /api/upload-status/<upload_id>);
+		the response returns as soon as the job is registered.
 		"""
         try:
             j = request.get_json(silent=True) or {}
@@ -723,114 +719,31 @@ def register(app, socketio=None):
                     'message':
                     'Cannot verify registrator permissions'
                 }), 403
+            jobs = getattr(app, 'upload_jobs', None)
+            if jobs is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Upload registry unavailable'
+                }), 503
             r = Registrator(name, url_template, "", True, rid)
-            # Resolve storage dir
-            storage_dir = app._sql._build_storage_dir(cat_id, sub_id)
-            makedirs(storage_dir, exist_ok=True)
-            created_ids = []
-            for fname in file_names:
-                try:
-                    url = r.build_url(date=str(base_parts.get('date') or ''),
-                                      user=str(base_parts.get('user') or ''),
-                                      time_s=str(base_parts.get('time') or ''),
-                                      type_s=str(base_parts.get('type') or ''),
-                                      file_s=str(fname or ''))
-                    # Generate internal name (unique, collision-resistant)
-                    seed = f"{rid}:{cat_id}:{sub_id}:{fname}:{time.time()}"
-                    real_base = md5(seed.encode('utf-8')).hexdigest()
-                    is_audio = fname.lower().endswith(
-                        ('.aac', '.m4a', '.mp3', '.wav', '.oga', '.ogg',
-                         '.wma', '.opus', '.mka'))
-                    target_ext = '.m4a' if is_audio else '.mp4'
-                    base_path = ospath.join(storage_dir, real_base)
-                    # Download remote file to .webm temp (ffmpeg detects container)
-                    try:
-                        with urlopen(url, timeout=20) as resp, open(
-                                base_path + '.webm', 'wb') as out:
-                            out.write(resp.read())
-                    except Exception:
-                        # skip this file on network error
-                        continue
-                    # Probe size and duration for metadata
-                    size_mb = 0.0
-                    try:
-                        size_bytes = ospath.getsize(base_path + '.webm')
-                        size_mb = round(size_bytes / (1024 * 1024), 1)
-                    except Exception:
-                        pass
-                    length_seconds = 0
-                    try:
-                        p = Popen([
-                            "ffprobe", "-v", "error", "-show_entries",
-                            "format=duration", "-of",
-                            "default=noprint_wrappers=1:nokey=1",
-                            base_path + '.webm'
-                        ],
-                                  stdout=PIPE,
-                                  stderr=PIPE,
-                                  universal_newlines=True)
-                        sout, _ = p.communicate(timeout=10)
-                        length_seconds = int(float((sout or '0').strip()) or 0)
-                    except Exception:
-                        pass
-                    # Create DB record via new schema with non-editable description marker
-                    owner = f"{current_user.name} ({app._sql.group_name_by_id([current_user.gid])})"
-                    desc = f"Регистратор — {name}"
-                    file_id = app._sql.file_add2([
-                        fname, real_base + target_ext, cat_id, sub_id, owner,
-                        desc,
-                        datetime.utcnow().strftime('%Y-%m-%d %H:%M'), 0, 0,
-                        size_mb, None
-                    ])
-                    # Update probed metadata if available
-                    try:
-                        if length_seconds or size_mb:
-                            app._sql.file_update_metadata(
-                                [length_seconds, size_mb, file_id])
-                            if socketio:
-                                try:
-                                    socketio.emit(
-                                        'files:changed', {
-                                            'reason': 'metadata',
-                                            'id': file_id,
-                                            'meta': {
-                                                'length': length_seconds,
-                                                'size': size_mb
-                                            }
-                                        })
-                                except Exception:
-                                    pass
-                    except Exception:
-                        pass
-                    created_ids.append(file_id)
-                    # Schedule conversion
-                    try:
-                        app.media_service.convert_async(
-                            base_path + '.webm', base_path + target_ext,
-                            ('file', file_id))
-                    except Exception:
-                        pass
-                except Exception:
-                    continue
-            # Soft refresh for clients (emit to files room and broadcast registrators change)
-            try:
-                if socketio:
-                    from modules.sync_manager import SyncManager, emit_registrators_changed
-                    sm = SyncManager(socketio)
-                    sm.emit_to_room('files:changed', {
-                        'reason': 'registrators-import',
-                        'ids': created_ids
-                    },
-                                    'files',
-                                    reason='registrators-import')
-                    try:
-                        emit_registrators_changed(socketio,
-                                                  'import',
-                                                  ids=created_ids)
-                    except Exception:
-                        pass
-            except Exception:
-                pass
+            file_urls = [
+                r.build_url(date=str(base_parts.get('date') or ''),
+                            user=str(base_parts.get('user') or ''),
+                            time_s=str(base_parts.get('time') or ''),
+                            type_s=str(base_parts.get('type') or ''),
+                            file_s=str(fname or '')) for fname in file_names
+            ]
+            upload_job, active_uploads = create_registrator_upload(
+                app, jobs, file_urls, file_names, name, rid, cat_id, sub_id)
+            if upload_job is None:
+                return jsonify({
+                    'status': 'error',
+                    'message':
+                    f'Maximum parallel uploads limit reached ({active_uploads}/{jobs.max_parallel})'
+                }), 429
+            # Files are registered (and announced) one by one by the worker
+            start_background_upload(upload_job, app.registrator_importer,
+                                    jobs)
             # Log the import action
             try:
                 cat = app._sql.category_by_id([cat_id])
@@ -838,16 +751,16 @@ def register(app, socketio=None):
                 cat_name = cat.name if cat else f"cat_id={cat_id}"
                 sub_name = sub.name if sub else f"sub_id={sub_id}"
                 log_action(
-                    'REGISTRATOR_IMPORT', current_user.name,
-                    f'imported {len(created_ids)} files from registrator {name} to {cat_name}/{sub_name}',
+                    'REGISTRATOR_IMPORT_START', current_user.name,
+                    f'started background import of {len(file_names)} files from registrator {name} to {cat_name}/{sub_name}',
                     (request.remote_addr or ''))
             except Exception:
                 pass
 
             return jsonify({
                 'status': 'success',
-                'created': len(created_ids),
-                'ids': created_ids
+                'queued': len(file_names),
+                'upload_id': upload_job['id']
             })
         except Exception as e:
             app.flash_error(e)
@@ -29,6 +29,15 @@ def register(app):
             except Exception as e:
                 _log.error(f"[users] Error joining users room: {e}")
 
+    def _invalidate_principal(user_id) -> None:
+        """Drop cached principal (row + permission bitmask) after a mutation."""
+        try:
+            cache = getattr(app, 'principal_cache', None)
+            if cache is not None:
+                cache.invalidate(user_id)
+        except Exception as e:
+            _log.warning(f"[users] principal invalidation failed: {e}")
+
     rate_limit = app.rate_limiters.get(
         'users',
         app.rate_limiters.get('default', lambda *args, **kwargs: lambda f: f))
@@ -321,6 +330,7 @@ def register(app):
                 login, name, (request.form.get('group') or '').strip(),
                 int(request.form.get('enabled') != None), permission_value, id
             ])
+            _invalidate_principal(id)
             log_action('USER_EDIT', current_user.name,
                        f'edited user {name} ({login})', request.remote_addr)
         except Exception as e:
@@ -398,6 +408,7 @@ def register(app):
 
             user = app._sql.user_by_id([id])
             app._sql.user_reset([app.hash(password), id])
+            _invalidate_principal(id)
             log_action(
                 'USER_RESET', current_user.name,
                 f'reset password for {user.name if user else "id="+str(id)}',
@@ -467,6 +478,7 @@ def register(app):
             old_enabled = 1 if u and u.is_enabled() else 0
 
             app._sql.user_toggle([new_enabled, id])
+            _invalidate_principal(id)
             log_action(
                 'USER_TOGGLE', current_user.name,
                 f'toggled {u.name if u else "id="+str(id)} enabled {old_enabled}->{new_enabled}',
@@ -542,6 +554,7 @@ def register(app):
                 app.flash_error('Нельзя удалить администратора')
                 return redirect(url_for('users'))
             app._sql.user_delete([id])
+            _invalidate_principal(id)
             log_action('USER_DELETE', current_user.name,
                        f'deleted user {user.name} ({user.login})',
                        request.remote_addr)
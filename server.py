@@ -43,8 +43,6 @@ import os
 import signal
 import time
 import traceback
-import redis
-from configparser import SectionProxy
 from datetime import datetime as dt, timedelta, datetime
 from os import path, listdir
 from typing import Any, Dict, List, Optional, Union
@@ -57,19 +55,30 @@ from flask_socketio import SocketIO
 from socketio import RedisManager as _SioRedisManager
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from modules.core import Config
 from modules.logging import init_logging, get_logger, log_action
-from modules.redis_client import init_redis_client
-from modules.rate_limiter import create_rate_limiter
+from modules.redis_client import (close_shared_redis, init_redis_client,
+                                   redis_config_from, shared_redis)
+from modules.rate_limiter import RateLimiter, create_rate_limiter
 from modules.presence_manager import RedisPresenceManager
 from modules.force_logout_manager import RedisForceLogoutManager
 from modules.file_cache_manager import RedisFileCacheManager
 from modules.upload_manager import RedisUploadManager
+from modules.upload_jobs import upload_registry_from_config
 from modules.server import Server
 from modules.threadpool import ThreadPool
 from modules.middleware import init_middleware
+from modules.job_queue import media_queue_from_config
+from modules.conversion_progress import ConversionProgress
+from modules.registrators import RegistratorIndex
 
 from routes import register_all
 from services.media import MediaService
+from services.hls import hls_packager_from_config
+from services.media_probe import MediaProbe
+from services.previews import preview_generator_from_config
+from services.registrator_import import RegistratorImporter
+from services.file_reconciler import FileReconciler
 from services.permissions import dirs_by_permission
 from utils.common import make_dir
 
@@ -84,61 +93,11 @@ _shutdown_requested = False
 
 
 def _create_redis_client_for_logging():
-    """Create a temporary Redis client for logging synchronization using config settings."""
+    """Shared Redis client for logging synchronization using config settings."""
+    if _redis_client is not None and _redis_client.client is not None:
+        return _redis_client.client
     try:
-        # Get Redis config from the main app
-        temp_app = Server(path.dirname(path.realpath(__file__)))
-        redis_config = {}
-
-        # Try dict-style access first
-        try:
-            redis_config = temp_app._sql.config['redis']
-        except Exception:
-            # Fallback to ConfigParser-style access
-            try:
-                redis_config = {
-                    'server':
-                    temp_app._sql.config.get('redis', 'server', fallback=None),
-                    'port':
-                    temp_app._sql.config.get('redis', 'port', fallback=6379),
-                    'password':
-                    temp_app._sql.config.get('redis',
-                                             'password',
-                                             fallback=None),
-                    'socket':
-                    temp_app._sql.config.get('redis', 'socket', fallback=None),
-                    'db':
-                    temp_app._sql.config.get('redis', 'db', fallback=0)
-                }
-                # Convert port to int
-                try:
-                    redis_config['port'] = int(redis_config['port'])
-                except (ValueError, TypeError):
-                    redis_config['port'] = 6379
-            except Exception:
-                redis_config = {}
-
-        # Create Redis client using the same logic as RedisClient
-        if redis_config.get('socket'):
-            if redis_config.get('password'):
-                url = f"unix://:{redis_config['password']}@{redis_config['socket']}?db={redis_config.get('db', 0)}"
-            else:
-                url = f"unix://{redis_config['socket']}?db={redis_config.get('db', 0)}"
-        else:
-            host = redis_config.get('server', 'localhost')
-            port = redis_config.get('port', 6379)
-            password = redis_config.get('password')
-            db = redis_config.get('db', 0)
-
-            if password:
-                url = f"redis://:{password}@{host}:{port}/{db}"
-            else:
-                url = f"redis://{host}:{port}/{db}"
-
-        return redis.from_url(url,
-                              decode_responses=True,
-                              socket_connect_timeout=5,
-                              socket_timeout=5)
+        return shared_redis(redis_config_from(Config().config))
     except Exception:
         return None
 
@@ -148,32 +107,7 @@ redis_client = None
 try:
     # We need to create a temporary app to read config
     temp_app = Server(path.dirname(path.realpath(__file__)))
-    redis_config = {}
-    # Try dict-style access first
-    try:
-        redis_config = temp_app._sql.config['redis']
-    except Exception:
-        # Fallback to ConfigParser-style access
-        try:
-            redis_config = {
-                'server':
-                temp_app._sql.config.get('redis', 'server', fallback=None),
-                'port':
-                temp_app._sql.config.get('redis', 'port', fallback=6379),
-                'password':
-                temp_app._sql.config.get('redis', 'password', fallback=None),
-                'socket':
-                temp_app._sql.config.get('redis', 'socket', fallback=None),
-                'db':
-                temp_app._sql.config.get('redis', 'db', fallback=0)
-            }
-            # Convert port to int
-            try:
-                redis_config['port'] = int(redis_config['port'])
-            except (ValueError, TypeError):
-                redis_config['port'] = 6379
-        except Exception:
-            redis_config = {}
+    redis_config = redis_config_from(temp_app._sql.config)
 
     if redis_config:
         # Only log Redis connection attempt once across all workers
@@ -182,24 +116,7 @@ try:
                 'redis_connection_attempt_logged', '1', nx=True, ex=20):
             _log.info("Attempting to connect to Redis...")
 
-        # Normalize to dict for typed init_redis_client
-        try:
-            if isinstance(redis_config, SectionProxy):
-                redis_config = {
-                    'server': redis_config.get('server', fallback=None),
-                    'port':
-                    int(redis_config.get('port', fallback='6379') or 6379),
-                    'password': redis_config.get('password', fallback=None),
-                    'socket': redis_config.get('socket', fallback=None),
-                    'db': redis_config.get('db', fallback='0'),
-                }
-        except Exception:
-            pass
-        # Convert to plain dict and coalesce None to {}
-        redis_dict = (dict(redis_config) if hasattr(redis_config, 'items') else
-                      (redis_config or {}))
-        # Type assertion for mypy - we know it's a dict at this point
-        redis_client = init_redis_client(redis_dict)  # type: ignore
+        redis_client = init_redis_client(redis_config)
         if not redis_client or not redis_client.connected:
             _log.error("❌ Redis connection FAILED - application cannot start")
             _log.error(
@@ -224,20 +141,34 @@ app = Server(path.dirname(path.realpath(__file__)), redis_client=redis_client)
 # No adapter: use ConfigParser (config.ini) only
 
 # Initialize Redis-based components
-rate_limiters = create_rate_limiter(redis_client) if redis_client else {}
+rate_limiter = RateLimiter(
+    redis_client,
+    local_share=app._sql.config.getfloat('web',
+                                         'rate_limit_local_share',
+                                         fallback=0.0))
+rate_limiters = create_rate_limiter(rate_limiter)
 presence_manager = RedisPresenceManager(redis_client) if redis_client else None
 force_logout_manager = RedisForceLogoutManager(
     redis_client) if redis_client else None
+if force_logout_manager:
+    # Keeps the per-request force-logout checks in memory (pub/sub epoch)
+    force_logout_manager.start_listener()
+# Drops locally cached principals when another worker invalidates them
+app.principal_cache.start_listener()
 file_cache_manager = RedisFileCacheManager(
     redis_client) if redis_client else None
 upload_manager = RedisUploadManager(redis_client) if redis_client else None
 
 # Store components in app for access by routes
+setattr(app, 'rate_limiter', rate_limiter)
 setattr(app, 'rate_limiters', rate_limiters)
 setattr(app, 'presence_manager', presence_manager)
 setattr(app, 'force_logout_manager', force_logout_manager)
 setattr(app, 'file_cache_manager', file_cache_manager)
 setattr(app, 'upload_manager', upload_manager)
+# Registrator upload jobs: shared pool, leased slot semaphore, hash counters
+setattr(app, 'upload_jobs',
+        upload_registry_from_config(app._sql.config, redis_client))
 
 # Clear maintenance locks on server startup
 if redis_client:
@@ -381,11 +312,99 @@ else:
             'Socket.IO client manager=%s, message_queue not configured (single-process/dev)',
             manager_name)
 tp = ThreadPool(int(app._sql.config['videos']['max_threads']))
-media_service = MediaService(tp, app._sql.config['files']['root'], app._sql,
-                             socketio)
+# Conversions go to the durable Redis queue consumed by media_worker.py;
+# without Redis (or with [videos] queue = inprocess) they run in tp
+media_queue = media_queue_from_config(app._sql.config, redis_client)
+conversion_progress = ConversionProgress(
+    redis_client,
+    socketio,
+    min_interval=app._sql.config.getfloat('videos',
+                                          'progress_interval',
+                                          fallback=1.0))
+setattr(app, 'conversion_progress', conversion_progress)
+media_service = MediaService(
+    tp,
+    app._sql.config['files']['root'],
+    app._sql,
+    socketio,
+    job_queue=media_queue,
+    progress=conversion_progress,
+    convert_timeout=app._sql.config.getint('videos',
+                                           'convert_timeout',
+                                           fallback=300),
+    stall_timeout=app._sql.config.getint('videos',
+                                         'stall_timeout',
+                                         fallback=120),
+    probe=MediaProbe(redis_client),
+    remux=app._sql.config.getboolean('videos', 'remux', fallback=True),
+    remux_max_height=app._sql.config.getint('videos',
+                                            'remux_max_height',
+                                            fallback=1080),
+    remux_max_kbps=app._sql.config.getint('videos',
+                                          'remux_max_kbps',
+                                          fallback=4000),
+    hls=hls_packager_from_config(app._sql.config),
+    previews=preview_generator_from_config(app._sql.config),
+    timeout_factor=app._sql.config.getfloat('videos',
+                                            'convert_timeout_factor',
+                                            fallback=3.0),
+    chunked_min_seconds=app._sql.config.getint('videos',
+                                               'chunked_min_seconds',
+                                               fallback=900),
+    chunk_seconds=app._sql.config.getint('videos',
+                                         'chunk_seconds',
+                                         fallback=120),
+    chunk_parallelism=app._sql.config.getint('videos',
+                                             'chunk_parallelism',
+                                             fallback=2),
+    concurrent_jobs=tp.max)
+# hls.js is not bundled: HLS links are only rendered once static/js/lib/hls.min.js is in place
+app.config['HLS_ENABLED'] = (media_service.hls is not None and path.isfile(
+    path.join(app.static_folder, 'js', 'lib', 'hls.min.js')))
+if media_service.hls is not None and not app.config['HLS_ENABLED']:
+    _log.warning("HLS packaging is on but static/js/lib/hls.min.js is missing; players use MP4")
 # NOTE: Removed early directory creation to avoid root-owned folders when gunicorn starts as root.
 # Directories are created lazily in route handlers under the effective runtime user.
 setattr(app, 'media_service', media_service)
+# Registrator downloads stream straight into storage (no HTTP loopback)
+setattr(app, 'registrator_importer',
+        RegistratorImporter(
+            app._sql,
+            media_service,
+            socketio,
+            max_retries=app._sql.config.getint('files',
+                                               'import_max_retries',
+                                               fallback=5),
+            retry_backoff=app._sql.config.getfloat('files',
+                                                   'import_retry_backoff',
+                                                   fallback=2.0)))
+# Keep file_exists in sync with the disk in the background (listings trust the DB)
+file_reconciler = FileReconciler(
+    app._sql,
+    app._sql.config['files']['root'],
+    redis_client=redis_client,
+    interval=app._sql.config.getint('files',
+                                    'reconcile_interval',
+                                    fallback=60),
+    use_inotify=app._sql.config.getboolean('files',
+                                           'reconcile_inotify',
+                                           fallback=False))
+file_reconciler.start()
+setattr(app, 'file_reconciler', file_reconciler)
+# Registrator directory listings: Redis cache, revalidation and prefetch
+registrator_index = RegistratorIndex(
+    redis_client,
+    ttl=app._sql.config.getint('registrators', 'index_ttl', fallback=60),
+    stale_ttl=app._sql.config.getint('registrators',
+                                     'index_stale_ttl',
+                                     fallback=86400),
+    prefetch_workers=app._sql.config.getint('registrators',
+                                            'prefetch_workers',
+                                            fallback=4),
+    prefetch_limit=app._sql.config.getint('registrators',
+                                          'prefetch_limit',
+                                          fallback=10))
+setattr(app, 'registrator_index', registrator_index)
 register_all(app, tp, media_service, socketio)
 
 
@@ -539,7 +558,7 @@ def gateway_timeout(e):
 @app.login_manager.user_loader
 def load_user(id):
     """Load user for session management; ignore disabled accounts."""
-    user = app._sql.user_by_id([id])
+    user = app.principal_cache.get_user(id)
     if user and not user.is_enabled():
         return None
     return user
@@ -677,6 +696,8 @@ def logout():
                     'session')
                 if sid:
                     app.redis_client.hdel('sessions:active', sid)
+                    if getattr(app, 'request_tracker', None):
+                        app.request_tracker.forget(sid)
 
                 # Notify admins about user logout
                 if socketio:
@@ -804,20 +825,15 @@ def proxy(url: str) -> str:
 
     # Protection Layer 4: Rate limiting per IP
     client_ip = request.environ.get('REMOTE_ADDR', '') or ''
-    if not hasattr(app, '_proxy_rate_limit') or not isinstance(
-            getattr(app, '_proxy_rate_limit'), dict):
-        setattr(app, '_proxy_rate_limit', {})
-
-    current_time = time.time()
-    rate_limiter = getattr(app, '_proxy_rate_limit', {})
-    if client_ip in rate_limiter:
-        last_request = rate_limiter[client_ip]
-        if current_time - last_request < 1:  # Max 1 request per second per IP
-            _log.warning(f'[proxy] rate limit exceeded for {client_ip}')
-            return ''
-
-    rate_limiter[client_ip] = current_time
-    setattr(app, '_proxy_rate_limit', rate_limiter)
+    # Max 1 request per second per IP
+    try:
+        allowed, _ = app.rate_limiter.hit('proxy_ip', f'ip:{client_ip}', 1, 1)
+    except Exception as e:
+        _log.warning(f'[proxy] rate limiting error: {e}')
+        allowed = True
+    if not allowed:
+        _log.warning(f'[proxy] rate limit exceeded for {client_ip}')
+        return ''
 
     # Protection Layer 5: Validate URL format
     if not url or len(url) < 3 or '!' not in url:
@@ -893,6 +909,30 @@ def signal_handler(signum, frame):
         except Exception as e:
             _log.warning(f"Media service stop error: {e}")
 
+    # Stop file reconciler
+    if 'file_reconciler' in globals() and file_reconciler:
+        try:
+            file_reconciler.stop()
+        except Exception as e:
+            _log.warning(f"File reconciler stop error: {e}")
+
+    if 'registrator_index' in globals() and registrator_index:
+        try:
+            registrator_index.shutdown()
+        except Exception as e:
+            _log.warning(f"Registrator index stop error: {e}")
+
+    if force_logout_manager:
+        try:
+            force_logout_manager.shutdown()
+        except Exception as e:
+            _log.warning(f"Force logout listener stop error: {e}")
+
+    try:
+        app.principal_cache.shutdown()
+    except Exception as e:
+        _log.warning(f"Principal cache listener stop error: {e}")
+
     # Stop thread pool
     if 'tp' in globals() and tp:
         try:
@@ -922,6 +962,7 @@ def signal_handler(signum, frame):
     if temp_redis and temp_redis.set(
             'graceful_shutdown_completed_logged', '1', nx=True, ex=20):
         _log.info("Graceful shutdown completed")
+    close_shared_redis()
     exit(0)
 
 
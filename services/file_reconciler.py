@@ -0,0 +1,220 @@
+"""Background reconciliation of the ``file_exists`` column with the disk.
+
+Each sweep lists every storage directory once and writes only the rows whose
+status changed. A storage root or directory that cannot be listed (e.g. an
+NFS mount that is briefly gone) is skipped rather than read as empty, so an
+outage never marks the library as vanished.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from modules.logging import get_logger
+
+_log = get_logger(__name__)
+
+# Redis key used to elect a single sweeping worker per interval
+RECONCILE_LOCK_KEY = 'znf:reconcile:lock'
+
+
+class FileReconciler:
+    """Background synchronizer of the ``file_exists`` column with the disk.
+
+	Periodically lists each storage directory once with ``os.scandir`` and
+	writes only the rows whose status changed, in batched UPDATEs. Listing
+	routes trust the DB column instead of stat'ing every file per request.
+	"""
+
+    def __init__(self,
+                 sql_utils: Any,
+                 files_root: str,
+                 redis_client: Optional[Any] = None,
+                 interval: int = 60,
+                 batch_size: int = 500,
+                 use_inotify: bool = False) -> None:
+        """Initialize reconciler.
+
+		Args:
+			sql_utils: Data access layer (file_locations_all, file_set_exists_bulk).
+			files_root: Root path for files storage (config files.root).
+			redis_client: Optional RedisClient; when set, one worker sweeps per interval.
+			interval: Seconds between sweeps.
+			batch_size: Max ids per UPDATE statement.
+			use_inotify: Wake up early on local filesystem events (needs inotify_simple).
+		"""
+        self._sql = sql_utils
+        self.files_root = files_root
+        self.redis = redis_client
+        self.interval = max(5, int(interval or 60))
+        self.batch_size = max(1, int(batch_size or 500))
+        self.use_inotify = bool(use_inotify)
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_stats: Dict[str, Any] = {}
+
+    def _storage_dir(self, cat_folder: Optional[str],
+                     sub_folder: Optional[str]) -> str:
+        return os.path.join(self.files_root, 'files', cat_folder or '',
+                            sub_folder or '')
+
+    @staticmethod
+    def _list_dir(directory: str) -> Optional[Set[str]]:
+        """Names in ``directory``; None when it is missing or unreadable."""
+        try:
+            with os.scandir(directory) as it:
+                return {e.name for e in it}
+        except OSError:
+            return None
+
+    @staticmethod
+    def _present(file_name: str, names: Set[str]) -> bool:
+        # Same rule as File._check_file_exists: converted file or the original .webm
+        if not file_name:
+            return False
+        if file_name in names:
+            return True
+        return (os.path.splitext(file_name)[0] + '.webm') in names
+
+    def _write(self, ids: List[int], exists: bool) -> None:
+        for i in range(0, len(ids), self.batch_size):
+            self._sql.file_set_exists_bulk(ids[i:i + self.batch_size], exists)
+
+    def sweep(self) -> Dict[str, Any]:
+        """Run one full reconciliation pass.
+
+		Directories that cannot be listed are skipped; when the storage root
+		itself is not a readable directory the pass is aborted without writes.
+
+		Returns:
+			dict: counters {'checked', 'dirs', 'skipped_dirs', 'appeared',
+			'vanished', 'seconds'}, or {'aborted': reason} when aborted
+		"""
+        started = time.time()
+        base = os.path.join(self.files_root, 'files')
+        if not os.path.isdir(base) or not os.access(base, os.R_OK | os.X_OK):
+            _log.warning(f"File reconcile skipped: storage root {base} is not readable")
+            self.last_stats = {'aborted': 'storage root not readable'}
+            return self.last_stats
+        rows = self._sql.file_locations_all()
+        by_dir: Dict[str, list] = {}
+        for fid, cat_folder, sub_folder, file_name, file_exists in rows:
+            by_dir.setdefault(self._storage_dir(cat_folder, sub_folder),
+                              []).append((fid, file_name, file_exists))
+        appeared: List[int] = []
+        vanished: List[int] = []
+        skipped = 0
+        for directory, entries in by_dir.items():
+            names = self._list_dir(directory)
+            if names is None:
+                # Missing or unreadable directory: leave its rows as they are
+                skipped += 1
+                continue
+            for fid, file_name, file_exists in entries:
+                present = self._present(file_name, names)
+                if present and not file_exists:
+                    appeared.append(int(fid))
+                elif file_exists and not present:
+                    vanished.append(int(fid))
+        self._write(appeared, True)
+        self._write(vanished, False)
+        stats = {
+            'checked': len(rows),
+            'dirs': len(by_dir),
+            'skipped_dirs': skipped,
+            'appeared': len(appeared),
+            'vanished': len(vanished),
+            'seconds': round(time.time() - started, 3),
+        }
+        self.last_stats = stats
+        if skipped:
+            _log.warning(f"File reconcile: {skipped} storage directories could not be listed")
+        if appeared or vanished:
+            _log.info(f"File reconcile: {stats}")
+        return stats
+
+    def _acquire_turn(self) -> bool:
+        if not self.redis:
+            return True
+        try:
+            return bool(
+                self.redis.client.set(RECONCILE_LOCK_KEY,
+                                      str(os.getpid()),
+                                      nx=True,
+                                      ex=max(1, self.interval - 1)))
+        except Exception:
+            return True
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self._acquire_turn():
+                    self.sweep()
+            except Exception as e:
+                _log.warning(f"File reconcile failed: {e}")
+            self._wake.wait(self.interval)
+            if self._wake.is_set():
+                # Debounce bursts of filesystem events
+                self._stop.wait(2)
+                self._wake.clear()
+                if self.redis:
+                    try:
+                        self.redis.delete(RECONCILE_LOCK_KEY)
+                    except Exception:
+                        pass
+
+    def _watch(self) -> None:
+        try:
+            from inotify_simple import INotify, flags  # type: ignore
+        except Exception:
+            _log.info('inotify_simple not installed; reconciler uses periodic sweeps only')
+            return
+        try:
+            ino = INotify()
+            mask = (flags.CREATE | flags.DELETE | flags.MOVED_FROM
+                    | flags.MOVED_TO | flags.CLOSE_WRITE)
+            base = os.path.join(self.files_root, 'files')
+            for directory in self._walk_dirs(base):
+                try:
+                    ino.add_watch(directory, mask)
+                except Exception:
+                    continue
+            while not self._stop.is_set():
+                if ino.read(timeout=1000):
+                    self._wake.set()
+        except Exception as e:
+            _log.warning(f"inotify watcher stopped: {e}")
+
+    @staticmethod
+    def _walk_dirs(base: str) -> Iterable[str]:
+        # Storage layout is files/<category>/<subcategory>
+        yield base
+        for cat in FileReconciler._subdirs(base):
+            yield cat
+            for sub in FileReconciler._subdirs(cat):
+                yield sub
+
+    @staticmethod
+    def _subdirs(directory: str) -> List[str]:
+        try:
+            with os.scandir(directory) as it:
+                return [e.path for e in it if e.is_dir(follow_symlinks=False)]
+        except Exception:
+            return []
+
+    def start(self) -> None:
+        """Start background sweeping (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        if self.use_inotify:
+            threading.Thread(target=self._watch, daemon=True).start()
+
+    def stop(self) -> None:
+        """Stop background sweeping."""
+        self._stop.set()
+        self._wake.set()
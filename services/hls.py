@@ -0,0 +1,207 @@
+import os
+import re
+import shutil
+from subprocess import DEVNULL, PIPE, Popen, TimeoutExpired
+from typing import Any, Dict, List, Optional, Tuple
+
+from modules.logging import get_logger
+
+_log = get_logger(__name__)
+
+MASTER_PLAYLIST = 'master.m3u8'
+# master.m3u8 | <variant>/index.m3u8 | <variant>/seg_00001.ts
+HLS_NAME_RE = re.compile(
+    r'^(master\.m3u8|[a-z0-9]+/(index\.m3u8|seg_\d{5}\.ts))$')
+HLS_MIMETYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+}
+
+
+def hls_dir(media_path: str) -> str:
+    """HLS output directory stored next to a media file: ``<base>.hls``."""
+    return os.path.splitext(media_path)[0] + '.hls'
+
+
+def parse_ladder(value: Optional[str]) -> List[Tuple[int, int]]:
+    """``'360:600,720:2000'`` -> [(360, 600), (720, 2000)] (height, video kbps)."""
+    rungs = []
+    for item in (value or '').split(','):
+        height, sep, kbps = item.strip().partition(':')
+        try:
+            if sep and int(height) > 0 and int(kbps) > 0:
+                rungs.append((int(height), int(kbps)))
+        except ValueError:
+            _log.warning(f"Ignoring invalid HLS ladder entry: {item!r}")
+    return sorted(set(rungs))
+
+
+class HlsPackager:
+    """Segments converted MP4 files into VOD HLS next to the source.
+
+	The source rendition is always a stream copy of the MP4 (no re-encode);
+	``ladder`` rungs smaller than the source are encoded on top of it. The
+	layout is ``<base>.hls/master.m3u8`` with one ``<variant>/index.m3u8``
+	plus ``seg_NNNNN.ts`` segments per rendition. Output is written to a
+	temporary directory and swapped in, so readers never see half a ladder.
+	"""
+
+    AUDIO_KBPS = 128
+
+    def __init__(self,
+                 segment_seconds: int = 4,
+                 ladder: Optional[List[Tuple[int, int]]] = None,
+                 timeout: int = 600,
+                 timeout_factor: float = 3.0) -> None:
+        """Initialize packager.
+
+		Args:
+			segment_seconds: Target segment duration in seconds.
+			ladder: Extra renditions as (height, video kbps), e.g. [(360, 600)].
+			timeout: Minimal limit for one ffmpeg run in seconds.
+			timeout_factor: Seconds of ffmpeg time allowed per second of media;
+				the limit is max(timeout, duration * timeout_factor).
+		"""
+        self.segment_seconds = max(1, int(segment_seconds))
+        self.ladder = list(ladder or [])
+        self.timeout = max(1, int(timeout))
+        self.timeout_factor = max(0.0, float(timeout_factor))
+
+    def keyframe_args(self) -> List[str]:
+        """ffmpeg options aligning keyframes with segment boundaries."""
+        return [
+            "-force_key_frames", f"expr:gte(t,n_forced*{self.segment_seconds})"
+        ]
+
+    def _segment_args(self, out_dir: str) -> List[str]:
+        return [
+            "-f", "hls", "-hls_time",
+            str(self.segment_seconds), "-hls_playlist_type", "vod",
+            "-hls_flags", "independent_segments", "-hls_segment_filename",
+            os.path.join(out_dir, 'seg_%05d.ts'),
+            os.path.join(out_dir, 'index.m3u8')
+        ]
+
+    def plan(self, src: str, info: Dict[str, Any],
+             out_root: str) -> List[Dict[str, Any]]:
+        """Renditions for ``src``: name, ffmpeg command, bandwidth, resolution."""
+        video = info.get('video') or {}
+        width = int(video.get('width') or 0)
+        height = int(video.get('height') or 0)
+        duration = float(info.get('duration') or 0)
+        bandwidth = int(info.get('bit_rate') or 0)
+        if not bandwidth and duration:
+            bandwidth = int(info.get('size_bytes', 0) * 8 / duration)
+        base = ["ffmpeg", "-hide_banner", "-y", "-i", src, "-map", "0:v:0",
+                "-map", "0:a:0?"]
+        src_dir = os.path.join(out_root, 'src')
+        variants = [{
+            'name': 'src',
+            'bandwidth': bandwidth or 1_000_000,
+            'resolution': (width, height),
+            'cmd': base + ["-c", "copy"] + self._segment_args(src_dir),
+        }]
+        for rung_height, kbps in self.ladder:
+            if not height or rung_height >= height:
+                continue
+            rung_width = int(round(width * rung_height / height / 2.0)) * 2
+            out_dir = os.path.join(out_root, f'{rung_height}p')
+            variants.append({
+                'name': f'{rung_height}p',
+                'bandwidth': (kbps + self.AUDIO_KBPS) * 1000,
+                'resolution': (rung_width, rung_height),
+                'cmd': base + [
+                    "-vf", f"scale=-2:{rung_height}", "-c:v", "libx264",
+                    "-preset", "veryfast", "-b:v", f"{kbps}k", "-maxrate",
+                    f"{kbps * 107 // 100}k", "-bufsize", f"{kbps * 2}k"
+                ] + self.keyframe_args() + [
+                    "-c:a", "aac", "-b:a", f"{self.AUDIO_KBPS}k"
+                ] + self._segment_args(out_dir),
+            })
+        return variants
+
+    @staticmethod
+    def master_playlist(variants: List[Dict[str, Any]]) -> str:
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-INDEPENDENT-SEGMENTS']
+        # Highest bandwidth first: players start with the first entry
+        for v in sorted(variants, key=lambda v: -v['bandwidth']):
+            attrs = f"BANDWIDTH={int(v['bandwidth'])}"
+            w, h = v['resolution']
+            if w and h:
+                attrs += f",RESOLUTION={w}x{h}"
+            lines.append(f"#EXT-X-STREAM-INF:{attrs}")
+            lines.append(f"{v['name']}/index.m3u8")
+        return '\n'.join(lines) + '\n'
+
+    def _timeout_for(self, duration: Optional[float]) -> int:
+        """Run limit for media of ``duration`` seconds (never below timeout)."""
+        return max(self.timeout, int((duration or 0) * self.timeout_factor))
+
+    def _run(self, cmd: List[str], timeout: int) -> None:
+        p = Popen(cmd, stdout=DEVNULL, stderr=PIPE, universal_newlines=True)
+        try:
+            _, err = p.communicate(timeout=timeout)
+        except TimeoutExpired:
+            p.kill()
+            p.communicate()
+            raise TimeoutError(f"ffmpeg HLS run exceeded {timeout}s")
+        if p.returncode != 0:
+            raise RuntimeError(
+                f"ffmpeg HLS exit code {p.returncode}: {(err or '')[-500:]}")
+
+    def package(self, src: str, info: Dict[str, Any]) -> bool:
+        """Write HLS renditions of ``src`` into ``hls_dir(src)``.
+
+		Args:
+			src: Converted MP4 (H.264/AAC).
+			info: MediaProbe metadata of ``src``.
+
+		Returns:
+			bool: True when the playlist set was written.
+		"""
+        if not info.get('has_video'):
+            return False
+        target = hls_dir(src)
+        tmp = target + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        try:
+            variants = self.plan(src, info, tmp)
+            timeout = self._timeout_for(info.get('duration'))
+            for v in variants:
+                os.makedirs(os.path.join(tmp, v['name']), exist_ok=True)
+                self._run(v['cmd'], timeout)
+            with open(os.path.join(tmp, MASTER_PLAYLIST), 'w') as fh:
+                fh.write(self.master_playlist(variants))
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(tmp, target)
+            return True
+        except Exception as e:
+            _log.error(f"HLS packaging failed for {src}: {e}")
+            shutil.rmtree(tmp, ignore_errors=True)
+            return False
+
+
+def remove_hls(media_path: str) -> None:
+    """Delete the HLS output of a media file, if any."""
+    shutil.rmtree(hls_dir(media_path), ignore_errors=True)
+
+
+def move_hls(old_media_path: str, new_media_path: str) -> None:
+    """Move the HLS output along with its media file."""
+    old, new = hls_dir(old_media_path), hls_dir(new_media_path)
+    if os.path.isdir(old) and old != new:
+        shutil.rmtree(new, ignore_errors=True)
+        shutil.move(old, new)
+
+
+def hls_packager_from_config(config: Any) -> Optional[HlsPackager]:
+    """Build the packager from ``[videos] hls*`` settings; None when disabled."""
+    if not config.getboolean('videos', 'hls', fallback=False):
+        return None
+    return HlsPackager(
+        segment_seconds=config.getint('videos', 'hls_segment_seconds',
+                                      fallback=4),
+        ladder=parse_ladder(config.get('videos', 'hls_ladder', fallback='')),
+        timeout=config.getint('videos', 'convert_timeout', fallback=300),
+        timeout_factor=config.getfloat('videos', 'convert_timeout_factor',
+                                       fallback=3.0))
@@ -1,12 +1,20 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from os import path, remove, rename
 from subprocess import Popen, PIPE
-import json
+from threading import Event, Lock, Thread
 import os
-from typing import Tuple, Any, Optional
+import shutil
+import time
+from typing import Tuple, Any, List, Optional
 
 from modules.threadpool import ThreadPool
 from modules.logging import get_logger
+from modules.conversion_progress import parse_out_time, parse_progress_block, parse_speed
 from modules.sync_manager import emit_files_changed
+from services.hls import HlsPackager
+from services.media_probe import MediaProbe
+from services.previews import PreviewGenerator
 
 
 class MediaService:
@@ -20,7 +28,22 @@ class MediaService:
                  thread_pool: ThreadPool,
                  files_root: str,
                  sql_utils: Any,
-                 socketio: Optional[Any] = None) -> None:
+                 socketio: Optional[Any] = None,
+                 job_queue: Optional[Any] = None,
+                 progress: Optional[Any] = None,
+                 convert_timeout: int = 300,
+                 stall_timeout: int = 120,
+                 probe: Optional[MediaProbe] = None,
+                 remux: bool = True,
+                 remux_max_height: int = 1080,
+                 remux_max_kbps: int = 4000,
+                 hls: Optional[HlsPackager] = None,
+                 previews: Optional[PreviewGenerator] = None,
+                 timeout_factor: float = 3.0,
+                 chunked_min_seconds: int = 900,
+                 chunk_seconds: int = 120,
+                 chunk_parallelism: int = 2,
+                 concurrent_jobs: int = 1) -> None:
         """Initialize media service.
 
 		Args:
@@ -28,33 +51,165 @@ class MediaService:
 			files_root: Root path for files storage (used by callers for paths).
 			sql_utils: Data access layer with required methods (file_ready, order_*, ...).
 			socketio: Optional Socket.IO server for broadcasting updates.
+			job_queue: Optional durable queue (RedisJobQueue); when set, conversions
+				are enqueued for media_worker.py instead of run in thread_pool.
+			progress: Optional ConversionProgress receiving ffmpeg progress/ETA.
+			convert_timeout: Minimal limit for one ffmpeg run in seconds.
+			stall_timeout: Kill ffmpeg when its position does not advance for this long.
+			probe: MediaProbe for duration/size (an uncached one by default).
+			remux: Stream-copy sources that are already H.264/AAC instead of re-encoding.
+			remux_max_height: Largest video height accepted for a remux.
+			remux_max_kbps: Largest video bitrate accepted for a remux (0 = any).
+			hls: Optional HlsPackager; converted videos are also segmented to HLS.
+			previews: Optional PreviewGenerator for poster and scrub sprite.
+			timeout_factor: Run limit per second of media; the effective limit is
+				max(convert_timeout, duration * timeout_factor).
+			chunked_min_seconds: Full encodes of sources at least this long are split
+				into segments encoded in parallel (0 disables).
+			chunk_seconds: Target segment length of a chunked encode.
+			chunk_parallelism: Concurrent segment encodes per conversion
+				(0 = CPU count divided by ``concurrent_jobs``).
+			concurrent_jobs: Conversions this process runs at once (thread pool
+				or worker concurrency); CPU shares are split between them.
 		"""
         self.thread_pool = thread_pool
         self.files_root = files_root
         self._sql = sql_utils
         self.socketio = socketio
+        self.job_queue = job_queue
+        self.progress = progress
+        self.convert_timeout = max(1, int(convert_timeout))
+        self.stall_timeout = max(1, int(stall_timeout))
+        self.probe = probe if probe is not None else MediaProbe()
+        self.remux = bool(remux)
+        self.remux_max_height = max(0, int(remux_max_height))
+        self.remux_max_kbps = max(0, int(remux_max_kbps))
+        self.hls = hls
+        self.previews = previews
+        self.timeout_factor = max(0.0, float(timeout_factor))
+        self.chunked_min_seconds = max(0, int(chunked_min_seconds))
+        self.chunk_seconds = max(10, int(chunk_seconds))
+        self.concurrent_jobs = max(1, int(concurrent_jobs or 1))
+        self.chunk_parallelism = int(chunk_parallelism) if int(
+            chunk_parallelism) > 0 else max(
+                1, (os.cpu_count() or 1) // self.concurrent_jobs)
         try:
             self._log = get_logger(__name__)
         except Exception:
             import logging as _pylog
             self._log = _pylog.getLogger(__name__)
 
-    def convert_async(self, src_path: str, dst_path: str,
-                      entity: Tuple[str, int]) -> None:
+    def convert_async(self,
+                      src_path: str,
+                      dst_path: str,
+                      entity: Tuple[str, int],
+                      priority: int = 0) -> None:
         """Schedule asynchronous conversion from src to dst for the given entity.
 
 		Args:
 			src_path: Path to source file (e.g., .webm)
 			dst_path: Path to destination file (e.g., .mp4)
 			entity: Tuple of (entity_type, entity_id), where entity_type is 'file'|'order'.
+			priority: Queue priority (-9..9, higher first); ignored in in-process mode.
 		"""
+        if self.progress is not None and entity[0] == 'file':
+            try:
+                self.progress.queued(int(entity[1]))
+            except Exception:
+                pass
+        if self.job_queue is not None:
+            self.job_queue.enqueue('convert', {
+                'src': src_path,
+                'dst': dst_path,
+                'entity': [entity[0], int(entity[1])]
+            },
+                                   priority=priority)
+            return
         self.thread_pool.add(self._convert, (src_path, dst_path, entity))
 
-    def _convert(self, args: Tuple[str, str, Tuple[str, int]]) -> None:
+    def run_job(self, job: dict) -> None:
+        """Queue handler for 'convert' jobs (used by media_worker.py).
+
+		Raises on a failed conversion so the queue retries it; the entity is
+		only marked ready despite the error on the last attempt.
+		"""
+        payload = job['payload']
+        etype, entity_id = payload['entity']
+        last = int(job.get('attempts', 1)) >= int(job.get('max_attempts', 1))
+        if not self._convert((payload['src'], payload['dst'],
+                              (etype, int(entity_id))),
+                             give_up=last):
+            raise RuntimeError(
+                f"conversion failed: {payload['src']} -> {payload['dst']}")
+
+    def _video_remuxable(self, info: dict) -> bool:
+        """H.264 yuv420p within the configured height/bitrate limits."""
+        video = info.get('video')
+        if not video or video.get('codec') != 'h264':
+            return False
+        if video.get('pix_fmt') not in ('yuv420p', 'yuvj420p'):
+            return False
+        height = int(video.get('height') or 0)
+        if not height or (self.remux_max_height
+                          and height > self.remux_max_height):
+            return False
+        # Containers like Matroska only report the overall bitrate
+        kbps = int(video.get('bit_rate') or info.get('bit_rate') or 0) // 1000
+        if self.remux_max_kbps and kbps > self.remux_max_kbps:
+            return False
+        return True
+
+    def _encode_video_args(self) -> List[str]:
+        """Video options of the full encode: H.264 in MP4 with scaling/CRF."""
+        keyframes = self.hls.keyframe_args() if self.hls is not None else []
+        return [
+            "-c:v", "libx264", "-preset", "slow", "-crf", "28", "-b:v",
+            "250k", "-vf", "scale=800:600"
+        ] + keyframes
+
+    def _timeout_for(self, duration: Optional[float]) -> int:
+        """Run limit for media of ``duration`` seconds (never below convert_timeout)."""
+        return max(self.convert_timeout,
+                   int((duration or 0) * self.timeout_factor))
+
+    def _plan_conversion(self, src: str, dst: str) -> Tuple[str, List[str]]:
+        """Pick the cheapest ffmpeg pipeline producing ``dst`` from ``src``.
+
+		Returns:
+			Tuple[str, List[str]]: (mode, ffmpeg command), mode being
+			'remux' (stream copy), 'audio' (video copied, audio transcoded)
+			or 'encode' (full H.264 encode).
+		"""
+        base = ["ffmpeg", "-hide_banner", "-y", "-i", src]
+        aac = ["-c:a", "aac", "-b:a", "192k"]
+        faststart = ["-movflags", "+faststart"]
+        info = self.probe.probe(src) if self.remux else {}
+        audio = info.get('audio')
+        audio_copy = audio is not None and audio.get('codec') == 'aac'
+        if (os.path.splitext(dst)[1] or '').lower() == '.m4a':
+            # Audio-only: AAC in M4A container, video dropped
+            if audio_copy:
+                return 'remux', base + ["-vn", "-c:a", "copy"] + faststart + [
+                    dst
+                ]
+            return 'audio', base + ["-vn"] + aac + [dst]
+        if self._video_remuxable(info):
+            if audio is None or audio_copy:
+                return 'remux', base + ["-c", "copy"] + faststart + [dst]
+            return 'audio', base + ["-c:v", "copy"] + aac + faststart + [dst]
+        return 'encode', base + self._encode_video_args() + [dst]
+
+    def _convert(self,
+                 args: Tuple[str, str, Tuple[str, int]],
+                 give_up: bool = True) -> bool:
         """Worker function executed in background thread to run ffmpeg and post-process.
 
 		Args:
 			args: Tuple of (src_path, dst_path, (entity_type, entity_id)).
+			give_up: Mark the entity ready even if ffmpeg fails (no retry will follow).
+
+		Returns:
+			bool: False if ffmpeg failed or timed out.
 		"""
         old, new, entity = args
         etype, entity_id = entity
@@ -69,74 +224,54 @@ class MediaService:
                 pass
             if etype == 'file':
                 self._sql.file_ready([entity_id])
-            return
+            return True
 
         if old == new:
             # If destination equals source, force a default target extension
             # Default to mp4; audio pipeline below will override when needed
             rename(old, old + '.mp4')
             old += '.mp4'
-        # Select conversion pipeline based on target extension
-        dst_ext = (os.path.splitext(new)[1] or '').lower()
-        if dst_ext == '.m4a':
-            # Audio-only: convert to AAC in M4A container
-            process = Popen(
-                [
-                    "ffmpeg",
-                    "-hide_banner",
-                    "-y",
-                    "-i",
-                    old,
-                    "-vn",  # drop video
-                    "-c:a",
-                    "aac",
-                    "-b:a",
-                    "192k",
-                    new
-                ],
-                stdout=PIPE,
-                stderr=PIPE,
-                universal_newlines=True)
-        else:
-            # Video: H.264 in MP4 with scaling/CRF
-            process = Popen([
-                "ffmpeg", "-hide_banner", "-y", "-i", old, "-c:v", "libx264",
-                "-preset", "slow", "-crf", "28", "-b:v", "250k", "-vf",
-                "scale=800:600", new
-            ],
-                            stdout=PIPE,
-                            stderr=PIPE,
-                            universal_newlines=True)
+        mode, cmd = self._plan_conversion(old, new)
+        file_id = entity_id if etype == 'file' else None
+        duration = self.probe.probe(old)['duration']
         try:
-            out, err = process.communicate(timeout=300)  # 5 minute timeout
-            if process.returncode != 0:
-                try:
-                    from flask import current_app as app
-                    app.logger.error("FFmpeg failed for %s -> %s: %s", old,
-                                     new, err)
-                except Exception:
-                    pass
+            if mode == 'encode' and self.chunked_min_seconds and \
+                    duration >= self.chunked_min_seconds and \
+                    new.lower().endswith('.mp4'):
+                returncode, err = self._encode_chunked(old, new, duration,
+                                                       file_id)
+            else:
+                returncode, err = self._run_ffmpeg(
+                    cmd, old, file_id, timeout=self._timeout_for(duration))
+            if returncode != 0:
+                self._log.error('FFmpeg failed for %s -> %s: %s', old, new,
+                                (err or '')[-500:])
+                self._progress_finish(file_id, False,
+                                      f'ffmpeg exit code {returncode}')
                 # Still mark as ready but with error indication
-                if etype == 'file':
+                if etype == 'file' and give_up:
                     self._sql.file_ready([entity_id])
-                return
+                return False
         except Exception as e:
-            try:
-                from flask import current_app as app
-                app.logger.error("FFmpeg timeout or error for %s -> %s: %s",
-                                 old, new, e)
-            except Exception:
-                pass
-            process.kill()
+            self._log.error('FFmpeg timeout or error for %s -> %s: %s', old,
+                            new, e)
+            self._progress_finish(file_id, False, str(e))
             # Mark as ready even on error to prevent hanging
-            if etype == 'file':
+            if etype == 'file' and give_up:
                 self._sql.file_ready([entity_id])
-            return
-        # After conversion, probe duration and size (robust ffprobe)
-        length_seconds, size_mb = self._probe_length_and_size(new)
+            return False
+        if etype == 'file':
+            try:
+                self._sql.file_set_conversion_mode(entity_id, mode)
+            except Exception as e:
+                self._log.warning('Failed to store conversion mode of %s: %s',
+                                  entity_id, e)
+        # After conversion, probe duration and size (single cached ffprobe)
+        length_seconds, size_mb = self.probe.length_and_size(new)
         # conversion done; avoid extra info logs
         if etype == 'file':
             self._sql.file_ready([entity_id])
+            self._progress_finish(file_id, True)
             try:
                 self._sql.file_update_metadata(
                     [length_seconds, size_mb, entity_id])
@@ -168,6 +303,9 @@ class MediaService:
                     except Exception:
                         pass
                     pass
+            # Background stages after the MP4 is already playable
+            if new.lower().endswith('.mp4'):
+                self._post_process(new, entity_id)
         elif etype == 'order':
             ord = self._sql.order_by_id([entity_id])
             ord.attachments.remove(path.basename(old))
@@ -175,89 +313,241 @@ class MediaService:
             self._sql.order_edit_attachments(
                 ['|'.join(ord.attachments), entity_id])
         remove(old)
+        return True
+
+    def _post_process(self, media_path: str, file_id: int) -> None:
+        """HLS packaging and preview generation for a converted video."""
+        if self.hls is None and self.previews is None:
+            return
+        info = self.probe.probe(media_path)
+        if self.hls is not None:
+            self.hls.package(media_path, info)
+        if self.previews is not None:
+            version = self.previews.generate(media_path, info)
+            if version is None:
+                return
+            try:
+                self._sql.file_set_preview_version(file_id, version)
+            except Exception as e:
+                self._log.warning('Failed to store preview version of %s: %s',
+                                  file_id, e)
+                return
+            if self.socketio:
+                try:
+                    emit_files_changed(self.socketio,
+                                       'preview-ready',
+                                       id=file_id,
+                                       previewVersion=version)
+                except Exception:
+                    pass
+
+    def _run_ffmpeg(self,
+                    cmd: List[str],
+                    src: str,
+                    file_id: Optional[int],
+                    timeout: Optional[int] = None) -> Tuple[int, str]:
+        """Run ffmpeg with ``-progress pipe:1`` and report progress while it encodes.
+
+		The process is killed when it runs longer than ``timeout`` or its
+		encoded position does not advance for ``stall_timeout`` seconds.
 
-    def _probe_length_and_size(self, target: str) -> Tuple[int, float]:
-        """Probe duration (in seconds) and size (in MB) for a media file using robust strategies.
+		Args:
+			cmd: ffmpeg command line (without progress options).
+			src: Source path, probed for the total duration (percent/ETA).
+			file_id: File ID to report progress for; None disables reporting.
+			timeout: Run limit in seconds; derived from the duration if None.
+
+		Returns:
+			tuple: (returncode, last stderr lines)
 
-		Tries in order:
-		1) Container duration: format.duration
-		2) Video stream duration: stream.duration (v:0)
-		3) Estimate via nb_frames / r_frame_rate for v:0 (with -count_frames)
+		Raises:
+			TimeoutError: If the process was killed by the watchdog.
 		"""
-        length_seconds = 0
-        size_mb: float = 0.0
-        # Size
-        try:
-            size_bytes = os.path.getsize(target)
-            size_mb = round(size_bytes /
-                            (1024 * 1024), 1) if size_bytes else 0.0
-        except Exception:
-            pass
-        # 1) format.duration
+        report = self.progress is not None and file_id is not None
+        duration = (self.probe.probe(src)['duration']
+                    or None) if report or timeout is None else None
+        if timeout is None:
+            timeout = self._timeout_for(duration)
+        process = Popen(cmd[:1] + ["-nostats", "-progress", "pipe:1"] +
+                        cmd[1:],
+                        stdout=PIPE,
+                        stderr=PIPE,
+                        universal_newlines=True)
+        err_tail: deque = deque(maxlen=40)
+        state = {'advanced': time.monotonic(), 'out_time': -1.0, 'killed': ''}
+        done = Event()
+
+        def _drain_stderr() -> None:
+            try:
+                for line in process.stderr:
+                    err_tail.append(line)
+            except Exception:
+                pass
+
+        def _watchdog() -> None:
+            started = time.monotonic()
+            while not done.wait(1.0):
+                now = time.monotonic()
+                if now - started > timeout:
+                    state['killed'] = f'timeout after {timeout}s'
+                elif now - state['advanced'] > self.stall_timeout:
+                    state['killed'] = f'stalled for {self.stall_timeout}s'
+                else:
+                    continue
+                try:
+                    process.kill()
+                except Exception:
+                    pass
+                return
+
+        Thread(target=_drain_stderr, daemon=True).start()
+        Thread(target=_watchdog, daemon=True).start()
+        block: List[str] = []
         try:
-            p = Popen([
-                "ffprobe", "-v", "error", "-show_entries", "format=duration",
-                "-of", "default=noprint_wrappers=1:nokey=1", target
-            ],
-                      stdout=PIPE,
-                      stderr=PIPE,
-                      universal_newlines=True)
-            sout, _ = p.communicate(timeout=10)
-            length_seconds = int(float((sout or '0').strip()) or 0)
+            for line in process.stdout:
+                line = line.strip()
+                block.append(line)
+                if not line.startswith('progress='):
+                    continue
+                data = parse_progress_block(block)
+                block = []
+                out_time = parse_out_time(data)
+                if out_time is not None and out_time > state['out_time']:
+                    state['out_time'] = out_time
+                    state['advanced'] = time.monotonic()
+                if report:
+                    self.progress.update(file_id,
+                                         out_time,
+                                         duration,
+                                         parse_speed(data.get('speed')),
+                                         force=(data.get('progress') == 'end'))
+            process.wait()
         except Exception:
-            pass
-        # 2) stream.duration
-        if not length_seconds:
             try:
-                p = Popen([
-                    "ffprobe", "-v", "error", "-select_streams", "v:0",
-                    "-show_entries", "stream=duration", "-of",
-                    "default=noprint_wrappers=1:nokey=1", target
-                ],
-                          stdout=PIPE,
-                          stderr=PIPE,
-                          universal_newlines=True)
-                sout, _ = p.communicate(timeout=10)
-                length_seconds = int(float((sout or '0').strip()) or 0)
+                process.kill()
             except Exception:
                 pass
-        # 3) nb_frames / r_frame_rate
-        if not length_seconds:
-            try:
-                p = Popen([
-                    "ffprobe", "-v", "error", "-select_streams", "v:0",
-                    "-count_frames", "-show_entries",
-                    "stream=nb_read_frames,nb_frames,r_frame_rate", "-of",
-                    "json", target
-                ],
-                          stdout=PIPE,
-                          stderr=PIPE,
-                          universal_newlines=True)
-                sout, _ = p.communicate(timeout=10)
-                data = json.loads(sout or '{}')
-                frames = 0
-                fps = 0.0
-                streams = data.get('streams') or []
-                if streams:
-                    st = streams[0]
-                    frames_str = st.get('nb_read_frames') or st.get(
-                        'nb_frames') or '0'
-                    try:
-                        frames = int(frames_str)
-                    except Exception:
-                        frames = int(float(frames_str) or 0)
-                    rate_str = st.get('r_frame_rate') or '0/1'
+            raise
+        finally:
+            done.set()
+        if state['killed']:
+            raise TimeoutError(state['killed'])
+        return process.returncode, ''.join(err_tail)
+
+    def _encode_chunked(self, src: str, dst: str, duration: float,
+                        file_id: Optional[int]) -> Tuple[int, str]:
+        """Full encode of a long source as segments encoded in parallel.
+
+		The video is split at keyframes by stream copy, segments are encoded
+		concurrently (``chunk_parallelism``) while the audio is transcoded
+		once in a single pass (no AAC priming gaps at segment joins), then
+		everything is joined with the concat demuxer without re-encoding.
+
+		Returns:
+			tuple: (returncode, last stderr lines) like ``_run_ffmpeg``.
+
+		Raises:
+			TimeoutError: If a step was killed by the watchdog.
+		"""
+        work = dst + '.chunks'
+        shutil.rmtree(work, ignore_errors=True)
+        os.makedirs(work)
+        whole_timeout = self._timeout_for(duration)
+        try:
+            returncode, err = self._run_ffmpeg([
+                "ffmpeg", "-hide_banner", "-y", "-i", src, "-map", "0:v:0",
+                "-c", "copy", "-f", "segment", "-segment_time",
+                str(self.chunk_seconds), "-reset_timestamps", "1",
+                path.join(work, 'src_%05d.mkv')
+            ],
+                                               src,
+                                               None,
+                                               timeout=whole_timeout)
+            if returncode != 0:
+                return returncode, err
+            parts = sorted(f for f in os.listdir(work) if f.startswith('src_'))
+            if not parts:
+                return 1, 'segmenting produced no output'
+            has_audio = bool(self.probe.probe(src).get('has_audio'))
+            threads = str(max(1, (os.cpu_count() or 1) //
+                              (self.chunk_parallelism * self.concurrent_jobs)))
+            started = time.monotonic()
+            state = {'done': 0.0}
+            state_lock = Lock()
+            failed = Event()
+
+            def _encode_part(index: int) -> Tuple[int, str]:
+                if failed.is_set():
+                    return 1, 'skipped after a failed segment'
+                part = path.join(work, parts[index])
+                try:
+                    result = self._run_ffmpeg(
+                        ["ffmpeg", "-hide_banner", "-y", "-i", part, "-an"] +
+                        self._encode_video_args() +
+                        ["-threads", threads,
+                         path.join(work, f'enc_{index:05d}.mp4')],
+                        part,
+                        None,
+                        timeout=self._timeout_for(self.chunk_seconds))
+                except Exception:
+                    failed.set()
+                    raise
+                if result[0] != 0:
+                    failed.set()
+                elif self.progress is not None and file_id is not None:
+                    with state_lock:
+                        state['done'] = min(duration,
+                                            state['done'] + self.chunk_seconds)
+                        done = state['done']
+                    elapsed = max(0.001, time.monotonic() - started)
                     try:
-                        num, den = rate_str.split('/')
-                        den_v = float(den) if float(den) != 0 else 1.0
-                        fps = float(num) / den_v
+                        self.progress.update(file_id,
+                                             done,
+                                             duration,
+                                             done / elapsed,
+                                             force=True)
                     except Exception:
-                        fps = 0.0
-                if frames > 0 and fps > 0:
-                    length_seconds = int(frames / fps)
-            except Exception:
-                pass
-        return length_seconds, size_mb
+                        pass
+                return result
+
+            audio_path = path.join(work, 'audio.m4a')
+            with ThreadPoolExecutor(
+                    max_workers=self.chunk_parallelism + 1) as pool:
+                audio_job = pool.submit(self._run_ffmpeg, [
+                    "ffmpeg", "-hide_banner", "-y", "-i", src, "-vn", "-c:a",
+                    "aac", "-b:a", "192k", audio_path
+                ], src, None, whole_timeout) if has_audio else None
+                results = list(pool.map(_encode_part, range(len(parts))))
+                if audio_job is not None:
+                    results.append(audio_job.result())
+            for returncode, err in results:
+                if returncode != 0:
+                    return returncode, err
+            listing = path.join(work, 'parts.txt')
+            with open(listing, 'w') as fh:
+                for index in range(len(parts)):
+                    fh.write(f"file 'enc_{index:05d}.mp4'\n")
+            cmd = [
+                "ffmpeg", "-hide_banner", "-y", "-f", "concat", "-safe", "0",
+                "-i", listing
+            ]
+            if has_audio:
+                cmd += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0"]
+            cmd += ["-c", "copy", "-movflags", "+faststart", dst]
+            return self._run_ffmpeg(cmd, src, None, timeout=whole_timeout)
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+
+    def _progress_finish(self,
+                         file_id: Optional[int],
+                         ok: bool,
+                         error: Optional[str] = None) -> None:
+        if self.progress is None or file_id is None:
+            return
+        try:
+            self.progress.finish(file_id, ok, error)
+        except Exception:
+            pass
 
     def stop(self) -> None:
         """Stop media service gracefully.
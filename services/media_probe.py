@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+from subprocess import DEVNULL, Popen, PIPE
+from threading import Timer
+from typing import Any, Dict, Optional, Tuple
+
+from modules.logging import get_logger
+
+_log = get_logger(__name__)
+
+
+class MediaProbe:
+    """Single-pass ffprobe with a Redis metadata cache.
+
+	One ``ffprobe -show_format -show_streams`` call replaces the former chain
+	of up to three probes (the last of which decoded every frame). Files
+	without a container duration (e.g. MediaRecorder .webm) are measured from
+	packet timestamps, which only demuxes. Results are cached in Redis under
+	``(path, size, mtime)``, so a changed file is probed again automatically.
+	"""
+
+    KEY_PREFIX = 'znf:probe:v2:'
+
+    def __init__(self,
+                 redis_client: Optional[Any] = None,
+                 ttl: int = 30 * 86400,
+                 timeout: int = 10,
+                 packet_timeout: int = 60) -> None:
+        """Initialize probe.
+
+		Args:
+			redis_client: Optional RedisClient used as the metadata cache.
+			ttl: Cache lifetime in seconds.
+			timeout: Timeout of the main ffprobe call in seconds.
+			packet_timeout: Timeout of the packet-timestamp fallback in seconds.
+		"""
+        self.redis = redis_client
+        self.ttl = max(60, int(ttl))
+        self.timeout = timeout
+        self.packet_timeout = packet_timeout
+
+    def _cache_key(self, target: str, st: os.stat_result) -> str:
+        raw = f"{os.path.abspath(target)}|{st.st_size}|{st.st_mtime_ns}"
+        return self.KEY_PREFIX + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.redis:
+            return None
+        try:
+            raw = self.redis.get(key)
+            return json.loads(raw) if raw else None
+        except Exception:
+            return None
+
+    def _cache_set(self, key: str, info: Dict[str, Any]) -> None:
+        if not self.redis:
+            return
+        try:
+            self.redis.set(key, json.dumps(info), ex=self.ttl)
+        except Exception:
+            pass
+
+    def probe(self, target: str, scan_packets: bool = True) -> Dict[str, Any]:
+        """Return media metadata of a file.
+
+		Args:
+			target: Media file path.
+			scan_packets: Measure files without a reported duration from packet
+				timestamps. Request handlers pass False: the scan can take up to
+				``packet_timeout`` and the conversion job probes the file again.
+
+		Returns:
+			dict: {'duration': float seconds (0 if unknown), 'size_bytes': int,
+			'size_mb': float, 'has_video': bool, 'has_audio': bool,
+			'format': str, 'bit_rate': int, 'video': {codec, profile, pix_fmt,
+			width, height, bit_rate} | None, 'audio': {codec, channels,
+			bit_rate} | None}; empty values if the file is missing or unreadable.
+		"""
+        try:
+            st = os.stat(target)
+        except OSError:
+            return self._empty(0)
+        key = self._cache_key(target, st)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        info = self._empty(st.st_size)
+        data = self._ffprobe_json(target)
+        fmt = data.get('format') or {}
+        streams = data.get('streams') or []
+        info['format'] = fmt.get('format_name') or ''
+        video = next((s for s in streams if s.get('codec_type') == 'video'),
+                     None)
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'),
+                     None)
+        info['has_video'] = video is not None
+        info['has_audio'] = audio is not None
+        info['bit_rate'] = int(self._float(fmt.get('bit_rate')))
+        if video is not None:
+            info['video'] = {
+                'codec': video.get('codec_name') or '',
+                'profile': video.get('profile') or '',
+                'pix_fmt': video.get('pix_fmt') or '',
+                'width': int(video.get('width') or 0),
+                'height': int(video.get('height') or 0),
+                'bit_rate': int(self._float(video.get('bit_rate'))),
+            }
+        if audio is not None:
+            info['audio'] = {
+                'codec': audio.get('codec_name') or '',
+                'channels': int(audio.get('channels') or 0),
+                'bit_rate': int(self._float(audio.get('bit_rate'))),
+            }
+        duration = self._float(fmt.get('duration'))
+        if not duration:
+            duration = max([self._float(s.get('duration'))
+                            for s in streams] or [0.0])
+        skipped = False
+        if not duration and streams:
+            if scan_packets:
+                duration = self._packet_duration(
+                    target, 'v:0' if info['has_video'] else 'a:0')
+            else:
+                skipped = True
+        info['duration'] = round(duration or 0.0, 3)
+        # A result without the packet scan is incomplete: leave it uncached
+        if data and not skipped:
+            self._cache_set(key, info)
+        return info
+
+    def length_and_size(self, target: str) -> Tuple[int, float]:
+        """Duration in whole seconds and size in MB (one decimal)."""
+        info = self.probe(target)
+        return int(info['duration'] or 0), float(info['size_mb'] or 0.0)
+
+    @staticmethod
+    def _empty(size_bytes: int) -> Dict[str, Any]:
+        return {
+            'duration': 0.0,
+            'size_bytes': int(size_bytes or 0),
+            'size_mb': round(size_bytes /
+                             (1024 * 1024), 1) if size_bytes else 0.0,
+            'has_video': False,
+            'has_audio': False,
+            'format': '',
+            'bit_rate': 0,
+            'video': None,
+            'audio': None,
+        }
+
+    @staticmethod
+    def _float(value: Any) -> float:
+        try:
+            result = float(value)
+        except (TypeError, ValueError):
+            return 0.0
+        return result if result > 0 else 0.0
+
+    def _ffprobe_json(self, target: str) -> Dict[str, Any]:
+        try:
+            p = Popen([
+                "ffprobe", "-v", "error", "-print_format", "json",
+                "-show_format", "-show_streams", target
+            ],
+                      stdout=PIPE,
+                      stderr=PIPE,
+                      universal_newlines=True)
+            sout, _ = p.communicate(timeout=self.timeout)
+            return json.loads(sout or '{}') or {}
+        except Exception as e:
+            _log.warning(f"ffprobe failed for {target}: {e}")
+            return {}
+
+    def _packet_duration(self, target: str, stream: str) -> float:
+        """End time of the last packet of ``stream`` (demux only, no decoding)."""
+        p = None
+        try:
+            p = Popen([
+                "ffprobe", "-v", "error", "-select_streams", stream,
+                "-show_entries", "packet=pts_time,duration_time", "-of",
+                "csv=p=0", target
+            ],
+                      stdout=PIPE,
+                      stderr=DEVNULL,
+                      universal_newlines=True)
+            # Guard the streaming read: kill ffprobe after packet_timeout
+            killer = Timer(self.packet_timeout, p.kill)
+            killer.daemon = True
+            killer.start()
+            end = 0.0
+            for line in p.stdout:
+                parts = line.strip().split(',')
+                pts = self._float(parts[0]) if parts else 0.0
+                dur = self._float(parts[1]) if len(parts) > 1 else 0.0
+                if pts + dur > end:
+                    end = pts + dur
+            p.wait()
+            killer.cancel()
+            return end
+        except Exception as e:
+            _log.warning(f"ffprobe packet scan failed for {target}: {e}")
+            if p is not None:
+                try:
+                    p.kill()
+                except Exception:
+                    pass
+            return 0.0
@@ -0,0 +1,135 @@
+"""
+Standalone consumer of the media job queue.
+
+With ``[videos] queue = redis`` the web workers only enqueue conversions;
+``media_worker.py`` runs a ``MediaWorker`` that reserves jobs from the
+``RedisJobQueue``, dispatches them to handlers by kind and acks or fails
+them (failed jobs are retried with backoff, then dead-lettered). Jobs are
+leased, so a crashed worker's jobs return to the queue after the
+visibility timeout.
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from modules.logging import get_logger
+
+_log = get_logger(__name__)
+
+
+def default_concurrency() -> int:
+    """One ffmpeg per core, leaving one core for the rest of the host."""
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+class MediaWorker:
+    """Consumer of a RedisJobQueue running jobs in a fixed number of threads.
+
+	Runs in its own process (``media_worker.py``), so encoding no longer
+	competes with the gunicorn web workers for CPU. Throughput scales by
+	raising ``concurrency`` or starting more worker processes.
+	"""
+
+    def __init__(self,
+                 queue: Any,
+                 handlers: Dict[str, Callable[[dict], None]],
+                 concurrency: int = 0,
+                 poll_interval: float = 1.0) -> None:
+        """Initialize worker.
+
+		Args:
+			queue: RedisJobQueue (reserve/ack/fail/touch).
+			handlers: Map of job kind to handler; a handler raises to request a retry.
+			concurrency: Number of consumer threads; 0 sizes it to the CPU count.
+			poll_interval: Seconds to sleep when the queue is empty.
+		"""
+        self.queue = queue
+        self.handlers = dict(handlers)
+        self.concurrency = int(concurrency or 0) or default_concurrency()
+        self.poll_interval = max(0.1, float(poll_interval))
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.processed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def _heartbeat(self, job: dict, done: threading.Event) -> None:
+        # Keep long conversions invisible to other consumers while they run
+        interval = max(1.0, self.queue.visibility_timeout / 3.0)
+        while not done.wait(interval):
+            try:
+                self.queue.touch(job)
+            except Exception as e:
+                _log.warning(f"Job heartbeat failed for {job.get('id')}: {e}")
+
+    def run_one(self) -> bool:
+        """Reserve and process a single job.
+
+		Returns:
+			bool: False if the queue was empty.
+		"""
+        job = self.queue.reserve()
+        if job is None:
+            return False
+        handler = self.handlers.get(job.get('kind'))
+        if handler is None:
+            self.queue.fail(job, f"no handler for job kind {job.get('kind')!r}")
+            return True
+        done = threading.Event()
+        beat = threading.Thread(target=self._heartbeat,
+                                args=(job, done),
+                                daemon=True)
+        beat.start()
+        try:
+            handler(job)
+        except Exception as e:
+            done.set()
+            with self._lock:
+                self.failed += 1
+            self.queue.fail(job, str(e))
+            return True
+        done.set()
+        self.queue.ack(job)
+        with self._lock:
+            self.processed += 1
+        return True
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if not self.run_one():
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                # Redis unavailable etc.: back off instead of spinning
+                _log.warning(f"Media worker loop error: {e}")
+                self._stop.wait(self.poll_interval * 5)
+
+    def start(self) -> None:
+        """Start consumer threads (idempotent)."""
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.concurrency):
+            t = threading.Thread(target=self._loop,
+                                 name=f'media-worker-{i}',
+                                 daemon=True)
+            self._threads.append(t)
+            t.start()
+        _log.info(f"Media worker started with concurrency={self.concurrency}")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop taking jobs and wait for running ones to finish.
+
+		Jobs still running after ``timeout`` are delivered again once their
+		visibility timeout expires.
+		"""
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def wait(self) -> None:
+        """Block until stop() is called."""
+        while not self._stop.wait(1.0):
+            pass
@@ -7,7 +7,7 @@ def dirs_by_permission(app, page_id: int, perm: str):
 
     # Build directories list according to permissions
     dirs = []
-    group_name = app._sql.group_name_by_id([current_user.gid])
+    group_name = None
     # Access to files page is determined by 'a' (view) or 'z' (admin) on this page
     can_view_any = current_user.is_allowed(
         page_id, 'a') or current_user.is_allowed(page_id, 'z')
@@ -25,48 +25,14 @@ def dirs_by_permission(app, page_id: int, perm: str):
         has_admin_any = False
         has_display_all = False
 
-    # Build fresh directory structure from database instead of using cached app.dirs
-    fresh_dirs = []
+    # Directory tree comes from the shared CategoryTree cache (one joined query,
+    # reloaded when categories routes bump the version); app.dirs is a fallback
     try:
-        categories = app._sql.category_all() or []
-        for cat in categories:
-            try:
-                # Skip disabled and system 'registrators'
-                if hasattr(cat, 'enabled') and int(cat.enabled) != 1:
-                    continue
-                if (getattr(cat, 'folder_name', '')
-                        or '').strip().lower() == 'registrators':
-                    continue
-                # Collect enabled subcategories
-                enabled_subs = []
-                subcategories = app._sql.subcategory_by_category([cat.id
-                                                                  ]) or []
-                for sub in subcategories:
-                    if hasattr(sub, 'enabled') and int(sub.enabled) == 1:
-                        enabled_subs.append(sub)
-                # Skip category without enabled subcategories
-                if not enabled_subs:
-                    continue
-                # Add category root
-                fresh_dirs.append({cat.folder_name: cat.display_name})
-                # Add enabled subcategories
-                for sub in enabled_subs:
-                    try:
-                        # Avoid key collision when sub folder equals category folder
-                        key = sub.folder_name
-                        cat_key = list(fresh_dirs[len(fresh_dirs) -
-                                                  1].keys())[0]
-                        if str(key) == str(cat_key):
-                            # Suffix with stable marker and id
-                            key = f"{sub.folder_name}__dup_{sub.id}"
-                        fresh_dirs[len(fresh_dirs) - 1].update(
-                            {key: sub.display_name})
-                    except Exception:
-                        # Fallback without normalization
-                        fresh_dirs[len(fresh_dirs) - 1].update(
-                            {sub.folder_name: sub.display_name})
-            except Exception:
-                continue
+        tree = getattr(app, 'category_tree', None)
+        if tree is not None:
+            fresh_dirs = tree.dirs()
+        else:
+            fresh_dirs = [dict(e) for e in (getattr(app, 'dirs', None) or [])]
     except Exception as e:
         try:
             app.logger.warning("Could not load categories from database: %s",
@@ -104,6 +70,8 @@ def dirs_by_permission(app, page_id: int, perm: str):
                 dirs.append(entry)
         else:
             # Regular users: filter by group permissions
+            if group_name is None:
+                group_name = app._sql.group_name_by_id([current_user.gid])
             filtered = {root_key: entry[root_key]}
             for k, v in entry.items():
                 if group_name in v:
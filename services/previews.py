@@ -0,0 +1,195 @@
+import math
+import os
+import shutil
+import time
+from subprocess import DEVNULL, PIPE, Popen, TimeoutExpired
+from typing import Any, Dict, List, Optional
+
+from modules.logging import get_logger
+
+_log = get_logger(__name__)
+
+POSTER = 'poster.jpg'
+SPRITE = 'sprite.jpg'
+THUMBS_VTT = 'thumbs.vtt'
+PREVIEW_NAMES = (POSTER, SPRITE, THUMBS_VTT)
+PREVIEW_MIMETYPES = {
+    POSTER: 'image/jpeg',
+    SPRITE: 'image/jpeg',
+    THUMBS_VTT: 'text/vtt',
+}
+
+
+def preview_dir(media_path: str) -> str:
+    """Preview output directory stored next to a media file: ``<base>.preview``."""
+    return os.path.splitext(media_path)[0] + '.preview'
+
+
+def vtt_timestamp(seconds: float) -> str:
+    """``75.5`` -> ``'00:01:15.500'``."""
+    ms = int(round(max(0.0, seconds) * 1000))
+    h, rest = divmod(ms, 3600 * 1000)
+    m, rest = divmod(rest, 60 * 1000)
+    s, ms = divmod(rest, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+
+class PreviewGenerator:
+    """Poster frame and scrub sprite (with WebVTT thumbnails) for converted videos.
+
+	Outputs ``<base>.preview/{poster.jpg,sprite.jpg,thumbs.vtt}``. The sprite
+	is decoded from keyframes only (``-skip_frame nokey``), so it costs a
+	fraction of a full decode. ``generate`` returns a new version number that
+	callers store and put into preview URLs, which lets them be cached as
+	immutable.
+	"""
+
+    def __init__(self,
+                 poster_width: int = 480,
+                 tile_width: int = 160,
+                 columns: int = 10,
+                 max_tiles: int = 100,
+                 min_interval: float = 2.0,
+                 timeout: int = 300) -> None:
+        """Initialize generator.
+
+		Args:
+			poster_width: Poster width in pixels.
+			tile_width: Width of one sprite thumbnail in pixels.
+			columns: Thumbnails per sprite row.
+			max_tiles: Upper bound of thumbnails per video.
+			min_interval: Smallest distance between thumbnails in seconds.
+			timeout: Limit for one ffmpeg run in seconds.
+		"""
+        self.poster_width = max(16, int(poster_width))
+        self.tile_width = max(16, int(tile_width))
+        self.columns = max(1, int(columns))
+        self.max_tiles = max(1, int(max_tiles))
+        self.min_interval = max(0.5, float(min_interval))
+        self.timeout = max(1, int(timeout))
+
+    def layout(self, info: Dict[str, Any]) -> Dict[str, Any]:
+        """Sprite geometry for a probed video: interval, tiles, grid and tile size."""
+        video = info.get('video') or {}
+        width = int(video.get('width') or 0)
+        height = int(video.get('height') or 0)
+        duration = float(info.get('duration') or 0)
+        interval = max(self.min_interval, duration / self.max_tiles)
+        tiles = max(1, min(self.max_tiles, int(math.ceil(duration / interval))))
+        tile_height = int(round(self.tile_width * height / width / 2.0)) * 2 \
+            if width and height else int(self.tile_width * 9 / 16)
+        return {
+            'interval': interval,
+            'tiles': tiles,
+            'columns': min(self.columns, tiles),
+            'rows': int(math.ceil(tiles / float(self.columns))),
+            'tile_width': self.tile_width,
+            'tile_height': tile_height,
+        }
+
+    def commands(self, src: str, info: Dict[str, Any],
+                 out_dir: str) -> List[List[str]]:
+        """ffmpeg command lines for the poster and the sprite."""
+        duration = float(info.get('duration') or 0)
+        lay = self.layout(info)
+        # Skip black intro frames but stay inside short clips
+        seek = min(5.0, duration * 0.1)
+        poster = [
+            "ffmpeg", "-hide_banner", "-y", "-ss", f"{seek:.3f}", "-i", src,
+            "-frames:v", "1", "-vf", f"scale={self.poster_width}:-2", "-q:v",
+            "4",
+            os.path.join(out_dir, POSTER)
+        ]
+        sprite = [
+            "ffmpeg", "-hide_banner", "-y", "-skip_frame", "nokey", "-i", src,
+            "-an", "-vf",
+            (f"fps=1/{lay['interval']:.3f},"
+             f"scale={lay['tile_width']}:{lay['tile_height']},"
+             f"tile={lay['columns']}x{lay['rows']}"), "-frames:v", "1",
+            "-q:v", "5",
+            os.path.join(out_dir, SPRITE)
+        ]
+        return [poster, sprite]
+
+    def thumbs_vtt(self, info: Dict[str, Any]) -> str:
+        """WebVTT cues mapping time ranges to ``sprite.jpg#xywh=`` tiles."""
+        duration = float(info.get('duration') or 0)
+        lay = self.layout(info)
+        w, h = lay['tile_width'], lay['tile_height']
+        lines = ['WEBVTT', '']
+        for i in range(lay['tiles']):
+            start = i * lay['interval']
+            if duration and start >= duration:
+                break
+            end = min((i + 1) * lay['interval'], duration) if duration \
+                else (i + 1) * lay['interval']
+            x = (i % lay['columns']) * w
+            y = (i // lay['columns']) * h
+            lines.append(f"{vtt_timestamp(start)} --> {vtt_timestamp(end)}")
+            lines.append(f"{SPRITE}#xywh={x},{y},{w},{h}")
+            lines.append('')
+        return '\n'.join(lines)
+
+    def _run(self, cmd: List[str]) -> None:
+        p = Popen(cmd, stdout=DEVNULL, stderr=PIPE, universal_newlines=True)
+        try:
+            _, err = p.communicate(timeout=self.timeout)
+        except TimeoutExpired:
+            p.kill()
+            p.communicate()
+            raise TimeoutError(f"ffmpeg preview run exceeded {self.timeout}s")
+        if p.returncode != 0:
+            raise RuntimeError(
+                f"ffmpeg preview exit code {p.returncode}: {(err or '')[-500:]}")
+
+    def generate(self, src: str, info: Dict[str, Any]) -> Optional[int]:
+        """Write poster, sprite and thumbnails of ``src`` into ``preview_dir(src)``.
+
+		Args:
+			src: Converted video file.
+			info: MediaProbe metadata of ``src``.
+
+		Returns:
+			Optional[int]: New preview version, or None if nothing was written.
+		"""
+        if not info.get('has_video') or not float(info.get('duration') or 0):
+            return None
+        target = preview_dir(src)
+        tmp = target + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        try:
+            os.makedirs(tmp, exist_ok=True)
+            for cmd in self.commands(src, info, tmp):
+                self._run(cmd)
+            with open(os.path.join(tmp, THUMBS_VTT), 'w') as fh:
+                fh.write(self.thumbs_vtt(info))
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(tmp, target)
+            return int(time.time())
+        except Exception as e:
+            _log.error(f"Preview generation failed for {src}: {e}")
+            shutil.rmtree(tmp, ignore_errors=True)
+            return None
+
+
+def remove_previews(media_path: str) -> None:
+    """Delete the previews of a media file, if any."""
+    shutil.rmtree(preview_dir(media_path), ignore_errors=True)
+
+
+def move_previews(old_media_path: str, new_media_path: str) -> None:
+    """Move the previews along with their media file."""
+    old, new = preview_dir(old_media_path), preview_dir(new_media_path)
+    if os.path.isdir(old) and old != new:
+        shutil.rmtree(new, ignore_errors=True)
+        shutil.move(old, new)
+
+
+def preview_generator_from_config(config: Any) -> Optional[PreviewGenerator]:
+    """Build the generator from ``[videos] previews*`` settings; None when disabled."""
+    if not config.getboolean('videos', 'previews', fallback=True):
+        return None
+    return PreviewGenerator(
+        tile_width=config.getint('videos', 'preview_tile_width', fallback=160),
+        max_tiles=config.getint('videos', 'preview_max_tiles', fallback=100),
+        timeout=config.getint('videos', 'convert_timeout', fallback=300))
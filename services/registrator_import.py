@@ -0,0 +1,367 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+
+from modules.logging import get_logger
+from modules.sync_manager import emit_files_changed
+from modules.upload_jobs import UploadCancelled
+
+_log = get_logger(__name__)
+
+AUDIO_EXTENSIONS = ('.aac', '.m4a', '.mp3', '.wav', '.flac', '.oga', '.ogg',
+                    '.wma', '.opus', '.mka')
+# Worth another attempt: timeouts, throttling and gateway errors
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+class RegistratorImportError(Exception):
+    """A registrator file could not be downloaded or registered."""
+
+
+class _TransientImportError(RegistratorImportError):
+    """Retryable failure (dropped connection, 5xx)."""
+
+
+def _parse_content_range(value: Optional[str]) -> Tuple[int, int]:
+    """``'bytes 100-199/1000'`` -> ``(100, 1000)``; total is 0 when unknown."""
+    match = re.match(r'\s*bytes\s+(\d+)-\d+/(\d+|\*)', value or '')
+    if not match:
+        return -1, 0
+    total = match.group(2)
+    return int(match.group(1)), int(total) if total != '*' else 0
+
+
+class RegistratorImporter:
+    """Streams registrator media straight into file storage and registers it.
+
+	The download is written chunk by chunk into a temp file inside the target
+	storage directory while size and SHA-256 are computed on the fly, then
+	renamed into place. Interrupted transfers continue with ``Range``
+	requests (guarded by ``If-Range``) under a bounded retry policy; the
+	resume record can be persisted through ``on_state`` to survive a
+	restart. The file is registered and queued for conversion in-process
+	(no HTTP loopback), so memory per import stays constant.
+	"""
+
+    def __init__(self,
+                 sql_utils: Any,
+                 media_service: Any,
+                 socketio: Optional[Any] = None,
+                 chunk_size: int = 1024 * 1024,
+                 connect_timeout: float = 10,
+                 read_timeout: float = 60,
+                 max_retries: int = 5,
+                 retry_backoff: float = 2.0,
+                 checkpoint_seconds: float = 5.0) -> None:
+        """Initialize importer.
+
+		Args:
+			sql_utils: Data access layer (get_file_storage_path, file_add2, ...).
+			media_service: MediaService used for probing and conversion.
+			socketio: Optional Socket.IO server for 'files:changed' events.
+			chunk_size: Download chunk size in bytes.
+			connect_timeout: Connect timeout in seconds.
+			read_timeout: Timeout between two received chunks in seconds.
+			max_retries: Resume attempts per file before giving up.
+			retry_backoff: First retry delay in seconds, doubled per attempt
+				(capped at 30s).
+			checkpoint_seconds: Interval of ``on_state`` progress snapshots.
+		"""
+        self._sql = sql_utils
+        self.media_service = media_service
+        self.socketio = socketio
+        self.chunk_size = max(64 * 1024, int(chunk_size))
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max(0, int(max_retries))
+        self.retry_backoff = max(0.0, float(retry_backoff))
+        self.checkpoint_seconds = max(0.0, float(checkpoint_seconds))
+        self._local = threading.local()
+
+    def _get_session(self) -> requests.Session:
+        """Per-thread keep-alive session (imports run in parallel threads)."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({
+                'User-Agent': 'ZNF-Importer',
+                'Accept': '*/*',
+                # Compressed transfer would hide the real size from progress
+                # and makes byte ranges meaningless
+                'Accept-Encoding': 'identity',
+            })
+            self._local.session = session
+        return session
+
+    @staticmethod
+    def _hash_prefix(path: str, length: int) -> 'hashlib._Hash':
+        """SHA-256 of the first ``length`` bytes already on disk."""
+        digest = hashlib.sha256()
+        remaining = length
+        with open(path, 'rb') as fh:
+            while remaining > 0:
+                block = fh.read(min(remaining, 4 * 1024 * 1024))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+        return digest
+
+    def _checkpoint(self,
+                    state: Dict[str, Any],
+                    on_state: Optional[Callable[[Dict[str, Any]], None]],
+                    force: bool = False) -> None:
+        if on_state is None:
+            return
+        now = time.monotonic()
+        if not force and now - state.get('_saved', 0) < self.checkpoint_seconds:
+            return
+        state['_saved'] = now
+        try:
+            on_state({k: v for k, v in state.items() if not k.startswith('_')})
+        except UploadCancelled:
+            raise
+        except Exception as e:
+            _log.warning(f"Import checkpoint failed: {e}")
+
+    def _fetch(self, url: str, state: Dict[str, Any], ctx: Dict[str, Any],
+               verify: bool,
+               on_progress: Optional[Callable[[int, int], None]],
+               on_state: Optional[Callable[[Dict[str, Any]], None]]) -> None:
+        """One HTTP attempt: continue ``state['part']`` from ``state['offset']``."""
+        offset = int(state.get('offset') or 0)
+        headers = {}
+        if offset:
+            headers['Range'] = f"bytes={offset}-"
+            # Server answers 200 with the whole body if the file has changed
+            validator = state.get('etag') or state.get('last_modified')
+            if validator:
+                headers['If-Range'] = validator
+        with self._get_session().get(url,
+                                     stream=True,
+                                     timeout=self.timeout,
+                                     verify=verify,
+                                     headers=headers) as resp:
+            status = resp.status_code
+            if offset and status == 416 and offset == state.get('total'):
+                return
+            if offset and status == 206:
+                start, total = _parse_content_range(
+                    resp.headers.get('content-range'))
+                if start != offset:
+                    raise RegistratorImportError(
+                        f"unexpected Content-Range for {url}: "
+                        f"{resp.headers.get('content-range')}")
+                total = total or state.get('total') or 0
+            elif status == 200:
+                if offset:
+                    _log.warning(
+                        f"Server ignored range for {url}, restarting at 0")
+                offset = 0
+                ctx['digest'] = hashlib.sha256()
+                total = int(resp.headers.get('content-length') or 0)
+                state['etag'] = resp.headers.get('etag')
+                state['last_modified'] = resp.headers.get('last-modified')
+            elif status in RETRY_STATUSES:
+                raise _TransientImportError(f"HTTP {status} for {url}")
+            else:
+                raise RegistratorImportError(f"HTTP {status} for {url}")
+            state['offset'] = offset
+            state['total'] = total
+            digest = ctx['digest']
+            with open(state['part'], 'r+b') as out:
+                out.seek(offset)
+                out.truncate()
+                for chunk in resp.iter_content(chunk_size=self.chunk_size):
+                    if not chunk:
+                        continue
+                    out.write(chunk)
+                    digest.update(chunk)
+                    offset += len(chunk)
+                    state['offset'] = offset
+                    if on_progress is not None:
+                        on_progress(offset, total)
+                    if on_state is not None and time.monotonic() - state.get(
+                            '_saved', 0) >= self.checkpoint_seconds:
+                        # Only checkpoint bytes that have reached the file
+                        out.flush()
+                        self._checkpoint(state, on_state)
+        if total and offset < total:
+            raise _TransientImportError(
+                f"connection dropped at {offset}/{total} bytes of {url}")
+
+    def download(self,
+                 url: str,
+                 dest_path: str,
+                 verify: bool = True,
+                 on_progress: Optional[Callable[[int, int], None]] = None,
+                 state: Optional[Dict[str, Any]] = None,
+                 on_state: Optional[Callable[[Dict[str, Any]], None]] = None
+                 ) -> Dict[str, Any]:
+        """Stream ``url`` into ``dest_path``, resuming with ``Range`` after errors.
+
+		Args:
+			url: Source URL.
+			dest_path: Final path; a temp file in the same directory is renamed
+				onto it only after a complete download.
+			verify: Verify the TLS certificate of the source.
+			on_progress: Optional callback(downloaded_bytes, total_bytes or 0).
+			state: Resume record ('part', 'offset', 'etag', 'last_modified',
+				'total'), updated in place. Pass a saved record to continue an
+				interrupted download.
+			on_state: Optional callback receiving a copy of ``state`` every
+				``checkpoint_seconds`` and before each retry, for persistence.
+				Raising UploadCancelled from it aborts the download.
+
+		Returns:
+			dict: {'path', 'size_bytes', 'sha256', 'seconds'}
+
+		Raises:
+			RegistratorImportError: On HTTP errors, a changed source or when the
+				download is still incomplete after ``max_retries`` retries.
+		"""
+        directory = os.path.dirname(dest_path)
+        os.makedirs(directory, exist_ok=True)
+        started = time.monotonic()
+        state = state if state is not None else {}
+        part = state.get('part')
+        if part and os.path.dirname(part) == directory and os.path.isfile(part):
+            # Trust only what is both on disk and recorded
+            offset = min(int(state.get('offset') or 0), os.path.getsize(part))
+            _log.info(f"Resuming {url} at {offset} bytes")
+        else:
+            fd, part = tempfile.mkstemp(prefix='.import-',
+                                        suffix='.part',
+                                        dir=directory)
+            os.close(fd)
+            offset = 0
+            state.update(etag=None, last_modified=None, total=0)
+        state.update(part=part, offset=offset)
+        ctx = {'digest': self._hash_prefix(part, offset)}
+        attempt = 0
+        try:
+            self._checkpoint(state, on_state, force=True)
+            while True:
+                try:
+                    self._fetch(url, state, ctx, verify, on_progress, on_state)
+                    break
+                except (requests.RequestException, _TransientImportError) as e:
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        raise RegistratorImportError(
+                            f"giving up on {url} after {attempt} attempts: {e}"
+                        ) from e
+                    delay = min(30.0, self.retry_backoff * 2**(attempt - 1))
+                    _log.warning(f"Download of {url} interrupted at "
+                                 f"{state['offset']} bytes ({e}); "
+                                 f"retry {attempt}/{self.max_retries} in "
+                                 f"{delay:.0f}s")
+                    self._checkpoint(state, on_state, force=True)
+                    time.sleep(delay)
+            size = os.path.getsize(part)
+            total = int(state.get('total') or 0)
+            if size != state['offset'] or (total and size != total):
+                raise RegistratorImportError(
+                    f"size mismatch for {url}: {size}/{total} bytes")
+            os.replace(part, dest_path)
+        except Exception:
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+            raise
+        return {
+            'path': dest_path,
+            'size_bytes': size,
+            'sha256': ctx['digest'].hexdigest(),
+            'seconds': time.monotonic() - started,
+        }
+
+    def import_file(self,
+                    url: str,
+                    display_name: str,
+                    cat_id: int,
+                    sub_id: int,
+                    owner: str,
+                    description: str,
+                    verify: bool = True,
+                    on_progress: Optional[Callable[[int, int], None]] = None,
+                    priority: int = -1,
+                    state: Optional[Dict[str, Any]] = None,
+                    on_state: Optional[Callable[[Dict[str, Any]], None]] = None
+                    ) -> Dict[str, Any]:
+        """Download one registrator file, create its DB record and queue conversion.
+
+		``state``/``on_state`` are passed to ``download`` to resume a partial
+		transfer.
+
+		Returns:
+			dict: download info (see ``download``) plus 'id' of the new file.
+		"""
+        storage_dir = self._sql.get_file_storage_path(cat_id, sub_id)
+        seed = f"{cat_id}:{sub_id}:{url}:{time.time()}"
+        real_base = hashlib.md5(seed.encode('utf-8')).hexdigest()
+        base_path = os.path.join(storage_dir, real_base)
+        target_ext = '.m4a' if (display_name or '').lower().endswith(
+            AUDIO_EXTENSIONS) else '.mp4'
+        # Original keeps a .webm name until converted (ffmpeg detects the container)
+        info = self.download(url,
+                             base_path + '.webm',
+                             verify=verify,
+                             on_progress=on_progress,
+                             state=state,
+                             on_state=on_state)
+        size_mb = round(info['size_bytes'] / (1024 * 1024), 1)
+        try:
+            length_seconds = int(
+                self.media_service.probe.probe(base_path + '.webm')['duration'])
+        except Exception:
+            length_seconds = 0
+        file_id = self._sql.file_add2([
+            display_name, real_base + target_ext, cat_id, sub_id, owner,
+            description,
+            datetime.now().strftime('%Y-%m-%d %H:%M'), 0, length_seconds,
+            size_mb, None
+        ])
+        if self.socketio:
+            try:
+                emit_files_changed(self.socketio,
+                                   'added',
+                                   id=file_id,
+                                   meta={
+                                       'length': length_seconds,
+                                       'size': size_mb
+                                   })
+            except Exception:
+                pass
+        # Bulk imports yield to interactive uploads
+        self.media_service.convert_async(base_path + '.webm',
+                                         base_path + target_ext,
+                                         ('file', file_id),
+                                         priority=priority)
+        speed = info['size_bytes'] / 1048576.0 / max(info['seconds'], 0.001)
+        _log.info(f"Imported {display_name} as id={file_id}: "
+                  f"{info['size_bytes']} bytes, sha256={info['sha256']}, "
+                  f"{speed:.1f} MB/s")
+        return dict(info, id=file_id)
+
+    def discard(self, file_id: int, media_path: str) -> None:
+        """Unregister an imported file and delete its media (original and converted)."""
+        self._sql.file_delete([int(file_id)])
+        base = os.path.splitext(media_path)[0]
+        for ext in ('.webm', '.mp4', '.m4a'):
+            try:
+                os.remove(base + ext)
+            except OSError:
+                pass
+        if self.socketio:
+            try:
+                emit_files_changed(self.socketio, 'deleted', id=int(file_id))
+            except Exception:
+                pass
@@ -26,6 +26,12 @@ function stopAllMedia() {
         element.srcObject = null;
       }
 
+      // Stop hls.js segment loading (see pages/files.js)
+      if (element.__hls) {
+        element.__hls.destroy();
+        element.__hls = null;
+      }
+
       element.muted = true;
       element.volume = 0;
       element.onerror = null;
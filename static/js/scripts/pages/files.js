@@ -56,7 +56,10 @@ function handleDoubleClick(event) {
       const isMediaFile = isMediaFileUrl(url) || isMediaFileRow(this);
 
       if (isMediaFile) {
-        openMediaFile(url);
+        openMediaFile(url, this.getAttribute("data-hls"), {
+          poster: this.getAttribute("data-poster"),
+          thumbs: this.getAttribute("data-thumbs"),
+        });
       } else {
         // For non-media files, open in new tab
         window.open(url, "_blank");
@@ -118,8 +121,9 @@ function isMediaFileRow(row) {
   return false;
 }
 
-// Open media file in modal player
-function openMediaFile(url) {
+// Open media file in modal player (hlsUrl: optional HLS master playlist,
+// previews: optional {poster, thumbs} URLs from the row)
+function openMediaFile(url, hlsUrl, previews) {
   try {
     // Stop any existing media
     if (window.stopAllMedia) {
@@ -140,7 +144,7 @@ function openMediaFile(url) {
     if (isAudio) {
       openAudioFile(url);
     } else {
-      openVideoFile(url);
+      openVideoFile(url, hlsUrl, previews);
     }
   } catch (err) {
     window.ErrorHandler.handleError(err, "openMediaFile");
@@ -201,8 +205,107 @@ function openAudioFile(url) {
   }
 }
 
+// Attach an HLS playlist to the player: native HLS (Safari/iOS) or hls.js
+// when it is loaded. Returns false if HLS can't be played here.
+function attachHlsSource(player, hlsUrl) {
+  if (!hlsUrl) return false;
+  if (player.canPlayType("application/vnd.apple.mpegurl")) {
+    player.src = hlsUrl;
+    return true;
+  }
+  if (window.Hls && window.Hls.isSupported()) {
+    const hls = new window.Hls();
+    hls.on(window.Hls.Events.ERROR, function (_event, data) {
+      // hls.js reports failures here instead of the media element
+      if (data && data.fatal && player.onerror) player.onerror();
+    });
+    hls.loadSource(hlsUrl);
+    hls.attachMedia(player);
+    player.__hls = hls;
+    return true;
+  }
+  return false;
+}
+
+function detachHlsSource(player) {
+  if (player && player.__hls) {
+    try {
+      player.__hls.destroy();
+    } catch (_) {}
+    player.__hls = null;
+  }
+}
+
+// Parse "HH:MM:SS.mmm" (or "MM:SS.mmm") into seconds
+function parseVttTime(value) {
+  const parts = String(value || "").trim().split(":").map(parseFloat);
+  return parts.reduce((acc, part) => acc * 60 + (part || 0), 0);
+}
+
+// Parse the thumbs.vtt of a sprite into [{start, end, url, x, y, w, h}]
+function parseThumbsVtt(text, baseUrl) {
+  const cues = [];
+  const blocks = String(text || "").split(/\r?\n\r?\n/);
+  blocks.forEach((block) => {
+    const lines = block.trim().split(/\r?\n/);
+    const timing = lines.findIndex((line) => line.includes("-->"));
+    if (timing < 0 || !lines[timing + 1]) return;
+    const [start, end] = lines[timing].split("-->");
+    const match = lines[timing + 1].match(/^(.*)#xywh=(\d+),(\d+),(\d+),(\d+)$/);
+    if (!match) return;
+    cues.push({
+      start: parseVttTime(start),
+      end: parseVttTime(end),
+      url: new URL(match[1], new URL(baseUrl, window.location.href)).href,
+      x: +match[2],
+      y: +match[3],
+      w: +match[4],
+      h: +match[5],
+    });
+  });
+  return cues;
+}
+
+// Show sprite thumbnails while hovering the player's control bar
+function setupScrubPreview(player, thumbsUrl) {
+  const scrub = document.getElementById("player-scrub");
+  player.onmousemove = null;
+  player.onmouseleave = null;
+  if (!scrub) return;
+  scrub.style.display = "none";
+  if (!thumbsUrl) return;
+  fetch(thumbsUrl, { credentials: "same-origin" })
+    .then((resp) => (resp.ok ? resp.text() : ""))
+    .then((text) => {
+      const cues = parseThumbsVtt(text, thumbsUrl);
+      if (!cues.length) return;
+      player.onmousemove = function (event) {
+        const rect = player.getBoundingClientRect();
+        // Only over the bottom control bar, where the timeline is
+        if (!player.duration || rect.bottom - event.clientY > 40) {
+          scrub.style.display = "none";
+          return;
+        }
+        const ratio = Math.min(1, Math.max(0, (event.clientX - rect.left) / rect.width));
+        const t = ratio * player.duration;
+        const cue = cues.find((c) => t >= c.start && t < c.end) || cues[cues.length - 1];
+        scrub.style.width = cue.w + "px";
+        scrub.style.height = cue.h + "px";
+        scrub.style.backgroundImage = "url(" + JSON.stringify(cue.url) + ")";
+        scrub.style.backgroundPosition = -cue.x + "px " + -cue.y + "px";
+        const offset = player.offsetLeft + ratio * rect.width - cue.w / 2;
+        scrub.style.left = Math.max(0, Math.min(offset, player.offsetLeft + rect.width - cue.w)) + "px";
+        scrub.style.display = "block";
+      };
+      player.onmouseleave = function () {
+        scrub.style.display = "none";
+      };
+    })
+    .catch(() => {});
+}
+
 // Open video file in modal
-function openVideoFile(url) {
+function openVideoFile(url, hlsUrl, previews) {
   try {
     const player = document.getElementById("player-video");
     if (!player) return;
@@ -219,15 +322,28 @@ function openVideoFile(url) {
       }
     }
 
-    // Configure video player
+    // Configure video player: segmented HLS when available, else progressive MP4
     player.muted = false;
     player.volume = 1;
-    player.src = url;
+    detachHlsSource(player);
+    if (previews && previews.poster) player.poster = previews.poster;
+    else player.removeAttribute("poster");
+    setupScrubPreview(player, previews && previews.thumbs);
+    const usingHls = attachHlsSource(player, hlsUrl);
+    if (!usingHls) player.src = url;
     player.currentTime = 0;
 
     // Set up event handlers
     player.onerror = function onVideoErr() {
       try {
+        if (usingHls && player.__hlsFallback !== url) {
+          // File not packaged (yet): fall back to the MP4
+          player.__hlsFallback = url;
+          detachHlsSource(player);
+          player.src = url;
+          return;
+        }
+        player.__hlsFallback = null;
         player.onerror = null;
         if (window.popupClose) {
           window.popupClose("popup-view");
@@ -240,6 +356,7 @@ function openVideoFile(url) {
 
     player.onloadeddata = function () {
       try {
+        player.__hlsFallback = null;
         window.__mediaOpenState.opening = false;
       } catch (err) {
         window.ErrorHandler.handleError(err, "openVideoFile");
@@ -599,12 +716,72 @@ function setupFilesSocketHandlers() {
       }
     });
 
+    // Conversion progress of rows still being processed (per-file rooms)
+    socket.on("files:progress", function (data) {
+      try {
+        renderFileProgress(data);
+      } catch (err) {
+        console.error("Error handling files:progress:", err);
+      }
+    });
+    watchProcessingFiles(socket);
+
     console.log("Files socket handlers setup complete");
   } catch (err) {
     console.error("Error setting up files socket handlers:", err);
   }
 }
 
+function formatEta(seconds) {
+  const total = Math.max(0, Math.round(seconds));
+  const m = Math.floor(total / 60);
+  const s = total % 60;
+  return m > 0 ? `${m} мин ${s} с` : `${s} с`;
+}
+
+function renderFileProgress(data) {
+  if (!data || !data.id) return;
+  const el = document.querySelector(
+    `.files-progress[data-progress-id="${data.id}"]`
+  );
+  if (!el) return;
+  if (data.state === "queued") {
+    el.textContent = "в очереди";
+  } else if (data.state === "running") {
+    const parts = [];
+    if (data.percent !== null && data.percent !== undefined) {
+      parts.push(`${data.percent}%`);
+    }
+    if (data.speed) parts.push(`${data.speed}x`);
+    if (data.eta !== null && data.eta !== undefined) {
+      parts.push(`осталось ${formatEta(data.eta)}`);
+    }
+    el.textContent = parts.join(", ");
+  } else if (data.state === "failed") {
+    el.textContent = "ошибка конвертации";
+  } else if (data.state === "done") {
+    el.textContent = "100%";
+  }
+}
+
+// Join per-file progress rooms and load the current status once
+function watchProcessingFiles(socket) {
+  const ids = Array.from(
+    document.querySelectorAll(".files-progress[data-progress-id]")
+  ).map((el) => parseInt(el.getAttribute("data-progress-id"), 10));
+  if (!ids.length) return;
+  socket.emit("files:watch", { ids: ids });
+  ids.forEach((id) => {
+    fetch(`/files/progress/${id}`, {
+      headers: { Accept: "application/json" },
+      credentials: "same-origin",
+    })
+      .then((r) => (r.ok ? r.json() : null))
+      .then((resp) => resp && renderFileProgress(resp.progress))
+      .catch(() => {});
+  });
+}
+
 // Initialize socket handlers when DOM is ready
 document.addEventListener("DOMContentLoaded", function () {
   try {
@@ -274,9 +274,9 @@ function importSelected() {
         return r.json();
       })
       .then(function (data) {
-        if (data && data.success) {
+        if (data && (data.success || data.status === "success")) {
           if (window.showToast) {
-            window.showToast("Файлы импортированы", "success");
+            window.showToast("Импорт запущен в фоне", "success");
           }
           if (window.refreshLevels) {
             window.refreshLevels();
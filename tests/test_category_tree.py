@@ -0,0 +1,93 @@
+import types
+
+from modules.category_tree import CategoryTree
+
+
+def _cat(id, folder, enabled=1):
+    return types.SimpleNamespace(id=id,
+                                 folder_name=folder,
+                                 display_name=folder.upper(),
+                                 enabled=enabled)
+
+
+def _sub(id, cat_id, folder, enabled=1):
+    return types.SimpleNamespace(id=id,
+                                 category_id=cat_id,
+                                 folder_name=folder,
+                                 display_name=folder.upper(),
+                                 enabled=enabled)
+
+
+class _Sql:
+
+    def __init__(self):
+        self.loads = 0
+
+    def category_tree_rows(self):
+        self.loads += 1
+        return ([
+            _cat(1, 'video'),
+            _cat(2, 'registrators'),
+            _cat(3, 'off', enabled=0),
+            _cat(4, 'empty')
+        ], [
+            _sub(10, 1, 'a'),
+            _sub(11, 1, 'video'),
+            _sub(12, 1, 'hidden', enabled=0),
+            _sub(20, 2, 'r1'),
+            _sub(30, 3, 'x'),
+        ])
+
+
+class _Redis:
+
+    def __init__(self):
+        self.store = {}
+        self.client = self
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def incr(self, key):
+        self.store[key] = int(self.store.get(key) or 0) + 1
+        return self.store[key]
+
+
+def test_dirs_filters_and_dedups_keys():
+    tree = CategoryTree(_Sql())
+    assert tree.dirs() == [{'video': 'VIDEO', 'a': 'A', 'video__dup_11': 'VIDEO'}]
+    assert tree.category_id_by_folder('video') == 1
+    assert tree.subcategory_id_by_folder(1, 'a') == 10
+    assert tree.subcategory_id_by_folder(1, 'nope') is None
+
+
+def test_version_bump_reloads_other_workers():
+    sql, redis = _Sql(), _Redis()
+    worker1 = CategoryTree(sql, redis, check_interval=0)
+    worker2 = CategoryTree(sql, redis, check_interval=0)
+    worker1.dirs()
+    worker2.dirs()
+    worker2.dirs()
+    assert sql.loads == 2
+    worker1.invalidate()
+    worker2.dirs()
+    assert sql.loads == 3
+
+
+def test_folder_enabled_needs_both_levels_enabled():
+    sql = _Sql()
+    tree = CategoryTree(sql)
+    assert tree.folder_enabled(1, 10)
+    assert not tree.folder_enabled(1, 12)
+    assert not tree.folder_enabled(3, 30)
+    assert not tree.folder_enabled(1, 99)
+    assert sql.loads == 1
+
+
+def test_display_names_from_loaded_tree():
+    sql = _Sql()
+    tree = CategoryTree(sql)
+    assert tree.display_names(1, 11) == ('VIDEO', 'VIDEO')
+    assert tree.display_names(2, 10) == ('REGISTRATORS', '')
+    assert tree.display_names(99, 10) == ('', '')
+    assert sql.loads == 1
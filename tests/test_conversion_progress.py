@@ -0,0 +1,82 @@
+from unittest.mock import patch, MagicMock
+
+from modules.conversion_progress import (ConversionProgress, parse_out_time,
+                                         parse_progress_block, parse_speed)
+from services.media import MediaService
+
+
+class _Redis:
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def get(self, key):
+        return self.data.get(key)
+
+
+class _Socket:
+
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, data, namespace='/', room=None):
+        self.events.append((event, room, data))
+
+
+def test_parse_progress_block():
+    data = parse_progress_block(
+        ['frame=10', 'out_time_ms=4500000', 'speed=1.5x', 'progress=continue'])
+    assert parse_out_time(data) == 4.5
+    assert parse_speed(data['speed']) == 1.5
+    assert parse_speed('N/A') is None
+    assert parse_out_time({'out_time_ms': 'N/A'}) is None
+
+
+def test_update_is_throttled_and_computes_eta():
+    redis, sock = _Redis(), _Socket()
+    progress = ConversionProgress(redis, sock, min_interval=60)
+    assert progress.update(5, 30.0, 120.0, 2.0)
+    assert not progress.update(5, 40.0, 120.0, 2.0)
+    status = progress.get(5)
+    assert status['state'] == 'running'
+    assert status['percent'] == 25.0
+    assert status['eta'] == 45
+    assert sock.events[0][0] == 'files:progress'
+    assert sock.events[0][1] == 'file:5'
+    progress.finish(5, True)
+    assert progress.get(5)['state'] == 'done'
+
+
+class _SQL:
+
+    def __init__(self):
+        self.ready_ids = []
+
+    def file_ready(self, args):
+        self.ready_ids.append(args[0])
+
+
+def test_run_ffmpeg_reports_progress():
+    progress = ConversionProgress(None, None, min_interval=0)
+    ms = MediaService(None, '/tmp', _SQL(), None, progress=progress)
+    lines = [
+        'out_time_ms=5000000\n', 'speed=2x\n', 'progress=continue\n',
+        'out_time_ms=10000000\n', 'speed=2x\n', 'progress=end\n'
+    ]
+    with patch('services.media.Popen') as mp, \
+     patch.object(ms.probe, 'probe', return_value={'duration': 10.0}):
+        proc = MagicMock()
+        proc.stdout = iter(lines)
+        proc.stderr = iter([])
+        proc.returncode = 0
+        mp.return_value = proc
+        returncode, _ = ms._run_ffmpeg(['ffmpeg', '-i', 'a.webm', 'a.mp4'],
+                                       'a.webm', 9)
+        cmd = mp.call_args[0][0]
+    assert returncode == 0
+    assert cmd[:4] == ['ffmpeg', '-nostats', '-progress', 'pipe:1']
+    status = progress.get(9)
+    assert status['percent'] == 100.0 and status['eta'] == 0
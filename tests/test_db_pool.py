@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+from mysql.connector import errors as mysql_errors
+
+from modules.db_pool import ConnectionPool
+
+
+class _Conn:
+
+    def __init__(self, n):
+        self.n = n
+        self.pings = 0
+        self.closed = False
+
+    def ping(self, reconnect=True, attempts=1, delay=0):
+        self.pings += 1
+
+    def close(self):
+        self.closed = True
+
+
+def _factory():
+    made = []
+
+    def make():
+        made.append(_Conn(len(made)))
+        return made[-1]
+
+    return make, made
+
+
+def test_nested_calls_reuse_greenlet_connection():
+    make, made = _factory()
+    pool = ConnectionPool(make, size=1, acquire_timeout=0.1)
+    with pool.connection() as outer:
+        with pool.connection() as inner:
+            assert inner is outer
+    assert len(made) == 1
+    assert pool.status()['in_use'] == 0
+
+
+def test_waiters_are_served_fifo_and_timeout():
+    make, _ = _factory()
+    pool = ConnectionPool(make, size=1, acquire_timeout=2)
+    order = []
+
+    def worker(tag):
+        with pool.connection():
+            order.append(tag)
+
+    with pool.connection():
+        threads = []
+        for tag in range(3):
+            t = threading.Thread(target=worker, args=(tag, ))
+            t.start()
+            threads.append(t)
+            while pool.status()['waiters'] < tag + 1:
+                time.sleep(0.001)
+    for t in threads:
+        t.join()
+    assert order == [0, 1, 2]
+    assert pool.status()['max_waiters'] == 3
+
+    pool.acquire_timeout = 0.05
+    errors = []
+
+    def starved():
+        try:
+            pool._acquire()
+        except mysql_errors.PoolError as e:
+            errors.append(e)
+
+    with pool.connection():
+        t = threading.Thread(target=starved)
+        t.start()
+        t.join()
+    assert len(errors) == 1 and pool.status()['timeouts'] == 1
+
+
+def test_ping_only_after_idle_and_broken_connections_dropped():
+    make, made = _factory()
+    pool = ConnectionPool(make, size=2, idle_check_seconds=60)
+    with pool.connection():
+        pass
+    with pool.connection():
+        pass
+    assert made[0].pings == 0
+    pool.idle_check_seconds = 0
+    time.sleep(0.001)
+    with pool.connection():
+        pass
+    assert made[0].pings == 1
+    with pytest.raises(mysql_errors.OperationalError):
+        with pool.connection():
+            raise mysql_errors.OperationalError('gone')
+    assert made[0].closed and pool.status()['open_connections'] == 0
@@ -0,0 +1,49 @@
+from services.file_reconciler import FileReconciler
+
+
+class _Sql:
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.updates = []
+
+    def file_locations_all(self):
+        return self.rows
+
+    def file_set_exists_bulk(self, ids, exists):
+        self.updates.append((list(ids), exists))
+
+
+def test_sweep_writes_only_changed_rows(tmp_path):
+    sub = tmp_path / 'files' / 'cat' / 'sub'
+    sub.mkdir(parents=True)
+    (sub / 'a.mp4').write_bytes(b'x')
+    (sub / 'b.webm').write_bytes(b'x')
+    sql = _Sql([
+        (1, 'cat', 'sub', 'a.mp4', 1),  # present, unchanged
+        (2, 'cat', 'sub', 'b.mp4', 0),  # original .webm appeared
+        (3, 'cat', 'sub', 'c.mp4', 1),  # vanished
+        (4, 'cat', 'missing', 'd.mp4', 1),  # directory gone: left alone
+    ])
+    rec = FileReconciler(sql, str(tmp_path))
+    stats = rec.sweep()
+    assert stats['checked'] == 4 and stats['skipped_dirs'] == 1
+    assert stats['appeared'] == 1 and stats['vanished'] == 1
+    assert ([2], True) in sql.updates
+    assert ([3], False) in sql.updates
+
+
+def test_sweep_batches_updates(tmp_path):
+    (tmp_path / 'files' / 'c' / 's').mkdir(parents=True)
+    sql = _Sql([(i, 'c', 's', f'{i}.mp4', 1) for i in range(1, 6)])
+    rec = FileReconciler(sql, str(tmp_path), batch_size=2)
+    rec.sweep()
+    assert [len(ids) for ids, _ in sql.updates] == [2, 2, 1]
+
+
+def test_missing_storage_root_aborts_without_writes(tmp_path):
+    sql = _Sql([(i, 'c', 's', f'{i}.mp4', 1) for i in range(1, 6)])
+    rec = FileReconciler(sql, str(tmp_path / 'unmounted'))
+    stats = rec.sweep()
+    assert 'aborted' in stats
+    assert not any(exists is False for _, exists in sql.updates)
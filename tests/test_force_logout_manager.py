@@ -0,0 +1,147 @@
+import queue
+import time
+import types
+
+from modules.force_logout_manager import RedisForceLogoutManager
+
+
+class _Client:
+    """String/set/pubsub subset of redis-py; counts commands sent."""
+
+    def __init__(self):
+        self.strings, self.sets = {}, {}
+        self.subscribers = []
+        self.commands = 0
+
+    def pipeline(self, transaction=True):
+        return _Pipe(self)
+
+    def get(self, key):
+        self.commands += 1
+        return self.strings.get(key)
+
+    def publish(self, channel, message):
+        self.commands += 1
+        for sub in self.subscribers:
+            sub.put({'type': 'message', 'channel': channel, 'data': message})
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return _PubSub(self)
+
+
+class _Pipe:
+
+    def __init__(self, client):
+        self.client = client
+        self.ops = []
+
+    def __getattr__(self, name):
+        def queue_op(*args):
+            self.ops.append((name, args))
+        return queue_op
+
+    def execute(self):
+        c = self.client
+        c.commands += 1
+        out = []
+        for name, args in self.ops:
+            if name == 'get':
+                out.append(c.strings.get(args[0]))
+            elif name == 'incr':
+                c.strings[args[0]] = str(int(c.strings.get(args[0]) or 0) + 1)
+                out.append(int(c.strings[args[0]]))
+            elif name == 'smembers':
+                out.append(set(c.sets.get(args[0], set())))
+            elif name == 'scard':
+                out.append(len(c.sets.get(args[0], set())))
+            elif name == 'sadd':
+                members = c.sets.setdefault(args[0], set())
+                before = len(members)
+                members.update(args[1:])
+                out.append(len(members) - before)
+            elif name == 'srem':
+                members = c.sets.get(args[0], set())
+                out.append(int(args[1] in members))
+                members.discard(args[1])
+            elif name == 'delete':
+                out.append(sum(c.sets.pop(k, None) is not None for k in args))
+        return out
+
+
+class _PubSub:
+
+    def __init__(self, client):
+        self.client = client
+        self.messages = queue.Queue()
+
+    def subscribe(self, channel):
+        self.client.subscribers.append(self.messages)
+
+    def get_message(self, timeout=0.0):
+        try:
+            return self.messages.get(timeout=min(timeout, 0.05))
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.client.subscribers.remove(self.messages)
+
+
+def _manager(client, **kwargs):
+    return RedisForceLogoutManager(types.SimpleNamespace(client=client), **kwargs)
+
+
+def test_checks_use_local_snapshot():
+    client = _Client()
+    admin, worker = _manager(client), _manager(client, max_staleness=60)
+    assert not worker.is_user_forced_logout(7)
+
+    admin.add_user_logout(7)
+    admin.add_session_logout('s1')
+    assert admin.is_user_forced_logout(7) and admin.is_session_forced_logout('s1')
+
+    sent = client.commands
+    for _ in range(50):
+        worker.is_user_forced_logout(7)
+        worker.is_session_forced_logout('s1')
+    # Still within max_staleness and no listener: no I/O, old snapshot
+    assert client.commands == sent
+    assert not worker.is_user_forced_logout(7)
+
+
+def test_stale_snapshot_reloads_only_when_epoch_moved():
+    client = _Client()
+    admin, worker = _manager(client), _manager(client, max_staleness=0)
+    worker.is_user_forced_logout(1)
+
+    sent = client.commands
+    assert not worker.is_user_forced_logout(1)
+    assert client.commands == sent + 1  # epoch GET only
+
+    admin.add_users_logout([1, 2])
+    assert worker.is_user_forced_logout(2)
+    assert admin.remove_user_logout(2)
+    assert not worker.is_user_forced_logout(2)
+
+
+def test_listener_applies_published_changes():
+    client = _Client()
+    admin, worker = _manager(client), _manager(client, max_staleness=60)
+    worker.start_listener()
+    try:
+        deadline = time.monotonic() + 2
+        while not client.subscribers and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        admin.add_user_logout(5)
+        while not worker.is_user_forced_logout(5) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert worker.is_user_forced_logout(5)
+
+        assert admin.clear_all_logouts()
+        while worker.is_user_forced_logout(5) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not worker.is_user_forced_logout(5)
+    finally:
+        worker.shutdown()
+    assert not client.subscribers
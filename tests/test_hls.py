@@ -0,0 +1,62 @@
+import os
+
+from services.hls import (HLS_NAME_RE, HlsPackager, hls_dir, parse_ladder)
+
+
+def _info(width=1280, height=720):
+    return {
+        'duration': 10.0,
+        'size_bytes': 2_500_000,
+        'bit_rate': 2_000_000,
+        'has_video': True,
+        'video': {'codec': 'h264', 'width': width, 'height': height},
+    }
+
+
+def test_parse_ladder_and_names():
+    assert parse_ladder('720:2000, 360:600,bad,0:100') == [(360, 600),
+                                                           (720, 2000)]
+    assert hls_dir('/data/a/abc.mp4') == '/data/a/abc.hls'
+    assert HLS_NAME_RE.match('master.m3u8')
+    assert HLS_NAME_RE.match('360p/seg_00012.ts')
+    assert not HLS_NAME_RE.match('../abc.mp4')
+
+
+def test_plan_copies_source_and_skips_upscaled_rungs():
+    packager = HlsPackager(segment_seconds=4, ladder=[(360, 600), (720, 2000)])
+    variants = packager.plan('/tmp/a.mp4', _info(), '/tmp/a.hls')
+    assert [v['name'] for v in variants] == ['src', '360p']
+    assert '-c' in variants[0]['cmd'] and 'copy' in variants[0]['cmd']
+    assert variants[1]['resolution'] == (640, 360)
+    assert variants[1]['cmd'][-1] == os.path.join('/tmp/a.hls', '360p',
+                                                  'index.m3u8')
+    playlist = HlsPackager.master_playlist(variants)
+    lines = playlist.splitlines()
+    assert lines[0] == '#EXTM3U'
+    assert lines[4] == 'src/index.m3u8'
+    assert 'BANDWIDTH=728000,RESOLUTION=640x360' in playlist
+
+
+def test_package_swaps_output_in(tmp_path, monkeypatch):
+    src = tmp_path / 'a.mp4'
+    src.write_bytes(b'')
+    packager = HlsPackager()
+    runs = []
+
+    def _run(cmd, timeout):
+        runs.append((cmd, timeout))
+        open(cmd[-1], 'w').close()
+
+    monkeypatch.setattr(packager, '_run', _run)
+    assert packager.package(str(src), _info())
+    out = tmp_path / 'a.hls'
+    assert (out / 'master.m3u8').exists()
+    assert (out / 'src' / 'index.m3u8').exists()
+    assert not (tmp_path / 'a.hls.tmp').exists()
+    assert not packager.package(str(src), dict(_info(), has_video=False))
+
+
+def test_timeout_scales_with_duration():
+    packager = HlsPackager(timeout=300, timeout_factor=2)
+    assert packager._timeout_for(None) == 300
+    assert packager._timeout_for(3600) == 7200
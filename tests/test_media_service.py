@@ -1,7 +1,10 @@
+import json
+import os
 import types
 from unittest.mock import patch, MagicMock
 
 from services.media import MediaService
+from services.media_probe import MediaProbe
 
 
 class _DummyTP:
@@ -22,50 +25,188 @@ class _DummySQL:
         pass
 
 
-def _make_media_service():
-    return MediaService(_DummyTP(), "/tmp", _DummySQL(), socketio=None)
+class _Cache:
 
+    def __init__(self):
+        self.data = {}
 
-def test_probe_length_uses_format_duration_first():
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+def _make_media_service(probe=None):
+    return MediaService(_DummyTP(), "/tmp", _DummySQL(), socketio=None,
+                        probe=probe)
+
+
+def _stat(size):
+    return types.SimpleNamespace(st_size=size, st_mtime_ns=1)
+
+
+def test_probe_uses_single_json_ffprobe():
     ms = _make_media_service()
 
-    # Mock getsize and Popen for format duration path
-    with patch("services.media.os.path.getsize", return_value=5 * 1024 * 1024), \
-     patch("services.media.Popen") as mock_popen:
+    with patch("services.media_probe.os.stat", return_value=_stat(5 * 1024 * 1024)), \
+     patch("services.media_probe.Popen") as mock_popen:
         proc = MagicMock()
-        proc.communicate.return_value = ("12.34", "")
+        proc.communicate.return_value = (json.dumps({
+            'format': {'duration': '12.34', 'format_name': 'mov,mp4'},
+            'streams': [{'codec_type': 'video'}]
+        }), "")
         proc.returncode = 0
         mock_popen.return_value = proc
 
-        length, size_mb = ms._probe_length_and_size("/tmp/fake.mp4")
+        length, size_mb = ms.probe.length_and_size("/tmp/fake.mp4")
         assert length == 12
         assert size_mb == 5.0
-        # First call is for format duration
+        assert mock_popen.call_count == 1
         args, kwargs = mock_popen.call_args
-        assert "-show_entries" in args[0] and "format=duration" in args[0]
+        assert "-show_format" in args[0] and "-show_streams" in args[0]
+        assert "-count_frames" not in args[0]
 
 
-def test_probe_length_fallbacks_to_stream_then_frames():
-    ms = _make_media_service()
+def test_probe_falls_back_to_packet_timestamps():
+    probe = MediaProbe()
 
-    with patch("services.media.os.path.getsize", return_value=0), \
-     patch("services.media.Popen") as mock_popen:
-        # First ffprobe (format) returns bad output
+    with patch("services.media_probe.os.stat", return_value=_stat(0)), \
+     patch("services.media_probe.Popen") as mock_popen:
+        # No duration in format or streams (e.g. MediaRecorder .webm)
         proc1 = MagicMock()
-        proc1.communicate.return_value = ("", "")
-        proc1.returncode = 0
-        # Second ffprobe (stream duration) returns bad output
+        proc1.communicate.return_value = (json.dumps({
+            'format': {'duration': 'N/A'},
+            'streams': [{'codec_type': 'video'}]
+        }), "")
+        # Packet scan: pts_time,duration_time per packet
         proc2 = MagicMock()
-        proc2.communicate.return_value = ("", "")
-        proc2.returncode = 0
-        # Third ffprobe (json frames) returns usable data
-        proc3 = MagicMock()
-        json_out = '{"streams": [{"nb_read_frames": "300", "r_frame_rate": "30/1"}]}'
-        proc3.communicate.return_value = (json_out, "")
-        proc3.returncode = 0
-
-        mock_popen.side_effect = [proc1, proc2, proc3]
-
-        length, size_mb = ms._probe_length_and_size("/tmp/fake.mp4")
-        assert length == 10  # 300 / 30
-        assert size_mb == 0.0
+        proc2.stdout = iter(["0.000,0.033\n", "9.950,0.050\n", "5.000,\n"])
+        mock_popen.side_effect = [proc1, proc2]
+
+        info = probe.probe("/tmp/fake.webm")
+        assert info['duration'] == 10.0
+        assert info['size_mb'] == 0.0
+        packet_cmd = mock_popen.call_args_list[1][0][0]
+        assert "packet=pts_time,duration_time" in packet_cmd
+        assert "-count_frames" not in packet_cmd
+
+
+def test_probe_can_skip_packet_scan_without_caching():
+    probe = MediaProbe(_Cache())
+
+    with patch("services.media_probe.os.stat", return_value=_stat(0)), \
+     patch("services.media_probe.Popen") as mock_popen:
+        proc = MagicMock()
+        proc.communicate.return_value = (json.dumps({
+            'format': {'duration': 'N/A'},
+            'streams': [{'codec_type': 'video'}]
+        }), "")
+        mock_popen.return_value = proc
+
+        assert probe.probe("/tmp/fake.webm", scan_packets=False)['duration'] == 0.0
+        assert mock_popen.call_count == 1
+        assert probe.redis.data == {}
+
+
+def test_probe_results_are_cached_by_path_size_mtime():
+    probe = MediaProbe(_Cache())
+
+    with patch("services.media_probe.os.stat", return_value=_stat(1024)), \
+     patch("services.media_probe.Popen") as mock_popen:
+        proc = MagicMock()
+        proc.communicate.return_value = (json.dumps(
+            {'format': {'duration': '3.5'}, 'streams': []}), "")
+        mock_popen.return_value = proc
+        assert probe.probe("/tmp/a.mp4")['duration'] == 3.5
+        assert probe.probe("/tmp/a.mp4")['duration'] == 3.5
+        assert mock_popen.call_count == 1
+    with patch("services.media_probe.os.stat", return_value=_stat(2048)), \
+     patch("services.media_probe.Popen") as mock_popen:
+        mock_popen.return_value = proc
+        probe.probe("/tmp/a.mp4")
+        assert mock_popen.call_count == 1
+
+
+def _probed(video=None, audio=None):
+    info = MediaProbe._empty(0)
+    info.update(video=video, audio=audio)
+    return info
+
+
+def test_plan_conversion_picks_cheapest_pipeline():
+    ms = _make_media_service()
+    h264 = {'codec': 'h264', 'pix_fmt': 'yuv420p', 'height': 720,
+            'bit_rate': 2_000_000}
+    aac = {'codec': 'aac'}
+    opus = {'codec': 'opus'}
+    cases = [
+        (_probed(h264, aac), 'a.mp4', 'remux', ['-c', 'copy']),
+        (_probed(h264, opus), 'a.mp4', 'audio', ['-c:v', 'copy']),
+        (_probed(dict(h264, height=2160), aac), 'a.mp4', 'encode',
+         ['-c:v', 'libx264']),
+        (_probed({'codec': 'vp8', 'pix_fmt': 'yuv420p', 'height': 480},
+                 opus), 'a.mp4', 'encode', ['-c:v', 'libx264']),
+        (_probed(None, aac), 'a.m4a', 'remux', ['-c:a', 'copy']),
+        (_probed(None, opus), 'a.m4a', 'audio', ['-c:a', 'aac']),
+    ]
+    for info, dst, mode, flags in cases:
+        with patch.object(ms.probe, 'probe', return_value=info):
+            got_mode, cmd = ms._plan_conversion('/tmp/src', dst)
+        assert got_mode == mode, (info, dst)
+        joined = ' '.join(cmd)
+        assert ' '.join(flags) in joined
+        assert cmd[-1] == dst
+
+
+def test_plan_conversion_always_encodes_when_remux_disabled():
+    ms = MediaService(_DummyTP(), "/tmp", _DummySQL(), remux=False)
+    with patch.object(ms.probe, 'probe') as probe:
+        mode, _ = ms._plan_conversion('/tmp/src.mp4', '/tmp/dst.mp4')
+    assert mode == 'encode'
+    probe.assert_not_called()
+
+
+def test_timeout_scales_with_duration():
+    ms = MediaService(_DummyTP(), "/tmp", _DummySQL(), convert_timeout=300,
+                      timeout_factor=2.0)
+    assert ms._timeout_for(None) == 300
+    assert ms._timeout_for(60) == 300
+    assert ms._timeout_for(3 * 3600) == 6 * 3600
+
+
+def test_chunk_parallelism_splits_cores_between_jobs(monkeypatch):
+    monkeypatch.setattr("services.media.os.cpu_count", lambda: 16)
+    assert _make_media_service().chunk_parallelism == 2
+    ms = MediaService(_DummyTP(), "/tmp", _DummySQL(), chunk_parallelism=0,
+                      concurrent_jobs=4)
+    assert ms.chunk_parallelism == 4
+
+
+def test_encode_chunked_splits_encodes_and_concats(tmp_path, monkeypatch):
+    ms = MediaService(_DummyTP(), str(tmp_path), _DummySQL(),
+                      chunk_seconds=60, chunk_parallelism=2)
+    dst = str(tmp_path / 'out.mp4')
+    calls = []
+
+    def _fake_run(cmd, src, file_id, timeout=None):
+        calls.append(cmd)
+        if '-f' in cmd and 'segment' in cmd:
+            work = os.path.dirname(cmd[-1])
+            for i in range(3):
+                open(os.path.join(work, f'src_{i:05d}.mkv'), 'w').close()
+        return 0, ''
+
+    monkeypatch.setattr(ms, '_run_ffmpeg', _fake_run)
+    monkeypatch.setattr(ms.probe, 'probe',
+                        lambda target: dict(MediaProbe._empty(0),
+                                            has_audio=True))
+    assert ms._encode_chunked('/tmp/long.webm', dst, 170.0, None) == (0, '')
+    encodes = [c for c in calls if '-an' in c]
+    assert len(encodes) == 3
+    assert all('libx264' in c for c in encodes)
+    concat = calls[-1]
+    assert concat[concat.index('-f') + 1] == 'concat'
+    assert concat[-1] == dst and 'copy' in concat
+    assert any('-vn' in c for c in calls)
+    assert not os.path.exists(dst + '.chunks')
@@ -66,7 +66,7 @@ def test_convert_async_timeout_marks_ready():
         def _raise(*a, **k):
             raise Exception("timeout")
 
-        proc.communicate.side_effect = _raise
+        proc.wait.side_effect = _raise
         mp.return_value = proc
         ms._convert(("/tmp/a.webm", "/tmp/a.mp4", ('file', 5)))
     assert 5 in sql.ready_ids
@@ -0,0 +1,110 @@
+import pytest
+
+from services.media import MediaService
+from services.media_worker import MediaWorker
+
+
+class _Queue:
+
+    visibility_timeout = 60
+
+    def __init__(self, jobs):
+        self.jobs = list(jobs)
+        self.acked = []
+        self.failed = []
+
+    def reserve(self):
+        return self.jobs.pop(0) if self.jobs else None
+
+    def touch(self, job):
+        pass
+
+    def ack(self, job):
+        self.acked.append(job['id'])
+
+    def fail(self, job, error=''):
+        self.failed.append((job['id'], error))
+        return True
+
+
+def _job(id, kind='convert', attempts=1, max_attempts=3):
+    return {
+        'id': id,
+        'kind': kind,
+        'attempts': attempts,
+        'max_attempts': max_attempts,
+        'payload': {
+            'src': '/tmp/a.webm',
+            'dst': '/tmp/a.mp4',
+            'entity': ['file', 7]
+        }
+    }
+
+
+def test_worker_acks_success_and_fails_on_error():
+    seen = []
+
+    def handler(job):
+        seen.append(job['id'])
+        if job['id'] == 'bad':
+            raise RuntimeError('boom')
+
+    queue = _Queue([_job('ok'), _job('bad'), _job('x', kind='unknown')])
+    worker = MediaWorker(queue, {'convert': handler}, concurrency=1)
+    while worker.run_one():
+        pass
+    assert seen == ['ok', 'bad']
+    assert queue.acked == ['ok']
+    assert [j for j, _ in queue.failed] == ['bad', 'x']
+    assert worker.processed == 1 and worker.failed == 1
+
+
+def test_worker_concurrency_defaults_to_cpu_count():
+    assert MediaWorker(_Queue([]), {}, concurrency=0).concurrency >= 1
+
+
+class _SQL:
+
+    def __init__(self):
+        self.ready_ids = []
+
+    def file_ready(self, args):
+        self.ready_ids.append(args[0])
+
+
+class _EnqueueOnly:
+
+    def __init__(self):
+        self.calls = []
+
+    def enqueue(self, kind, payload, priority=0):
+        self.calls.append((kind, payload, priority))
+
+
+def test_convert_async_enqueues_when_queue_configured():
+    queue = _EnqueueOnly()
+    ms = MediaService(None, '/tmp', _SQL(), None, job_queue=queue)
+    ms.convert_async('/tmp/a.webm', '/tmp/a.mp4', ('file', 7), priority=-1)
+    assert queue.calls == [('convert', {
+        'src': '/tmp/a.webm',
+        'dst': '/tmp/a.mp4',
+        'entity': ['file', 7]
+    }, -1)]
+
+
+def test_run_job_marks_ready_only_on_last_attempt(monkeypatch):
+    sql = _SQL()
+    ms = MediaService(None, '/tmp', sql, None)
+
+    def _failing_convert(args, give_up=True):
+        if give_up:
+            sql.file_ready([args[2][1]])
+        return False
+
+    monkeypatch.setattr(ms, '_convert', _failing_convert)
+    with pytest.raises(RuntimeError):
+        ms.run_job(_job('a', attempts=1, max_attempts=2))
+    assert sql.ready_ids == []
+    with pytest.raises(RuntimeError):
+        ms.run_job(_job('a', attempts=2, max_attempts=2))
+    assert sql.ready_ids == [7]
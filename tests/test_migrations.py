@@ -0,0 +1,112 @@
+import pytest
+
+from modules.migrations import Migration, MigrationRunner
+
+
+class _FakeCursor:
+
+    def __init__(self, db):
+        self.db = db
+        self._row = None
+        self._rows = []
+
+    def execute(self, sql, args=None):
+        self.db.log.append(sql.strip().split()[0].upper())
+        if 'GET_LOCK' in sql:
+            self._row = (1, )
+        elif sql.strip().upper().startswith('SELECT VERSION'):
+            self._rows = [(v, ) for v in sorted(self.db.versions)]
+        elif sql.strip().upper().startswith('INSERT INTO'):
+            self.db.versions.add(int(args[0]))
+        else:
+            self._row = None
+
+    def fetchone(self):
+        return self._row
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class _FakeConn:
+
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, buffered=False):
+        return _FakeCursor(self.db)
+
+    def close(self):
+        self.db.closed = True
+
+
+class _FakeDb:
+
+    def __init__(self, versions=()):
+        self.versions = set(versions)
+        self.log = []
+        self.closed = False
+
+
+def _config():
+    return {
+        'db': {
+            'prefix': 'web',
+            'name': 'znf',
+            'host': 'localhost',
+            'user': 'u',
+            'password': 'p',
+        }
+    }
+
+
+def test_runner_applies_pending_in_order_and_records_versions():
+    db = _FakeDb(versions=[1])
+    calls = []
+    steps = [
+        Migration(3, 'third', lambda cur, p, d: calls.append(3)),
+        Migration(1, 'first', lambda cur, p, d: calls.append(1)),
+        Migration(2, 'second', lambda cur, p, d: calls.append(2)),
+    ]
+    runner = MigrationRunner(_config(), steps, connect=lambda **kw: _FakeConn(db))
+    applied = runner.run()
+    assert applied == [2, 3]
+    assert calls == [2, 3]
+    assert db.versions == {1, 2, 3}
+    assert db.closed
+    assert runner.latest_version == 3
+
+
+def test_runner_is_noop_when_up_to_date():
+    db = _FakeDb(versions=[1, 2])
+    calls = []
+    steps = [
+        Migration(1, 'first', lambda cur, p, d: calls.append(1)),
+        Migration(2, 'second', lambda cur, p, d: calls.append(2)),
+    ]
+    runner = MigrationRunner(_config(), steps, connect=lambda **kw: _FakeConn(db))
+    assert runner.run() == []
+    assert calls == []
+    # Lock is always released
+    assert db.log.count('SELECT') >= 3
+
+
+def test_run_migrations_reraises_failed_step(monkeypatch):
+    from modules import migrations
+
+    class _Failing:
+
+        def __init__(self, config):
+            pass
+
+        def run(self):
+            raise RuntimeError('boom')
+
+    monkeypatch.setattr(migrations, 'MigrationRunner', _Failing)
+    monkeypatch.setattr(migrations, '_migrated', False)
+    with pytest.raises(RuntimeError, match='boom'):
+        migrations.run_migrations(_config())
+    assert migrations._migrated is False
@@ -0,0 +1,122 @@
+import types
+
+from modules.presence_manager import RedisPresenceManager
+
+
+def _bound(value):
+    value = str(value)
+    if value in ('-inf', '+inf'):
+        return float(value), False
+    if value.startswith('('):
+        return float(value[1:]), True
+    return float(value), False
+
+
+class _Client:
+    """Sorted set/hash/set subset of redis-py; pipelines run immediately."""
+
+    def __init__(self):
+        self.zset, self.hash, self.sets = {}, {}, {}
+        self.keys_called = False
+
+    def pipeline(self):
+        return _Pipe(self)
+
+    def keys(self, pattern):
+        self.keys_called = True
+        return []
+
+    def zadd(self, key, mapping):
+        self.zset.update(mapping)
+
+    def zrem(self, key, *members):
+        return sum(self.zset.pop(m, None) is not None for m in members)
+
+    def zrangebyscore(self, key, lo, hi):
+        (lo, lo_x), (hi, hi_x) = _bound(lo), _bound(hi)
+        return sorted(m for m, s in self.zset.items()
+                      if (s > lo if lo_x else s >= lo) and (
+                          s < hi if hi_x else s <= hi))
+
+    def zremrangebyscore(self, key, lo, hi):
+        return self.zrem(key, *self.zrangebyscore(key, lo, hi))
+
+    def hset(self, key, field, value):
+        self.hash[field] = value
+
+    def hmget(self, key, fields):
+        return [self.hash.get(f) for f in fields]
+
+    def hdel(self, key, *fields):
+        return sum(self.hash.pop(f, None) is not None for f in fields)
+
+    def sadd(self, key, member):
+        self.sets.setdefault(key, set()).add(member)
+
+    def srem(self, key, *members):
+        self.sets.get(key, set()).difference_update(members)
+
+    def smembers(self, key):
+        return set(self.sets.get(key, set()))
+
+    def delete(self, key):
+        self.sets.pop(key, None)
+
+    def expire(self, key, seconds):
+        pass
+
+
+class _Pipe:
+
+    def __init__(self, client):
+        self.client = client
+        self.results = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        return lambda *a, **k: self.results.append(method(*a, **k))
+
+    def execute(self):
+        return self.results
+
+
+def _manager():
+    client = _Client()
+    return RedisPresenceManager(types.SimpleNamespace(client=client)), client
+
+
+def test_presence_is_listed_deduplicated_and_removed_per_user():
+    manager, client = _manager()
+    manager.update_presence('sid1', 1, 'Ivan', '10.0.0.1', '/files', 'UA')
+    manager.update_presence('sid2', 2, 'Olga', '10.0.0.2', '/', 'UA')
+    manager.update_heartbeat(1, '10.0.0.1', '/files', 'UA')
+    active = manager.get_active_presence()
+    assert sorted(e['user_id'] for e in active) == [1, 2]
+    assert manager.remove_user_presence(1)
+    assert [e['sid'] for e in manager.get_active_presence()] == ['sid2']
+    assert manager.remove_presence('sid2')
+    assert manager.get_active_presence() == []
+    assert not client.keys_called
+
+
+def test_stale_entries_are_hidden_then_trimmed():
+    manager, client = _manager()
+    manager.update_presence('old', 1, 'Ivan', 'ip', '/', 'UA')
+    manager.update_presence('idle', 2, 'Olga', 'ip', '/', 'UA')
+    client.zset['s:old'] -= manager.retention + 1
+    client.zset['s:idle'] -= manager.stale_threshold + 1
+    assert manager.get_active_presence() == []
+    assert 's:old' not in client.hash and 's:idle' in client.hash
+    client.zset['s:idle'] -= manager.retention
+    assert manager.cleanup_stale_presence() == 1
+    assert client.zset == {} and client.hash == {}
+    # Trimmed entries no longer pile up in the per-user sets
+    assert not any(client.sets.values())
+
+
+def test_removed_session_leaves_user_set():
+    manager, client = _manager()
+    manager.update_presence('sid1', 1, 'Ivan', 'ip', '/', 'UA')
+    manager.update_heartbeat(1, 'ip', '/', 'UA')
+    assert manager.remove_presence('sid1')
+    assert client.sets['znf:presence:user:1'] == {'h:1:ip'}
@@ -0,0 +1,54 @@
+from services.previews import PreviewGenerator, preview_dir, vtt_timestamp
+
+
+def _info(duration=25.0, width=1280, height=720):
+    return {
+        'duration': duration,
+        'has_video': True,
+        'video': {'codec': 'h264', 'width': width, 'height': height},
+    }
+
+
+def test_layout_caps_tiles_and_keeps_aspect():
+    gen = PreviewGenerator(tile_width=160, columns=10, max_tiles=100,
+                           min_interval=2.0)
+    short = gen.layout(_info(25.0))
+    assert short['interval'] == 2.0 and short['tiles'] == 13
+    assert (short['columns'], short['rows']) == (10, 2)
+    assert short['tile_height'] == 90
+    long = gen.layout(_info(3600.0))
+    assert long['tiles'] == 100 and long['interval'] == 36.0
+
+
+def test_thumbs_vtt_maps_cues_to_sprite_tiles():
+    gen = PreviewGenerator(tile_width=160, columns=10, min_interval=2.0)
+    vtt = gen.thumbs_vtt(_info(25.0)).splitlines()
+    assert vtt[0] == 'WEBVTT'
+    assert vtt[2] == '00:00:00.000 --> 00:00:02.000'
+    assert vtt[3] == 'sprite.jpg#xywh=0,0,160,90'
+    # 11th tile starts the second sprite row; the last cue ends at the duration
+    assert 'sprite.jpg#xywh=0,90,160,90' in vtt
+    assert vtt[-2] == '00:00:24.000 --> 00:00:25.000'
+    assert vtt_timestamp(3725.5) == '01:02:05.500'
+    assert preview_dir('/d/abc.mp4') == '/d/abc.preview'
+
+
+def test_generate_writes_versioned_output(tmp_path, monkeypatch):
+    src = tmp_path / 'a.mp4'
+    src.write_bytes(b'')
+    gen = PreviewGenerator()
+    cmds = []
+
+    def _run(cmd):
+        cmds.append(cmd)
+        open(cmd[-1], 'wb').close()
+
+    monkeypatch.setattr(gen, '_run', _run)
+    version = gen.generate(str(src), _info())
+    assert isinstance(version, int)
+    out = tmp_path / 'a.preview'
+    assert sorted(p.name for p in out.iterdir()) == [
+        'poster.jpg', 'sprite.jpg', 'thumbs.vtt'
+    ]
+    assert '-skip_frame' in cmds[1]
+    assert gen.generate(str(src), dict(_info(), has_video=False)) is None
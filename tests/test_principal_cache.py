@@ -0,0 +1,127 @@
+import queue
+import time
+
+from classes.user import User
+from modules.principal_cache import PrincipalCache
+
+
+class _Sql:
+
+    def __init__(self):
+        self.loads = 0
+        self.permission = 'a,,ab,,,,'
+
+    def user_by_id(self, args):
+        self.loads += 1
+        return User(args[0], 'ivan', 'Ivan', 'hash', 1, 1, self.permission)
+
+
+class _Redis:
+
+    def __init__(self):
+        self.store = {}
+        self.client = self
+        self.subscribers = []
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, ex=None):
+        self.store[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.store.pop(key, None)
+
+    def scan_iter(self, match=None, count=None):
+        prefix = (match or '').rstrip('*')
+        return [k for k in list(self.store) if k.startswith(prefix)]
+
+    def publish(self, channel, message):
+        for sub in self.subscribers:
+            sub.put({'type': 'message', 'channel': channel, 'data': message})
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return _PubSub(self)
+
+
+class _PubSub:
+
+    def __init__(self, client):
+        self.client = client
+        self.messages = queue.Queue()
+
+    def subscribe(self, channel):
+        self.client.subscribers.append(self.messages)
+
+    def get_message(self, timeout=0.0):
+        try:
+            return self.messages.get(timeout=min(timeout, 0.05))
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.client.subscribers.remove(self.messages)
+
+
+def test_user_permission_mask_matches_scopes():
+    user = User(1, 'l', 'n', 'p', 1, 1, 'a,,abd,,,,')
+    assert user.has('files.upload') and user.has('files.delete_any')
+    assert not user.has('files.edit_any') and not user.has('users.manage')
+    admin = User(2, 'l', 'n', 'p', 1, 1, ',,z,,,,')
+    assert admin.has('users.manage') and 'admin.view' in admin.permissions
+
+
+def test_principal_served_from_cache_until_invalidated():
+    sql, redis = _Sql(), _Redis()
+    worker1 = PrincipalCache(sql, redis)
+    worker2 = PrincipalCache(sql, redis)
+    assert worker1.get_user(5).has('files.upload')
+    assert worker2.get_user('5').password == ''
+    worker1.get_user(5)
+    assert sql.loads == 1
+    sql.permission = 'a,,a,,,,'
+    worker1.invalidate(5)
+    assert not worker1.get_user(5).has('files.upload')
+    assert sql.loads == 2
+
+
+def test_invalidate_all_drops_every_principal():
+    sql, redis = _Sql(), _Redis()
+    cache = PrincipalCache(sql, redis)
+    cache.get_user(1)
+    cache.get_user(2)
+    cache.invalidate_all()
+    assert redis.store == {}
+    cache.get_user(1)
+    assert sql.loads == 3
+
+
+def _wait(condition, deadline):
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_invalidation_reaches_other_workers_local_copy():
+    sql, redis = _Sql(), _Redis()
+    admin = PrincipalCache(sql, redis, local_ttl=60)
+    worker = PrincipalCache(sql, redis, local_ttl=60)
+    worker.start_listener()
+    try:
+        deadline = time.monotonic() + 2
+        assert _wait(lambda: redis.subscribers, deadline)
+        worker.get_user(5)
+        worker.get_user(6)
+
+        sql.permission = 'a,,a,,,,'
+        admin.invalidate(5)
+        assert _wait(lambda: 5 not in worker._local, deadline)
+        assert 6 in worker._local
+        assert not worker.get_user(5).has('files.upload')
+
+        admin.invalidate_all()
+        assert _wait(lambda: not worker._local, deadline)
+    finally:
+        worker.shutdown()
+    assert not redis.subscribers
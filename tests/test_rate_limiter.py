@@ -0,0 +1,89 @@
+import pytest
+from flask import Flask
+
+from modules import rate_limiter as rl
+from modules.rate_limiter import RateLimiter, _gcra
+
+
+class _Script:
+    """Runs the GCRA step the Lua script performs, on a dict 'server'."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.store = {}
+        self.calls = []
+
+    def __call__(self, keys, args):
+        interval, tolerance, pending = args
+        self.calls.append(pending)
+        allowed, tat, retry_after, remaining = _gcra(
+            self.store.get(keys[0], 0.0), self.clock[0], interval, tolerance, pending)
+        self.store[keys[0]] = tat
+        return [int(allowed), int(retry_after), remaining]
+
+
+class _Redis:
+
+    def __init__(self, script):
+        self.script = script
+
+    def register_script(self, source):
+        return self.script
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(rl.time, 'time', lambda: now[0] / 1000)
+    return now
+
+
+def test_gcra_allows_burst_then_spaces_requests(clock):
+    limiter = RateLimiter()
+    results = [limiter.hit('login', 'ip:1', 3, 3)[0] for _ in range(4)]
+    assert results == [True, True, True, False]
+
+    clock[0] += 1000
+    assert limiter.hit('login', 'ip:1', 3, 3) == (True, 0.0)
+    allowed, retry_after = limiter.hit('login', 'ip:1', 3, 3)
+    assert not allowed and retry_after == pytest.approx(1.0)
+    # Other identities have their own budget
+    assert limiter.hit('login', 'ip:2', 3, 3)[0]
+
+
+def test_redis_backend_uses_one_script_call_per_request(clock):
+    script = _Script(clock)
+    limiter = RateLimiter(_Redis(script))
+    for _ in range(5):
+        limiter.hit('files', 'u:7', 5, 60)
+
+    assert len(script.calls) == 5
+    assert limiter.hit('files', 'u:7', 5, 60)[0] is False
+
+
+def test_local_share_charges_local_admissions_on_next_call(clock):
+    script = _Script(clock)
+    limiter = RateLimiter(_Redis(script), local_share=0.5)
+    allowed = [limiter.hit('files', 'u:7', 10, 60)[0] for _ in range(10)]
+
+    assert all(allowed)
+    assert len(script.calls) < 10
+    # Every admission reached Redis: the key's budget is used up
+    assert not limiter.hit('files', 'u:7', 10, 60)[0]
+    # Locally admitted requests plus those admitted by Redis (the last call was denied)
+    assert sum(script.calls) + len(script.calls) - 1 == 10
+
+
+def test_decorator_returns_429_json():
+    app = Flask(__name__)
+    limiters = rl.create_rate_limiter(RateLimiter())
+
+    @app.route('/api/x', methods=['POST'])
+    @limiters['registrators']
+    def api_x():
+        return 'ok'
+
+    client = app.test_client()
+    codes = [client.post('/api/x').status_code for _ in range(61)]
+    assert codes.count(200) == 60 and codes[-1] == 429
+    assert client.post('/api/x').headers['Retry-After'] == '1'
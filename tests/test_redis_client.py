@@ -0,0 +1,66 @@
+from configparser import ConfigParser
+
+import redis
+
+from modules import redis_client as rc
+
+
+def _config(text):
+    config = ConfigParser()
+    config.read_string(text)
+    return config
+
+
+def test_config_from_parser():
+    config = _config("[redis]\nhost = cache\nport = x\nhealth_check_interval = 5\n")
+    cfg = rc.redis_config_from(config)
+
+    assert cfg['server'] == 'cache' and cfg['port'] == 6379
+    assert cfg['health_check_interval'] == 5 and cfg['max_connections'] == 64
+    assert rc.redis_config_from(_config("[db]\n")) == {}
+
+
+def test_shared_client_reuses_one_pool():
+    cfg = {'server': 'cache', 'port': 6390, 'health_check_interval': 7}
+    try:
+        first = rc.shared_redis(cfg)
+        assert rc.shared_redis(dict(cfg)) is first
+        kwargs = first.connection_pool.connection_kwargs
+        assert kwargs['health_check_interval'] == 7
+        assert kwargs['decode_responses'] is True
+    finally:
+        rc.close_shared_redis()
+    assert rc.shared_redis(cfg) is not first
+    rc.close_shared_redis()
+
+
+class _Client:
+
+    def __init__(self):
+        self.calls = []
+
+    def ping(self):
+        self.calls.append('ping')
+        return True
+
+    def get(self, key):
+        self.calls.append('get')
+        if key == 'down':
+            raise redis.ConnectionError('gone')
+        return 'v'
+
+
+def test_commands_do_not_ping_and_reconnect_after_errors(monkeypatch):
+    fake = _Client()
+    monkeypatch.setattr(rc, 'shared_redis', lambda config: fake)
+    monkeypatch.setattr(rc.RedisClient, '_log_connection_once', lambda self, url: None)
+    client = rc.RedisClient({'server': 'cache'})
+    fake.calls.clear()
+
+    assert client.get('a') == 'v' and client.get('b') == 'v'
+    assert fake.calls == ['get', 'get']
+
+    assert client.get('down') is None
+    assert not client.connected
+    assert client.get('a') == 'v'
+    assert fake.calls[-2:] == ['ping', 'get']
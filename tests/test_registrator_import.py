@@ -0,0 +1,157 @@
+import hashlib
+import os
+
+import pytest
+
+from modules.upload_jobs import UploadCancelled
+from services.registrator_import import (RegistratorImporter,
+                                         RegistratorImportError)
+
+
+class _Resp:
+
+    def __init__(self, chunks, status=200, length=None, headers=None):
+        self.chunks = chunks
+        self.status_code = status
+        total = sum(len(c) for c in chunks) if length is None else length
+        self.headers = dict(headers or {}, **{'content-length': str(total)})
+
+    def iter_content(self, chunk_size=1):
+        return iter(self.chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Session:
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, **kwargs):
+        self.calls.append((url, kwargs))
+        return self.responses.pop(0)
+
+
+class _SQL:
+
+    def __init__(self, root):
+        self.root = root
+        self.added = []
+
+    def get_file_storage_path(self, cat_id, sub_id):
+        return os.path.join(self.root, f'{cat_id}', f'{sub_id}')
+
+    def file_add2(self, args):
+        self.added.append(args)
+        return 42
+
+
+class _Probe:
+
+    def probe(self, target):
+        return {'duration': 12.7}
+
+
+class _Media:
+
+    def __init__(self):
+        self.probe = _Probe()
+        self.converted = []
+
+    def convert_async(self, src, dst, entity, priority=0):
+        self.converted.append((src, dst, entity, priority))
+
+
+def _importer(tmp_path, *responses, max_retries=5):
+    importer = RegistratorImporter(_SQL(str(tmp_path)),
+                                   _Media(),
+                                   max_retries=max_retries,
+                                   retry_backoff=0)
+    session = _Session(*responses)
+    importer._get_session = lambda: session
+    return importer, session
+
+
+def test_import_streams_to_storage_and_registers(tmp_path):
+    chunks = [b'a' * 1000, b'b' * 500]
+    importer, session = _importer(tmp_path, _Resp(chunks))
+    seen = []
+    result = importer.import_file('https://reg/x.MOV', 'x.MOV', 1, 2,
+                                  'user (group)', 'desc', verify=False,
+                                  on_progress=lambda d, t: seen.append((d, t)))
+    assert result['id'] == 42 and result['size_bytes'] == 1500
+    assert result['sha256'] == hashlib.sha256(b''.join(chunks)).hexdigest()
+    assert seen == [(1000, 1500), (1500, 1500)]
+    assert session.calls[0][1]['stream'] is True
+    assert session.calls[0][1]['verify'] is False
+    src, dst, entity, priority = importer.media_service.converted[0]
+    assert os.path.getsize(src) == 1500 and dst.endswith('.mp4')
+    assert entity == ('file', 42) and priority == -1
+    args = importer._sql.added[0]
+    assert args[0] == 'x.MOV' and args[8] == 12
+    # Only the final file is left in the storage directory
+    assert os.listdir(os.path.dirname(src)) == [os.path.basename(src)]
+
+
+def test_truncated_download_leaves_nothing_behind(tmp_path):
+    importer, _ = _importer(tmp_path,
+                            _Resp([b'abc'], length=10),
+                            max_retries=0)
+    dest = str(tmp_path / 'out.webm')
+    with pytest.raises(RegistratorImportError):
+        importer.download('https://reg/y.mp4', dest)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_dropped_download_resumes_with_range(tmp_path):
+    body = b'0123456789'
+    importer, session = _importer(
+        tmp_path, _Resp([body[:4]], length=10, headers={'etag': '"v1"'}),
+        _Resp([body[4:]],
+              status=206,
+              headers={'content-range': 'bytes 4-9/10'}))
+    saved = []
+    info = importer.download('https://reg/z.mp4',
+                             str(tmp_path / 'z.webm'),
+                             on_state=saved.append)
+    assert (tmp_path / 'z.webm').read_bytes() == body
+    assert info['sha256'] == hashlib.sha256(body).hexdigest()
+    headers = session.calls[1][1]['headers']
+    assert headers == {'Range': 'bytes=4-', 'If-Range': '"v1"'}
+    assert saved[-1]['offset'] == 4 and saved[-1]['etag'] == '"v1"'
+
+
+def test_saved_state_continues_after_restart(tmp_path):
+    body = b'0123456789'
+    part = tmp_path / '.import-x.part'
+    # Bytes past the recorded offset were never checkpointed
+    part.write_bytes(body[:6])
+    importer, session = _importer(
+        tmp_path,
+        _Resp([body[4:]], status=206, headers={'content-range': 'bytes 4-9/10'}))
+    state = {'part': str(part), 'offset': 4, 'total': 10, 'etag': '"v1"'}
+    info = importer.download('https://reg/z.mp4',
+                             str(tmp_path / 'z.webm'),
+                             state=state)
+    assert len(session.calls) == 1
+    assert info['size_bytes'] == 10
+    assert info['sha256'] == hashlib.sha256(body).hexdigest()
+    assert not part.exists()
+
+
+def test_cancel_from_on_state_aborts_and_cleans_up(tmp_path):
+    importer, session = _importer(tmp_path, _Resp([b'abc']))
+
+    def _on_state(snapshot):
+        raise UploadCancelled('u1')
+
+    with pytest.raises(UploadCancelled):
+        importer.download('https://reg/c.mp4',
+                          str(tmp_path / 'c.webm'),
+                          on_state=_on_state)
+    assert session.calls == [] and os.listdir(str(tmp_path)) == []
@@ -0,0 +1,93 @@
+from modules import registrators
+from modules.registrators import RegistratorIndex, parse_listing_html
+
+
+def test_parse_listing_html_skips_parent_and_queries():
+    html = ('<a href="../">..</a><a href="2024-01-02/">x</a>'
+            '<a href="?C=M">s</a><a href="a%20b.MOV">f</a>'
+            '<a href="2024-01-02/">dup</a>')
+    assert parse_listing_html(html) == ['2024-01-02', 'a b.MOV']
+
+
+def test_listing_is_cached_then_revalidated(monkeypatch):
+    calls = []
+
+    def fake_fetch(url, etag=None, last_modified=None, timeout=8):
+        calls.append((url, etag))
+        if etag:
+            return 304, [], etag, None
+        return 200, ['a', 'b'], '"e1"', None
+
+    monkeypatch.setattr(registrators, 'fetch_directory_listing', fake_fetch)
+    index = RegistratorIndex(ttl=60, prefetch_workers=0)
+    assert index.listing('http://reg/', 1) == ['a', 'b']
+    assert index.listing('http://reg/', 1) == ['a', 'b']
+    assert len(calls) == 1
+    # Expired: conditional request keeps the cached names on 304
+    assert index.listing('http://reg/', 1, max_age=0) == ['a', 'b']
+    assert calls[-1] == ('http://reg/', '"e1"')
+    stats = index.stats(1)
+    assert (stats['hit'], stats['fetched'], stats['revalidated']) == (1, 1, 1)
+    assert stats['requests'] == 2
+
+
+def test_unreachable_registrator_serves_stale_listing(monkeypatch):
+    state = {'down': False}
+
+    def fake_fetch(url, etag=None, last_modified=None, timeout=8):
+        if state['down']:
+            raise OSError('timed out')
+        return 200, ['x'], None, None
+
+    monkeypatch.setattr(registrators, 'fetch_directory_listing', fake_fetch)
+    index = RegistratorIndex(ttl=0, prefetch_workers=0)
+    assert index.listing('http://reg/d', 2) == ['x']
+    state['down'] = True
+    assert index.listing('http://reg/d', 2) == ['x']
+    assert index.listing('http://reg/other', 2) == []
+    assert index.stats(2)['error'] == 2
+
+
+def test_prefetch_is_bounded_and_skips_fresh(monkeypatch):
+    fetched = []
+
+    def fake_fetch(url, etag=None, last_modified=None, timeout=8):
+        fetched.append(url)
+        return 200, [], None, None
+
+    monkeypatch.setattr(registrators, 'fetch_directory_listing', fake_fetch)
+    index = RegistratorIndex(ttl=60, prefetch_workers=2, prefetch_limit=3)
+    index.listing('http://reg/0', 3)
+    urls = [f'http://reg/{i}' for i in range(6)]
+    # Only the first prefetch_limit candidates are considered, fresh ones included
+    assert index.prefetch(urls, 3) == 2
+    index._pool.shutdown(wait=True)
+    assert sorted(fetched) == ['http://reg/0', 'http://reg/1', 'http://reg/2']
+
+
+class _Redis:
+
+    def __init__(self):
+        self.store = {}
+        self.mgets = 0
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def mget(self, keys):
+        self.mgets += 1
+        return [self.store.get(k) for k in keys]
+
+    def set(self, key, value, ex=None):
+        self.store[key] = value
+
+
+def test_prefetch_reads_candidates_with_one_mget(monkeypatch):
+    monkeypatch.setattr(registrators, 'fetch_directory_listing',
+                        lambda url, **kw: (200, [], None, None))
+    redis = _Redis()
+    index = RegistratorIndex(redis, ttl=60, prefetch_workers=1, prefetch_limit=4)
+    index.listing('http://reg/1')
+    assert index.prefetch((f'http://reg/{i}' for i in range(10))) == 3
+    index._pool.shutdown(wait=True)
+    assert redis.mgets == 1
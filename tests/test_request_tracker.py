@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+from modules.request_tracker import (PRESENCE_KEY, SESSIONS_KEY, RequestTracker,
+                                     SessionTTLMap)
+
+
+class _Client:
+    """Hash subset of redis-py; counts pipeline round trips."""
+
+    def __init__(self, fail=False):
+        self.hash = {}
+        self.round_trips = 0
+        self.fail = fail
+
+    def pipeline(self, transaction=True):
+        return _Pipe(self)
+
+
+class _Pipe:
+
+    def __init__(self, client):
+        self.client = client
+        self.ops = []
+
+    def hset(self, key, field, value):
+        self.ops.append(lambda c: c.hash.setdefault(key, {}).__setitem__(field, value))
+
+    def expire(self, key, ttl):
+        self.ops.append(lambda c: True)
+
+    def execute(self):
+        self.client.round_trips += 1
+        if self.client.fail:
+            raise ConnectionError('down')
+        return [op(self.client) for op in self.ops]
+
+
+def _entry(ip='10.0.0.1'):
+    return {'user_id': 7, 'user': 'ann', 'ip': ip, 'ua': 'UA', 'created_at': 1.0}
+
+
+def test_session_map_prunes_oldest_first():
+    sessions = SessionTTLMap()
+    sessions.touch('a', {'last_seen': 10})
+    sessions.touch('b', {'last_seen': 20})
+    sessions.touch('a', {'last_seen': 30})
+
+    assert sessions.prune(25) == 1
+    assert list(sessions) == ['a']
+
+
+def test_touch_session_keeps_created_at_and_prunes():
+    tracker = RequestTracker()
+    tracker.touch_session('old', 1, 'x', 'ip', 'ua', now=100.0, max_age=50)
+    first = tracker.touch_session('s1', 7, 'ann', 'ip', 'ua', now=160.0, max_age=50)
+    again = tracker.touch_session('s1', 7, 'ann', 'ip', 'ua', now=170.0, max_age=50)
+
+    assert 'old' not in tracker.sessions
+    assert again is first
+    assert again['created_at'] == 160.0 and again['last_seen'] == 170.0
+
+
+def test_writes_are_coalesced_into_one_pipeline():
+    client = _Client()
+    tracker = RequestTracker(write_interval=60)
+
+    assert tracker.track(client, 's1', _entry(), '/files')
+    assert client.round_trips == 1
+    assert json.loads(client.hash[SESSIONS_KEY]['s1'])['user_id'] == 7
+    assert json.loads(client.hash[PRESENCE_KEY]['ann|10.0.0.1'])['page'] == '/files'
+
+    client.hash.clear()
+    assert not tracker.track(client, 's1', _entry(), '/files')
+    assert client.hash == {} and client.round_trips == 1
+
+    # Changed details are written through immediately
+    tracker.track(client, 's1', _entry(), '/categories')
+    assert PRESENCE_KEY in client.hash and SESSIONS_KEY not in client.hash
+    assert client.round_trips == 2
+
+
+def test_nothing_queued_skips_redis():
+    client = _Client()
+    tracker = RequestTracker(write_interval=60)
+    tracker.track(client, 's1', _entry(), None)
+    tracker.track(client, 's1', _entry(), None)
+
+    assert client.round_trips == 1
+
+
+def test_failed_pipeline_is_retried_by_next_request():
+    client = _Client(fail=True)
+    tracker = RequestTracker(write_interval=60)
+    with pytest.raises(ConnectionError):
+        tracker.track(client, 's1', _entry(), None)
+
+    client.fail = False
+    tracker.track(client, 's1', _entry(), None)
+    assert 's1' in client.hash[SESSIONS_KEY]
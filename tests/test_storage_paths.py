@@ -0,0 +1,53 @@
+import os
+import types
+
+from modules.category_tree import CategoryTree
+from modules.storage_paths import StoragePathResolver
+
+
+class _Sql:
+
+    def __init__(self):
+        self.loads = 0
+        self.subs = [
+            types.SimpleNamespace(id=10,
+                                  category_id=1,
+                                  folder_name='day',
+                                  display_name='Day',
+                                  enabled=1)
+        ]
+
+    def category_tree_rows(self):
+        self.loads += 1
+        cats = [
+            types.SimpleNamespace(id=1,
+                                  folder_name='video',
+                                  display_name='Video',
+                                  enabled=1)
+        ]
+        return cats, list(self.subs)
+
+
+def test_resolves_without_queries_per_file(tmp_path):
+    sql = _Sql()
+    tree = CategoryTree(sql, check_interval=60)
+    resolver = StoragePathResolver(str(tmp_path), tree)
+    for _ in range(100):
+        assert resolver.storage_dir(1, 10) == os.path.join(
+            str(tmp_path), 'files', 'video', 'day')
+    assert sql.loads == 1
+
+
+def test_unknown_subcategory_triggers_single_reload(tmp_path):
+    sql = _Sql()
+    tree = CategoryTree(sql, check_interval=60)
+    resolver = StoragePathResolver(str(tmp_path), tree)
+    resolver.storage_dir(1, 10)
+    sql.subs.append(
+        types.SimpleNamespace(id=11,
+                              category_id=1,
+                              folder_name='night',
+                              display_name='Night',
+                              enabled=1))
+    assert resolver.folders(1, 11) == ('video', 'night')
+    assert sql.loads == 2
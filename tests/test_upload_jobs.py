@@ -0,0 +1,141 @@
+import time
+
+from modules.upload_jobs import UploadJobRegistry
+
+
+class _Redis:
+    """Hash/set subset of redis-py used by the registry (no Lua)."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.sets = {}
+        self.slots = {}
+        self.writes = 0
+
+    def register_script(self, script):
+        return lambda keys, args: [0, 0]
+
+    def pipeline(self):
+        return _Pipe(self)
+
+    def exists(self, key):
+        return key in self.hashes
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def smembers(self, key):
+        return set(self.sets.get(key, set()))
+
+
+class _Pipe:
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.results = []
+
+    def delete(self, key):
+        self.redis.hashes.pop(key, None)
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        h = self.redis.hashes.setdefault(key, {})
+        h.update(mapping or {field: value})
+        self.results.append(1)
+
+    def zscore(self, key, member):
+        self.results.append(self.redis.slots.get(member))
+
+    def hincrby(self, key, field, amount):
+        h = self.redis.hashes.setdefault(key, {})
+        h[field] = str(int(h.get(field) or 0) + amount)
+
+    def sadd(self, key, member):
+        self.redis.sets.setdefault(key, set()).add(member)
+
+    def srem(self, key, member):
+        self.redis.sets.get(key, set()).discard(member)
+
+    def zrem(self, key, member):
+        pass
+
+    def expire(self, key, seconds):
+        pass
+
+    def execute(self):
+        self.redis.writes += 1
+        return self.results
+
+
+def _job():
+    return {
+        'id': 'u1',
+        'user_id': 7,
+        'file_urls': ['http://reg/a.MOV'],
+        'file_names': ['a.MOV'],
+        'total_files': 1,
+        'completed_files': 0,
+        'error_count': 0,
+        'status': 'running',
+        'start_time': 1.5,
+        'ip': '',
+    }
+
+
+def test_job_round_trips_through_hash_fields():
+    registry = UploadJobRegistry(_Redis())
+    registry.create(_job())
+    job = registry.get('u1')
+    assert job['user_id'] == 7 and job['file_urls'] == ['http://reg/a.MOV']
+    assert job['start_time'] == 1.5 and job['ip'] == ''
+    assert registry.running_ids() == ['u1']
+    registry.incr('u1', 'error_count')
+    registry.update('u1', resume={'offset': 10})
+    job = registry.get('u1')
+    assert job['error_count'] == 1 and job['resume'] == {'offset': 10}
+    registry.finish('u1', 'completed')
+    assert registry.get('u1')['status'] == 'completed'
+    assert registry.running_ids() == []
+
+
+def test_progress_writes_are_throttled_and_counted_incrementally():
+    redis = _Redis()
+    registry = UploadJobRegistry(redis, progress_interval=3600)
+    registry.create(_job())
+    registry.start_file('u1', 0, 'a.MOV')
+    writes = redis.writes
+    assert registry.report_progress('u1', 100, 1000)
+    assert not registry.report_progress('u1', 200, 1000)
+    assert registry.report_progress('u1', 1000, 1000, force=True)
+    assert redis.writes == writes + 2
+    job = registry.get('u1')
+    assert job['bytes_done'] == 1000 and job['current_file_progress'] == 100
+
+
+def test_cancel_waits_for_a_live_worker():
+    redis = _Redis()
+    registry = UploadJobRegistry(redis)
+    registry.create(_job())
+    assert not registry.cancel_requested('u1')
+
+    redis.slots['u1'] = time.time() + 60
+    assert registry.request_cancel('u1')
+    assert registry.cancel_requested('u1')
+    # The job stays running until the worker acknowledges
+    assert registry.get('u1')['status'] == 'running'
+
+    redis.slots['u1'] = time.time() - 1
+    assert not registry.request_cancel('u1')
+
+
+def test_progress_after_restart_counts_from_zero():
+    registry = UploadJobRegistry(_Redis(), progress_interval=0)
+    registry.create(_job())
+    registry.start_file('u1', 0, 'a.MOV')
+    registry.report_progress('u1', 600, 1000)
+    # Server ignored the Range request: the file is fetched again from 0
+    registry.report_progress('u1', 300, 1000)
+    registry.report_progress('u1', 1000, 1000)
+    assert registry.get('u1')['bytes_done'] == 600 + 1000